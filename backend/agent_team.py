@@ -21,25 +21,90 @@ except ImportError:
     except ImportError:
         raise ImportError("无法导入pyautogen或autogen库。请确保已安装必要的依赖。")
 
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Callable, List, Optional
+import copy
+import json
 import logging
+import time
 
 from agents.analyst import AnalystAgent
 from agents.researcher import ResearcherAgent
 from agents.strategist import StrategistAgent
 from agents.adaptor import AdaptorAgent
 from tools.user_interaction_tools import ask_user_clarification
+from tools.tool_cache import normalize_query
+from fsm_driver import FSMDriver, BudgetExceeded
+from context_manager import ContextManager
+
+try:
+    from helios.services.metering import get_meter, usage_context
+except ImportError:
+    get_meter = None
+    usage_context = None
+
+try:
+    from helios.services.resilience import check_cancelled
+except ImportError:
+    check_cancelled = None
+
+try:
+    from helios.services.autogen_client import HeliosModelClient
+except ImportError:
+    HeliosModelClient = None
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+class PlanSession:
+    """
+    单个规划会话的状态
+    
+    状态机状态、共享数据和耗时统计都保存在会话中，
+    因此同一个AdaptivePlanTeam（以及其中的智能体）可以同时服务多个会话。
+    设置on_checkpoint后，每次状态转换都会以检查点字典调用它，用于持久化进度。
+    """
+    
+    def __init__(self, session_id: str, initial_state: str,
+                 on_checkpoint: Optional[Callable[[Dict[str, Any]], None]] = None):
+        """
+        Args:
+            session_id: 会话ID
+            initial_state: 初始状态
+            on_checkpoint: 状态转换后保存检查点的回调
+        """
+        self.session_id = session_id
+        self.on_checkpoint = on_checkpoint
+        self.reset(initial_state)
+    
+    def reset(self, initial_state: str):
+        """
+        清空会话，回到初始状态
+        
+        Args:
+            initial_state: 初始状态
+        """
+        self.state = initial_state
+        self.shared_data = {
+            "structured_goal": None,
+            "research_report": None,
+            "plan": None,
+            "feedback": None
+        }
+        self.timings = {}
+        self.speculation = {}
+        self.last_used = time.monotonic()
+
 class AdaptivePlanTeam:
     """
     自适应规划团队
     
     该类编排四个核心智能体的协作，实现从目标分析到计划生成的完整流程。
     使用有限状态机管理智能体之间的交互。
+    
+    智能体只在初始化时创建一次；每个会话的状态保存在PlanSession中，
+    快速路径下run和process_feedback可以在多个线程中对不同的会话并发调用。
+    未传入会话时使用团队的默认会话（self.session）。
     """
     
     # 定义状态机状态
@@ -53,25 +118,104 @@ class AdaptivePlanTeam:
         "ERROR": "错误状态"
     }
     
+    # 推测执行：上游发言者开始工作时提前启动的下游发言者
+    SPECULATIONS = {"Analyst": "Researcher"}
+    
+    # 每个智能体的上下文窗口（保留的最近消息数），更早的消息并入滚动摘要
+    CONTEXT_WINDOWS = {"Analyst": 4, "Researcher": 4, "Strategist": 6, "Adaptor": 6}
+    
+    # 始终放在上下文最前面的关键产物
+    PINNED_ARTIFACTS = ("structured_goal", "plan")
+    
+    # 快速路径下每个状态的默认预算
+    DEFAULT_BUDGETS = {
+        "ANALYZING": {"max_rounds": 3, "max_tokens": 8000},
+        "RESEARCHING": {"max_rounds": 3, "max_tokens": 16000},
+        "PLANNING": {"max_rounds": 3, "max_tokens": 16000},
+        "FEEDBACK": {"max_rounds": 2, "max_tokens": 8000},
+    }
+    
     def __init__(self, 
                  config_list: List[Dict[str, Any]],
-                 user_proxy=None):
+                 user_proxy=None,
+                 fast_path: bool = True,
+                 budgets: Optional[Dict[str, Dict[str, int]]] = None,
+                 speculative: bool = False,
+                 context_manager: Optional[ContextManager] = None,
+                 meter=None,
+                 llm_client=None):
         """
         初始化自适应规划团队
         
         Args:
             config_list: LLM配置列表
             user_proxy: 用户代理实例，如果为None则创建一个新的
+            fast_path: 是否由FSMDriver直接按状态机调用智能体；
+                       为False时使用GroupChatManager编排
+            budgets: 每个状态的轮数和token预算，覆盖DEFAULT_BUDGETS中的对应项
+            speculative: 快速路径下是否在分析师工作时，基于原始目标提前推测执行研究员；
+                         目标确认后主题一致则复用推测结果，否则丢弃（会多消耗一次调用）
+            context_manager: 裁剪每次调用上下文的ContextManager，默认按CONTEXT_WINDOWS创建
+            meter: config_list不使用HeliosModelClient时，记录每次智能体调用估算用量的UsageMeter，
+                   默认使用helios的共享计量器；使用HeliosModelClient时由MultiModelClient
+                   按提供商返回的用量计量。任务和用户的归属由调用方的usage_context提供
+            llm_client: config_list使用HeliosModelClient时传给它的MultiModelClient，
+                        默认使用helios的共享客户端
         """
         self.config_list = config_list
         self.llm_config = {"config_list": config_list}
+        self.llm_client = llm_client
+        self.routed = False
+        self.fast_path = fast_path
+        self.speculative = speculative
+        self.context = context_manager or ContextManager(window_sizes=self.CONTEXT_WINDOWS)
+        self._chat_session = None
+        self.meter = meter if meter is not None else (get_meter() if get_meter else None)
+        self.model_name = config_list[0].get("model", "unknown") if config_list else "unknown"
+        self.budgets = {**self.DEFAULT_BUDGETS, **(budgets or {})}
         
-        self.state = self.STATES["INIT"]
+        self.session = self.create_session("default")
         self._setup_agents(user_proxy)
-        self._setup_groupchat()
+        if fast_path:
+            self._setup_driver()
+        else:
+            self._setup_groupchat()
         
         logger.info("自适应规划团队初始化完成")
     
+    def create_session(self, session_id: str) -> PlanSession:
+        """
+        创建一个处于初始状态的新会话
+        
+        Args:
+            session_id: 会话ID
+            
+        Returns:
+            PlanSession: 新会话
+        """
+        return PlanSession(session_id, self.STATES["INIT"])
+    
+    # 以下属性代理到默认会话，保持单会话用法不变
+    @property
+    def state(self) -> str:
+        return self.session.state
+    
+    @state.setter
+    def state(self, value: str):
+        self.session.state = value
+    
+    @property
+    def shared_data(self) -> Dict[str, Any]:
+        return self.session.shared_data
+    
+    @shared_data.setter
+    def shared_data(self, value: Dict[str, Any]):
+        self.session.shared_data = value
+    
+    @property
+    def timings(self) -> Dict[str, Dict[str, float]]:
+        return self.session.timings
+    
     def _setup_agents(self, user_proxy):
         """
         设置团队中的智能体
@@ -116,14 +260,24 @@ class AdaptivePlanTeam:
             name="Adaptor",
             llm_config=self.llm_config
         )
+        self._register_model_client(self.analyst, self.researcher, self.strategist, self.adaptor)
+    
+    def _register_model_client(self, *agents):
+        """
+        config_list中的条目使用HeliosModelClient时，为智能体注册该客户端，
+        使智能体的补全请求经过MultiModelClient的路由、缓存、计量和熔断器
         
-        # 存储智能体之间共享的数据
-        self.shared_data = {
-            "structured_goal": None,
-            "research_report": None,
-            "plan": None,
-            "feedback": None
-        }
+        Args:
+            agents: 使用self.llm_config的智能体
+        """
+        if HeliosModelClient is None:
+            return
+        if not any(config.get("model_client_cls") == HeliosModelClient.__name__ for config in self.config_list):
+            return
+        kwargs = {"client": self.llm_client} if self.llm_client is not None else {}
+        for agent in agents:
+            agent.register_model_client(HeliosModelClient, agent_name=agent.name, **kwargs)
+        self.routed = True
     
     def _setup_groupchat(self):
         """设置GroupChat和GroupChatManager"""
@@ -148,125 +302,360 @@ class AdaptivePlanTeam:
             groupchat=self.groupchat,
             llm_config=self.llm_config
         )
+        self._register_model_client(self.manager)
+        
+        # 智能体回复前裁剪GroupChat累积的完整历史
+        for agent in (self.analyst, self.researcher, self.strategist, self.adaptor):
+            agent.register_hook("process_all_messages_before_reply", self._context_hook(agent.name))
+    
+    def _context_hook(self, agent_name: str):
+        """返回GroupChat路径下裁剪指定智能体上下文的钩子"""
+        def hook(messages):
+            return self.context.build(agent_name, messages, self._pinned(self._chat_session or self.session))
+        return hook
+    
+    def _pinned(self, session: PlanSession) -> Dict[str, Any]:
+        """返回会话中需要固定在上下文中的关键产物"""
+        return {key: session.shared_data.get(key) for key in self.PINNED_ARTIFACTS}
+    
+    def estimate_context(self, agent_name: str, messages: List[Dict[str, Any]],
+                         session: Optional[PlanSession] = None) -> Dict[str, int]:
+        """
+        估算一次调用实际发送的上下文token数
+        
+        Args:
+            agent_name: 智能体名称
+            messages: 完整的对话历史
+            session: 会话，默认为团队的默认会话
+            
+        Returns:
+            Dict: 固定产物、摘要、窗口各部分及总计的token数和预算
+        """
+        return self.context.plan(agent_name, messages, self._pinned(session or self.session)).to_dict()
+    
+    def _setup_driver(self):
+        """设置快速路径使用的智能体映射，不创建GroupChatManager"""
+        self.driver_agents = {
+            "Analyst": self.analyst,
+            "Researcher": self.researcher,
+            "Strategist": self.strategist,
+            "Adaptor": self.adaptor,
+        }
+    
+    def _record_usage(self, state: str, agent_name: str, prompt_tokens: int,
+                      completion_tokens: int, seconds: float):
+        """
+        把快速路径下一次智能体调用的估算用量记入计量器
+        
+        只在智能体不经过MultiModelClient时使用；此时拿不到提供商返回的用量，
+        按config_list中的第一个模型估算
+        """
+        if self.meter is None:
+            return
+        try:
+            self.meter.record(
+                self.model_name, prompt_tokens, completion_tokens, latency=seconds,
+                estimated=True, agent=agent_name, state=state,
+            )
+        except Exception as e:
+            logger.warning(f"记录 {agent_name} 的用量失败: {e}")
+    
+    def _call_context(self, state: str, agent_name: str):
+        """把一次智能体调用（包括推测调用）的用量归属到状态和智能体"""
+        return usage_context(agent=agent_name, state=state)
+    
+    def _check_run(self, state: str, agent_name: Optional[str] = None):
+        """
+        在helios中运行时检查本次运行是否已被取消或超过截止时间
+        
+        Args:
+            state: 当前状态
+            agent_name: 即将发言的智能体名称
+        
+        Raises:
+            OperationCancelled: 如果运行已被取消
+            DeadlineExceeded: 如果截止时间已过
+        """
+        if check_cancelled is not None:
+            check_cancelled(f"{state}阶段{agent_name}" if agent_name else f"{state}阶段")
+    
+    def _state_name(self, session: PlanSession) -> str:
+        """返回会话当前状态的键名，例如'RESEARCHING'"""
+        for name, description in self.STATES.items():
+            if description == session.state:
+                return name
+        return session.state
+    
+    def _drive(self, initial_message: str, session: PlanSession):
+        """
+        用FSMDriver驱动会话的一次对话，超出预算时进入错误状态
+        
+        Args:
+            initial_message: 初始消息
+            session: 会话
+        """
+        # 驱动器只持有无状态的智能体映射和绑定到会话的回调，每次运行新建即可
+        driver = FSMDriver(
+            agents=self.driver_agents,
+            transition=lambda speaker, content: self._fsm_transition(speaker, content, session),
+            get_state=lambda: self._state_name(session),
+            budgets=self.budgets,
+            speculate=self.SPECULATIONS if self.speculative else None,
+            accept_speculation=self._accept_speculation,
+            prepare_messages=lambda name, messages: self.context.build(name, messages, self._pinned(session)),
+            on_usage=None if self.routed else self._record_usage,
+            before_call=self._check_run,
+            call_context=self._call_context if self.routed and usage_context is not None else None,
+        )
+        try:
+            result = driver.run(initial_message, sender=self.user_proxy)
+            session.timings = result["timings"]
+            session.speculation = result["speculation"]
+        except BudgetExceeded as e:
+            session.timings = e.timings
+            session.state = self.STATES["ERROR"]
+            logger.error(f"会话 {session.session_id}: {e}")
     
-    def _fsm_transition(self, current_speaker, message_content):
+    def _accept_speculation(self, name: str, provisional: List[Dict[str, str]],
+                            messages: List[Dict[str, str]]) -> bool:
         """
-        有限状态机转换逻辑
+        判断推测执行的结果能否使用
+        
+        研究员的推测只基于原始目标。分析师确认的目标（structured_goal的'topic'或'goal'）
+        规范化后与原始目标互相包含时，说明分析没有改变研究主题，推测结果可以复用。
+        
+        Args:
+            name: 下游发言者名称
+            provisional: 推测时的对话历史
+            messages: 轮到下游发言者时的对话历史
+            
+        Returns:
+            bool: 能否使用推测结果
+        """
+        if name != "Researcher":
+            return False
+        analyst_outputs = [m["content"] for m in messages if m.get("name") == "Analyst"]
+        if not analyst_outputs:
+            return False
+        try:
+            structured_goal = json.loads(analyst_outputs[-1])
+        except ValueError:
+            return False
+        if not isinstance(structured_goal, dict):
+            return False
+        topic = structured_goal.get("topic") or structured_goal.get("goal")
+        if not isinstance(topic, str) or not topic.strip():
+            return False
+        objective = normalize_query(" ".join(m["content"] for m in provisional))
+        topic = normalize_query(topic)
+        return topic in objective or objective in topic
+    
+    def snapshot_session(self, session: PlanSession) -> Dict[str, Any]:
+        """
+        生成会话的检查点
+        
+        Args:
+            session: 会话
+            
+        Returns:
+            Dict: 可JSON序列化的检查点，包含状态键名和各阶段的输出
+        """
+        return {
+            "state": self._state_name(session),
+            "shared_data": copy.deepcopy(session.shared_data),
+        }
+    
+    def restore_session(self, session: PlanSession, checkpoint: Dict[str, Any]):
+        """
+        从检查点恢复会话的状态和各阶段输出
+        
+        Args:
+            session: 会话
+            checkpoint: snapshot_session生成的检查点
+        """
+        session.reset(self.STATES.get(checkpoint.get("state"), self.STATES["INIT"]))
+        session.shared_data.update(copy.deepcopy(checkpoint.get("shared_data") or {}))
+    
+    def _fsm_transition(self, current_speaker, message_content, session: Optional[PlanSession] = None):
+        """
+        有限状态机转换逻辑，状态发生变化时保存检查点
+        
+        快速路径和GroupChat路径都在每次转换时检查取消信号和截止时间，
+        运行被取消后不再调用下一个智能体。
         
         Args:
             current_speaker: 当前发言的智能体
             message_content: 消息内容
+            session: 会话，默认为团队的默认会话
         
         Returns:
             str: 下一个发言者的名称
         """
-        logger.info(f"当前状态: {self.state}, 当前发言者: {current_speaker.name}")
+        session = session or self.session
+        previous_state = session.state
+        next_speaker = self._next_speaker(current_speaker, message_content, session)
+        if session.state != previous_state and session.on_checkpoint is not None:
+            try:
+                session.on_checkpoint(self.snapshot_session(session))
+            except Exception as e:
+                # 检查点写入失败不中断规划，只是崩溃后需要重新计算更多阶段
+                logger.warning(f"会话 {session.session_id} 保存检查点失败: {e}")
+        if next_speaker != "User":
+            # 在检查点之后检查，取消的运行可以从已完成的状态恢复
+            self._check_run(self._state_name(session), next_speaker)
+        return next_speaker
+    
+    def _next_speaker(self, current_speaker, message_content, session: PlanSession):
+        """
+        根据会话当前状态和消息计算下一个发言者，并推进会话状态
+        
+        Args:
+            current_speaker: 当前发言的智能体
+            message_content: 消息内容
+            session: 会话
+        
+        Returns:
+            str: 下一个发言者的名称
+        """
+        logger.info(f"当前状态: {session.state}, 当前发言者: {current_speaker.name}")
         
         # 初始状态
-        if self.state == self.STATES["INIT"]:
-            self.state = self.STATES["ANALYZING"]
+        if session.state == self.STATES["INIT"]:
+            session.state = self.STATES["ANALYZING"]
             return "Analyst"
         
         # 目标分析状态
-        elif self.state == self.STATES["ANALYZING"]:
+        elif session.state == self.STATES["ANALYZING"]:
             if current_speaker.name == "Analyst" and "structured_goal" in message_content:
                 try:
                     # 尝试解析结构化目标
                     import json
-                    self.shared_data["structured_goal"] = json.loads(message_content)
-                    self.state = self.STATES["RESEARCHING"]
+                    session.shared_data["structured_goal"] = json.loads(message_content)
+                    session.state = self.STATES["RESEARCHING"]
                     return "Researcher"
                 except:
                     pass
             return "Analyst"  # 继续分析
         
         # 研究方法状态
-        elif self.state == self.STATES["RESEARCHING"]:
+        elif session.state == self.STATES["RESEARCHING"]:
             if current_speaker.name == "Researcher" and "research_report" in message_content:
-                self.shared_data["research_report"] = message_content
-                self.state = self.STATES["PLANNING"]
+                session.shared_data["research_report"] = message_content
+                session.state = self.STATES["PLANNING"]
                 return "Strategist"
             return "Researcher"  # 继续研究
         
         # 制定计划状态
-        elif self.state == self.STATES["PLANNING"]:
+        elif session.state == self.STATES["PLANNING"]:
             if current_speaker.name == "Strategist" and "plan" in message_content:
-                self.shared_data["plan"] = message_content
-                self.state = self.STATES["COMPLETE"]
+                session.shared_data["plan"] = message_content
+                session.state = self.STATES["COMPLETE"]
                 return "User"  # 返回给用户
             return "Strategist"  # 继续制定计划
         
         # 处理反馈状态
-        elif self.state == self.STATES["FEEDBACK"]:
+        elif session.state == self.STATES["FEEDBACK"]:
             if current_speaker.name == "Adaptor":
                 if "无需采取行动" in message_content:
-                    self.state = self.STATES["COMPLETE"]
+                    session.state = self.STATES["COMPLETE"]
                     return "User"
                 else:
-                    self.state = self.STATES["PLANNING"]
+                    session.state = self.STATES["PLANNING"]
                     return "Strategist"  # 重新规划
             return "Adaptor"
         
         # 完成状态 - 默认返回用户
         return "User"
     
-    def run(self, user_objective: str):
+    def run(self, user_objective: str, session: Optional[PlanSession] = None, resume: bool = False):
         """
         启动自适应规划团队处理用户目标
         
         Args:
             user_objective: 用户的初始目标描述
+            session: 会话，默认为团队的默认会话
+            resume: 为True且会话已从检查点恢复时，从最后完成的状态继续，
+                    复用已有的阶段输出而不重新计算
             
         Returns:
             Dict: 处理结果，包含结构化目标、研究报告和最终计划
         """
-        logger.info(f"开始处理用户目标: {user_objective}")
-        
-        # 重置状态
-        self.state = self.STATES["INIT"]
-        self.shared_data = {
-            "structured_goal": None,
-            "research_report": None,
-            "plan": None,
-            "feedback": None
-        }
+        session = session or self.session
+        resuming = resume and session.state not in (self.STATES["INIT"], self.STATES["ERROR"])
+        if resuming:
+            logger.info(f"从状态 {session.state} 继续处理用户目标: {user_objective}")
+            initial_message = self._resume_message(user_objective, session)
+            session.last_used = time.monotonic()
+        else:
+            logger.info(f"开始处理用户目标: {user_objective}")
+            # 重置状态
+            session.reset(self.STATES["INIT"])
+            initial_message = f"请帮我分析并制定以下目标的执行计划: {user_objective}"
         
-        # 配置GroupChatManager使用我们的状态机
-        self.manager.orchestrate_chat(
-            director=self._fsm_transition,
-            initial_message=f"请帮我分析并制定以下目标的执行计划: {user_objective}"
-        )
+        # 上一次运行已完成时直接返回检查点中的结果
+        if session.state != self.STATES["COMPLETE"]:
+            if self.fast_path:
+                self._drive(initial_message, session)
+            else:
+                # 配置GroupChatManager使用我们的状态机
+                self._chat_session = session
+                self.manager.orchestrate_chat(
+                    director=lambda speaker, content: self._fsm_transition(speaker, content, session),
+                    initial_message=initial_message
+                )
         
         return {
-            "structured_goal": self.shared_data["structured_goal"],
-            "research_report": self.shared_data["research_report"],
-            "plan": self.shared_data["plan"]
+            "structured_goal": session.shared_data["structured_goal"],
+            "research_report": session.shared_data["research_report"],
+            "plan": session.shared_data["plan"],
+            "timings": session.timings,
+            "speculation": session.speculation
         }
     
-    def process_feedback(self, feedback: str):
+    def _resume_message(self, user_objective: str, session: PlanSession) -> str:
+        """生成继续规划时的初始消息，附带已完成阶段的输出作为上下文"""
+        lines = [f"请继续制定以下目标的执行计划: {user_objective}"]
+        if session.shared_data["structured_goal"] is not None:
+            structured_goal = json.dumps(session.shared_data["structured_goal"], ensure_ascii=False)
+            lines.append(f"已完成的目标分析: {structured_goal}")
+        if session.shared_data["research_report"] is not None:
+            lines.append(f"已完成的研究报告: {session.shared_data['research_report']}")
+        return "\n".join(lines)
+    
+    def process_feedback(self, feedback: str, session: Optional[PlanSession] = None):
         """
         处理用户对计划的反馈
         
         Args:
             feedback: 用户反馈文本
+            session: 会话，默认为团队的默认会话
             
         Returns:
             Dict: 处理结果
         """
         logger.info(f"处理用户反馈: {feedback}")
+        session = session or self.session
+        session.last_used = time.monotonic()
         
         # 设置为反馈状态
-        self.state = self.STATES["FEEDBACK"]
-        self.shared_data["feedback"] = feedback
+        session.state = self.STATES["FEEDBACK"]
+        session.shared_data["feedback"] = feedback
         
         # 将反馈发送给AdaptorAgent
-        self.manager.orchestrate_chat(
-            director=self._fsm_transition,
-            initial_message=f"用户对计划的反馈: {feedback}"
-        )
+        initial_message = f"用户对计划的反馈: {feedback}"
+        original_plan = session.shared_data["plan"]
+        if self.fast_path:
+            self._drive(initial_message, session)
+        else:
+            self._chat_session = session
+            self.manager.orchestrate_chat(
+                director=lambda speaker, content: self._fsm_transition(speaker, content, session),
+                initial_message=initial_message
+            )
         
         return {
-            "original_plan": self.shared_data["plan"],
+            "original_plan": original_plan,
             "feedback": feedback,
-            "updated_plan": self.shared_data["plan"]  # 如果有重新规划，这里会更新
+            "updated_plan": session.shared_data["plan"],  # 如果有重新规划，这里会更新
+            "timings": session.timings
         } 
\ No newline at end of file
@@ -1,4 +1,7 @@
-from pyautogen.agentchat import ConversableAgent
+try:
+    from pyautogen.agentchat import ConversableAgent
+except ImportError:
+    from autogen import ConversableAgent
 
 class AdaptorAgent(ConversableAgent):
     def __init__(self, name: str, llm_config: dict, **kwargs):
@@ -1,7 +1,24 @@
-from pyautogen.agentchat import ConversableAgent
+import asyncio
+
+try:
+    from pyautogen.agentchat import ConversableAgent
+except ImportError:
+    from autogen import ConversableAgent
+
+try:
+    from tools.research_pipeline import ResearchPipeline, format_research
+    from tools.research_tools import web_search as search_tool
+except ImportError:
+    from backend.tools.research_pipeline import ResearchPipeline, format_research
+    from backend.tools.research_tools import web_search as search_tool
+
+try:
+    import helios.services as helios_services
+except ImportError:
+    helios_services = None
 
 class ResearcherAgent(ConversableAgent):
-    def __init__(self, name: str, llm_config: dict, **kwargs):
+    def __init__(self, name: str, llm_config: dict, pipeline_options: dict = None, **kwargs):
         super().__init__(
             name=name,
             llm_config=llm_config,
@@ -12,36 +29,60 @@ class ResearcherAgent(ConversableAgent):
             你的最终报告应该清晰、结构化，包含具体的学习方法建议。""",
             **kwargs,
         )
+        # 并行研究流水线的参数：max_concurrency、search_timeout、summarize_timeout、max_documents
+        self.pipeline_options = pipeline_options or {}
 
-    def web_search(self, query: str) -> str:
+    def web_search(self, query: str):
         """
-        执行网络搜索（这是一个模拟函数）。
+        执行网络搜索。
         
         Args:
             query: 搜索查询
             
         Returns:
-            str: 搜索结果文本
+            list[dict] | str: 搜索结果列表（'title'、'url'、'snippet'），或纯文本结果
+        """
+        return search_tool(query)
+
+    async def research_methods_async(self, goal: dict) -> str:
+        """
+        并行研究实现特定学习目标的方法：把目标扩展为多个子查询并发搜索，
+        按URL去重后并发摘要文档，最后合并为研究结果。
+        
+        Args:
+            goal: 包含学习目标详情的字典
+            
+        Returns:
+            str: 研究结果
         """
-        # 在实际实现中，这将调用真实的网络搜索API
-        # 目前返回模拟数据
-        return f"关于'{query}'的模拟搜索结果。包含相关资源和方法论。"
+        pipeline = ResearchPipeline(search=self.web_search, **self.pipeline_options)
+        research = await pipeline.run(goal)
+        return format_research(research)
         
     def research_methods(self, goal: dict) -> str:
         """
         研究实现特定学习目标的方法。
         
+        同步入口，供智能体工具调用。在事件循环中调用时（如FastAPI处理函数、
+        autogen的异步回复）asyncio.run不可用，改为在helios的后台事件循环中执行并阻塞等待；
+        异步代码应直接await research_methods_async。
+        
         Args:
             goal: 包含学习目标详情的字典
             
         Returns:
             str: 研究结果
+            
+        Raises:
+            RuntimeError: 在事件循环中调用且helios不可用时
         """
-        # 在实际场景中，这将使用LLM和搜索工具进行复杂的研究。
-        # 为演示目的，我们使用一个简单的模拟函数。
-        search_query = f"实现 {goal['topic']} 学习的最佳方法"
-        research_results = self.web_search(search_query)
-        return research_results
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.research_methods_async(goal))
+        if helios_services is None:
+            raise RuntimeError("在事件循环中请使用 await research_methods_async(goal)")
+        return helios_services.model_client.run_sync(self.research_methods_async(goal))
         
     def generate_report(self, goal: dict, research_data: str) -> str:
         """
@@ -1,4 +1,7 @@
-from pyautogen.agentchat import ConversableAgent
+try:
+    from pyautogen.agentchat import ConversableAgent
+except ImportError:
+    from autogen import ConversableAgent
 import json
 
 class StrategistAgent(ConversableAgent):
@@ -22,6 +22,10 @@ class Settings(BaseSettings):
     DEEPSEEK_API_KEY: str = Field(default="", validation_alias='DEEPSEEK_API_KEY')
     MOONSHOT_API_KEY: str = Field(default="", validation_alias='MOONSHOT_API_KEY')
 
+    # --- LLM 客户端配置 ---
+    # OpenAI客户端遇到429/超时时的重试次数；提供商限流时重试只会加剧过载
+    LLM_CLIENT_MAX_RETRIES: int = Field(default=1, validation_alias='LLM_CLIENT_MAX_RETRIES')
+
     # 你可以在这里继续添加其他配置，如数据库URL、其他API密钥等
 
 # 创建一个全局可用的配置实例
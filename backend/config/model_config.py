@@ -36,9 +36,9 @@ config_list_instance = [
 llm_config = {
     "config_list": config_list_instance,
     "temperature": 0.2,
-    "request_timeout": 120,
-    "retry_wait_time": 5,
-    "max_retries": 3,
+    # 单次请求的超时；autogen 0.2的OpenAI客户端不识别旧的request_timeout/retry_wait_time
+    "timeout": 120,
+    "max_retries": settings.LLM_CLIENT_MAX_RETRIES,
     "seed": 42,
 }
 
@@ -0,0 +1,237 @@
+"""
+Context Manager Module
+
+控制每次智能体调用发送的上下文大小。
+
+完整的对话历史会被整理为三部分：
+1. 固定的关键产物（如structured_goal、plan），始终放在最前面；
+2. 较早轮次的滚动摘要，按消息前缀缓存，新增轮次时只增量摘要新移出窗口的消息；
+3. 每个智能体各自大小的滑动窗口内的最近消息。
+超出token预算时继续缩小窗口，把更多消息并入摘要。
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from fsm_driver import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+Summarizer = Callable[[str, List[Dict[str, Any]]], str]
+
+
+def extractive_summary(previous: str, messages: List[Dict[str, Any]], max_tokens: int = 800,
+                       line_chars: int = 120, token_counter: Callable[[str], int] = estimate_tokens) -> str:
+    """
+    不调用LLM的摘要：每条消息保留发言者和开头的一段内容，超出长度时丢弃最早的行。
+
+    Args:
+        previous: 之前的摘要
+        messages: 需要并入摘要的消息
+        max_tokens: 摘要的token上限
+        line_chars: 每条消息保留的最大字符数
+        token_counter: 计算token数的函数
+
+    Returns:
+        str: 新的摘要
+    """
+    lines = previous.splitlines() if previous else []
+    for message in messages:
+        text = " ".join(str(message.get("content") or "").split())
+        if len(text) > line_chars:
+            text = text[:line_chars] + "…"
+        lines.append(f"- {message.get('name') or message.get('role', '')}: {text}")
+    while len(lines) > 1 and token_counter("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class ContextPlan:
+    """
+    一次调用的上下文及其token估算
+
+    Attributes:
+        messages: 实际发送的消息列表
+        pinned_tokens: 固定产物的token数
+        summary_tokens: 摘要的token数
+        window_tokens: 窗口内消息的token数
+        window_size: 实际使用的窗口大小
+        summarized: 并入摘要的消息数
+        limit: token预算
+    """
+
+    def __init__(self, messages, pinned_tokens, summary_tokens, window_tokens, window_size, summarized, limit):
+        self.messages = messages
+        self.pinned_tokens = pinned_tokens
+        self.summary_tokens = summary_tokens
+        self.window_tokens = window_tokens
+        self.window_size = window_size
+        self.summarized = summarized
+        self.limit = limit
+
+    @property
+    def total_tokens(self) -> int:
+        return self.pinned_tokens + self.summary_tokens + self.window_tokens
+
+    @property
+    def over_budget(self) -> bool:
+        return self.total_tokens > self.limit
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "pinned": self.pinned_tokens,
+            "summary": self.summary_tokens,
+            "window": self.window_tokens,
+            "total": self.total_tokens,
+            "limit": self.limit,
+            "window_size": self.window_size,
+            "summarized": self.summarized,
+        }
+
+
+class ContextManager:
+    """
+    按智能体裁剪对话历史的上下文管理器。
+
+    可在多个会话和线程间共享：固定产物由调用方每次传入，
+    摘要缓存以消息内容为键，不同会话互不影响。
+    """
+
+    def __init__(
+        self,
+        window_sizes: Optional[Dict[str, int]] = None,
+        default_window: int = 6,
+        max_tokens: int = 6000,
+        summarizer: Optional[Summarizer] = None,
+        summary_max_tokens: int = 800,
+        token_counter: Callable[[str], int] = estimate_tokens,
+        cache_size: int = 256,
+    ):
+        """
+        Args:
+            window_sizes: 每个智能体保留的最近消息数，例如 {"Analyst": 4}
+            default_window: 未配置的智能体的窗口大小
+            max_tokens: 每次调用的上下文token预算（moonshot-v1-8k等模型还需为回复预留空间）
+            summarizer: 摘要函数 (之前的摘要, 新消息) -> 新摘要，默认为extractive_summary；
+                        可传入调用LLM的实现
+            summary_max_tokens: 默认摘要函数的摘要长度上限
+            token_counter: 计算token数的函数
+            cache_size: 缓存的摘要数
+        """
+        self.window_sizes = window_sizes or {}
+        self.default_window = default_window
+        self.max_tokens = max_tokens
+        self.token_counter = token_counter
+        self.summarizer = summarizer or (
+            lambda previous, messages: extractive_summary(previous, messages, summary_max_tokens,
+                                                          token_counter=token_counter)
+        )
+        self.cache_size = cache_size
+        # 消息前缀的摘要 -> 该前缀的摘要
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"summary_hits": 0, "summary_misses": 0, "summarized_messages": 0}
+
+    @staticmethod
+    def _digests(messages: List[Dict[str, Any]]) -> List[str]:
+        """每个前缀的链式摘要值，digests[i]对应messages[:i+1]"""
+        digests, current = [], ""
+        for message in messages:
+            data = json.dumps([current, message.get("name"), message.get("role"), message.get("content")],
+                              ensure_ascii=False, default=str)
+            current = hashlib.sha256(data.encode("utf-8")).hexdigest()
+            digests.append(current)
+        return digests
+
+    def summarize(self, messages: List[Dict[str, Any]]) -> str:
+        """
+        返回消息列表的滚动摘要，复用最长的已缓存前缀，只对新增的消息调用摘要函数。
+
+        Args:
+            messages: 需要摘要的较早消息
+
+        Returns:
+            str: 摘要，消息为空时为空字符串
+        """
+        if not messages:
+            return ""
+        digests = self._digests(messages)
+        with self._lock:
+            if digests[-1] in self._summaries:
+                self._summaries.move_to_end(digests[-1])
+                self.stats["summary_hits"] += 1
+                return self._summaries[digests[-1]]
+            start, summary = 0, ""
+            for index in range(len(digests) - 2, -1, -1):
+                if digests[index] in self._summaries:
+                    start, summary = index + 1, self._summaries[digests[index]]
+                    break
+            self.stats["summary_misses"] += 1
+            self.stats["summarized_messages"] += len(messages) - start
+
+        summary = self.summarizer(summary, messages[start:])
+        with self._lock:
+            self._summaries[digests[-1]] = summary
+            self._summaries.move_to_end(digests[-1])
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+        return summary
+
+    def _count(self, messages: List[Dict[str, Any]]) -> int:
+        return sum(self.token_counter(str(m.get("content") or "")) for m in messages)
+
+    def plan(self, agent_name: str, messages: List[Dict[str, Any]],
+             pinned: Optional[Dict[str, Any]] = None) -> ContextPlan:
+        """
+        为一次调用整理上下文并估算token数。
+
+        Args:
+            agent_name: 被调用的智能体名称
+            messages: 完整的对话历史
+            pinned: 需要始终保留的关键产物，值为None的项被忽略
+
+        Returns:
+            ContextPlan: 整理后的消息和各部分的token数
+        """
+        pinned_messages = []
+        artifacts = [
+            f"[{key}]\n{value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)}"
+            for key, value in (pinned or {}).items() if value is not None
+        ]
+        if artifacts:
+            pinned_messages.append({"role": "system", "content": "关键信息:\n" + "\n\n".join(artifacts)})
+        pinned_tokens = self._count(pinned_messages)
+
+        window = min(self.window_sizes.get(agent_name, self.default_window), len(messages))
+        while True:
+            older, recent = messages[:len(messages) - window], messages[len(messages) - window:]
+            summary = self.summarize(older)
+            summary_messages = [{"role": "system", "content": "早前对话摘要:\n" + summary}] if summary else []
+            plan = ContextPlan(
+                messages=pinned_messages + summary_messages + list(recent),
+                pinned_tokens=pinned_tokens,
+                summary_tokens=self._count(summary_messages),
+                window_tokens=self._count(recent),
+                window_size=window,
+                summarized=len(older),
+                limit=self.max_tokens,
+            )
+            # 至少保留最近一条消息
+            if not plan.over_budget or window <= 1:
+                break
+            window -= 1
+
+        if plan.over_budget:
+            logger.warning(f"{agent_name} 的上下文约 {plan.total_tokens} tokens，超出预算 {self.max_tokens}")
+        return plan
+
+    def build(self, agent_name: str, messages: List[Dict[str, Any]],
+              pinned: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        返回实际发送给智能体的消息列表，参数同plan。
+        """
+        return self.plan(agent_name, messages, pinned).messages
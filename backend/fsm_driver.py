@@ -0,0 +1,298 @@
+"""
+FSM Driver Module
+
+按有限状态机直接驱动智能体协作的轻量编排器。
+
+每一步由状态机的转换函数决定下一个发言者，只调用该智能体生成回复，
+不经过GroupChatManager的发言者选择，因此选择发言者不需要任何LLM调用。
+每个状态有各自的轮数和token预算，并记录每个状态的耗时。
+
+可选的推测执行：上游智能体开始发言时，在后台线程中用当时的（临时）对话历史
+提前调用下游智能体；轮到下游智能体时由accept_speculation判断上游的最终输出
+是否与临时输入一致，一致则直接使用推测结果，否则丢弃并正常调用。
+推测调用在提交时复制调用方的contextvars上下文，用量归属、截止时间和取消信号随之传递。
+"""
+
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, ContextManager, Dict, Iterable, List, Optional
+
+try:
+    from helios.services.metering import estimate_tokens
+except ImportError:
+    def estimate_tokens(text: str) -> int:
+        """
+        没有helios时的粗略估算：每4个字符1个token。与helios一起运行时
+        使用helios.services.metering.estimate_tokens，预算与用量计量的口径一致。
+
+        Args:
+            text: 文本
+
+        Returns:
+            int: 估算的token数
+        """
+        return (len(text) + 3) // 4 if text else 0
+
+logger = logging.getLogger(__name__)
+
+
+class BudgetExceeded(RuntimeError):
+    """
+    某个状态用尽了轮数或token预算。
+
+    Attributes:
+        state: 状态名
+        kind: 'rounds' 或 'tokens'
+        used: 已使用量
+        limit: 预算上限
+    """
+
+    def __init__(self, state: str, kind: str, used: int, limit: int):
+        self.state = state
+        self.kind = kind
+        self.used = used
+        self.limit = limit
+        super().__init__(f"状态 {state} 超出{'轮数' if kind == 'rounds' else 'token'}预算: {used}/{limit}")
+
+
+class FSMDriver:
+    """
+    直接按状态机转换调用智能体的编排器。
+
+    transition(current_speaker, message_content) 返回下一个发言者的名称，
+    与AdaptivePlanTeam._fsm_transition的约定相同；返回终止发言者（默认为'User'）
+    或不在agents中的名称时结束本次运行。
+    """
+
+    def __init__(
+        self,
+        agents: Dict[str, Any],
+        transition: Callable[[Any, str], str],
+        get_state: Callable[[], str],
+        budgets: Optional[Dict[str, Dict[str, int]]] = None,
+        default_max_rounds: int = 5,
+        default_max_tokens: int = 16000,
+        token_counter: Callable[[str], int] = estimate_tokens,
+        terminal_speakers: Iterable[str] = ("User",),
+        on_message: Optional[Callable[[str, str, str], None]] = None,
+        speculate: Optional[Dict[str, str]] = None,
+        accept_speculation: Optional[Callable[[str, List[Dict[str, str]], List[Dict[str, str]]], bool]] = None,
+        prepare_messages: Optional[Callable[[str, List[Dict[str, str]]], List[Dict[str, str]]]] = None,
+        on_usage: Optional[Callable[[str, str, int, int, float], None]] = None,
+        before_call: Optional[Callable[[str, str], None]] = None,
+        call_context: Optional[Callable[[str, str], ContextManager]] = None,
+    ):
+        """
+        Args:
+            agents: 发言者名称到智能体的映射，智能体需提供generate_reply(messages=..., sender=...)
+            transition: 状态机转换函数
+            get_state: 返回当前状态名的函数，用于查找预算和记录耗时
+            budgets: 每个状态的预算，例如 {"RESEARCHING": {"max_rounds": 3, "max_tokens": 8000}}
+            default_max_rounds: 未配置的状态的默认轮数上限
+            default_max_tokens: 未配置的状态的默认token上限
+            token_counter: 计算文本token数的函数
+            terminal_speakers: 表示流程结束的发言者名称
+            on_message: 每条回复生成后的回调，参数为 (状态, 发言者, 内容)
+            speculate: 上游发言者到下游发言者的映射，上游开始发言时提前推测执行下游，
+                       例如 {"Analyst": "Researcher"}
+            accept_speculation: 判断推测结果能否使用的函数，参数为
+                                (下游发言者, 推测时的对话历史, 轮到下游时的对话历史)；
+                                未提供时总是丢弃推测结果
+            prepare_messages: 调用智能体前处理对话历史的函数，参数为 (发言者, 完整历史)，
+                              返回实际发送的消息列表（例如ContextManager.build）；
+                              提供时按实际发送的消息计算输入token
+            on_usage: 每次调用后的用量回调，参数为 (状态, 发言者, 输入token, 输出token, 耗时秒数)
+            before_call: 每次调用智能体（或采用推测结果）前的回调，参数为 (状态, 发言者)，
+                         抛出异常即中止运行，例如检查取消信号和截止时间
+            call_context: 包裹每次智能体调用（包括推测调用）的上下文管理器工厂，参数为 (状态, 发言者)，
+                          例如用usage_context把调用的用量归属到状态和智能体；
+                          推测调用的状态为发起推测时的状态
+        """
+        self.agents = agents
+        self.transition = transition
+        self.get_state = get_state
+        self.budgets = budgets or {}
+        self.default_max_rounds = default_max_rounds
+        self.default_max_tokens = default_max_tokens
+        self.token_counter = token_counter
+        self.terminal_speakers = set(terminal_speakers)
+        self.on_message = on_message
+        self.speculate = speculate or {}
+        self.accept_speculation = accept_speculation
+        self.prepare_messages = prepare_messages
+        self.on_usage = on_usage
+        self.before_call = before_call
+        self.call_context = call_context
+
+    def _limits(self, state: str):
+        budget = self.budgets.get(state, {})
+        return budget.get("max_rounds", self.default_max_rounds), budget.get("max_tokens", self.default_max_tokens)
+
+    @staticmethod
+    def _content(reply: Any) -> str:
+        if reply is None:
+            return ""
+        if isinstance(reply, dict):
+            return reply.get("content") or ""
+        return str(reply)
+
+    def _prompt(self, name: str, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        if self.prepare_messages is None:
+            return messages
+        return self.prepare_messages(name, list(messages))
+
+    def _prompt_tokens(self, prompt: List[Dict[str, str]], history_tokens: int) -> int:
+        if self.prepare_messages is None:
+            return history_tokens
+        return sum(self.token_counter(m.get("content") or "") for m in prompt)
+
+    def _reply(self, state: str, name: str, messages: List[Dict[str, str]], sender: Any):
+        agent = self.agents[name]
+        if self.call_context is None:
+            return agent.generate_reply(messages=messages, sender=sender)
+        with self.call_context(state, name):
+            return agent.generate_reply(messages=messages, sender=sender)
+
+    def _timed_reply(self, state: str, name: str, messages: List[Dict[str, str]], sender: Any):
+        start = time.perf_counter()
+        reply = self._reply(state, name, messages, sender)
+        return reply, time.perf_counter() - start
+
+    def _resolve_speculation(self, name: str, speculation, messages: List[Dict[str, str]], stats: Dict[str, float]):
+        """
+        决定是否使用推测结果。
+
+        Returns:
+            tuple | None: 可以使用时返回 (回复, 推测时实际发送的消息)，否则返回None
+        """
+        provisional, prompt, future = speculation
+        accepted = False
+        if self.accept_speculation is not None:
+            try:
+                accepted = self.accept_speculation(name, provisional, messages)
+            except Exception as e:
+                logger.warning(f"判断 {name} 的推测结果时出错，丢弃推测结果: {e}")
+        if not accepted:
+            # 还未开始的推测调用直接取消；已在进行的调用无法中断，其结果被丢弃
+            future.cancel()
+            stats["discarded"] += 1
+            logger.info(f"{name} 的上游输出与推测输入不一致，丢弃推测结果")
+            return None
+        wait_start = time.perf_counter()
+        try:
+            reply, duration = future.result()
+        except Exception as e:
+            stats["discarded"] += 1
+            logger.warning(f"{name} 的推测调用失败，改为正常调用: {e}")
+            return None
+        stats["reused"] += 1
+        saved = max(0.0, duration - (time.perf_counter() - wait_start))
+        stats["saved_seconds"] += saved
+        return reply, prompt
+
+    def run(self, initial_message: str, sender: Any) -> Dict[str, Any]:
+        """
+        从初始消息开始驱动状态机，直到转换到终止发言者。
+
+        Args:
+            initial_message: 初始消息
+            sender: 初始消息的发送者（通常是用户代理）
+
+        Returns:
+            dict: 'messages'为完整的对话记录，'timings'为每个状态的
+                  {'rounds': 轮数, 'tokens': token数, 'seconds': 耗时}，
+                  'speculation'为推测执行的统计
+                  {'started', 'reused', 'discarded', 'saved_seconds'}
+
+        Raises:
+            BudgetExceeded: 如果某个状态用尽预算；异常的timings属性为已记录的统计
+        """
+        messages: List[Dict[str, str]] = [
+            {"role": "user", "name": getattr(sender, "name", "User"), "content": initial_message}
+        ]
+        timings: Dict[str, Dict[str, float]] = {}
+        speaker, content = sender, initial_message
+        history_tokens = self.token_counter(initial_message)
+        speculation_stats = {"started": 0, "reused": 0, "discarded": 0, "saved_seconds": 0.0}
+        # 下游发言者 -> (推测时的对话历史, 实际发送的消息, Future)
+        pending: Dict[str, Any] = {}
+        executor = ThreadPoolExecutor(max_workers=len(self.speculate), thread_name_prefix="fsm-speculate") \
+            if self.speculate else None
+
+        try:
+            while True:
+                next_name = self.transition(speaker, content)
+                if next_name in self.terminal_speakers or next_name not in self.agents:
+                    break
+                state = self.get_state()
+                usage = timings.setdefault(state, {"rounds": 0, "tokens": 0, "seconds": 0.0})
+                max_rounds, max_tokens = self._limits(state)
+                if usage["rounds"] >= max_rounds:
+                    raise BudgetExceeded(state, "rounds", usage["rounds"], max_rounds)
+
+                agent = self.agents[next_name]
+                downstream = self.speculate.get(next_name)
+                if downstream in self.agents and downstream not in pending:
+                    provisional = list(messages)
+                    speculative_prompt = self._prompt(downstream, provisional)
+                    pending[downstream] = (
+                        provisional,
+                        speculative_prompt,
+                        executor.submit(
+                            contextvars.copy_context().run,
+                            self._timed_reply, state, downstream, speculative_prompt, speaker,
+                        ),
+                    )
+                    speculation_stats["started"] += 1
+
+                start = time.perf_counter()
+                resolved = None
+                if next_name in pending:
+                    resolved = self._resolve_speculation(next_name, pending.pop(next_name), messages, speculation_stats)
+                if self.before_call is not None:
+                    self.before_call(state, next_name)
+                if resolved is not None:
+                    reply, prompt = resolved
+                else:
+                    prompt = self._prompt(next_name, messages)
+                    reply = self._reply(state, next_name, prompt, speaker)
+                elapsed = time.perf_counter() - start
+                usage["seconds"] += elapsed
+                content = self._content(reply)
+
+                # 每一轮都要把对话历史发给智能体，按输入加输出计算token
+                reply_tokens = self.token_counter(content)
+                input_tokens = self._prompt_tokens(prompt, history_tokens)
+                usage["rounds"] += 1
+                usage["tokens"] += input_tokens + reply_tokens
+                history_tokens += reply_tokens
+                if self.on_usage is not None:
+                    self.on_usage(state, next_name, input_tokens, reply_tokens, elapsed)
+                messages.append({"role": "assistant", "name": next_name, "content": content})
+                if self.on_message is not None:
+                    self.on_message(state, next_name, content)
+                if usage["tokens"] > max_tokens:
+                    raise BudgetExceeded(state, "tokens", usage["tokens"], max_tokens)
+                speaker = agent
+        except BudgetExceeded as e:
+            e.timings = timings
+            raise
+        finally:
+            if executor is not None:
+                for _, _, future in pending.values():
+                    future.cancel()
+                speculation_stats["discarded"] += len(pending)
+                executor.shutdown(wait=False)
+                if speculation_stats["started"]:
+                    logger.info(
+                        f"推测执行: 启动 {speculation_stats['started']} 次, 使用 {speculation_stats['reused']} 次, "
+                        f"丢弃 {speculation_stats['discarded']} 次, 节省 {speculation_stats['saved_seconds']:.2f} 秒"
+                    )
+            for state, usage in timings.items():
+                logger.info(
+                    f"状态 {state}: {usage['rounds']} 轮, 约 {usage['tokens']} tokens, 耗时 {usage['seconds']:.2f} 秒"
+                )
+
+        return {"messages": messages, "timings": timings, "speculation": speculation_stats}
@@ -64,8 +64,8 @@ class TestAgentCollaboration:
             # 研究员生成研究报告
             research_result = researcher.research_methods(structured_goal)
             
-            # 验证web_search被调用，且结果包含预期内容
-            mock_web_search.assert_called_once()
+            # 验证web_search被调用（每个子查询一次），且结果包含预期内容
+            assert mock_web_search.called
             assert "Python" in research_result
             assert "数据分析" in research_result
     
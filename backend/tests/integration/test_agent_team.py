@@ -31,7 +31,7 @@ class TestAdaptivePlanTeam:
                                       mock_analyst):
         """测试AG2团队的初始化过程"""
         # 创建AdaptivePlanTeam实例
-        team = AdaptivePlanTeam(config_list=self.mock_config["config_list"])
+        team = AdaptivePlanTeam(config_list=self.mock_config["config_list"], fast_path=False)
         
         # 验证是否创建了所有智能体
         mock_analyst.assert_called_once()
@@ -66,7 +66,7 @@ class TestAdaptivePlanTeam:
         mock_researcher.return_value = mock_researcher_instance
         
         # 创建团队
-        team = AdaptivePlanTeam(config_list=self.mock_config["config_list"])
+        team = AdaptivePlanTeam(config_list=self.mock_config["config_list"], fast_path=False)
         
         # 测试状态转换: 初始状态 -> 分析状态
         assert team.state == team.STATES["INIT"]
@@ -88,7 +88,7 @@ class TestAdaptivePlanTeam:
         # 创建AdaptivePlanTeam实例，跳过实际初始化
         with patch('agent_team.AdaptivePlanTeam._setup_agents'), \
              patch('agent_team.AdaptivePlanTeam._setup_groupchat'):
-            team = AdaptivePlanTeam(config_list=self.mock_config["config_list"])
+            team = AdaptivePlanTeam(config_list=self.mock_config["config_list"], fast_path=False)
             
             # 调用run方法
             team.run("测试目标")
@@ -103,7 +103,7 @@ class TestAdaptivePlanTeam:
         # 创建AdaptivePlanTeam实例，跳过实际初始化
         with patch('agent_team.AdaptivePlanTeam._setup_agents'), \
              patch('agent_team.AdaptivePlanTeam._setup_groupchat'):
-            team = AdaptivePlanTeam(config_list=self.mock_config["config_list"])
+            team = AdaptivePlanTeam(config_list=self.mock_config["config_list"], fast_path=False)
             
             # 调用process_feedback方法
             team.process_feedback("测试反馈")
@@ -0,0 +1,83 @@
+import os
+import sys
+
+# 添加项目根目录到Python路径，以便正确导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from context_manager import ContextManager, extractive_summary
+from fsm_driver import FSMDriver
+
+
+def _history(n):
+    return [{"role": "assistant", "name": f"A{i % 3}", "content": f"第{i}轮的发言内容"} for i in range(n)]
+
+
+def test_window_summary_and_pinned_artifacts():
+    """窗口外的消息并入摘要，关键产物固定在最前面，值为None的产物被忽略"""
+    context = ContextManager(window_sizes={"Strategist": 3})
+    history = _history(10)
+
+    messages = context.build("Strategist", history, pinned={"structured_goal": {"goal": "学Python"}, "plan": None})
+
+    assert messages[0]["role"] == "system" and "学Python" in messages[0]["content"]
+    assert "[plan]" not in messages[0]["content"]
+    assert messages[1]["content"].startswith("早前对话摘要:")
+    assert "第6轮" in messages[1]["content"] and "第7轮" not in messages[1]["content"]
+    assert messages[2:] == history[-3:]
+
+
+def test_rolling_summary_is_cached_and_incremental():
+    """历史增长时只对新移出窗口的消息调用摘要函数，相同前缀直接命中缓存"""
+    calls = []
+
+    def summarizer(previous, messages):
+        calls.append(len(messages))
+        return extractive_summary(previous, messages)
+
+    context = ContextManager(default_window=2, summarizer=summarizer)
+    history = _history(8)
+    context.build("Analyst", history[:6])
+    context.build("Researcher", history[:6])
+    context.build("Analyst", history[:7])
+    context.build("Analyst", history)
+
+    assert calls == [4, 1, 1]
+    assert context.stats["summary_hits"] == 1
+
+
+def test_window_shrinks_to_fit_token_budget():
+    """超出token预算时继续缩小窗口，并给出每次调用的token估算"""
+    context = ContextManager(default_window=6, max_tokens=40, summary_max_tokens=10)
+    history = [{"role": "assistant", "name": "A", "content": "很长的内容" * 4} for _ in range(6)]
+
+    plan = context.plan("Analyst", history)
+
+    assert plan.window_size < 6
+    assert plan.summarized == 6 - plan.window_size
+    estimate = plan.to_dict()
+    assert estimate["total"] == estimate["pinned"] + estimate["summary"] + estimate["window"]
+    assert estimate["limit"] == 40
+
+
+def test_driver_sends_prepared_context():
+    """FSMDriver按prepare_messages处理后的消息调用智能体并计算输入token"""
+    seen = []
+
+    class Agent:
+        name = "Analyst"
+
+        def generate_reply(self, messages=None, sender=None):
+            seen.append(messages)
+            return "结果"
+
+    states = iter(["ANALYZING"])
+    driver = FSMDriver(
+        {"Analyst": Agent()},
+        transition=lambda speaker, content: "Analyst" if not seen else "User",
+        get_state=lambda: next(states),
+        prepare_messages=lambda name, messages: [{"role": "system", "content": "摘要"}] + messages[-1:],
+    )
+    result = driver.run("目标", sender=None)
+
+    assert seen == [[{"role": "system", "content": "摘要"}, {"role": "user", "name": "User", "content": "目标"}]]
+    assert result["timings"]["ANALYZING"]["tokens"] == 2 + 2 + 2
@@ -0,0 +1,211 @@
+import os
+import sys
+import time
+
+import pytest
+
+# 添加项目根目录到Python路径，以便正确导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fsm_driver import BudgetExceeded, FSMDriver, estimate_tokens
+
+
+class FakeAgent:
+    """记录调用次数的假智能体"""
+
+    def __init__(self, name, replies):
+        self.name = name
+        self.replies = list(replies)
+        self.calls = 0
+
+    def generate_reply(self, messages=None, sender=None):
+        self.calls += 1
+        return self.replies.pop(0) if self.replies else "done"
+
+
+class FakeMachine:
+    """Analyst -> Researcher -> Strategist -> User 的简化状态机"""
+
+    order = {"User": ("Analyst", "ANALYZING"), "Analyst": ("Researcher", "RESEARCHING"),
+             "Researcher": ("Strategist", "PLANNING"), "Strategist": ("User", "COMPLETED")}
+
+    def __init__(self, stay_in_research=0):
+        self.state = "INIT"
+        self.stay_in_research = stay_in_research
+
+    def transition(self, speaker, content):
+        name = getattr(speaker, "name", "User")
+        if name == "Researcher" and self.stay_in_research > 0:
+            self.stay_in_research -= 1
+            return "Researcher"
+        next_name, self.state = self.order[name]
+        return next_name
+
+
+def _agents():
+    return {name: FakeAgent(name, [f"{name} reply"]) for name in ("Analyst", "Researcher", "Strategist", "Adaptor")}
+
+
+def test_driver_calls_only_designated_agents():
+    """每一步只调用状态机指定的智能体，到达终止发言者时结束"""
+    agents = _agents()
+    machine = FakeMachine()
+    user = FakeAgent("User", [])
+    seen = []
+    driver = FSMDriver(agents, machine.transition, lambda: machine.state,
+                       on_message=lambda state, name, content: seen.append((state, name)))
+
+    result = driver.run("制定学习计划", sender=user)
+
+    assert [m["name"] for m in result["messages"]] == ["User", "Analyst", "Researcher", "Strategist"]
+    assert seen == [("ANALYZING", "Analyst"), ("RESEARCHING", "Researcher"), ("PLANNING", "Strategist")]
+    assert agents["Adaptor"].calls == 0
+    assert set(result["timings"]) == {"ANALYZING", "RESEARCHING", "PLANNING"}
+    assert all(t["rounds"] == 1 and t["tokens"] > 0 and t["seconds"] >= 0 for t in result["timings"].values())
+
+
+def test_round_budget_is_enforced_per_state():
+    """某个状态的轮数超出预算时抛出BudgetExceeded并附带已记录的统计"""
+    machine = FakeMachine(stay_in_research=5)
+    driver = FSMDriver(_agents(), machine.transition, lambda: machine.state,
+                       budgets={"RESEARCHING": {"max_rounds": 2}})
+
+    with pytest.raises(BudgetExceeded) as info:
+        driver.run("目标", sender=FakeAgent("User", []))
+
+    assert info.value.state == "RESEARCHING"
+    assert info.value.kind == "rounds"
+    assert info.value.timings["RESEARCHING"]["rounds"] == 2
+    assert info.value.timings["ANALYZING"]["rounds"] == 1
+
+
+def test_token_budget_counts_prompt_history():
+    """token预算按每轮发送的完整历史加回复计算"""
+    agents = _agents()
+    agents["Analyst"].replies = ["a" * 400]
+    machine = FakeMachine()
+    driver = FSMDriver(agents, machine.transition, lambda: machine.state,
+                       budgets={"RESEARCHING": {"max_tokens": 100}})
+
+    with pytest.raises(BudgetExceeded) as info:
+        driver.run("目标", sender=FakeAgent("User", []))
+
+    assert info.value.state == "RESEARCHING"
+    assert info.value.kind == "tokens"
+    assert info.value.used > 100
+    assert agents["Strategist"].calls == 0
+
+
+def test_estimate_tokens():
+    """中文字符按每字1个token，其余字符按每4个字符1个token"""
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("学习计划") == 4
+    assert estimate_tokens("abcdefgh") == 2
+    assert estimate_tokens("学习 python") == 2 + 2
+
+
+class SlowAgent(FakeAgent):
+    """每次回复耗时固定时间，并记录收到的对话历史"""
+
+    def __init__(self, name, delay):
+        super().__init__(name, [])
+        self.delay = delay
+        self.seen = []
+
+    def generate_reply(self, messages=None, sender=None):
+        self.seen.append([m["content"] for m in messages])
+        time.sleep(self.delay)
+        return super().generate_reply(messages=messages, sender=sender)
+
+
+def test_speculative_downstream_is_reused_when_accepted():
+    """上游运行期间推测执行下游，结果被接受时不再调用下游并节省时间"""
+    agents = _agents()
+    agents["Analyst"] = SlowAgent("Analyst", 0.1)
+    agents["Researcher"] = SlowAgent("Researcher", 0.1)
+    machine = FakeMachine()
+    driver = FSMDriver(agents, machine.transition, lambda: machine.state,
+                       speculate={"Analyst": "Researcher"},
+                       accept_speculation=lambda name, provisional, messages: True)
+
+    start = time.perf_counter()
+    result = driver.run("目标", sender=FakeAgent("User", []))
+    elapsed = time.perf_counter() - start
+
+    assert agents["Researcher"].calls == 1
+    assert agents["Researcher"].seen == [["目标"]]
+    assert result["speculation"]["started"] == 1
+    assert result["speculation"]["reused"] == 1
+    assert result["speculation"]["saved_seconds"] > 0.05
+    assert elapsed < 0.19
+    assert [m["name"] for m in result["messages"]] == ["User", "Analyst", "Researcher", "Strategist"]
+
+
+def test_divergent_speculation_is_discarded():
+    """上游输出与推测输入不一致时丢弃推测结果，用确认后的历史重新调用下游"""
+    agents = _agents()
+    agents["Researcher"] = SlowAgent("Researcher", 0)
+    machine = FakeMachine()
+    checked = []
+
+    def reject(name, provisional, messages):
+        checked.append((name, len(provisional), len(messages)))
+        return False
+
+    driver = FSMDriver(agents, machine.transition, lambda: machine.state,
+                       speculate={"Analyst": "Researcher"}, accept_speculation=reject)
+    result = driver.run("目标", sender=FakeAgent("User", []))
+
+    assert checked == [("Researcher", 1, 2)]
+    assert agents["Researcher"].seen[-1] == ["目标", "Analyst reply"]
+    assert result["speculation"]["discarded"] == 1
+    assert result["speculation"]["reused"] == 0
+
+
+def test_usage_callback_reports_each_call():
+    """每次调用后通过on_usage回调报告状态、发言者、输入/输出token和耗时"""
+    machine = FakeMachine()
+    calls = []
+    driver = FSMDriver(_agents(), machine.transition, lambda: machine.state,
+                       on_usage=lambda *args: calls.append(args))
+
+    result = driver.run("目标", sender=FakeAgent("User", []))
+
+    assert [(state, name) for state, name, *_ in calls] == [
+        ("ANALYZING", "Analyst"), ("RESEARCHING", "Researcher"), ("PLANNING", "Strategist")]
+    assert all(prompt > 0 and completion > 0 and seconds >= 0 for _, _, prompt, completion, seconds in calls)
+    assert sum(p + c for _, _, p, c, _ in calls) == sum(t["tokens"] for t in result["timings"].values())
+
+
+def test_before_call_aborts_run_and_context_reaches_speculation():
+    """before_call抛出异常时不再调用智能体；推测调用能读取调用方的contextvars"""
+    import contextvars
+
+    run_id = contextvars.ContextVar("run_id", default=None)
+    seen = []
+
+    class ContextAgent(FakeAgent):
+        def generate_reply(self, messages=None, sender=None):
+            seen.append((self.name, run_id.get()))
+            return super().generate_reply(messages, sender)
+
+    agents = _agents()
+    agents["Researcher"] = ContextAgent("Researcher", ["Researcher reply"])
+    machine = FakeMachine()
+
+    def before_call(state, name):
+        if name == "Strategist":
+            raise TimeoutError("已超过截止时间")
+
+    driver = FSMDriver(agents, machine.transition, lambda: machine.state,
+                       speculate={"Analyst": "Researcher"},
+                       accept_speculation=lambda name, provisional, messages: True,
+                       before_call=before_call)
+
+    run_id.set("run-1")
+    with pytest.raises(TimeoutError):
+        driver.run("目标", sender=FakeAgent("User", []))
+
+    assert seen == [("Researcher", "run-1")]
+    assert agents["Analyst"].calls == 1
+    assert agents["Strategist"].calls == 0
@@ -0,0 +1,92 @@
+import asyncio
+import os
+import sys
+import time
+
+# 添加项目根目录到Python路径，以便正确导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tools.research_pipeline import ResearchPipeline, expand_queries, format_research, normalize_url
+
+TEST_GOAL = {
+    "domain": "编程",
+    "topic": "Python学习",
+    "timeframe": "3个月",
+    "difficulty": "初级到中级"
+}
+
+
+class StubSearch:
+    """本地搜索桩：每个查询返回固定结果，带有重复的URL"""
+
+    def __init__(self, delay=0.1, fail=(), hang=()):
+        self.delay = delay
+        self.fail = fail
+        self.hang = hang
+        self.queries = []
+
+    async def __call__(self, query):
+        self.queries.append(query)
+        index = len(self.queries)
+        if query in self.hang:
+            await asyncio.sleep(10)
+        await asyncio.sleep(self.delay)
+        if query in self.fail:
+            raise RuntimeError("搜索服务不可用")
+        return [
+            {"title": "费曼技巧", "url": "https://Example.com/feynman/#intro", "snippet": "用简单语言解释"},
+            {"title": f"资源{index}", "url": f"https://example.com/doc-{index}", "snippet": f"片段{index}"},
+        ]
+
+
+def test_expand_queries_uses_goal_fields():
+    """目标被扩展为多个不重复的子查询"""
+    queries = expand_queries(TEST_GOAL)
+    assert len(queries) == 4
+    assert all("Python学习" in query for query in queries)
+    assert expand_queries({"topic": "钢琴"}, ["{topic} 入门", "{topic}  入门"]) == ["钢琴 入门"]
+
+
+def test_searches_and_summaries_run_concurrently_and_dedupe_urls():
+    """搜索和摘要并发执行，相同URL只摘要一次"""
+    search = StubSearch(delay=0.1)
+    summarized = []
+
+    def summarize(url):
+        time.sleep(0.1)
+        summarized.append(url)
+        return f"摘要:{url}"
+
+    pipeline = ResearchPipeline(search=search, summarize=summarize, max_concurrency=8)
+    start = time.perf_counter()
+    research = asyncio.run(pipeline.run(TEST_GOAL))
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.6
+    urls = [item["url"] for item in research["results"]]
+    assert len({normalize_url(url) for url in urls}) == len(urls) == 5
+    assert sorted(summarized) == sorted(urls)
+    report = format_research(research)
+    assert "费曼技巧" in report and "摘要:https://Example.com/feynman/#intro" in report
+
+
+def test_failures_and_timeouts_are_isolated():
+    """单个查询失败或超时不影响其他结果，错误被记录"""
+    queries = ["a", "b", "c"]
+    search = StubSearch(delay=0.01, fail={"b"}, hang={"c"})
+    pipeline = ResearchPipeline(search=search, summarize=lambda url: "ok", search_timeout=0.3, max_documents=1)
+
+    research = asyncio.run(pipeline.run(TEST_GOAL, queries=queries))
+
+    assert {item["query"] for item in research["results"]} == {"a"}
+    assert len(research["summaries"]) == 1
+    assert sorted((error["stage"], error["input"]) for error in research["errors"]) == [("search", "b"), ("search", "c")]
+    assert "2 个检索步骤失败或超时" in format_research(research)
+
+
+def test_plain_text_search_results_are_kept():
+    """返回纯文本的搜索函数也能使用"""
+    pipeline = ResearchPipeline(search=lambda query: f"{query}的结果", summarize=lambda url: "")
+    research = asyncio.run(pipeline.run(TEST_GOAL, queries=["Python 教程"]))
+    assert research["results"][0]["snippet"] == "Python 教程的结果"
+    assert research["summaries"] == {}
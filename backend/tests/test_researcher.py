@@ -1,3 +1,4 @@
+import asyncio
 import pytest
 import sys
 import os
@@ -31,6 +32,18 @@ def test_research_methods():
         assert len(result) > 0
         assert "Python" in result
 
+def test_research_methods_inside_event_loop():
+    """在事件循环中调用同步入口时，研究在helios的后台事件循环中执行"""
+    agent = ResearcherAgent(name="TestResearcher", llm_config=False)
+    
+    async def handler():
+        return agent.research_methods(TEST_GOAL)
+    
+    with patch.object(agent, 'web_search', return_value="Python学习方法包括项目驱动学习和交互式教程"):
+        result = asyncio.run(handler())
+    
+    assert "项目驱动学习" in result
+
 def test_generate_report():
     """测试生成报告的功能"""
     # 创建代理，不需要实际的LLM配置
@@ -0,0 +1,82 @@
+import os
+import sys
+
+import pytest
+
+# 添加项目根目录到Python路径，以便正确导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tools.planning_tools import create_task_graph
+from tools.task_graph import CycleError, TaskGraph
+
+PLAN = [
+    {"id": "task_1", "description": "研究Python基础知识", "depends_on": [], "duration": 3},
+    {"id": "task_2", "description": "完成第一章项目", "depends_on": ["task_1"], "duration": 2},
+    {"id": "task_3", "description": "学习数据分析库", "depends_on": ["task_1"], "duration": 5},
+    {"id": "task_4", "description": "完成实际数据集分析", "depends_on": ["task_2", "task_3"], "duration": 4},
+]
+
+
+def test_create_task_graph_returns_execution_order_and_schedule():
+    """依赖排在前面，并给出最早开始时间和关键路径"""
+    graph = create_task_graph(PLAN)
+    order = graph["topological_order"]
+    assert graph["is_valid"]
+    assert graph["adjacency_list"]["task_4"] == ["task_2", "task_3"]
+    assert order.index("task_1") < order.index("task_2") < order.index("task_4")
+    assert order.index("task_3") < order.index("task_4")
+    assert graph["earliest_start"] == {"task_1": 0, "task_2": 3, "task_3": 3, "task_4": 8}
+    assert graph["critical_path"] == ["task_1", "task_3", "task_4"]
+    assert graph["total_duration"] == 12
+
+
+def test_cycle_is_reported():
+    """循环依赖报告构成循环的任务"""
+    tasks = [
+        {"id": "a", "depends_on": ["c"]},
+        {"id": "b", "depends_on": ["a"]},
+        {"id": "c", "depends_on": ["b"]},
+        {"id": "d", "depends_on": []},
+    ]
+    with pytest.raises(ValueError) as excinfo:
+        create_task_graph(tasks)
+    cycle = excinfo.value.cycle
+    assert cycle[0] == cycle[-1]
+    assert sorted(cycle[:-1]) == ["a", "b", "c"]
+
+
+def test_long_chains_do_not_hit_recursion_limit():
+    """数万个节点的依赖链不会超过递归深度限制"""
+    size = sys.getrecursionlimit() * 20
+    tasks = [{"id": i, "depends_on": [i - 1] if i else []} for i in range(size)]
+    graph = TaskGraph.from_tasks(tasks)
+    assert graph.topological_order()[:3] == [0, 1, 2]
+    path, total = graph.critical_path()
+    assert len(path) == size and total == size
+
+    tasks[0]["depends_on"] = [size - 1]
+    with pytest.raises(CycleError) as excinfo:
+        TaskGraph.from_tasks(tasks)
+    assert len(excinfo.value.cycle) == size + 1
+
+
+def test_incremental_edits_check_cycles_and_keep_graph_consistent():
+    """增量增删依赖时检查循环，被拒绝的修改不改变图"""
+    graph = TaskGraph.from_tasks(PLAN)
+    with pytest.raises(CycleError) as excinfo:
+        graph.add_dependency("task_1", "task_4")
+    assert excinfo.value.cycle == ["task_1", "task_4", "task_2", "task_1"]
+    assert graph.dependencies("task_1") == []
+
+    graph.add_dependency("task_5", "task_4")
+    graph.add_task("task_0", duration=1)
+    graph.add_dependency("task_1", "task_0")
+    order = graph.topological_order()
+    assert order.index("task_0") < order.index("task_1") < order.index("task_5")
+    assert graph.earliest_start()["task_5"] == 13
+
+    graph.remove_dependency("task_4", "task_3")
+    graph.remove_task("task_2")
+    assert graph.dependencies("task_4") == []
+    assert "task_2" not in graph.topological_order()
+    assert graph.critical_path() == (["task_0", "task_1", "task_3"], 9)
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import sys
+import time
+
+# 添加项目根目录到Python路径，以便正确导入模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tools.tool_cache import FRESH, ToolCache, cached_tool, normalize_query, normalize_url
+
+
+def test_decorator_caches_by_normalized_key(tmp_path):
+    """规范化后相同的查询只调用一次工具"""
+    cache = ToolCache(path=str(tmp_path / "tools.db"))
+    calls = []
+
+    @cached_tool(ttl=60, key=normalize_query, cache=cache)
+    def search(query):
+        calls.append(query)
+        return [{"url": "https://example.com/feynman", "query": query}]
+
+    first = search("费曼技巧  学习法")
+    second = search("费曼技巧 学习法")
+    third = search("ＦＥＹＮＭＡＮ")
+    fourth = search("feynman")
+
+    assert calls == ["费曼技巧  学习法", "ＦＥＹＮＭＡＮ"]
+    assert first == second and third == fourth
+    assert search.cache_key("A  b") == search.cache_key("a b")
+    assert normalize_url("HTTPS://Example.com/a/#x") == "https://example.com/a"
+
+
+def test_l2_survives_process_restart_and_evicts_lru(tmp_path):
+    """L2中的条目在新的缓存实例中仍可命中，超过上限时淘汰最久未访问的条目"""
+    path = str(tmp_path / "tools.db")
+    cache = ToolCache(path=path, l1_size=1, l2_size=2)
+    cache.set("a", {"v": 1}, ttl=60)
+    cache.set("b", {"v": 2}, ttl=60)
+    assert cache.get("a") == ({"v": 1}, FRESH)
+    assert cache.stats["l2_hits"] == 1
+    cache.set("c", {"v": 3}, ttl=60)
+    cache.close()
+
+    reopened = ToolCache(path=path)
+    assert reopened.get("a") == ({"v": 1}, FRESH)
+    assert reopened.get("b") == (None, None)
+    assert reopened.get("c") == ({"v": 3}, FRESH)
+
+
+def test_ttl_and_stale_while_revalidate():
+    """过期后在stale窗口内返回旧值并在后台刷新，超出窗口后重新计算"""
+    cache = ToolCache()
+    version = {"n": 0}
+
+    @cached_tool(ttl=0.05, stale_ttl=0.2, cache=cache)
+    def summarize(url):
+        version["n"] += 1
+        return f"v{version['n']}"
+
+    assert summarize("u") == "v1"
+    time.sleep(0.08)
+    assert summarize("u") == "v1"
+    deadline = time.time() + 1
+    while version["n"] < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert cache.get(summarize.cache_key("u")) == ("v2", FRESH)
+
+    time.sleep(0.3)
+    assert cache.get(summarize.cache_key("u")) == (None, None)
+    assert summarize("u") == "v3"
+
+
+def test_async_tools_refresh_in_background():
+    """协程工具同样支持缓存和后台刷新，刷新期间不重复发起调用"""
+    cache = ToolCache()
+    calls = []
+
+    @cached_tool(ttl=0.2, stale_ttl=5, cache=cache)
+    async def search(query):
+        calls.append(query)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def run():
+        assert await search("q") == 1
+        await asyncio.sleep(0.25)
+        stale = await asyncio.gather(search("q"), search("q"), search("q"))
+        await asyncio.sleep(0.1)
+        return stale, await search("q")
+
+    stale, fresh = asyncio.run(run())
+    assert stale == [1, 1, 1]
+    assert fresh == 2
+    assert len(calls) == 2
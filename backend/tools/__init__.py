@@ -1,13 +1,23 @@
 # Import tools for easier access
 from .user_interaction_tools import ask_user_clarification
 from .research_tools import web_search, summarize_document
+from .tool_cache import ToolCache, cached_tool
+from .research_pipeline import ResearchPipeline, expand_queries, format_research
 from .planning_tools import create_task_graph
+from .task_graph import TaskGraph, CycleError
 from .feedback_tools import interpret_feedback
 
 __all__ = [
     'ask_user_clarification', 
     'web_search', 
     'summarize_document', 
+    'ResearchPipeline',
+    'expand_queries',
+    'format_research',
+    'ToolCache',
+    'cached_tool',
     'create_task_graph',
+    'TaskGraph',
+    'CycleError',
     'interpret_feedback'
 ] 
\ No newline at end of file
@@ -0,0 +1,197 @@
+import asyncio
+import inspect
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+from .research_tools import web_search, summarize_document
+from .tool_cache import normalize_url
+
+try:
+    from helios.services.resilience import guard
+except ImportError:
+    guard = None
+
+SearchFn = Callable[[str], Union[List[dict], str, Awaitable[Union[List[dict], str]]]]
+SummarizeFn = Callable[[str], Union[str, Awaitable[str]]]
+
+# 把学习目标扩展为多个子查询的模板
+QUERY_TEMPLATES = [
+    "实现 {topic} 学习的最佳方法",
+    "{topic} 学习路线 {timeframe}",
+    "{topic} 推荐学习资源",
+    "{topic} {difficulty} 常见难点与练习",
+]
+
+
+def expand_queries(goal: dict, templates: Optional[List[str]] = None) -> List[str]:
+    """
+    把学习目标扩展为一组子查询，去除重复的查询。
+
+    Args:
+        goal: 包含'topic'，可选'timeframe'、'difficulty'的学习目标字典
+        templates: 查询模板列表，默认使用QUERY_TEMPLATES
+
+    Returns:
+        list[str]: 子查询列表
+    """
+    fields = {
+        "topic": goal.get("topic", ""),
+        "timeframe": goal.get("timeframe", ""),
+        "difficulty": goal.get("difficulty", ""),
+    }
+    queries = []
+    for template in templates or QUERY_TEMPLATES:
+        query = " ".join(template.format(**fields).split())
+        if query and query not in queries:
+            queries.append(query)
+    return queries
+
+
+class ResearchPipeline:
+    """
+    并行研究流水线：扩展子查询 -> 并发搜索 -> URL去重 -> 并发摘要 -> 合并结果。
+
+    搜索和摘要函数可以是普通函数（在线程池中执行）或协程函数，
+    所有调用共用一个并发上限，每个阶段有各自的超时时间。
+    单个查询或文档失败不会影响其他结果，错误记录在结果的'errors'中。
+    """
+
+    def __init__(
+        self,
+        search: SearchFn = web_search,
+        summarize: SummarizeFn = summarize_document,
+        max_concurrency: int = 4,
+        search_timeout: float = 10.0,
+        summarize_timeout: float = 20.0,
+        max_documents: int = 6,
+    ):
+        """
+        Args:
+            search: 搜索函数，返回结果字典列表（'title'、'url'、'snippet'）或纯文本
+            summarize: 摘要函数，接收URL返回摘要文本
+            max_concurrency: 同时进行的搜索/摘要调用数上限
+            search_timeout: 搜索阶段的超时时间（秒）
+            summarize_timeout: 摘要阶段的超时时间（秒）
+            max_documents: 最多摘要的文档数
+        """
+        self.search = search
+        self.summarize = summarize
+        self.max_concurrency = max_concurrency
+        self.search_timeout = search_timeout
+        self.summarize_timeout = summarize_timeout
+        self.max_documents = max_documents
+
+    async def _call(self, semaphore: asyncio.Semaphore, fn: Callable, arg: str) -> Any:
+        async with semaphore:
+            if inspect.iscoroutinefunction(fn) or inspect.iscoroutinefunction(getattr(fn, "__call__", None)):
+                return await fn(arg)
+            result = await asyncio.to_thread(fn, arg)
+            if inspect.isawaitable(result):
+                result = await result
+            return result
+
+    async def _gather(self, semaphore, fn, args, timeout, stage, errors) -> Dict[str, Any]:
+        """
+        在整个阶段的超时时间内并发调用fn，返回成功的结果
+
+        在helios中运行时，所属运行被取消或超过截止时间会立即结束整个阶段并抛出异常。
+        """
+        tasks = {arg: asyncio.create_task(self._call(semaphore, fn, arg)) for arg in args}
+        if not tasks:
+            return {}
+        waiter = asyncio.wait(tasks.values(), timeout=timeout)
+        try:
+            done, pending = await (guard(waiter, f"研究流水线{stage}阶段") if guard else waiter)
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        for task in pending:
+            task.cancel()
+        results = {}
+        for arg, task in tasks.items():
+            if task in pending:
+                errors.append({"stage": stage, "input": arg, "error": f"超时（{timeout}秒）"})
+            elif task.exception() is not None:
+                errors.append({"stage": stage, "input": arg, "error": str(task.exception())})
+            else:
+                results[arg] = task.result()
+        return results
+
+    @staticmethod
+    def _normalize_results(query: str, raw: Union[List[dict], str]) -> List[dict]:
+        if isinstance(raw, str):
+            return [{"title": query, "url": None, "snippet": raw, "query": query}]
+        return [{**item, "query": query} for item in raw or []]
+
+    async def run(self, goal: dict, queries: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        执行研究流水线。
+
+        Args:
+            goal: 学习目标字典
+            queries: 子查询列表，默认由expand_queries生成
+
+        Returns:
+            dict: 包含'queries'、'results'（按URL去重后的搜索结果）、
+                  'summaries'（URL到摘要的映射）、'errors'和'timings'（各阶段耗时，秒）
+        """
+        queries = queries or expand_queries(goal)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        errors: List[dict] = []
+        timings: Dict[str, float] = {}
+
+        start = time.perf_counter()
+        raw = await self._gather(semaphore, self.search, queries, self.search_timeout, "search", errors)
+        timings["search"] = time.perf_counter() - start
+
+        # 按查询顺序合并结果，相同URL只保留第一次出现
+        results, seen = [], set()
+        for query in queries:
+            if query not in raw:
+                continue
+            for item in self._normalize_results(query, raw[query]):
+                url = item.get("url")
+                if url:
+                    key = normalize_url(url)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                results.append(item)
+
+        urls = [item["url"] for item in results if item.get("url")][:self.max_documents]
+        start = time.perf_counter()
+        summaries = await self._gather(semaphore, self.summarize, urls, self.summarize_timeout, "summarize", errors)
+        timings["summarize"] = time.perf_counter() - start
+
+        return {
+            "queries": queries,
+            "results": results,
+            "summaries": {url: summaries[url] for url in urls if url in summaries},
+            "errors": errors,
+            "timings": timings,
+        }
+
+
+def format_research(research: Dict[str, Any]) -> str:
+    """
+    把流水线结果合并为可写入报告的研究文本。
+
+    Args:
+        research: ResearchPipeline.run的返回值
+
+    Returns:
+        str: 研究文本
+    """
+    lines = []
+    for item in research["results"]:
+        url = item.get("url")
+        title = item.get("title") or item["query"]
+        lines.append(f"- {title}" + (f" ({url})" if url else ""))
+        if item.get("snippet"):
+            lines.append(f"  {item['snippet']}")
+        if url in research["summaries"]:
+            lines.extend(f"  {line}" for line in research["summaries"][url].strip().splitlines())
+    if research["errors"]:
+        lines.append(f"（{len(research['errors'])} 个检索步骤失败或超时，已跳过）")
+    return "\n".join(lines)
@@ -1,3 +1,7 @@
+from .tool_cache import cached_tool, normalize_query, normalize_url
+
+
+@cached_tool(ttl=86400.0, stale_ttl=6 * 3600.0, key=normalize_query)
 def web_search(query: str) -> list[dict]:
     """
     对给定查询执行网络搜索并返回结果列表。
@@ -29,6 +33,7 @@ def web_search(query: str) -> list[dict]:
         }
     ]
 
+@cached_tool(ttl=7 * 86400.0, stale_ttl=86400.0, key=normalize_url)
 def summarize_document(url: str) -> str:
     """
     从URL获取内容并返回简洁的摘要。
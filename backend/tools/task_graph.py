@@ -0,0 +1,304 @@
+from collections import deque
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+
+class CycleError(ValueError):
+    """
+    任务图中存在循环依赖。
+
+    Attributes:
+        cycle: 构成循环的任务id列表，首尾相同，例如 ['a', 'b', 'a']
+    """
+
+    def __init__(self, cycle: List[Hashable]):
+        self.cycle = cycle
+        super().__init__(f"检测到循环依赖: {' -> '.join(str(task_id) for task_id in cycle)}")
+
+
+class TaskGraph:
+    """
+    基于数组的任务依赖图。
+
+    任务id映射为连续的整数下标，前驱（依赖）和后继分别保存在按下标索引的列表中；
+    所有遍历都是迭代实现，不受Python递归深度限制。
+    支持增量地增删任务和依赖（添加依赖时检查循环），
+    并缓存拓扑序：不破坏现有顺序的修改无需重新排序。
+    """
+
+    def __init__(self):
+        self._index: Dict[Hashable, int] = {}
+        self._ids: List[Hashable] = []
+        self._deps: List[List[int]] = []
+        self._succ: List[List[int]] = []
+        self._duration: List[float] = []
+        self._order: Optional[List[int]] = None
+        self._position: Dict[int, int] = {}
+
+    @classmethod
+    def from_tasks(cls, tasks: Iterable[dict], duration_key: str = "duration") -> "TaskGraph":
+        """
+        从任务字典列表批量构建任务图。
+
+        Args:
+            tasks: 任务字典列表，每个任务包含'id'和可选的'depends_on'、duration_key字段
+            duration_key: 任务工期字段名，缺省时工期为1
+
+        Returns:
+            TaskGraph: 构建好的任务图
+
+        Raises:
+            CycleError: 如果存在循环依赖
+        """
+        graph = cls()
+        tasks = list(tasks)
+        for task in tasks:
+            graph.add_task(task["id"], task.get(duration_key, 1))
+        for task in tasks:
+            node = graph._index[task["id"]]
+            for dep_id in task.get("depends_on", []) or []:
+                dep = graph._node(dep_id)
+                if dep not in graph._deps[node]:
+                    graph._deps[node].append(dep)
+                    graph._succ[dep].append(node)
+        graph._order = None
+        graph.topological_order()
+        return graph
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, task_id: Hashable) -> bool:
+        return task_id in self._index
+
+    def _node(self, task_id: Hashable) -> int:
+        # 被引用但未定义的任务自动加入图中
+        if task_id not in self._index:
+            self.add_task(task_id)
+        return self._index[task_id]
+
+    def add_task(self, task_id: Hashable, duration: float = 1) -> None:
+        """
+        添加任务；已存在时只更新工期。
+
+        Args:
+            task_id: 任务id
+            duration: 任务工期
+        """
+        if task_id in self._index:
+            self._duration[self._index[task_id]] = duration
+            return
+        node = len(self._ids)
+        self._index[task_id] = node
+        self._ids.append(task_id)
+        self._deps.append([])
+        self._succ.append([])
+        self._duration.append(duration)
+        if self._order is not None:
+            self._position[node] = len(self._order)
+            self._order.append(node)
+
+    def remove_task(self, task_id: Hashable) -> None:
+        """
+        删除任务及其所有依赖关系。
+
+        Args:
+            task_id: 任务id
+
+        Raises:
+            KeyError: 如果任务不存在
+        """
+        node = self._index.pop(task_id)
+        for dep in self._deps[node]:
+            self._succ[dep].remove(node)
+        for succ in self._succ[node]:
+            self._deps[succ].remove(node)
+        self._deps[node] = []
+        self._succ[node] = []
+        if self._order is not None:
+            # 删除节点不会破坏其余节点的相对顺序
+            self._order.remove(node)
+            self._position = {n: i for i, n in enumerate(self._order)}
+
+    def add_dependency(self, task_id: Hashable, depends_on: Hashable) -> None:
+        """
+        添加依赖：task_id 依赖 depends_on。不存在的任务会被自动创建。
+
+        Args:
+            task_id: 任务id
+            depends_on: 被依赖的任务id
+
+        Raises:
+            CycleError: 如果添加后会形成循环，此时图保持不变
+        """
+        node, dep = self._node(task_id), self._node(depends_on)
+        if dep in self._deps[node]:
+            return
+        path = self._path(node, dep)
+        if path is not None:
+            # path是node沿后继到dep的链，按依赖方向表示为 node -> dep -> ... -> node
+            raise CycleError([self._ids[node]] + [self._ids[n] for n in reversed(path)])
+        self._deps[node].append(dep)
+        self._succ[dep].append(node)
+        if self._order is not None and self._position[dep] > self._position[node]:
+            self._order = None
+
+    def remove_dependency(self, task_id: Hashable, depends_on: Hashable) -> None:
+        """
+        删除依赖关系；删除依赖不会破坏已缓存的拓扑序。
+
+        Args:
+            task_id: 任务id
+            depends_on: 被依赖的任务id
+        """
+        node, dep = self._index[task_id], self._index[depends_on]
+        if dep in self._deps[node]:
+            self._deps[node].remove(dep)
+            self._succ[dep].remove(node)
+
+    def dependencies(self, task_id: Hashable) -> List[Hashable]:
+        """返回任务直接依赖的任务id列表"""
+        return [self._ids[n] for n in self._deps[self._index[task_id]]]
+
+    def dependents(self, task_id: Hashable) -> List[Hashable]:
+        """返回直接依赖该任务的任务id列表"""
+        return [self._ids[n] for n in self._succ[self._index[task_id]]]
+
+    def _path(self, start: int, target: int) -> Optional[List[int]]:
+        """沿后继方向查找从start到target的路径（广度优先），不存在时返回None"""
+        if start == target:
+            return [start]
+        parent = {start: start}
+        queue = deque([start])
+        while queue:
+            current = queue.popleft()
+            for succ in self._succ[current]:
+                if succ in parent:
+                    continue
+                parent[succ] = current
+                if succ == target:
+                    path = [succ]
+                    while path[-1] != start:
+                        path.append(parent[path[-1]])
+                    return path[::-1]
+                queue.append(succ)
+        return None
+
+    def find_cycle(self) -> Optional[List[Hashable]]:
+        """
+        查找一个循环依赖（迭代深度优先）。
+
+        Returns:
+            list | None: 构成循环的任务id列表（首尾相同，按依赖方向），没有循环时返回None
+        """
+        state = [0] * len(self._ids)  # 0 未访问, 1 在栈上, 2 已完成
+        for root in self._index.values():
+            if state[root]:
+                continue
+            stack: List[Tuple[int, int]] = [(root, 0)]
+            path = [root]
+            state[root] = 1
+            while stack:
+                node, edge = stack[-1]
+                if edge < len(self._deps[node]):
+                    stack[-1] = (node, edge + 1)
+                    dep = self._deps[node][edge]
+                    if state[dep] == 1:
+                        cycle = path[path.index(dep):] + [dep]
+                        return [self._ids[n] for n in cycle]
+                    if state[dep] == 0:
+                        state[dep] = 1
+                        stack.append((dep, 0))
+                        path.append(dep)
+                else:
+                    state[node] = 2
+                    stack.pop()
+                    path.pop()
+        return None
+
+    def topological_order(self) -> List[Hashable]:
+        """
+        返回任务的执行顺序：每个任务都排在它依赖的任务之后（Kahn算法）。
+
+        Returns:
+            list: 任务id列表
+
+        Raises:
+            CycleError: 如果存在循环依赖
+        """
+        if self._order is None:
+            indegree = [len(deps) for deps in self._deps]
+            queue = deque(n for n in self._index.values() if indegree[n] == 0)
+            order = []
+            while queue:
+                node = queue.popleft()
+                order.append(node)
+                for succ in self._succ[node]:
+                    indegree[succ] -= 1
+                    if indegree[succ] == 0:
+                        queue.append(succ)
+            if len(order) < len(self._index):
+                raise CycleError(self.find_cycle())
+            self._order = order
+            self._position = {n: i for i, n in enumerate(order)}
+        return [self._ids[n] for n in self._order]
+
+    def earliest_start(self) -> Dict[Hashable, float]:
+        """
+        计算每个任务的最早开始时间（所有依赖完成的最晚时间）。
+
+        Returns:
+            dict: 任务id到最早开始时间的映射
+        """
+        self.topological_order()
+        start = [0.0] * len(self._ids)
+        for node in self._order:
+            for dep in self._deps[node]:
+                start[node] = max(start[node], start[dep] + self._duration[dep])
+        return {self._ids[n]: start[n] for n in self._order}
+
+    def critical_path(self) -> Tuple[List[Hashable], float]:
+        """
+        计算关键路径：决定整个计划最短完成时间的任务链。
+
+        Returns:
+            tuple: (关键路径上的任务id列表, 总工期)
+        """
+        self.topological_order()
+        finish = [0.0] * len(self._ids)
+        previous = [-1] * len(self._ids)
+        for node in self._order:
+            start = 0.0
+            for dep in self._deps[node]:
+                if finish[dep] > start:
+                    start, previous[node] = finish[dep], dep
+            finish[node] = start + self._duration[node]
+        if not self._order:
+            return [], 0.0
+        node = max(self._order, key=lambda n: finish[n])
+        total = finish[node]
+        path = []
+        while node != -1:
+            path.append(self._ids[node])
+            node = previous[node]
+        return path[::-1], total
+
+    def adjacency_list(self) -> Dict[Hashable, List[Hashable]]:
+        """返回任务id到其依赖id列表的映射"""
+        return {task_id: [self._ids[n] for n in self._deps[node]] for task_id, node in self._index.items()}
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        返回任务图的摘要：邻接表、拓扑序、最早开始时间和关键路径。
+
+        Raises:
+            CycleError: 如果存在循环依赖
+        """
+        path, total = self.critical_path()
+        return {
+            "adjacency_list": self.adjacency_list(),
+            "topological_order": self.topological_order(),
+            "earliest_start": self.earliest_start(),
+            "critical_path": path,
+            "total_duration": total,
+            "is_valid": True,
+        }
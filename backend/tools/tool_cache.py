@@ -0,0 +1,335 @@
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+try:
+    from helios.services.resilience import check_cancelled
+except ImportError:
+    check_cancelled = None
+
+logger = logging.getLogger(__name__)
+
+FRESH = "fresh"
+STALE = "stale"
+
+
+def normalize_query(query: str) -> str:
+    """
+    规范化搜索查询用于缓存键：全角转半角、小写、合并连续空白。
+
+    Args:
+        query: 原始查询
+
+    Returns:
+        str: 规范化后的查询
+    """
+    return " ".join(unicodedata.normalize("NFKC", query).lower().split())
+
+
+def normalize_url(url: str) -> str:
+    """
+    规范化URL用于去重和缓存键：协议和主机名小写，去掉片段和末尾的斜杠。
+
+    Args:
+        url: 原始URL
+
+    Returns:
+        str: 规范化后的URL
+    """
+    parts = urlsplit(url.strip())
+    path = parts.path.rstrip("/")
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, parts.query, ""))
+
+
+class ToolCache:
+    """
+    工具调用结果的两级缓存。
+
+    L1为进程内的LRU字典，L2为SQLite文件（多个进程可共享）。
+    每个条目有自己的过期时间；过期后在stale窗口内仍可返回旧值，
+    同时由调用方在后台刷新（stale-while-revalidate）。
+    两级缓存都有条目数上限，超出后淘汰最久未访问的条目。
+    缓存的值需要能被JSON序列化。
+    """
+
+    def __init__(self, path: Optional[str] = None, l1_size: int = 256, l2_size: int = 10000):
+        """
+        Args:
+            path: SQLite文件路径，为None时只使用L1
+            l1_size: L1最大条目数
+            l2_size: L2最大条目数
+        """
+        self.path = path
+        self.l1_size = l1_size
+        self.l2_size = l2_size
+        # 键 -> (值, 过期时间, 可返回旧值的截止时间)
+        self._l1: "OrderedDict[str, Tuple[Any, float, float]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._refreshing = set()
+        self.stats = {"l1_hits": 0, "l2_hits": 0, "stale_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        if self.path is None:
+            return None
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS tool_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, "
+                "stale_until REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_tool_cache_last_access ON tool_cache (last_access)")
+            self._conn.commit()
+        return self._conn
+
+    def _remember(self, key: str, entry: Tuple[Any, float, float]):
+        self._l1[key] = entry
+        self._l1.move_to_end(key)
+        while len(self._l1) > self.l1_size:
+            self._l1.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def get(self, key: str) -> Tuple[Any, Optional[str]]:
+        """
+        查找缓存条目。
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            tuple: (值, 状态)，状态为FRESH、STALE，未命中时为(None, None)
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry is not None and now < entry[2]:
+                self._l1.move_to_end(key)
+                self.stats["l1_hits"] += 1
+            else:
+                self._l1.pop(key, None)
+                entry = None
+                db = self._db()
+                if db is not None:
+                    row = db.execute(
+                        "SELECT value, expires_at, stale_until FROM tool_cache WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row is not None and now < row[2]:
+                        db.execute("UPDATE tool_cache SET last_access = ? WHERE key = ?", (now, key))
+                        db.commit()
+                        entry = (json.loads(row[0]), row[1], row[2])
+                        self._remember(key, entry)
+                        self.stats["l2_hits"] += 1
+            if entry is None:
+                self.stats["misses"] += 1
+                return None, None
+            if now >= entry[1]:
+                self.stats["stale_hits"] += 1
+                return entry[0], STALE
+            return entry[0], FRESH
+
+    def set(self, key: str, value: Any, ttl: float, stale_ttl: float = 0.0):
+        """
+        写入缓存条目。
+
+        Args:
+            key: 缓存键
+            value: 可JSON序列化的值
+            ttl: 存活时间（秒）
+            stale_ttl: 过期后仍可返回旧值的时间（秒）
+        """
+        now = time.time()
+        entry = (value, now + ttl, now + ttl + stale_ttl)
+        with self._lock:
+            self._remember(key, entry)
+            self.stats["stores"] += 1
+            db = self._db()
+            if db is None:
+                return
+            db.execute(
+                "INSERT OR REPLACE INTO tool_cache (key, value, expires_at, stale_until, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), entry[1], entry[2], now),
+            )
+            excess = db.execute("SELECT COUNT(*) FROM tool_cache").fetchone()[0] - self.l2_size
+            if excess > 0:
+                db.execute(
+                    "DELETE FROM tool_cache WHERE key IN "
+                    "(SELECT key FROM tool_cache ORDER BY last_access LIMIT ?)",
+                    (excess,),
+                )
+                self.stats["evictions"] += excess
+            db.commit()
+
+    def begin_refresh(self, key: str) -> bool:
+        """标记条目正在后台刷新，已有刷新在进行时返回False"""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def end_refresh(self, key: str):
+        """清除条目的刷新标记"""
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def clear(self):
+        """清空两级缓存"""
+        with self._lock:
+            self._l1.clear()
+            db = self._db()
+            if db is not None:
+                db.execute("DELETE FROM tool_cache")
+                db.commit()
+
+    def close(self):
+        """关闭L2连接"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_default_cache: Optional[ToolCache] = None
+
+
+def get_default_cache() -> ToolCache:
+    """
+    获取进程共享的默认工具缓存。
+
+    通过环境变量配置: TOOL_CACHE_PATH（SQLite文件，设为空字符串则只用L1）、
+    TOOL_CACHE_L1_SIZE、TOOL_CACHE_L2_SIZE。
+    """
+    global _default_cache
+    if _default_cache is None:
+        path = os.getenv("TOOL_CACHE_PATH", "./helios_tool_cache.db")
+        _default_cache = ToolCache(
+            path=path or None,
+            l1_size=int(os.getenv("TOOL_CACHE_L1_SIZE", "256")),
+            l2_size=int(os.getenv("TOOL_CACHE_L2_SIZE", "10000")),
+        )
+    return _default_cache
+
+
+def _check_run(namespace: str):
+    """
+    在helios中运行时，执行工具前检查所属运行是否已被取消或超过截止时间
+
+    Raises:
+        OperationCancelled: 如果运行已被取消
+        DeadlineExceeded: 如果截止时间已过
+    """
+    if check_cancelled is not None:
+        check_cancelled(f"工具 {namespace}")
+
+
+def cached_tool(
+    ttl: float = 86400.0,
+    stale_ttl: float = 3600.0,
+    key: Optional[Callable[..., Any]] = None,
+    cache: Optional[ToolCache] = None,
+):
+    """
+    为工具函数启用结果缓存的装饰器，同时支持普通函数和协程函数。
+
+    缓存键为函数全名加上key(*args, **kwargs)的结果（默认为全部参数）的SHA-256。
+    命中过期但仍在stale窗口内的条目时直接返回旧值，并在后台刷新
+    （协程函数使用任务，普通函数使用守护线程）。
+    设置环境变量TOOL_CACHE_ENABLED=false可全局关闭缓存。
+    缓存未命中、需要真正执行工具前，会检查所属运行的取消信号和截止时间。
+
+    Args:
+        ttl: 结果的存活时间（秒）
+        stale_ttl: 过期后仍可返回旧值的时间（秒）
+        key: 从参数计算规范化缓存键的函数，例如normalize_query
+        cache: 使用的ToolCache，默认为get_default_cache()
+
+    Returns:
+        装饰器。被装饰的函数带有cache_key(*args, **kwargs)和uncached属性。
+    """
+    def decorator(fn):
+        namespace = f"{fn.__module__}.{fn.__qualname__}"
+
+        def cache_key(*args, **kwargs) -> str:
+            parts = key(*args, **kwargs) if key else [args, sorted(kwargs.items())]
+            data = json.dumps([namespace, parts], ensure_ascii=False, default=str)
+            return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+        def enabled() -> bool:
+            return os.getenv("TOOL_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if not enabled():
+                    _check_run(namespace)
+                    return await fn(*args, **kwargs)
+                store = cache or get_default_cache()
+                cache_id = cache_key(*args, **kwargs)
+                value, state = store.get(cache_id)
+                if state == FRESH:
+                    return value
+                if state == STALE:
+                    if store.begin_refresh(cache_id):
+                        async def refresh():
+                            try:
+                                store.set(cache_id, await fn(*args, **kwargs), ttl, stale_ttl)
+                            except Exception as e:
+                                logger.warning(f"后台刷新 {namespace} 的缓存失败，继续使用旧值: {e}")
+                            finally:
+                                store.end_refresh(cache_id)
+                        asyncio.get_running_loop().create_task(refresh())
+                    return value
+                _check_run(namespace)
+                result = await fn(*args, **kwargs)
+                store.set(cache_id, result, ttl, stale_ttl)
+                return result
+
+            wrapper = async_wrapper
+        else:
+            @functools.wraps(fn)
+            def sync_wrapper(*args, **kwargs):
+                if not enabled():
+                    _check_run(namespace)
+                    return fn(*args, **kwargs)
+                store = cache or get_default_cache()
+                cache_id = cache_key(*args, **kwargs)
+                value, state = store.get(cache_id)
+                if state == FRESH:
+                    return value
+                if state == STALE:
+                    if store.begin_refresh(cache_id):
+                        def refresh():
+                            try:
+                                store.set(cache_id, fn(*args, **kwargs), ttl, stale_ttl)
+                            except Exception as e:
+                                logger.warning(f"后台刷新 {namespace} 的缓存失败，继续使用旧值: {e}")
+                            finally:
+                                store.end_refresh(cache_id)
+                        threading.Thread(target=refresh, daemon=True).start()
+                    return value
+                _check_run(namespace)
+                result = fn(*args, **kwargs)
+                store.set(cache_id, result, ttl, stale_ttl)
+                return result
+
+            wrapper = sync_wrapper
+
+        wrapper.cache_key = cache_key
+        wrapper.uncached = fn
+        return wrapper
+
+    return decorator
@@ -5,6 +5,6 @@
 提供数据库连接和会话管理功能
 """
 
-from .models import Base, User, Task, ConversationMessage
+from .models import Base, User, Task, ConversationMessage, PlanJob
 
-__all__ = ["Base", "User", "Task", "ConversationMessage"] 
\ No newline at end of file
+__all__ = ["Base", "User", "Task", "ConversationMessage", "PlanJob"] 
\ No newline at end of file
@@ -2,12 +2,14 @@
 
 from typing import Generator
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends
 
-from helios.database.session import get_db
+from helios.database.session import get_db, get_async_db
 from helios.repositories.user_repository import UserRepository
-from helios.repositories.task_repository import TaskRepository
-from helios.repositories.conversation_repository import ConversationRepository
+from helios.repositories.task_repository import TaskRepository, AsyncTaskRepository
+from helios.repositories.conversation_repository import ConversationRepository, AsyncConversationRepository
+from helios.repositories.job_repository import JobRepository
 
 def get_user_repository(db: Session = Depends(get_db)) -> UserRepository:
     """
@@ -43,4 +45,40 @@ def get_conversation_repository(db: Session = Depends(get_db)) -> ConversationRe
     返回:
         ConversationRepository实例
     """
-    return ConversationRepository(db) 
\ No newline at end of file
+    return ConversationRepository(db)
+
+def get_job_repository(db: Session = Depends(get_db)) -> JobRepository:
+    """
+    获取PlanJob实体的仓储实例
+    
+    参数:
+        db: SQLAlchemy会话对象
+        
+    返回:
+        JobRepository实例
+    """
+    return JobRepository(db)
+
+def get_async_task_repository(db: AsyncSession = Depends(get_async_db)) -> AsyncTaskRepository:
+    """
+    获取Task实体的异步仓储实例
+    
+    参数:
+        db: SQLAlchemy异步会话对象
+        
+    返回:
+        AsyncTaskRepository实例
+    """
+    return AsyncTaskRepository(db)
+
+def get_async_conversation_repository(db: AsyncSession = Depends(get_async_db)) -> AsyncConversationRepository:
+    """
+    获取ConversationMessage实体的异步仓储实例
+    
+    参数:
+        db: SQLAlchemy异步会话对象
+        
+    返回:
+        AsyncConversationRepository实例
+    """
+    return AsyncConversationRepository(db)
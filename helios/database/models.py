@@ -2,7 +2,7 @@
 
 from datetime import datetime
 import uuid
-from sqlalchemy import Column, String, Integer, ForeignKey, DateTime, JSON, Text
+from sqlalchemy import Column, String, Integer, ForeignKey, DateTime, JSON, Text, Index, Boolean
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID
 
@@ -30,12 +30,23 @@ class Task(Base):
     priority = Column(Integer, default=10)
     result = Column(JSON, nullable=True)
     user_id = Column(Integer, ForeignKey("users.id"))
+    provider = Column(String(50), nullable=True)  # 执行该任务所用的模型提供商，用于按提供商限制并发
+    worker_id = Column(String(100), nullable=True)  # 领取该任务的调度器工作线程
+    started_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # 关系
     user = relationship("User", back_populates="tasks")
     messages = relationship("ConversationMessage", back_populates="task")
+    
+    __table_args__ = (
+        Index("ix_tasks_status_priority_created_at", "status", "priority", "created_at"),
+        # 键集分页按 (created_at, id) 排序
+        Index("ix_tasks_created_at_id", "created_at", "id"),
+        Index("ix_tasks_user_id_created_at_id", "user_id", "created_at", "id"),
+        Index("ix_tasks_status_created_at_id", "status", "created_at", "id"),
+    )
 
 class ConversationMessage(Base):
     __tablename__ = "conversation_messages"
@@ -48,4 +59,32 @@ class ConversationMessage(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # 关系
-    task = relationship("Task", back_populates="messages") 
\ No newline at end of file
+    task = relationship("Task", back_populates="messages")
+    
+    __table_args__ = (
+        # 同一任务内的序号唯一，并发追加时冲突的一方会重试
+        Index("uq_conversation_messages_task_id_sequence_order", "task_id", "sequence_order", unique=True),
+    )
+
+class PlanJob(Base):
+    __tablename__ = "plan_jobs"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    job_type = Column(String(50), nullable=False)  # plan_generation, feedback_submission
+    session_id = Column(String(100), index=True)  # 规划会话标识，同一会话的任务按顺序执行
+    payload = Column(JSON, nullable=True)
+    status = Column(String(20), default="QUEUED")  # QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    checkpoint = Column(JSON, nullable=True)  # 规划运行在每次状态转换后的检查点，重试和恢复时从这里继续
+    cancel_requested = Column(Boolean, default=False)  # 运行中的任务被请求取消，工作进程在心跳时发现并中止
+    worker_id = Column(String(100), nullable=True)
+    visible_at = Column(DateTime, default=datetime.utcnow)  # 早于此时间的任务才可被领取（可见性超时）
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_plan_jobs_status_visible_at", "status", "visible_at"),
+    )
@@ -0,0 +1,142 @@
+# helios/database/pool.py
+
+"""
+数据库连接池配置与监控
+
+根据配置为同步和异步引擎生成连接池参数，
+并提供带统计功能的连接池：记录当前借出的连接数、等待连接的耗时和超时次数。
+"""
+
+import threading
+import time
+from typing import Any, Dict
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+class PoolMetrics:
+    """
+    连接池的运行统计（线程安全）
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record_checkout(self, wait: float):
+        """记录一次成功借出连接及其等待时间（秒）"""
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def record_timeout(self):
+        """记录一次等待连接超时"""
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回统计快照，等待时间单位为毫秒"""
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "wait_max_ms": round(self.max_wait * 1000, 3),
+            }
+
+class _InstrumentedPoolMixin:
+    """在借出连接时计时的连接池混入类"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record_checkout(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        # dispose()会重建连接池，保留原有统计
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    """带统计功能的同步连接池"""
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    """带统计功能的异步连接池"""
+
+def is_memory_sqlite(url: str) -> bool:
+    """是否为内存SQLite数据库（使用单连接池，不适用连接池参数）"""
+    return url.startswith("sqlite") and (url.split("://", 1)[-1] in ("", "/") or ":memory:" in url)
+
+def to_async_url(url: str) -> str:
+    """
+    把同步数据库URL转换为对应的异步驱动URL
+
+    postgresql:// 使用asyncpg，sqlite:// 使用aiosqlite；已指定驱动的URL会替换为异步驱动。
+    """
+    scheme, _, rest = url.partition("://")
+    dialect = scheme.split("+", 1)[0]
+    drivers = {"postgresql": "asyncpg", "postgres": "asyncpg", "sqlite": "aiosqlite"}
+    if dialect not in drivers:
+        return url
+    return f"{'postgresql' if dialect == 'postgres' else dialect}+{drivers[dialect]}://{rest}"
+
+def engine_options(url: str, settings, asynchronous: bool = False) -> Dict[str, Any]:
+    """
+    生成create_engine / create_async_engine的连接池参数
+
+    参数:
+        url: 数据库URL
+        settings: 配置对象，提供DB_POOL_*参数
+        asynchronous: 是否为异步引擎
+
+    返回:
+        关键字参数字典
+    """
+    options: Dict[str, Any] = {"pool_pre_ping": settings.DB_POOL_PRE_PING}
+    if is_memory_sqlite(url):
+        return options
+    options.update(
+        poolclass=InstrumentedAsyncQueuePool if asynchronous else InstrumentedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+    )
+    return options
+
+def pool_stats(pool) -> Dict[str, Any]:
+    """
+    返回连接池的当前状态和统计
+
+    参数:
+        pool: SQLAlchemy连接池对象
+
+    返回:
+        包含连接池大小、借出数量、溢出数量和等待统计的字典
+    """
+    stats: Dict[str, Any] = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=pool.overflow(),
+        )
+    metrics = getattr(pool, "metrics", None)
+    if metrics is not None:
+        stats.update(metrics.snapshot())
+    return stats
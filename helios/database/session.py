@@ -6,14 +6,17 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 
+from helios.config import settings
+from helios.database.pool import engine_options, pool_stats, to_async_url
+
 # 加载环境变量
 load_dotenv()
 
 # 获取数据库URL，如果环境变量不存在，使用默认的SQLite数据库
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./helios.db")
 
-# 创建数据库引擎
-engine = create_engine(DATABASE_URL)
+# 创建数据库引擎，连接池参数来自DB_POOL_*配置
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL, settings))
 
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -27,4 +30,51 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+# --- 异步引擎 ---
+# 首次使用时才创建，未安装异步驱动（asyncpg / aiosqlite）时不影响同步路径
+_async_engine = None
+_async_session_factory = None
+
+def get_async_engine():
+    """获取异步数据库引擎"""
+    global _async_engine
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        url = settings.DATABASE_ASYNC_URL or to_async_url(DATABASE_URL)
+        _async_engine = create_async_engine(url, **engine_options(url, settings, asynchronous=True))
+    return _async_engine
+
+def AsyncSessionLocal():
+    """创建一个异步数据库会话"""
+    global _async_session_factory
+    if _async_session_factory is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        # 提交后不使对象过期，避免在异步上下文中隐式触发查询
+        _async_session_factory = async_sessionmaker(
+            bind=get_async_engine(), autoflush=False, expire_on_commit=False
+        )
+    return _async_session_factory()
+
+# 依赖函数，用于获取异步数据库会话
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def dispose_async_engine():
+    """关闭异步引擎的连接池（如果已创建）"""
+    global _async_engine, _async_session_factory
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+        _async_session_factory = None
+
+def get_pool_stats():
+    """获取同步和异步引擎的连接池统计"""
+    return {
+        "sync": pool_stats(engine.pool),
+        "async": pool_stats(_async_engine.sync_engine.pool) if _async_engine is not None else None,
+    }
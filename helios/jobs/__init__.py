@@ -0,0 +1,13 @@
+# helios/jobs/__init__.py
+
+"""
+后台任务模块
+提供基于数据库的持久化任务队列处理函数、独立的工作进程入口、任务调度器和智能体团队会话池
+"""
+
+from .handlers import JOB_HANDLERS, register_handler
+from .worker import JobWorker
+from .scheduler import TaskScheduler
+from .team_pool import PoolExhausted, TeamPool
+
+__all__ = ["JOB_HANDLERS", "register_handler", "JobWorker", "TaskScheduler", "TeamPool", "PoolExhausted"]
@@ -0,0 +1,132 @@
+# helios/jobs/handlers.py
+
+"""
+任务处理函数
+
+每个处理函数接收任务的payload字典，返回可JSON序列化的结果字典。
+处理函数抛出的异常会被工作进程捕获，并按任务的重试策略重新排队。
+
+工作进程会在payload中附加以下字段:
+    session_id: 规划会话标识
+    job_id: 任务ID
+    checkpoint: 上一次尝试保存的检查点，没有时为None
+    session_result: 同一会话最近一次成功任务的结果，没有时为None
+    save_checkpoint: 保存新检查点的函数，接收可JSON序列化的字典
+"""
+
+import json
+import os
+import sys
+from typing import Any, Callable, Dict
+
+from helios.services import logger
+from helios.services.autogen_client import HeliosModelClient
+from helios.jobs.team_pool import TeamPool
+
+JobHandler = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+# 任务类型到处理函数的映射
+JOB_HANDLERS: Dict[str, JobHandler] = {}
+
+_team_pool = None
+
+# 任务结果中用于恢复团队会话的阶段输出
+SESSION_ARTIFACTS = ("structured_goal", "research_report", "plan")
+
+# 智能体团队所在的目录；其中的模块使用顶层导入（如 from agents.analyst import ...）
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+
+def register_handler(job_type: str):
+    """注册任务处理函数的装饰器"""
+    def decorator(func: JobHandler) -> JobHandler:
+        JOB_HANDLERS[job_type] = func
+        return func
+    return decorator
+
+def _create_agent_team():
+    """
+    创建工作进程共享的智能体团队
+
+    智能体的补全请求通过HeliosModelClient经过共享的MultiModelClient。
+    工作进程中没有人工输入，也不执行代码，用户代理只负责发起对话和注册工具。
+    """
+    if BACKEND_DIR not in sys.path:
+        sys.path.append(BACKEND_DIR)
+    from agent_team import AdaptivePlanTeam, UserProxyAgent
+
+    user_proxy = UserProxyAgent(
+        name="User",
+        human_input_mode="NEVER",
+        max_consecutive_auto_reply=0,
+        system_message="你是最终用户。你的目标将由系统分析，转化为详细计划。",
+        code_execution_config=False
+    )
+    return AdaptivePlanTeam(config_list=[HeliosModelClient.config_entry()], user_proxy=user_proxy)
+
+def get_team_pool() -> TeamPool:
+    """惰性创建工作进程内共享的智能体团队会话池"""
+    global _team_pool
+    if _team_pool is None:
+        _team_pool = TeamPool(_create_agent_team)
+    return _team_pool
+
+def get_agent_team():
+    """返回工作进程内共享的智能体团队实例"""
+    return get_team_pool().team
+
+@register_handler("plan_generation")
+def handle_plan_generation(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """根据用户目标生成计划，有检查点时从最后完成的状态继续"""
+    checkpoint = payload.get("checkpoint")
+    with get_team_pool().session(payload.get("session_id") or "default") as (team, session):
+        if checkpoint:
+            team.restore_session(session, checkpoint)
+            logger.info(f"任务 {payload.get('job_id')} 从检查点状态 {checkpoint.get('state')} 继续")
+        session.on_checkpoint = payload.get("save_checkpoint")
+        try:
+            result = team.run(payload["goal"], session=session, resume=bool(checkpoint))
+        finally:
+            session.on_checkpoint = None
+        if session.state == team.STATES["ERROR"] or result["plan"] is None:
+            raise RuntimeError(f"智能体团队未能生成计划，停在状态: {session.state}")
+
+    logger.info(f"规划会话完成: {payload.get('session_id')}")
+    return {
+        "plan": result["plan"],
+        "structured_goal": result["structured_goal"],
+        "research_report": result["research_report"],
+        "timings": result["timings"],
+        "status": "completed"
+    }
+
+@register_handler("feedback_submission")
+def handle_feedback_submission(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """根据用户反馈调整现有计划"""
+    feedback = payload["text"]
+    details = {key: payload[key] for key in ("ratings", "priority_changes") if payload.get(key)}
+    if details:
+        feedback = f"{feedback}\n{json.dumps(details, ensure_ascii=False)}"
+
+    with get_team_pool().session(payload.get("session_id") or "default") as (team, session):
+        # 会话可能由其他工作进程创建，或已被淘汰、进程已重启，以数据库中的最新结果为准
+        session_result = payload.get("session_result")
+        if session_result:
+            team.restore_session(session, {
+                "state": "COMPLETE",
+                "shared_data": {key: session_result.get(key) for key in SESSION_ARTIFACTS},
+            })
+        if session.shared_data.get("plan") is None:
+            raise RuntimeError(f"会话 {payload.get('session_id')} 还没有可调整的计划")
+        result = team.process_feedback(feedback, session=session)
+        if session.state == team.STATES["ERROR"]:
+            raise RuntimeError(f"智能体团队未能处理反馈，停在状态: {session.state}")
+        artifacts = {key: session.shared_data.get(key) for key in ("structured_goal", "research_report")}
+
+    logger.info(f"反馈处理完成: {payload.get('session_id')}")
+    return {
+        "plan": result["updated_plan"],
+        "original_plan": result["original_plan"],
+        **artifacts,
+        "timings": result["timings"],
+        "status": "updated"
+    }
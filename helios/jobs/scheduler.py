@@ -0,0 +1,134 @@
+# helios/jobs/scheduler.py
+
+"""
+任务调度器
+
+从tasks表中按有效优先级领取PENDING任务并交给处理函数执行。
+多个调度器进程可以同时运行，领取操作是原子的，不会重复执行同一个任务。
+"""
+
+import os
+import socket
+import threading
+import uuid
+from typing import Callable, Dict, Optional
+
+from helios.config import settings
+from helios.database.models import Task
+from helios.database.session import SessionLocal
+from helios.repositories.task_repository import TaskRepository
+from helios.services import logger
+from helios.services.metering import usage_context
+
+TaskHandler = Callable[[Task], Optional[dict]]
+
+class TaskScheduler:
+    """
+    支持优先级老化、按用户公平调度和按提供商限流的任务调度器
+
+    每个工作线程使用独立的数据库会话，循环调用TaskRepository.claim_next领取任务，
+    处理函数的返回值作为任务结果保存，抛出异常时任务标记为FAILED。
+    """
+
+    def __init__(
+        self,
+        handler: TaskHandler,
+        session_factory: Callable = SessionLocal,
+        concurrency: int = settings.SCHEDULER_CONCURRENCY,
+        poll_interval: float = settings.SCHEDULER_POLL_INTERVAL,
+        provider_limits: Optional[Dict[str, int]] = None,
+        aging_interval: float = settings.SCHEDULER_AGING_INTERVAL,
+        fairness_penalty: float = settings.SCHEDULER_FAIRNESS_PENALTY,
+        window: int = settings.SCHEDULER_CANDIDATE_WINDOW,
+        stale_after: Optional[float] = None
+    ):
+        """
+        参数:
+            handler: 执行任务的函数，接收Task对象，返回结果字典
+            session_factory: 创建数据库会话的工厂函数
+            concurrency: 并发工作线程数
+            poll_interval: 没有可执行任务时的轮询间隔（秒）
+            provider_limits: {提供商: 最大并发任务数}，默认使用配置中的SCHEDULER_PROVIDER_LIMITS
+            aging_interval: 有效优先级每提升1所需的等待秒数
+            fairness_penalty: 用户每个运行中任务带来的优先级惩罚
+            window: 每次参与排序的候选任务数量
+            stale_after: 运行超过该秒数的任务视为调度器已崩溃并退回队列，None表示不回收
+        """
+        self.handler = handler
+        self.session_factory = session_factory
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.provider_limits = provider_limits if provider_limits is not None else dict(settings.SCHEDULER_PROVIDER_LIMITS)
+        self.aging_interval = aging_interval
+        self.fairness_penalty = fairness_penalty
+        self.window = window
+        self.stale_after = stale_after
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._stop = threading.Event()
+        self._threads = []
+
+    def run_once(self, thread_name: str = "main") -> bool:
+        """
+        领取并执行一个任务
+
+        返回:
+            如果执行了任务返回True，没有可执行任务时返回False
+        """
+        worker_id = f"{self.worker_id}-{thread_name}"
+        db = self.session_factory()
+        try:
+            task_repo = TaskRepository(db)
+            if self.stale_after is not None:
+                requeued = task_repo.requeue_stale(self.stale_after)
+                if requeued:
+                    logger.warning(f"已将 {requeued} 个超时未完成的任务退回队列")
+
+            task = task_repo.claim_next(
+                worker_id,
+                provider_limits=self.provider_limits,
+                aging_interval=self.aging_interval,
+                fairness_penalty=self.fairness_penalty,
+                window=self.window
+            )
+            if task is None:
+                return False
+
+            logger.info(f"调度器 {worker_id} 领取任务 {task.id} (priority={task.priority}, provider={task.provider})")
+            try:
+                with usage_context(task_id=str(task.id), user_id=task.user_id):
+                    result = self.handler(task)
+            except Exception as e:
+                logger.error(f"任务 {task.id} 执行失败: {str(e)}", exc_info=True)
+                task_repo.finish(task.id, worker_id, "FAILED", {"error": str(e)})
+            else:
+                task_repo.finish(task.id, worker_id, "COMPLETED", result)
+                logger.info(f"任务 {task.id} 执行完成")
+            return True
+        finally:
+            db.close()
+
+    def _loop(self, thread_name: str):
+        while not self._stop.is_set():
+            try:
+                processed = self.run_once(thread_name)
+            except Exception as e:
+                logger.error(f"调度线程 {thread_name} 出错: {str(e)}", exc_info=True)
+                processed = False
+            if not processed:
+                self._stop.wait(self.poll_interval)
+
+    def start(self):
+        """启动所有调度线程"""
+        for index in range(self.concurrency):
+            thread = threading.Thread(target=self._loop, args=(f"s{index}",), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"任务调度器 {self.worker_id} 已启动，并发数: {self.concurrency}")
+
+    def stop(self, timeout: Optional[float] = None):
+        """停止领取新任务，并等待正在执行的任务结束"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        logger.info(f"任务调度器 {self.worker_id} 已停止")
@@ -0,0 +1,168 @@
+# helios/jobs/team_pool.py
+
+"""
+智能体团队会话池
+
+工作进程内只创建一个智能体团队（智能体和LLM配置只构建一次），
+每个规划会话的状态保存在团队创建的独立会话对象中。
+会话池限制同时运行的会话数，超出的会话按先来先服务排队等待；
+同一会话的任务不会并发执行；空闲超过一定时间的会话状态会被释放。
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from helios.config import settings
+from helios.services import logger
+
+
+class PoolExhausted(TimeoutError):
+    """在排队超时时间内没有可用的会话名额"""
+
+
+class TeamPool:
+    """
+    共享一个智能体团队的会话池
+
+    团队需要提供create_session(session_id)方法，返回保存会话状态的对象。
+    使用方式:
+        with pool.session("user-1") as (team, session):
+            team.run(goal, session=session)
+    """
+
+    def __init__(
+        self,
+        team_factory: Callable[[], Any],
+        max_sessions: int = settings.TEAM_POOL_MAX_SESSIONS,
+        admission_timeout: float = settings.TEAM_POOL_ADMISSION_TIMEOUT,
+        idle_ttl: float = settings.TEAM_POOL_IDLE_TTL,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        参数:
+            team_factory: 创建智能体团队的工厂函数，首次使用时调用一次
+            max_sessions: 同时运行的会话数上限
+            admission_timeout: 排队等待的最长时间（秒）
+            idle_ttl: 会话空闲多久（秒）后被释放
+            clock: 时钟函数，便于测试
+        """
+        self.team_factory = team_factory
+        self.max_sessions = max_sessions
+        self.admission_timeout = admission_timeout
+        self.idle_ttl = idle_ttl
+        self.clock = clock
+        self._team = None
+        self._team_lock = threading.Lock()
+        self._condition = threading.Condition()
+        # 会话ID -> (会话对象, 最后使用时间)
+        self._sessions: Dict[str, Tuple[Any, float]] = {}
+        self._active = set()
+        self._waiting: deque = deque()
+        self.stats = {"admitted": 0, "queued": 0, "rejected": 0, "evicted": 0}
+
+    @property
+    def team(self) -> Any:
+        """共享的智能体团队，首次访问时创建"""
+        if self._team is None:
+            with self._team_lock:
+                if self._team is None:
+                    self._team = self.team_factory()
+        return self._team
+
+    def _can_admit(self, ticket: Tuple[object, str]) -> bool:
+        if len(self._active) >= self.max_sessions:
+            return False
+        # 按排队顺序放行：排在前面且可以运行的会话优先；
+        # 前面的会话若因同一会话正在运行而等待，则不阻塞后面的会话
+        for waiting in self._waiting:
+            if waiting is ticket:
+                return ticket[1] not in self._active
+            if waiting[1] not in self._active:
+                return False
+        return False
+
+    def _evict_idle_locked(self) -> int:
+        now = self.clock()
+        expired = [
+            session_id for session_id, (_, last_used) in self._sessions.items()
+            if session_id not in self._active and now - last_used > self.idle_ttl
+        ]
+        for session_id in expired:
+            del self._sessions[session_id]
+        if expired:
+            self.stats["evicted"] += len(expired)
+            logger.info(f"释放了 {len(expired)} 个空闲规划会话")
+        return len(expired)
+
+    def evict_idle(self) -> int:
+        """
+        释放空闲超时的会话
+
+        返回:
+            释放的会话数
+        """
+        with self._condition:
+            return self._evict_idle_locked()
+
+    @contextmanager
+    def session(self, session_id: str, timeout: Optional[float] = None) -> Iterator[Tuple[Any, Any]]:
+        """
+        占用一个会话名额并返回团队和该会话的状态对象
+
+        参数:
+            session_id: 会话ID
+            timeout: 排队等待的最长时间（秒），默认为admission_timeout
+
+        返回:
+            (团队, 会话对象) 的上下文管理器
+
+        异常:
+            PoolExhausted: 排队超时
+        """
+        team = self.team
+        timeout = self.admission_timeout if timeout is None else timeout
+        ticket = (object(), session_id)
+        with self._condition:
+            self._waiting.append(ticket)
+            if not self._can_admit(ticket):
+                self.stats["queued"] += 1
+                deadline = self.clock() + timeout
+                while not self._can_admit(ticket):
+                    remaining = deadline - self.clock()
+                    if remaining <= 0:
+                        self._waiting.remove(ticket)
+                        self.stats["rejected"] += 1
+                        self._condition.notify_all()
+                        raise PoolExhausted(f"会话 {session_id} 等待 {timeout} 秒后仍无可用名额")
+                    self._condition.wait(remaining)
+            self._waiting.remove(ticket)
+            self._active.add(session_id)
+            self.stats["admitted"] += 1
+            self._evict_idle_locked()
+            if session_id in self._sessions:
+                state = self._sessions[session_id][0]
+            else:
+                state = team.create_session(session_id)
+            self._sessions[session_id] = (state, self.clock())
+
+        try:
+            yield team, state
+        finally:
+            with self._condition:
+                self._active.discard(session_id)
+                self._sessions[session_id] = (state, self.clock())
+                self._condition.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回会话池的当前状态"""
+        with self._condition:
+            return {
+                "active": len(self._active),
+                "waiting": len(self._waiting),
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                **self.stats
+            }
@@ -0,0 +1,250 @@
+# helios/jobs/worker.py
+
+"""
+任务队列工作进程
+
+与API进程分开部署，从plan_jobs表中领取任务并执行。
+运行方式:
+    python -m helios.jobs.worker --concurrency 4
+"""
+
+import argparse
+import functools
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+from helios.config import settings
+from helios.database.session import SessionLocal
+from helios.repositories.job_repository import JobRepository
+from helios.services import logger
+from helios.services.metering import usage_context
+from helios.services.resilience import (
+    CancellationToken, DeadlineExceeded, OperationCancelled, cancel_scope, deadline_scope,
+)
+from helios.jobs.handlers import JOB_HANDLERS, JobHandler
+
+class JobWorker:
+    """
+    从持久化队列中并发领取并执行任务的工作进程
+
+    每个工作线程使用独立的数据库会话。任务执行期间，
+    心跳线程会定期延长任务的可见性超时，防止长时间运行的规划被其他进程重复领取，
+    同时检查任务是否被请求取消，发现后通过取消令牌中止正在进行的规划和LLM调用。
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable = SessionLocal,
+        handlers: Optional[Dict[str, JobHandler]] = None,
+        concurrency: int = settings.JOB_WORKER_CONCURRENCY,
+        poll_interval: float = settings.JOB_POLL_INTERVAL,
+        visibility_timeout: float = settings.JOB_VISIBILITY_TIMEOUT,
+        retry_delay: float = settings.JOB_RETRY_DELAY,
+        cancel_poll_interval: float = settings.JOB_CANCEL_POLL_INTERVAL
+    ):
+        """
+        参数:
+            session_factory: 创建数据库会话的工厂函数
+            handlers: 任务类型到处理函数的映射，默认使用已注册的处理函数
+            concurrency: 并发工作线程数
+            poll_interval: 队列为空时的轮询间隔（秒）
+            visibility_timeout: 任务领取后的可见性超时（秒）
+            retry_delay: 失败重试的基础等待时间（秒）
+            cancel_poll_interval: 检查任务是否被请求取消的间隔（秒）
+        """
+        self.session_factory = session_factory
+        self.handlers = handlers if handlers is not None else JOB_HANDLERS
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout
+        self.retry_delay = retry_delay
+        self.cancel_poll_interval = cancel_poll_interval
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._stop = threading.Event()
+        self._threads = []
+
+    def run_once(self, thread_name: str = "main") -> bool:
+        """
+        领取并执行一个任务
+
+        返回:
+            如果执行了任务返回True，队列为空时返回False
+        """
+        worker_id = f"{self.worker_id}-{thread_name}"
+        db = self.session_factory()
+        try:
+            job_repo = JobRepository(db)
+            job = job_repo.claim(worker_id, self.visibility_timeout)
+            if job is None:
+                return False
+
+            logger.info(f"工作进程 {worker_id} 领取任务 {job.id} ({job.job_type}), 第{job.attempts}次尝试")
+            handler = self.handlers.get(job.job_type)
+            if handler is None:
+                job_repo.fail(job.id, worker_id, f"未注册的任务类型: {job.job_type}", self.retry_delay)
+                return True
+
+            # 截止时间由API进程按请求写入payload（墙上时间），过期的任务不再执行
+            deadline_at = (job.payload or {}).get("deadline_at")
+            remaining = deadline_at - time.time() if deadline_at is not None else None
+            if remaining is not None and remaining <= 0:
+                logger.warning(f"任务 {job.id} 已超过截止时间，不再执行")
+                job_repo.fail(job.id, worker_id, "任务已超过截止时间", self.retry_delay, retryable=False)
+                return True
+            if job.cancel_requested:
+                job_repo.mark_cancelled(job.id, worker_id)
+                return True
+
+            token = CancellationToken()
+            heartbeat_stop = threading.Event()
+            heartbeat = threading.Thread(
+                target=self._heartbeat,
+                args=(job.id, worker_id, heartbeat_stop, token),
+                daemon=True
+            )
+            heartbeat.start()
+            try:
+                # 任务执行期间的LLM调用用量都归属到该任务，并受任务截止时间和取消令牌的约束
+                with usage_context(task_id=str(job.id), user_id=(job.payload or {}).get("user_id")), \
+                        deadline_scope(remaining), cancel_scope(token):
+                    result = handler(dict(
+                        job.payload or {},
+                        session_id=job.session_id,
+                        job_id=str(job.id),
+                        checkpoint=job.checkpoint,
+                        session_result=self._session_result(job_repo, job.session_id),
+                        save_checkpoint=functools.partial(self.save_checkpoint, job.id, worker_id)
+                    ))
+            except Exception as e:
+                if token.cancelled or isinstance(e, OperationCancelled):
+                    # 智能体团队可能把取消异常包装成普通的失败，以令牌状态为准
+                    logger.info(f"任务 {job.id} 已取消: {str(e)}")
+                    job_repo.mark_cancelled(job.id, worker_id, str(e))
+                elif isinstance(e, DeadlineExceeded):
+                    logger.warning(f"任务 {job.id} 超过截止时间: {str(e)}")
+                    job_repo.fail(job.id, worker_id, str(e), self.retry_delay, retryable=False)
+                else:
+                    logger.error(f"任务 {job.id} 执行失败: {str(e)}", exc_info=True)
+                    job_repo.fail(job.id, worker_id, str(e), self.retry_delay)
+            else:
+                job_repo.complete(job.id, worker_id, result)
+                logger.info(f"任务 {job.id} 执行完成")
+            finally:
+                heartbeat_stop.set()
+                heartbeat.join()
+            return True
+        finally:
+            db.close()
+
+    @staticmethod
+    def _session_result(job_repo: JobRepository, session_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """会话最近一次成功任务的结果，团队会话不在本进程内存中时由处理函数据此恢复"""
+        if not session_id:
+            return None
+        latest = job_repo.find_latest_result(session_id)
+        return latest.result if latest is not None else None
+
+    def save_checkpoint(self, job_id: uuid.UUID, worker_id: str, checkpoint: Dict[str, Any]) -> bool:
+        """
+        使用独立的数据库会话保存任务检查点
+
+        返回:
+            写入成功返回True，任务已不由该工作进程持有时返回False
+        """
+        db = self.session_factory()
+        try:
+            saved = JobRepository(db).save_checkpoint(job_id, worker_id, checkpoint)
+        finally:
+            db.close()
+        if not saved:
+            logger.warning(f"任务 {job_id} 已不再由 {worker_id} 持有，检查点未保存")
+        return saved
+
+    def _heartbeat(
+        self,
+        job_id: uuid.UUID,
+        worker_id: str,
+        stop: threading.Event,
+        token: Optional[CancellationToken] = None
+    ):
+        """在任务执行期间定期续期可见性超时，并检查任务是否被请求取消"""
+        extend_interval = max(self.visibility_timeout / 3, 0.01)
+        interval = min(extend_interval, self.cancel_poll_interval) if token is not None else extend_interval
+        next_extend = time.monotonic() + extend_interval
+        while not stop.wait(interval):
+            db = self.session_factory()
+            try:
+                job_repo = JobRepository(db)
+                if token is not None and not token.cancelled and job_repo.is_cancel_requested(job_id):
+                    logger.info(f"任务 {job_id} 被请求取消，正在中止")
+                    token.cancel("任务已被取消")
+                if time.monotonic() >= next_extend:
+                    next_extend = time.monotonic() + extend_interval
+                    if not job_repo.extend(job_id, worker_id, self.visibility_timeout):
+                        logger.warning(f"任务 {job_id} 已不再由 {worker_id} 持有")
+                        return
+            except Exception as e:
+                logger.error(f"任务 {job_id} 心跳失败: {str(e)}")
+            finally:
+                db.close()
+
+    def _loop(self, thread_name: str):
+        while not self._stop.is_set():
+            try:
+                processed = self.run_once(thread_name)
+            except Exception as e:
+                logger.error(f"工作线程 {thread_name} 出错: {str(e)}", exc_info=True)
+                processed = False
+            if not processed:
+                self._stop.wait(self.poll_interval)
+
+    def start(self):
+        """启动所有工作线程"""
+        for index in range(self.concurrency):
+            thread = threading.Thread(target=self._loop, args=(f"t{index}",), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"工作进程 {self.worker_id} 已启动，并发数: {self.concurrency}")
+
+    def stop(self, timeout: Optional[float] = None):
+        """停止领取新任务，并等待正在执行的任务结束"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        logger.info(f"工作进程 {self.worker_id} 已停止")
+
+    def run_forever(self):
+        """启动工作线程并阻塞，直到收到SIGINT或SIGTERM"""
+        self.start()
+        signal.signal(signal.SIGTERM, lambda *_: self._stop.set())
+        try:
+            while not self._stop.wait(1):
+                pass
+        except KeyboardInterrupt:
+            pass
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Helios 规划任务工作进程")
+    parser.add_argument("--concurrency", type=int, default=settings.JOB_WORKER_CONCURRENCY, help="并发工作线程数")
+    parser.add_argument("--poll-interval", type=float, default=settings.JOB_POLL_INTERVAL, help="队列为空时的轮询间隔（秒）")
+    parser.add_argument("--visibility-timeout", type=float, default=settings.JOB_VISIBILITY_TIMEOUT, help="任务可见性超时（秒）")
+    args = parser.parse_args()
+
+    from helios.database.migrations import create_tables
+    create_tables()
+
+    JobWorker(
+        concurrency=args.concurrency,
+        poll_interval=args.poll_interval,
+        visibility_timeout=args.visibility_timeout
+    ).run_forever()
+
+if __name__ == "__main__":
+    main()
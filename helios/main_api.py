@@ -7,11 +7,12 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from helios.services import logger
-from helios.routers import tasks, websocket, adaptive_plan
+from helios.config import settings
+from helios.services import logger, model_client
+from helios.routers import tasks, websocket, adaptive_plan, llm, database, usage
 from helios.database.migrations import create_tables
 from helios.repositories.user_repository import UserRepository
-from helios.database.session import SessionLocal
+from helios.database.session import SessionLocal, dispose_async_engine
 from helios.security import get_password_hash
 
 # ----------------- 部署优化部分 -----------------
@@ -57,6 +58,24 @@ def on_startup():
     # 智能体系统初始化由路由模块处理
     logger.info("Helios API服务启动完成")
 
+@app.on_event("startup")
+async def on_startup_pubsub():
+    # 连接WebSocket跨进程广播后端
+    await websocket.start_pubsub()
+    logger.info(f"WebSocket广播后端已启动: {settings.PUBSUB_BACKEND}")
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    # 关闭各LLM提供商的持久连接池
+    await model_client.aclose()
+    logger.info("LLM连接池已关闭")
+    # 写入尚未落盘的用量统计
+    model_client.meter.flush()
+    await dispose_async_engine()
+    # 尽量把已排队的WebSocket消息发送完再关闭广播后端
+    await websocket.flush_connections(timeout=2.0)
+    await websocket.pubsub.close()
+
 # 获取允许的CORS来源
 cors_origins = os.getenv("CORS_ORIGINS", "http://localhost:3000,http://localhost:5173").split(",")
 logger.info(f"配置CORS允许的来源: {cors_origins}")
@@ -68,6 +87,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # 列表接口的分页游标
 )
 
 # 挂载 static 目录，用于提供 CSS, JS 等文件
@@ -77,6 +97,9 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 app.include_router(tasks.router, prefix="/api")
 app.include_router(websocket.router)
 app.include_router(adaptive_plan.router)  # 添加适应性规划路由
+app.include_router(llm.router, prefix="/api")
+app.include_router(database.router, prefix="/api")
+app.include_router(usage.router, prefix="/api")
 
 # 将根路径指向 index.html
 @app.get("/", include_in_schema=False)
@@ -0,0 +1,130 @@
+# helios/repositories/async_base.py
+
+from typing import TypeVar, Generic, Type, List, Optional, Any
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+ModelType = TypeVar("ModelType")
+
+class AsyncBaseRepository(Generic[ModelType]):
+    """
+    BaseRepository的异步版本，基于AsyncSession
+
+    在async def的路由中使用，数据库I/O不会阻塞事件循环。
+
+    泛型参数:
+        ModelType: SQLAlchemy模型类型
+    """
+    def __init__(self, model: Type[ModelType], db: AsyncSession):
+        """
+        初始化仓储
+
+        参数:
+            model: SQLAlchemy模型类
+            db: SQLAlchemy异步会话对象
+        """
+        self.model = model
+        self.db = db
+
+    async def get(self, item_id: Any) -> Optional[ModelType]:
+        """
+        通过ID获取单个实体
+
+        参数:
+            item_id: 实体ID
+
+        返回:
+            找到的实体对象，如果不存在则返回None
+        """
+        return await self.db.get(self.model, item_id)
+
+    async def find(self, **kwargs) -> List[ModelType]:
+        """
+        根据条件查找实体
+
+        参数:
+            **kwargs: 过滤条件，字段名和值的键值对
+
+        返回:
+            符合条件的实体对象列表
+        """
+        result = await self.db.scalars(select(self.model).filter_by(**kwargs))
+        return list(result)
+
+    async def find_one(self, **kwargs) -> Optional[ModelType]:
+        """
+        根据条件查找单个实体
+
+        参数:
+            **kwargs: 过滤条件，字段名和值的键值对
+
+        返回:
+            符合条件的第一个实体对象，如果不存在则返回None
+        """
+        result = await self.db.scalars(select(self.model).filter_by(**kwargs).limit(1))
+        return result.first()
+
+    async def create(self, **kwargs) -> ModelType:
+        """
+        创建新实体
+
+        参数:
+            **kwargs: 实体属性的键值对
+
+        返回:
+            创建的实体对象
+        """
+        item = self.model(**kwargs)
+        self.db.add(item)
+        await self.db.commit()
+        await self.db.refresh(item)
+        return item
+
+    async def update(self, item_id: Any, **kwargs) -> Optional[ModelType]:
+        """
+        更新实体
+
+        参数:
+            item_id: 实体ID
+            **kwargs: 要更新的属性的键值对
+
+        返回:
+            更新后的实体对象，如果实体不存在则返回None
+        """
+        item = await self.get(item_id)
+        if item:
+            for key, value in kwargs.items():
+                setattr(item, key, value)
+            await self.db.commit()
+            await self.db.refresh(item)
+        return item
+
+    async def delete(self, item_id: Any) -> bool:
+        """
+        删除实体
+
+        参数:
+            item_id: 实体ID
+
+        返回:
+            如果删除成功则返回True，否则返回False
+        """
+        item = await self.get(item_id)
+        if item:
+            await self.db.delete(item)
+            await self.db.commit()
+            return True
+        return False
+
+    async def count(self, **kwargs) -> int:
+        """
+        计算符合条件的实体数量
+
+        参数:
+            **kwargs: 过滤条件，字段名和值的键值对
+
+        返回:
+            符合条件的实体数量
+        """
+        statement = select(func.count()).select_from(self.model).filter_by(**kwargs)
+        return (await self.db.execute(statement)).scalar_one()
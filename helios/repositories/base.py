@@ -1,11 +1,44 @@
 # helios/repositories/base.py
 
-from typing import TypeVar, Generic, Type, List, Optional, Any, Dict, Union
+from contextlib import contextmanager
+from typing import TypeVar, Generic, Type, List, Optional, Any, Dict, Iterator, Sequence, Union
 from sqlalchemy.orm import Session
-from sqlalchemy import select, update, delete
+from sqlalchemy import select, update, delete, insert
 
 ModelType = TypeVar("ModelType")
 
+# 记录在Session.info中的工作单元嵌套深度
+UNIT_OF_WORK_DEPTH = "unit_of_work_depth"
+
+@contextmanager
+def unit_of_work(db: Session) -> Iterator[Session]:
+    """
+    把多次仓储调用合并到同一个事务中
+
+    在上下文中，仓储方法只flush而不commit；正常退出最外层上下文时统一提交一次，
+    发生异常时整体回滚。可以嵌套使用，只有最外层负责提交。
+
+    示例:
+        with unit_of_work(db):
+            conv_repo.add_messages(task_id, turns)
+            task_repo.update_status(task_id, "COMPLETED")
+
+    参数:
+        db: SQLAlchemy会话对象
+    """
+    depth = db.info.get(UNIT_OF_WORK_DEPTH, 0)
+    db.info[UNIT_OF_WORK_DEPTH] = depth + 1
+    try:
+        yield db
+        if depth == 0:
+            db.commit()
+    except Exception:
+        if depth == 0:
+            db.rollback()
+        raise
+    finally:
+        db.info[UNIT_OF_WORK_DEPTH] = depth
+
 class BaseRepository(Generic[ModelType]):
     """
     提供通用CRUD操作的基础仓储类
@@ -24,6 +57,29 @@ class BaseRepository(Generic[ModelType]):
         self.model = model
         self.db = db
 
+    @property
+    def in_unit_of_work(self) -> bool:
+        """当前会话是否处于unit_of_work上下文中"""
+        return self.db.info.get(UNIT_OF_WORK_DEPTH, 0) > 0
+
+    def _commit(self, *fresh: Any):
+        """
+        提交当前事务；处于工作单元中时只flush，由工作单元统一提交
+
+        参数:
+            *fresh: 已通过RETURNING完整加载的新对象。提交时不让它们过期（避免访问属性时再逐个查询），
+                    提交后仍留在会话中，调用方可以继续访问属性和延迟加载关系
+        """
+        if self.in_unit_of_work:
+            self.db.flush()
+            return
+        # 提交会让会话中的所有对象过期；先移出新对象，提交后再放回，不发出SQL
+        for item in fresh:
+            self.db.expunge(item)
+        self.db.commit()
+        for item in fresh:
+            self.db.add(item)
+
     def get(self, item_id: Any) -> Optional[ModelType]:
         """
         通过ID获取单个实体
@@ -81,7 +137,7 @@ class BaseRepository(Generic[ModelType]):
         """
         item = self.model(**kwargs)
         self.db.add(item)
-        self.db.commit()
+        self._commit()
         self.db.refresh(item)
         return item
     
@@ -100,7 +156,7 @@ class BaseRepository(Generic[ModelType]):
         if item:
             for key, value in kwargs.items():
                 setattr(item, key, value)
-            self.db.commit()
+            self._commit()
             self.db.refresh(item)
         return item
     
@@ -117,7 +173,7 @@ class BaseRepository(Generic[ModelType]):
         item = self.get(item_id)
         if item:
             self.db.delete(item)
-            self.db.commit()
+            self._commit()
             return True
         return False
     
@@ -131,4 +187,77 @@ class BaseRepository(Generic[ModelType]):
         返回:
             符合条件的实体数量
         """
-        return self.db.query(self.model).filter_by(**kwargs).count() 
\ No newline at end of file
+        return self.db.query(self.model).filter_by(**kwargs).count()
+
+    def bulk_create(self, items: Sequence[Dict[str, Any]]) -> List[ModelType]:
+        """
+        批量创建实体，使用一条多行 INSERT ... RETURNING 语句
+
+        参数:
+            items: 每个实体属性的键值对列表
+
+        返回:
+            创建的实体对象列表，与items顺序一致；对象已完整加载并留在会话中，提交后不会过期
+        """
+        if not items:
+            return []
+        created = list(self.db.scalars(
+            insert(self.model).returning(self.model, sort_by_parameter_order=True),
+            [dict(item) for item in items]
+        ))
+        self._commit(*created)
+        return created
+
+    def bulk_update(self, items: Sequence[Dict[str, Any]]) -> int:
+        """
+        按主键批量更新实体，使用executemany执行 UPDATE ... WHERE id = ?
+
+        参数:
+            items: 每项必须包含主键字段，其余键值对为要更新的属性
+
+        返回:
+            更新的实体数量
+        """
+        if not items:
+            return 0
+        self.db.execute(update(self.model), [dict(item) for item in items])
+        if self.in_unit_of_work:
+            # 按主键的批量更新不会同步会话中已加载的对象
+            self.db.expire_all()
+        self._commit()
+        return len(items)
+
+    def update_where(self, values: Dict[str, Any], **kwargs) -> int:
+        """
+        用一条 UPDATE ... WHERE 语句更新所有符合条件的实体
+
+        参数:
+            values: 要更新的属性的键值对
+            **kwargs: 过滤条件，字段名和值的键值对
+
+        返回:
+            更新的实体数量
+        """
+        updated = self.db.execute(
+            update(self.model).filter_by(**kwargs).values(**values)
+        ).rowcount
+        self._commit()
+        return updated
+
+    def delete_where(self, **kwargs) -> int:
+        """
+        用一条 DELETE ... WHERE 语句删除所有符合条件的实体
+
+        参数:
+            **kwargs: 过滤条件，字段名和值的键值对；不允许为空，避免误删整张表
+
+        返回:
+            删除的实体数量
+        """
+        if not kwargs:
+            raise ValueError("delete_where需要至少一个过滤条件")
+        deleted = self.db.execute(
+            delete(self.model).filter_by(**kwargs)
+        ).rowcount
+        self._commit()
+        return deleted
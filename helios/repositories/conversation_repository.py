@@ -1,17 +1,108 @@
 # helios/repositories/conversation_repository.py
 
+import asyncio
+import random
+import time
 import uuid
-from typing import List, Optional
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+from sqlalchemy import func, insert, literal, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from helios.database.models import ConversationMessage
+from helios.repositories.async_base import AsyncBaseRepository
 from helios.repositories.base import BaseRepository
 
+def next_sequence(task_id: uuid.UUID):
+    """该任务下一个sequence_order的子查询：COALESCE(MAX(sequence_order), -1) + 1"""
+    return select(
+        func.coalesce(func.max(ConversationMessage.sequence_order), -1) + 1
+    ).where(ConversationMessage.task_id == task_id).scalar_subquery()
+
+def append_message_statement(task_id: uuid.UUID, speaker: str, message: str, sequence=None):
+    """
+    构造追加一条消息的 INSERT ... SELECT ... RETURNING 语句
+
+    参数:
+        sequence: 序号表达式，默认为next_sequence(task_id)
+    """
+    table = ConversationMessage.__table__
+    values = select(
+        literal(task_id, type_=table.c.task_id.type),
+        literal(speaker, type_=table.c.speaker.type),
+        literal(message, type_=table.c.message.type),
+        sequence if sequence is not None else next_sequence(task_id),
+        literal(datetime.utcnow(), type_=table.c.created_at.type),
+    )
+    return insert(ConversationMessage).from_select(
+        ["task_id", "speaker", "message", "sequence_order", "created_at"], values
+    ).returning(*table.c)
+
+def append_messages_statement(task_id: uuid.UUID, turns: Sequence[Tuple[str, str]], sequence=None):
+    """
+    构造批量追加消息的多行 INSERT ... VALUES ... RETURNING 语句
+
+    每一行的序号是同一个子查询加上行内偏移，子查询在语句开始时求值，
+    因此整批序号在一条语句中原子地分配，且连续。
+
+    参数:
+        turns: (发言者, 消息内容) 列表，按对话顺序排列
+        sequence: 起始序号表达式，默认为next_sequence(task_id)
+    """
+    table = ConversationMessage.__table__
+    start = sequence if sequence is not None else next_sequence(task_id)
+    now = datetime.utcnow()
+    return insert(ConversationMessage).values([
+        {
+            "task_id": task_id,
+            "speaker": speaker,
+            "message": message,
+            "sequence_order": start + offset,
+            "created_at": now,
+        }
+        for offset, (speaker, message) in enumerate(turns)
+    ]).returning(*table.c)
+
+def retry_delay(attempt: int, base: float = 0.01, cap: float = 0.5) -> float:
+    """序号冲突后重试前的等待秒数（指数退避加随机抖动），错开并发写入者"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+def message_page_statement(task_id: uuid.UUID, after: Optional[int], limit: int, preview: Optional[int]):
+    """构造消息的键集分页查询，多取一行用于判断是否还有下一页"""
+    message = ConversationMessage.message
+    if preview is not None:
+        message = func.substr(ConversationMessage.message, 1, preview).label("message")
+    statement = select(
+        ConversationMessage.id,
+        ConversationMessage.sequence_order,
+        ConversationMessage.speaker,
+        message,
+        ConversationMessage.created_at
+    ).where(ConversationMessage.task_id == task_id)
+    if after is not None:
+        statement = statement.where(ConversationMessage.sequence_order > after)
+    return statement.order_by(ConversationMessage.sequence_order).limit(limit + 1)
+
+def split_message_page(rows: List[Any], limit: int) -> Tuple[List[Any], Optional[int]]:
+    """截取一页消息并返回下一页的after值"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, rows[-1].sequence_order
+
 class ConversationRepository(BaseRepository[ConversationMessage]):
     """
     ConversationMessage实体的仓储类，提供对话消息相关的数据访问方法
     """
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, max_retries: int = 5):
+        """
+        参数:
+            db: SQLAlchemy会话对象
+            max_retries: 追加消息遇到序号冲突时的最大尝试次数
+        """
         super().__init__(ConversationMessage, db)
+        self.max_retries = max_retries
     
     def find_by_task_id(self, task_id: uuid.UUID) -> List[ConversationMessage]:
         """
@@ -29,6 +120,28 @@ class ConversationRepository(BaseRepository[ConversationMessage]):
             self.model.sequence_order
         ).all()
     
+    def find_page(
+        self,
+        task_id: uuid.UUID,
+        after: Optional[int] = None,
+        limit: int = 100,
+        preview: Optional[int] = None
+    ) -> Tuple[List[Any], Optional[int]]:
+        """
+        按sequence_order分页查找任务的对话消息（键集分页）
+
+        参数:
+            task_id: 任务ID
+            after: 只返回sequence_order大于该值的消息，None表示从头开始
+            limit: 每页数量
+            preview: 如果指定，只返回消息内容的前preview个字符
+
+        返回:
+            (消息行列表, 下一页游标)，没有更多数据时游标为None
+        """
+        rows = self.db.execute(message_page_statement(task_id, after, limit, preview)).all()
+        return split_message_page(rows, limit)
+    
     def find_by_speaker(self, task_id: uuid.UUID, speaker: str) -> List[ConversationMessage]:
         """
         查找指定发言者在任务中的所有对话消息
@@ -63,9 +176,46 @@ class ConversationRepository(BaseRepository[ConversationMessage]):
             self.model.sequence_order.desc()
         ).first()
     
+    def _next_sequence(self, task_id: uuid.UUID):
+        """该任务下一个sequence_order的子查询"""
+        return next_sequence(task_id)
+
+    def _with_retry(self, operation):
+        """
+        执行一次追加事务，遇到 (task_id, sequence_order) 唯一约束冲突时回滚，退避后重试
+
+        并发写入者读到相同的最大序号时，只有一方能插入成功，另一方重新分配序号。
+        处于unit_of_work中时，每次尝试包在保存点里，冲突只回滚这一次追加。
+        SQLite上不重试：pysqlite的保存点会绕过外层事务，而SQLite的写语句先取得写锁再读取，
+        序号分配和插入又在同一条语句中完成，并发写入者只会排队等待，不会读到过期的最大序号。
+        """
+        if self.in_unit_of_work and self.db.get_bind().dialect.name == "sqlite":
+            result = operation()
+            self._commit(*(result if isinstance(result, list) else [result]))
+            return result
+
+        for attempt in range(self.max_retries):
+            try:
+                if self.in_unit_of_work:
+                    with self.db.begin_nested():
+                        result = operation()
+                else:
+                    result = operation()
+                self._commit(*(result if isinstance(result, list) else [result]))
+                return result
+            except IntegrityError:
+                if not self.in_unit_of_work:
+                    self.db.rollback()
+                if attempt == self.max_retries - 1:
+                    raise
+                time.sleep(retry_delay(attempt))
+
     def add_message(self, task_id: uuid.UUID, speaker: str, message: str) -> ConversationMessage:
         """
         添加新的对话消息
+
+        在一条 INSERT ... SELECT ... RETURNING 语句中分配序号并插入，
+        由 (task_id, sequence_order) 唯一约束保证并发追加不会产生重复序号。
         
         参数:
             task_id: 任务ID
@@ -73,16 +223,91 @@ class ConversationRepository(BaseRepository[ConversationMessage]):
             message: 消息内容
             
         返回:
-            创建的对话消息对象
+            创建的对话消息对象，已完整加载并留在会话中，提交后不会过期
         """
-        # 获取当前最大的sequence_order
-        last_message = self.get_last_message(task_id)
-        sequence_order = (last_message.sequence_order + 1) if last_message else 0
-        
-        # 创建新消息
-        return self.create(
-            task_id=task_id,
-            speaker=speaker,
-            message=message,
-            sequence_order=sequence_order
-        ) 
\ No newline at end of file
+        def append():
+            return self.db.execute(
+                select(self.model).from_statement(
+                    append_message_statement(task_id, speaker, message, self._next_sequence(task_id))
+                )
+            ).scalar_one()
+
+        return self._with_retry(append)
+
+    def add_messages(self, task_id: uuid.UUID, turns: Sequence[Tuple[str, str]]) -> List[ConversationMessage]:
+        """
+        批量追加多条对话消息，在一条语句中分配连续的序号并插入
+
+        参数:
+            task_id: 任务ID
+            turns: (发言者, 消息内容) 列表，按对话顺序排列
+
+        返回:
+            创建的对话消息对象列表，已完整加载并留在会话中，提交后不会过期
+        """
+        if not turns:
+            return []
+
+        def append():
+            created = self.db.execute(
+                select(self.model).from_statement(
+                    append_messages_statement(task_id, turns, self._next_sequence(task_id))
+                )
+            ).scalars().all()
+            return sorted(created, key=lambda item: item.sequence_order)
+
+        return self._with_retry(append)
+
+class AsyncConversationRepository(AsyncBaseRepository[ConversationMessage]):
+    """
+    ConversationRepository的异步版本，供async def路由和WebSocket使用
+    """
+    def __init__(self, db: AsyncSession, max_retries: int = 5):
+        """
+        参数:
+            db: SQLAlchemy异步会话对象
+            max_retries: 追加消息遇到序号冲突时的最大尝试次数
+        """
+        super().__init__(ConversationMessage, db)
+        self.max_retries = max_retries
+
+    async def find_by_task_id(self, task_id: uuid.UUID) -> List[ConversationMessage]:
+        """
+        查找任务的所有对话消息，按sequence_order排序
+        """
+        result = await self.db.scalars(
+            select(self.model).where(
+                self.model.task_id == task_id
+            ).order_by(self.model.sequence_order)
+        )
+        return list(result)
+
+    async def find_page(
+        self,
+        task_id: uuid.UUID,
+        after: Optional[int] = None,
+        limit: int = 100,
+        preview: Optional[int] = None
+    ) -> Tuple[List[Any], Optional[int]]:
+        """
+        按sequence_order分页查找任务的对话消息，参数和返回值同ConversationRepository.find_page
+        """
+        rows = (await self.db.execute(message_page_statement(task_id, after, limit, preview))).all()
+        return split_message_page(rows, limit)
+
+    async def add_message(self, task_id: uuid.UUID, speaker: str, message: str) -> ConversationMessage:
+        """
+        添加新的对话消息，序号分配方式同ConversationRepository.add_message
+        """
+        for attempt in range(self.max_retries):
+            try:
+                created = (await self.db.execute(
+                    select(self.model).from_statement(append_message_statement(task_id, speaker, message))
+                )).scalar_one()
+                await self.db.commit()
+                return created
+            except IntegrityError:
+                await self.db.rollback()
+                if attempt == self.max_retries - 1:
+                    raise
+                await asyncio.sleep(retry_delay(attempt))
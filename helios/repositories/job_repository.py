@@ -0,0 +1,326 @@
+# helios/repositories/job_repository.py
+
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+from sqlalchemy import and_, exists, func, or_, update
+from sqlalchemy.orm import Session, aliased
+from helios.database.models import PlanJob
+from helios.repositories.base import BaseRepository
+
+class JobRepository(BaseRepository[PlanJob]):
+    """
+    PlanJob实体的仓储类，实现基于数据库表的持久化任务队列
+
+    任务被领取后进入RUNNING状态，并在visible_at之前对其他工作进程不可见。
+    如果工作进程崩溃而没有按时续期，任务会在可见性超时后被重新领取。
+    """
+    def __init__(self, db: Session):
+        super().__init__(PlanJob, db)
+
+    def enqueue(
+        self,
+        job_type: str,
+        payload: Dict[str, Any],
+        session_id: Optional[str] = None,
+        max_attempts: int = 3
+    ) -> PlanJob:
+        """
+        将新任务加入队列
+
+        参数:
+            job_type: 任务类型，对应一个已注册的处理函数
+            payload: 任务参数
+            session_id: 规划会话标识
+            max_attempts: 最大尝试次数
+
+        返回:
+            创建的任务对象
+        """
+        return self.create(
+            job_type=job_type,
+            payload=payload,
+            session_id=session_id,
+            max_attempts=max_attempts,
+            status="QUEUED",
+            visible_at=datetime.utcnow()
+        )
+
+    def claim(self, worker_id: str, visibility_timeout: float = 300) -> Optional[PlanJob]:
+        """
+        原子地领取一个可执行的任务
+
+        可领取的任务包括排队中的任务，以及可见性已超时的运行中任务。
+        同一会话中已有任务在运行时，该会话的其他任务暂不领取，保证会话内顺序执行。
+        PostgreSQL上使用 FOR UPDATE SKIP LOCKED 避免竞争；
+        其他数据库通过带条件的UPDATE（比较并交换）保证只有一个工作进程领取成功。
+
+        参数:
+            worker_id: 工作进程标识
+            visibility_timeout: 领取后对其他进程不可见的秒数
+
+        返回:
+            领取到的任务对象，没有可执行任务时返回None
+        """
+        now = datetime.utcnow()
+        running = aliased(PlanJob)
+        session_busy = exists().where(
+            running.session_id == self.model.session_id,
+            running.status == "RUNNING",
+            running.visible_at > now,
+            running.id != self.model.id
+        )
+        query = self.db.query(self.model).filter(
+            self.model.status.in_(["QUEUED", "RUNNING"]),
+            self.model.visible_at <= now,
+            or_(self.model.session_id.is_(None), ~session_busy)
+        ).order_by(self.model.created_at.asc())
+
+        is_postgres = self.db.get_bind().dialect.name == "postgresql"
+        if is_postgres:
+            query = query.with_for_update(skip_locked=True, of=self.model)
+
+        # 提交会使对象过期并重新加载最新状态，因此先记录查询时的状态用于比较并交换
+        candidates = [
+            (job, job.status, job.visible_at, job.attempts >= job.max_attempts)
+            for job in query.limit(1 if is_postgres else 5).all()
+        ]
+        for job, status, visible_at, exhausted in candidates:
+            if exhausted:
+                # 运行中超时且已用尽重试次数的任务直接标记为失败
+                self.db.execute(
+                    update(self.model).where(
+                        self.model.id == job.id,
+                        self.model.status == status,
+                        self.model.visible_at == visible_at
+                    ).values(status="FAILED", error=func.coalesce(self.model.error, "任务执行超时"))
+                )
+                self.db.commit()
+                continue
+            claimed = self.db.execute(
+                update(self.model).where(
+                    and_(
+                        self.model.id == job.id,
+                        self.model.status == status,
+                        self.model.visible_at == visible_at
+                    )
+                ).values(
+                    status="RUNNING",
+                    worker_id=worker_id,
+                    attempts=self.model.attempts + 1,
+                    visible_at=now + timedelta(seconds=visibility_timeout),
+                    updated_at=now
+                )
+            ).rowcount
+            self.db.commit()
+            if claimed == 1:
+                self.db.refresh(job)
+                return job
+        self.db.commit()
+        return None
+
+    def _transition(self, job: PlanJob, **values) -> PlanJob:
+        for key, value in values.items():
+            setattr(job, key, value)
+        self._commit()
+        self.db.refresh(job)
+        return job
+
+    def _owned(self, job_id: uuid.UUID, worker_id: str) -> Optional[PlanJob]:
+        """获取仍由指定工作进程持有的任务"""
+        return self.db.query(self.model).filter(
+            self.model.id == job_id,
+            self.model.status == "RUNNING",
+            self.model.worker_id == worker_id
+        ).first()
+
+    def extend(self, job_id: uuid.UUID, worker_id: str, visibility_timeout: float = 300) -> bool:
+        """
+        延长任务的可见性超时（心跳）
+
+        返回:
+            任务仍由该工作进程持有时返回True
+        """
+        updated = self.db.execute(
+            update(self.model).where(
+                self.model.id == job_id,
+                self.model.status == "RUNNING",
+                self.model.worker_id == worker_id
+            ).values(visible_at=datetime.utcnow() + timedelta(seconds=visibility_timeout))
+        ).rowcount
+        self._commit()
+        return updated == 1
+
+    def save_checkpoint(self, job_id: uuid.UUID, worker_id: str, checkpoint: Dict[str, Any]) -> bool:
+        """
+        保存任务的检查点
+
+        只有仍持有任务的工作进程可以写入，避免已超时的旧工作进程覆盖新的进度。
+
+        参数:
+            job_id: 任务ID
+            worker_id: 工作进程标识
+            checkpoint: 可JSON序列化的检查点
+
+        返回:
+            写入成功返回True，任务已不由该工作进程持有时返回False
+        """
+        updated = self.db.execute(
+            update(self.model).where(
+                self.model.id == job_id,
+                self.model.status == "RUNNING",
+                self.model.worker_id == worker_id
+            ).values(checkpoint=checkpoint, updated_at=datetime.utcnow())
+        ).rowcount
+        self._commit()
+        return updated == 1
+
+    def resume(self, job_id: uuid.UUID) -> Optional[PlanJob]:
+        """
+        把最终失败或已取消的任务重新排队，保留检查点以便从最后完成的状态继续
+
+        返回:
+            重新排队的任务对象，任务不存在或不是FAILED/CANCELLED状态时返回None
+        """
+        job = self.get(job_id)
+        if job is None or job.status not in ("FAILED", "CANCELLED"):
+            return None
+        return self._transition(
+            job,
+            status="QUEUED",
+            attempts=0,
+            cancel_requested=False,
+            worker_id=None,
+            visible_at=datetime.utcnow()
+        )
+
+    def complete(self, job_id: uuid.UUID, worker_id: str, result: Dict[str, Any]) -> Optional[PlanJob]:
+        """
+        标记任务成功完成
+
+        返回:
+            更新后的任务对象，如果任务已不由该工作进程持有则返回None
+        """
+        job = self._owned(job_id, worker_id)
+        if job is None:
+            return None
+        return self._transition(job, status="SUCCEEDED", result=result, error=None)
+
+    def fail(
+        self,
+        job_id: uuid.UUID,
+        worker_id: str,
+        error: str,
+        retry_delay: float = 5,
+        retryable: bool = True
+    ) -> Optional[PlanJob]:
+        """
+        记录任务失败；未用尽重试次数时重新排队，否则标记为最终失败
+
+        参数:
+            job_id: 任务ID
+            worker_id: 工作进程标识
+            error: 错误信息
+            retry_delay: 重试前等待的基础秒数，按尝试次数指数增长
+            retryable: 为False时直接标记为最终失败（例如已超过截止时间）
+
+        返回:
+            更新后的任务对象，如果任务已不由该工作进程持有则返回None
+        """
+        job = self._owned(job_id, worker_id)
+        if job is None:
+            return None
+        if retryable and job.attempts < job.max_attempts:
+            delay = retry_delay * (2 ** (job.attempts - 1))
+            return self._transition(
+                job,
+                status="QUEUED",
+                error=error,
+                worker_id=None,
+                visible_at=datetime.utcnow() + timedelta(seconds=delay)
+            )
+        return self._transition(job, status="FAILED", error=error)
+
+    def cancel(self, job_id: uuid.UUID) -> Optional[PlanJob]:
+        """
+        取消任务
+
+        排队中的任务直接标记为CANCELLED；运行中的任务只设置cancel_requested，
+        由持有它的工作进程在下次心跳时中止运行并标记为CANCELLED。
+        已结束的任务保持原状态。
+
+        参数:
+            job_id: 任务ID
+
+        返回:
+            更新后的任务对象，任务不存在时返回None
+        """
+        now = datetime.utcnow()
+        self.db.execute(
+            update(self.model).where(
+                self.model.id == job_id,
+                self.model.status == "QUEUED"
+            ).values(status="CANCELLED", error="任务已取消", worker_id=None, updated_at=now)
+        )
+        self.db.execute(
+            update(self.model).where(
+                self.model.id == job_id,
+                self.model.status == "RUNNING"
+            ).values(cancel_requested=True, updated_at=now)
+        )
+        self._commit()
+        job = self.get(job_id)
+        if job is not None:
+            self.db.refresh(job)
+        return job
+
+    def is_cancel_requested(self, job_id: uuid.UUID) -> bool:
+        """任务是否已被请求取消"""
+        requested = self.db.query(self.model.cancel_requested).filter(self.model.id == job_id).scalar()
+        self.db.commit()
+        return bool(requested)
+
+    def mark_cancelled(self, job_id: uuid.UUID, worker_id: str, reason: str = "任务已取消") -> Optional[PlanJob]:
+        """
+        工作进程中止运行后把任务标记为CANCELLED
+
+        返回:
+            更新后的任务对象，如果任务已不由该工作进程持有则返回None
+        """
+        job = self._owned(job_id, worker_id)
+        if job is None:
+            return None
+        return self._transition(job, status="CANCELLED", error=reason)
+
+    def find_latest_by_session(self, session_id: str) -> Optional[PlanJob]:
+        """
+        查找会话最近创建的任务
+
+        参数:
+            session_id: 规划会话标识
+
+        返回:
+            最近的任务对象，如果不存在则返回None
+        """
+        return self.db.query(self.model).filter(
+            self.model.session_id == session_id
+        ).order_by(
+            self.model.created_at.desc()
+        ).first()
+
+    def find_latest_result(self, session_id: str) -> Optional[PlanJob]:
+        """
+        查找会话最近一次成功完成的任务
+
+        参数:
+            session_id: 规划会话标识
+
+        返回:
+            最近成功的任务对象，如果不存在则返回None
+        """
+        return self.db.query(self.model).filter(
+            self.model.session_id == session_id,
+            self.model.status == "SUCCEEDED"
+        ).order_by(
+            self.model.created_at.desc()
+        ).first()
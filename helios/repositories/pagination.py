@@ -0,0 +1,47 @@
+# helios/repositories/pagination.py
+
+"""
+键集（keyset）分页的游标编解码
+
+游标把上一页最后一行的排序键编码为不透明的字符串，
+下一页通过 WHERE (created_at, id) < (游标值) 直接定位，而不是使用OFFSET扫描并丢弃前面的行。
+"""
+
+import base64
+import uuid
+from datetime import datetime
+from typing import Tuple
+
+def encode_cursor(created_at: datetime, item_id: uuid.UUID) -> str:
+    """
+    把 (created_at, id) 编码为游标字符串
+
+    参数:
+        created_at: 最后一行的创建时间
+        item_id: 最后一行的ID
+
+    返回:
+        URL安全的游标字符串
+    """
+    raw = f"{created_at.isoformat()}|{item_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """
+    解析游标字符串
+
+    参数:
+        cursor: encode_cursor生成的游标
+
+    返回:
+        (created_at, id) 元组
+
+    异常:
+        ValueError: 游标格式无效
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, item_id = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(created_at), uuid.UUID(item_id)
+    except Exception as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
@@ -1,10 +1,54 @@
 # helios/repositories/task_repository.py
 
 import uuid
-from typing import List, Optional
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from helios.database.models import Task
+from helios.repositories.async_base import AsyncBaseRepository
 from helios.repositories.base import BaseRepository
+from helios.repositories.pagination import decode_cursor, encode_cursor
+
+# 列表视图只需要的列，不加载较大的result JSON列
+TASK_SUMMARY_COLUMNS = (
+    Task.id,
+    Task.description,
+    Task.status,
+    Task.priority,
+    Task.user_id,
+    Task.provider,
+    Task.created_at,
+    Task.updated_at,
+)
+
+def task_page_statement(
+    status: Optional[str],
+    user_id: Optional[int],
+    limit: int,
+    after: Optional[str]
+):
+    """构造任务列表的键集分页查询，多取一行用于判断是否还有下一页"""
+    statement = select(*TASK_SUMMARY_COLUMNS)
+    if status:
+        statement = statement.where(Task.status == status)
+    if user_id is not None:
+        statement = statement.where(Task.user_id == user_id)
+    if after:
+        created_at, task_id = decode_cursor(after)
+        statement = statement.where(or_(
+            Task.created_at < created_at,
+            and_(Task.created_at == created_at, Task.id < task_id)
+        ))
+    return statement.order_by(Task.created_at.desc(), Task.id.desc()).limit(limit + 1)
+
+def split_task_page(rows: List[Any], limit: int) -> Tuple[List[Any], Optional[str]]:
+    """截取一页数据并生成下一页游标"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
 
 class TaskRepository(BaseRepository[Task]):
     """
@@ -93,4 +137,238 @@ class TaskRepository(BaseRepository[Task]):
         ).order_by(
             self.model.priority.desc(),
             self.model.created_at.asc()
-        ).limit(limit).all() 
\ No newline at end of file
+        ).limit(limit).all()
+
+    def list_page(
+        self,
+        status: Optional[str] = None,
+        user_id: Optional[int] = None,
+        limit: int = 50,
+        after: Optional[str] = None
+    ) -> Tuple[List[Any], Optional[str]]:
+        """
+        按创建时间倒序分页列出任务（键集分页），只查询摘要列
+
+        参数:
+            status: 可选的状态过滤
+            user_id: 可选的用户ID过滤
+            limit: 每页数量
+            after: 上一页返回的游标，None表示第一页
+
+        返回:
+            (任务摘要行列表, 下一页游标)，没有更多数据时游标为None
+
+        异常:
+            ValueError: 游标格式无效
+        """
+        rows = self.db.execute(task_page_statement(status, user_id, limit, after)).all()
+        return split_task_page(rows, limit)
+
+    def running_counts(self, column) -> Dict[Any, int]:
+        """
+        按指定列统计运行中（IN_PROGRESS）的任务数量
+
+        参数:
+            column: 分组列，例如 Task.user_id 或 Task.provider
+
+        返回:
+            {列值: 运行中任务数}
+        """
+        rows = self.db.query(column, func.count(self.model.id)).filter(
+            self.model.status == "IN_PROGRESS"
+        ).group_by(column).all()
+        return {key: count for key, count in rows}
+
+    def _candidates(self, window: int, lock: bool) -> List[Task]:
+        """
+        取出调度候选任务：优先级最高的一批，加上等待最久的一批（供老化计算使用）
+        """
+        by_priority = self.db.query(self.model).filter(
+            self.model.status == "PENDING"
+        ).order_by(
+            self.model.priority.desc(),
+            self.model.created_at.asc()
+        )
+        oldest = self.db.query(self.model).filter(
+            self.model.status == "PENDING"
+        ).order_by(self.model.created_at.asc())
+        if lock:
+            by_priority = by_priority.with_for_update(skip_locked=True, of=self.model)
+            oldest = oldest.with_for_update(skip_locked=True, of=self.model)
+
+        candidates = {}
+        for task in by_priority.limit(window).all() + oldest.limit(window).all():
+            candidates[task.id] = task
+        return list(candidates.values())
+
+    def claim_next(
+        self,
+        worker_id: str,
+        provider_limits: Optional[Dict[str, int]] = None,
+        aging_interval: float = 60.0,
+        fairness_penalty: float = 5.0,
+        window: int = 50
+    ) -> Optional[Task]:
+        """
+        原子地领取下一个待处理任务，并将其标记为IN_PROGRESS
+
+        有效优先级 = priority + 等待秒数 / aging_interval - fairness_penalty × 该用户运行中的任务数。
+        已达到并发上限的提供商的任务会被跳过。
+        PostgreSQL上候选行通过 FOR UPDATE SKIP LOCKED 锁定，并发的调度器不会拿到同一批行；
+        其他数据库通过带条件的UPDATE（比较并交换）保证只有一个调度器领取成功。
+
+        参数:
+            worker_id: 调度器工作线程标识
+            provider_limits: {提供商: 最大并发任务数}，未列出的提供商不限制
+            aging_interval: 有效优先级每提升1所需的等待秒数
+            fairness_penalty: 用户每个运行中任务带来的优先级惩罚
+            window: 每次参与排序的候选任务数量
+
+        返回:
+            领取到的任务对象，没有可执行任务时返回None
+        """
+        provider_limits = provider_limits or {}
+        is_postgres = self.db.get_bind().dialect.name == "postgresql"
+        now = datetime.utcnow()
+
+        running_by_user = self.running_counts(self.model.user_id)
+        running_by_provider = self.running_counts(self.model.provider)
+
+        def score(task: Task) -> float:
+            waited = (now - task.created_at).total_seconds() if task.created_at else 0.0
+            aging = waited / aging_interval if aging_interval > 0 else 0.0
+            return (task.priority or 0) + aging - fairness_penalty * running_by_user.get(task.user_id, 0)
+
+        candidates = sorted(
+            self._candidates(window, lock=is_postgres),
+            key=lambda task: (-score(task), task.created_at or now)
+        )
+        for task in candidates:
+            limit = provider_limits.get(task.provider)
+            if limit is not None and running_by_provider.get(task.provider, 0) >= limit:
+                continue
+            claimed = self.db.execute(
+                update(self.model).where(
+                    self.model.id == task.id,
+                    self.model.status == "PENDING"
+                ).values(
+                    status="IN_PROGRESS",
+                    worker_id=worker_id,
+                    started_at=now,
+                    updated_at=now
+                )
+            ).rowcount
+            self.db.commit()
+            if claimed != 1:
+                continue
+            if limit is not None and self.running_counts(self.model.provider).get(task.provider, 0) > limit:
+                # 其他调度器同时领取了同一提供商的任务，退回以保证不超过并发上限
+                self.release(task.id, worker_id)
+                running_by_provider[task.provider] = limit
+                continue
+            self.db.refresh(task)
+            return task
+        self.db.commit()
+        return None
+
+    def release(self, task_id: uuid.UUID, worker_id: str) -> bool:
+        """
+        把已领取的任务退回PENDING状态
+
+        返回:
+            任务仍由该工作线程持有并成功退回时返回True
+        """
+        updated = self.db.execute(
+            update(self.model).where(
+                self.model.id == task_id,
+                self.model.status == "IN_PROGRESS",
+                self.model.worker_id == worker_id
+            ).values(status="PENDING", worker_id=None, started_at=None)
+        ).rowcount
+        self._commit()
+        return updated == 1
+
+    def finish(self, task_id: uuid.UUID, worker_id: str, status: str, result: Optional[dict] = None) -> Optional[Task]:
+        """
+        结束由指定工作线程持有的任务
+
+        参数:
+            task_id: 任务ID
+            worker_id: 调度器工作线程标识
+            status: 最终状态，COMPLETED或FAILED
+            result: 任务结果
+
+        返回:
+            更新后的任务对象，如果任务已不由该工作线程持有则返回None
+        """
+        task = self.db.query(self.model).filter(
+            self.model.id == task_id,
+            self.model.status == "IN_PROGRESS",
+            self.model.worker_id == worker_id
+        ).first()
+        if task is None:
+            return None
+        task.status = status
+        task.result = result
+        self._commit()
+        self.db.refresh(task)
+        return task
+
+    def requeue_stale(self, older_than: float) -> int:
+        """
+        把运行时间超过指定秒数的IN_PROGRESS任务退回PENDING（用于回收崩溃的调度器持有的任务）
+
+        参数:
+            older_than: 秒数
+
+        返回:
+            被退回的任务数量
+        """
+        updated = self.db.execute(
+            update(self.model).where(
+                self.model.status == "IN_PROGRESS",
+                self.model.started_at < datetime.utcnow() - timedelta(seconds=older_than)
+            ).values(status="PENDING", worker_id=None, started_at=None)
+        ).rowcount
+        self._commit()
+        return updated
+
+class AsyncTaskRepository(AsyncBaseRepository[Task]):
+    """
+    TaskRepository的异步版本，供async def路由使用
+    """
+    def __init__(self, db: AsyncSession):
+        super().__init__(Task, db)
+
+    async def find_pending_tasks(self, limit: int = 10) -> List[Task]:
+        """
+        查找待处理的任务
+
+        参数:
+            limit: 返回结果的最大数量
+
+        返回:
+            待处理的任务对象列表
+        """
+        result = await self.db.scalars(
+            select(self.model).where(
+                self.model.status == "PENDING"
+            ).order_by(
+                self.model.priority.desc(),
+                self.model.created_at.asc()
+            ).limit(limit)
+        )
+        return list(result)
+
+    async def list_page(
+        self,
+        status: Optional[str] = None,
+        user_id: Optional[int] = None,
+        limit: int = 50,
+        after: Optional[str] = None
+    ) -> Tuple[List[Any], Optional[str]]:
+        """
+        按创建时间倒序分页列出任务，参数和返回值同TaskRepository.list_page
+        """
+        rows = (await self.db.execute(task_page_statement(status, user_id, limit, after))).all()
+        return split_task_page(rows, limit)
@@ -3,13 +3,18 @@
 提供与智能体规划系统交互的API接口
 """
 
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Request
 from typing import Dict, Any, List, Optional
+from datetime import datetime
+import uuid
+import time
 import logging
 from pydantic import BaseModel
 
-# 导入智能体团队
-from helios_backend.agent_team import AdaptivePlanTeam
+from helios.config import settings
+from helios.database.dependencies import get_job_repository
+from helios.repositories.job_repository import JobRepository
+from helios.services.rate_limit import RateLimited, get_admission_controller
 
 # 设置日志记录器
 logger = logging.getLogger(__name__)
@@ -20,9 +25,50 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
-# 创建全局智能体团队实例
-# 注意：在生产环境中，应该考虑将其作为依赖注入或使用更合适的状态管理方式
-agent_team = AdaptivePlanTeam()
+# 规划和反馈由独立的工作进程（python -m helios.jobs.worker）从持久化队列中执行，
+# API进程只负责入队和查询状态。JobRepository使用同步会话，因此这些路由定义为普通函数，
+# 由FastAPI放到线程池中执行，不阻塞事件循环
+
+async def admit(route: str, user_id: Optional[str]):
+    """准入检查：超出用户或路由限额且排队时间过长时返回429和Retry-After"""
+    try:
+        await get_admission_controller().admit_request(route, user_id)
+    except RateLimited as e:
+        raise too_many_requests(route, user_id, e)
+
+def admit_sync(route: str, user_id: Optional[str]):
+    """admit的同步版本，供在线程池中执行的同步路由使用，排队等待不会阻塞事件循环"""
+    try:
+        get_admission_controller().admit_request_sync(route, user_id)
+    except RateLimited as e:
+        raise too_many_requests(route, user_id, e)
+
+def too_many_requests(route: str, user_id: Optional[str], error: RateLimited) -> HTTPException:
+    """把RateLimited转换为带Retry-After的429响应"""
+    logger.warning(f"拒绝 {route} 请求（用户 {user_id}）: {error}")
+    return HTTPException(status_code=429, detail=str(error), headers=error.headers)
+
+def request_timeout(request: Request, default: float) -> float:
+    """
+    读取客户端通过X-Request-Timeout头给出的等待上限（秒），不超过服务端默认值
+
+    参数:
+        request: 当前HTTP请求
+        default: 服务端的默认截止时间（秒）
+
+    异常:
+        HTTPException: 如果请求头不是正数
+    """
+    header = request.headers.get("X-Request-Timeout")
+    if header is None:
+        return default
+    try:
+        timeout = float(header)
+    except ValueError:
+        timeout = 0
+    if timeout <= 0:
+        raise HTTPException(status_code=400, detail="X-Request-Timeout必须是正数（秒）")
+    return min(timeout, default)
 
 # 定义请求和响应模型
 class GoalRequest(BaseModel):
@@ -43,33 +89,53 @@ class PlanResponse(BaseModel):
     plan: Optional[str] = None
     error: Optional[str] = None
     conversation_id: Optional[str] = None
+    job_id: Optional[str] = None
 
-# 规划会话存储
-# 在生产环境中，应该使用数据库存储
-active_sessions: Dict[str, Dict[str, Any]] = {}
+class JobStatusResponse(BaseModel):
+    """后台任务状态响应模型"""
+    job_id: str
+    job_type: str
+    status: str
+    attempts: int
+    max_attempts: int
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    checkpoint_state: Optional[str] = None
+    cancel_requested: bool = False
+    created_at: datetime
+    updated_at: datetime
 
 @router.post("/generate", response_model=PlanResponse)
-async def generate_plan(request: GoalRequest, background_tasks: BackgroundTasks):
+def generate_plan(
+    request: GoalRequest,
+    http_request: Request,
+    job_repo: JobRepository = Depends(get_job_repository)
+):
     """
     生成新的适应性计划
     
     根据用户目标，使用多智能体系统生成详细计划
     """
+    admit_sync("plan_generate", request.user_id)
+    deadline_at = time.time() + request_timeout(http_request, settings.PLAN_DEADLINE_SECONDS)
     try:
         logger.info(f"收到新的规划请求: {request.goal[:50]}...")
+        session_id = request.user_id or "default"
         
-        # 启动规划会话（异步处理）
-        background_tasks.add_task(
-            process_plan_generation,
-            request.goal,
-            request.user_id
+        # 将规划任务加入持久化队列，由工作进程异步处理
+        job = job_repo.enqueue(
+            "plan_generation",
+            {"goal": request.goal, "user_id": request.user_id, "deadline_at": deadline_at},
+            session_id=session_id,
+            max_attempts=settings.JOB_MAX_ATTEMPTS
         )
         
         # 立即返回接收确认
         return {
             "success": True,
             "plan": "正在生成计划，请稍候...",
-            "conversation_id": request.user_id or "default"
+            "conversation_id": session_id,
+            "job_id": str(job.id)
         }
     except Exception as e:
         logger.error(f"生成计划时发生错误: {str(e)}", exc_info=True)
@@ -79,29 +145,42 @@ async def generate_plan(request: GoalRequest, background_tasks: BackgroundTasks)
         )
 
 @router.post("/feedback", response_model=PlanResponse)
-async def submit_feedback(request: FeedbackRequest, background_tasks: BackgroundTasks):
+def submit_feedback(
+    request: FeedbackRequest,
+    http_request: Request,
+    job_repo: JobRepository = Depends(get_job_repository)
+):
     """
     提交对计划的反馈
     
     根据用户反馈，调整现有计划
     """
+    admit_sync("plan_feedback", request.user_id)
+    deadline_at = time.time() + request_timeout(http_request, settings.PLAN_DEADLINE_SECONDS)
     try:
         logger.info(f"收到反馈: {request.text[:50]}...")
+        session_id = request.user_id or "default"
         
-        # 提交反馈（异步处理）
-        background_tasks.add_task(
-            process_feedback_submission,
-            request.text,
-            request.ratings,
-            request.priority_changes,
-            request.user_id
+        # 将反馈任务加入持久化队列，同一会话的任务按顺序执行
+        job = job_repo.enqueue(
+            "feedback_submission",
+            {
+                "text": request.text,
+                "ratings": request.ratings,
+                "priority_changes": request.priority_changes,
+                "user_id": request.user_id,
+                "deadline_at": deadline_at
+            },
+            session_id=session_id,
+            max_attempts=settings.JOB_MAX_ATTEMPTS
         )
         
         # 立即返回接收确认
         return {
             "success": True,
             "plan": "正在处理反馈，请稍候...",
-            "conversation_id": request.user_id or "default"
+            "conversation_id": session_id,
+            "job_id": str(job.id)
         }
     except Exception as e:
         logger.error(f"处理反馈时发生错误: {str(e)}", exc_info=True)
@@ -111,25 +190,39 @@ async def submit_feedback(request: FeedbackRequest, background_tasks: Background
         )
 
 @router.get("/status/{conversation_id}", response_model=PlanResponse)
-async def get_planning_status(conversation_id: str):
+def get_planning_status(
+    conversation_id: str,
+    job_repo: JobRepository = Depends(get_job_repository)
+):
     """
     获取规划会话状态
     
     查询特定会话的当前状态和计划内容
     """
     try:
-        if conversation_id not in active_sessions:
+        latest_job = job_repo.find_latest_by_session(conversation_id)
+        if latest_job is None:
             raise HTTPException(
                 status_code=404,
                 detail=f"找不到会话ID: {conversation_id}"
             )
         
-        session = active_sessions[conversation_id]
+        if latest_job.status in ("FAILED", "CANCELLED"):
+            return {
+                "success": False,
+                "error": latest_job.error,
+                "conversation_id": conversation_id,
+                "job_id": str(latest_job.id)
+            }
+        
+        finished_job = job_repo.find_latest_result(conversation_id)
+        plan = finished_job.result.get("plan") if finished_job and finished_job.result else None
         
         return {
             "success": True,
-            "plan": session.get("plan", "尚未生成计划"),
-            "conversation_id": conversation_id
+            "plan": plan or "尚未生成计划",
+            "conversation_id": conversation_id,
+            "job_id": str(latest_job.id)
         }
     except HTTPException:
         raise
@@ -140,79 +233,83 @@ async def get_planning_status(conversation_id: str):
             detail=f"获取会话状态失败: {str(e)}"
         )
 
-# 后台任务处理函数
-def process_plan_generation(goal: str, user_id: Optional[str] = None):
-    """异步处理规划生成"""
-    try:
-        session_id = user_id or "default"
-        
-        # 启动规划会话
-        result = agent_team.start_planning_session(goal)
-        
-        # 存储结果
-        active_sessions[session_id] = {
-            "plan": result.get("plan", ""),
-            "history": result.get("history", []),
-            "status": "completed" if result.get("success", False) else "failed"
-        }
-        
-        logger.info(f"规划会话完成: {session_id}")
-    except Exception as e:
-        logger.error(f"规划生成过程中发生错误: {str(e)}", exc_info=True)
-        active_sessions[user_id or "default"] = {
-            "plan": f"生成计划时发生错误: {str(e)}",
-            "status": "failed"
-        }
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+def get_job_status(
+    job_id: uuid.UUID,
+    job_repo: JobRepository = Depends(get_job_repository)
+):
+    """
+    获取后台任务状态
+    
+    返回任务的执行状态、尝试次数以及结果或错误信息
+    """
+    job = job_repo.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return serialize_job(job)
 
-def process_feedback_submission(
-    feedback_text: str,
-    ratings: Optional[Dict[str, int]] = None,
-    priority_changes: Optional[List[Dict[str, Any]]] = None,
-    user_id: Optional[str] = None
+@router.post("/jobs/{job_id}/cancel", response_model=JobStatusResponse)
+def cancel_job(
+    job_id: uuid.UUID,
+    job_repo: JobRepository = Depends(get_job_repository)
 ):
-    """异步处理反馈提交"""
-    try:
-        session_id = user_id or "default"
-        
-        # 构建反馈数据
-        feedback_data = {
-            "text": feedback_text
-        }
-        
-        if ratings:
-            feedback_data["ratings"] = ratings
-            
-        if priority_changes:
-            feedback_data["priority_changes"] = priority_changes
-        
-        # 提交反馈
-        result = agent_team.provide_feedback(feedback_data)
-        
-        # 更新存储的结果
-        if session_id in active_sessions:
-            active_sessions[session_id].update({
-                "plan": result.get("updated_plan", ""),
-                "history": result.get("history", []),
-                "status": "updated" if result.get("success", False) else "failed"
-            })
-        else:
-            active_sessions[session_id] = {
-                "plan": result.get("updated_plan", ""),
-                "history": result.get("history", []),
-                "status": "updated" if result.get("success", False) else "failed"
-            }
-        
-        logger.info(f"反馈处理完成: {session_id}")
-    except Exception as e:
-        logger.error(f"处理反馈过程中发生错误: {str(e)}", exc_info=True)
-        if user_id or "default" in active_sessions:
-            active_sessions[user_id or "default"].update({
-                "status": "failed",
-                "error": f"处理反馈时发生错误: {str(e)}"
-            })
-        else:
-            active_sessions[user_id or "default"] = {
-                "plan": "处理反馈时发生错误",
-                "status": "failed",
-                "error": str(e)
-            } 
\ No newline at end of file
+    """
+    取消后台任务
+    
+    排队中的任务立即取消；运行中的任务由工作进程在下次心跳时中止，
+    正在进行的LLM调用会被中断，之后不再进入新的规划阶段
+    """
+    job = job_repo.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status not in ("QUEUED", "RUNNING"):
+        raise HTTPException(status_code=409, detail=f"任务已结束，无法取消，当前状态: {job.status}")
+    
+    job = job_repo.cancel(job_id)
+    logger.info(f"任务 {job_id} 已请求取消，当前状态: {job.status}")
+    return serialize_job(job)
+
+def serialize_job(job) -> Dict[str, Any]:
+    """把PlanJob转换为JobStatusResponse字典"""
+    return {
+        "job_id": str(job.id),
+        "job_type": job.job_type,
+        "status": job.status,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "result": job.result,
+        "error": job.error,
+        "checkpoint_state": (job.checkpoint or {}).get("state"),
+        "cancel_requested": bool(job.cancel_requested),
+        "created_at": job.created_at,
+        "updated_at": job.updated_at
+    }
+
+@router.post("/jobs/{job_id}/resume", response_model=PlanResponse)
+def resume_job(
+    job_id: uuid.UUID,
+    job_repo: JobRepository = Depends(get_job_repository)
+):
+    """
+    恢复失败或已取消的后台任务
+    
+    将已最终失败或已取消的任务重新排队，工作进程会从任务最后保存的检查点继续，
+    复用已完成阶段的输出
+    """
+    job = job_repo.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status not in ("FAILED", "CANCELLED"):
+        raise HTTPException(status_code=409, detail=f"只能恢复失败或已取消的任务，当前状态: {job.status}")
+    
+    job = job_repo.resume(job_id)
+    if job is None:
+        raise HTTPException(status_code=409, detail="任务状态已变化，无法恢复")
+    checkpoint_state = (job.checkpoint or {}).get("state")
+    logger.info(f"任务 {job_id} 已重新排队，检查点状态: {checkpoint_state}")
+    return {
+        "success": True,
+        "plan": "正在从检查点继续生成计划，请稍候..." if checkpoint_state else "正在重新生成计划，请稍候...",
+        "conversation_id": job.session_id,
+        "job_id": str(job.id)
+    }
@@ -0,0 +1,15 @@
+# helios/routers/database.py
+
+from fastapi import APIRouter
+
+from helios.database.session import get_pool_stats
+
+router = APIRouter(
+    prefix="/db",
+    tags=["database"],
+)
+
+@router.get("/stats")
+async def get_database_stats():
+    """获取数据库连接池的运行统计：借出连接数、溢出连接数、等待连接的耗时和超时次数"""
+    return get_pool_stats()
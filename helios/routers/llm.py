@@ -0,0 +1,22 @@
+# helios/routers/llm.py
+
+from fastapi import APIRouter
+
+from helios.services import model_client
+
+router = APIRouter(
+    prefix="/llm",
+    tags=["llm"],
+)
+
+@router.get("/stats")
+async def get_llm_stats():
+    """获取LLM客户端的运行统计：响应缓存命中率、路由延迟、连接池状态、准入控制计数和熔断器状态"""
+    return {
+        "cache": model_client.cache.stats() if model_client.cache else None,
+        "routing": model_client.router.stats(),
+        "pools": model_client.transport.stats(),
+        "admission": model_client.limiter.stats,
+        "breakers": {name: breaker.snapshot() for name, breaker in model_client.breakers.items()},
+        "retry_budget": model_client.retry_policy.budget.balance if model_client.retry_policy.budget else None,
+    }
@@ -1,15 +1,26 @@
 # helios/routers/tasks.py
 
+import time
 import uuid
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Request, status, BackgroundTasks, Query, Response
 from pydantic import BaseModel, Field
 from datetime import datetime
 
-from helios.repositories.task_repository import TaskRepository
-from helios.repositories.conversation_repository import ConversationRepository
-from helios.database.dependencies import get_task_repository, get_conversation_repository
-from helios.services import logger
+from helios.repositories.task_repository import TaskRepository, AsyncTaskRepository
+from helios.repositories.conversation_repository import ConversationRepository, AsyncConversationRepository
+from helios.repositories.base import unit_of_work
+from helios.database.dependencies import (
+    get_task_repository,
+    get_conversation_repository,
+    get_async_task_repository,
+    get_async_conversation_repository,
+)
+from helios.database.session import AsyncSessionLocal
+from helios.config import settings
+from helios.services import logger, model_client, deadline_scope
+from helios.services.resilience import OperationCancelled, operations
+from helios.routers.adaptive_plan import admit, request_timeout
 
 # 导入 WebSocket 广播功能
 # 使用 try/except 避免循环导入问题
@@ -25,6 +36,7 @@ class TaskCreate(BaseModel):
     description: str
     priority: int = Field(default=10)
     user_id: int
+    provider: Optional[str] = None
 
 class TaskUpdate(BaseModel):
     description: Optional[str] = None
@@ -42,29 +54,45 @@ class MessageCreate(BaseModel):
     speaker: str
     message: str
 
+class MessageBatch(BaseModel):
+    """一次智能体运行产生的多条消息，以及可选的任务状态变更"""
+    messages: List[MessageCreate]
+    status: Optional[str] = None
+
+class AgentReplyRequest(BaseModel):
+    """请求某个智能体基于当前对话流式生成一条回复"""
+    speaker: str
+    model: str = "qwen-max"
+    system_message: Optional[str] = None
+    temperature: float = Field(default=0.2)
+
 class Message(BaseModel):
     id: int
     sequence_order: int
     speaker: str
     message: str
-    created_at: str
+    created_at: datetime
 
     class Config:
         from_attributes = True
 
-class Task(BaseModel):
+class TaskSummary(BaseModel):
+    """任务列表中使用的摘要，不包含result"""
     id: uuid.UUID
     description: str
     status: str
     priority: int
     user_id: int
-    created_at: str
-    updated_at: str
-    result: Optional[dict] = None
+    provider: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
 
     class Config:
         from_attributes = True
 
+class Task(TaskSummary):
+    result: Optional[dict] = None
+
 # 按照技术报告04添加的新模型
 class FeedbackPayload(BaseModel):
     """用户对任务的反馈数据模型"""
@@ -86,50 +114,59 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=Task, status_code=status.HTTP_201_CREATED)
-async def create_task(
+def create_task(
     task_data: TaskCreate,
     task_repo: TaskRepository = Depends(get_task_repository)
 ):
     """创建新任务"""
     return task_repo.create(**task_data.model_dump())
 
-@router.get("/", response_model=List[Task])
+# 下一页游标通过响应头返回，保持列表接口的响应体仍为数组
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+@router.get("/", response_model=List[TaskSummary])
 async def list_tasks(
+    response: Response,
     status: Optional[str] = None,
     user_id: Optional[int] = None,
-    task_repo: TaskRepository = Depends(get_task_repository)
+    limit: int = Query(default=50, ge=1, le=200),
+    after: Optional[str] = None,
+    task_repo: AsyncTaskRepository = Depends(get_async_task_repository)
 ):
-    """获取任务列表，可选按状态或用户ID过滤"""
-    if status and user_id:
-        return task_repo.find(status=status, user_id=user_id)
-    elif status:
-        return task_repo.find_by_status(status)
-    elif user_id:
-        return task_repo.find_by_user_id(user_id)
-    else:
-        return task_repo.get_all()
+    """
+    按创建时间倒序获取任务列表，可选按状态或用户ID过滤
+
+    还有更多数据时，响应头X-Next-Cursor中包含下一页的游标，作为after参数传入即可获取下一页。
+    """
+    try:
+        rows, next_cursor = await task_repo.list_page(status=status, user_id=user_id, limit=limit, after=after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return rows
 
 @router.get("/pending", response_model=List[Task])
 async def get_pending_tasks(
     limit: int = 10,
-    task_repo: TaskRepository = Depends(get_task_repository)
+    task_repo: AsyncTaskRepository = Depends(get_async_task_repository)
 ):
     """获取待处理的任务"""
-    return task_repo.find_by_status("PENDING", limit=limit)
+    return await task_repo.find_pending_tasks(limit=limit)
 
 @router.get("/{task_id}", response_model=Task)
 async def get_task(
     task_id: uuid.UUID,
-    task_repo: TaskRepository = Depends(get_task_repository)
+    task_repo: AsyncTaskRepository = Depends(get_async_task_repository)
 ):
     """获取单个任务的详细信息"""
-    task = task_repo.get(task_id)
+    task = await task_repo.get(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     return task
 
 @router.patch("/{task_id}", response_model=Task)
-async def update_task(
+def update_task(
     task_id: uuid.UUID,
     task_data: TaskUpdate,
     task_repo: TaskRepository = Depends(get_task_repository)
@@ -144,7 +181,7 @@ async def update_task(
     return updated_task
 
 @router.patch("/{task_id}/status", response_model=Task)
-async def update_task_status(
+def update_task_status(
     task_id: uuid.UUID,
     status_data: TaskStatusUpdate,
     task_repo: TaskRepository = Depends(get_task_repository)
@@ -158,7 +195,7 @@ async def update_task_status(
     return updated_task
 
 @router.put("/{task_id}/result", response_model=Task)
-async def set_task_result(
+def set_task_result(
     task_id: uuid.UUID,
     result: TaskResult,
     task_repo: TaskRepository = Depends(get_task_repository)
@@ -178,7 +215,7 @@ async def set_task_result(
     return updated_task
 
 @router.delete("/{task_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_task(
+def delete_task(
     task_id: uuid.UUID,
     task_repo: TaskRepository = Depends(get_task_repository)
 ):
@@ -189,13 +226,24 @@ async def delete_task(
 @router.get("/{task_id}/messages", response_model=List[Message])
 async def get_task_messages(
     task_id: uuid.UUID,
-    conv_repo: ConversationRepository = Depends(get_conversation_repository)
+    response: Response,
+    after: Optional[int] = Query(default=None, description="只返回sequence_order大于该值的消息"),
+    limit: int = Query(default=100, ge=1, le=500),
+    preview: Optional[int] = Query(default=None, ge=1, description="只返回每条消息的前preview个字符"),
+    conv_repo: AsyncConversationRepository = Depends(get_async_conversation_repository)
 ):
-    """获取与任务相关的消息历史"""
-    return conv_repo.find_by_task_id(task_id)
+    """
+    按顺序分页获取与任务相关的消息历史
+
+    还有更多消息时，响应头X-Next-Cursor中包含下一页的after值。
+    """
+    rows, next_cursor = await conv_repo.find_page(task_id, after=after, limit=limit, preview=preview)
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = str(next_cursor)
+    return rows
 
 @router.post("/{task_id}/messages", response_model=Message, status_code=status.HTTP_201_CREATED)
-async def add_task_message(
+def add_task_message(
     task_id: uuid.UUID,
     message_data: MessageCreate,
     background_tasks: BackgroundTasks,
@@ -228,13 +276,125 @@ async def add_task_message(
     
     return message
 
+@router.post("/{task_id}/messages/batch", response_model=List[Message], status_code=status.HTTP_201_CREATED)
+def add_task_messages(
+    task_id: uuid.UUID,
+    batch: MessageBatch,
+    background_tasks: BackgroundTasks,
+    task_repo: TaskRepository = Depends(get_task_repository),
+    conv_repo: ConversationRepository = Depends(get_conversation_repository)
+):
+    """
+    在一个事务中为任务追加多条消息，并可同时更新任务状态
+    """
+    task = task_repo.get(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    with unit_of_work(conv_repo.db):
+        messages = conv_repo.add_messages(
+            task_id, [(item.speaker, item.message) for item in batch.messages]
+        )
+        if batch.status:
+            task_repo.update_status(task_id, batch.status)
+
+    for message in messages:
+        background_tasks.add_task(
+            broadcast_message,
+            task_id=task_id,
+            message={
+                "id": message.id,
+                "sequence_order": message.sequence_order,
+                "speaker": message.speaker,
+                "message": message.message,
+                "created_at": message.created_at.isoformat(),
+            }
+        )
+    return messages
+
+@router.post("/{task_id}/agent-reply", status_code=status.HTTP_202_ACCEPTED)
+async def request_agent_reply(
+    task_id: uuid.UUID,
+    reply_request: AgentReplyRequest,
+    background_tasks: BackgroundTasks,
+    http_request: Request,
+    task_repo: AsyncTaskRepository = Depends(get_async_task_repository)
+):
+    """
+    让智能体基于任务的对话历史生成回复
+
+    回复以MESSAGE_DELTA帧通过WebSocket实时推送，完成后持久化为一条消息。
+    生成过程受截止时间约束（X-Request-Timeout头，不超过AGENT_REPLY_DEADLINE_SECONDS），
+    可以通过取消接口中止；断开WebSocket连接不会中止生成。
+    """
+    task = await task_repo.get(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    await admit("agent_reply", task.user_id)
+    deadline_at = time.monotonic() + request_timeout(http_request, settings.AGENT_REPLY_DEADLINE_SECONDS)
+
+    background_tasks.add_task(
+        process_agent_reply, task_id=task_id, reply_request=reply_request, deadline_at=deadline_at
+    )
+    return {"status": "streaming", "taskId": str(task_id), "speaker": reply_request.speaker}
+
+async def process_agent_reply(
+    task_id: uuid.UUID, reply_request: AgentReplyRequest, deadline_at: Optional[float] = None
+):
+    """后台流式生成智能体回复并广播，deadline_at为time.monotonic()时间"""
+    from helios.routers.websocket import stream_agent_reply
+
+    timeout = deadline_at - time.monotonic() if deadline_at is not None else None
+    try:
+        async with AsyncSessionLocal() as db:
+            conv_repo = AsyncConversationRepository(db)
+            messages = []
+            if reply_request.system_message:
+                messages.append({"role": "system", "content": reply_request.system_message})
+            for history in await conv_repo.find_by_task_id(task_id):
+                if history.speaker == "user":
+                    messages.append({"role": "user", "content": history.message})
+                else:
+                    messages.append({"role": "assistant", "name": history.speaker, "content": history.message})
+
+            # 截止时间到期或被取消时中止流式调用，不再继续消耗提供商的配额
+            with deadline_scope(timeout), operations.track(task_id):
+                chunks = model_client.stream_chat(
+                    reply_request.model, messages, temperature=reply_request.temperature
+                )
+                await stream_agent_reply(task_id, reply_request.speaker, chunks, conv_repo)
+    except OperationCancelled as e:
+        logger.info(f"任务 {task_id} 的智能体流式回复已中止: {str(e)}")
+    except Exception as e:
+        logger.error(f"任务 {task_id} 的智能体流式回复失败: {str(e)}")
+
+@router.post("/{task_id}/cancel")
+async def cancel_task_operations(
+    task_id: uuid.UUID,
+    task_repo: AsyncTaskRepository = Depends(get_async_task_repository)
+):
+    """
+    中止任务正在进行的智能体回复
+
+    取消请求通过广播后端送到所有API进程；返回的cancelled为本进程中止的操作数，
+    其他进程中的回复同样会被中止。被中止的回复不会持久化，订阅者收到MESSAGE_ABORTED帧。
+    """
+    from helios.routers.websocket import cancel_operations
+
+    task = await task_repo.get(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    cancelled = await cancel_operations(task_id, "用户取消")
+    logger.info(f"任务 {task_id} 已取消 {cancelled} 个进行中的操作")
+    return {"taskId": str(task_id), "cancelled": cancelled}
+
 # 新增端点：提交任务反馈
 @router.post("/{task_id}/feedback", response_model=FeedbackResponse, status_code=status.HTTP_202_ACCEPTED)
 async def submit_task_feedback(
     task_id: uuid.UUID,
     feedback: FeedbackPayload,
     background_tasks: BackgroundTasks,
-    task_repo: TaskRepository = Depends(get_task_repository)
+    task_repo: AsyncTaskRepository = Depends(get_async_task_repository)
 ):
     """
     接收用户对特定任务的反馈，并触发适应性循环
@@ -242,9 +402,10 @@ async def submit_task_feedback(
     此端点实现了技术报告04中定义的API接口规范，用于处理任务反馈
     """
     # 验证任务是否存在
-    task = task_repo.get(task_id)
+    task = await task_repo.get(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
+    await admit("task_feedback", task.user_id)
     
     logger.info(f"收到任务 {task_id} 的反馈: {feedback.feedbackType}")
     
@@ -0,0 +1,55 @@
+# helios/routers/usage.py
+
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from helios.services.metering import get_meter
+
+router = APIRouter(
+    prefix="/usage",
+    tags=["usage"],
+)
+
+def _totals(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """汇总分组结果的token数和费用"""
+    return {
+        "calls": sum(row["calls"] for row in rows),
+        "prompt_tokens": sum(row["prompt_tokens"] for row in rows),
+        "completion_tokens": sum(row["completion_tokens"] for row in rows),
+        "cost": round(sum(row["cost"] for row in rows), 6),
+    }
+
+def _breakdown(group_by: str, **filters) -> Dict[str, Any]:
+    try:
+        rows = get_meter().breakdown([name for name in group_by.split(",") if name], **filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"group_by": group_by, "filters": {k: v for k, v in filters.items() if v is not None},
+            "rows": rows, "totals": _totals(rows)}
+
+@router.get("/tasks/{task_id}")
+def get_task_usage(task_id: str, group_by: str = Query("agent,state,model")):
+    """获取单个任务的LLM用量，默认按智能体、状态和模型分组"""
+    return _breakdown(group_by, task_id=task_id)
+
+@router.get("/models")
+def get_model_usage(
+    day: Optional[str] = Query(None, description="日期，格式YYYY-MM-DD"),
+    user_id: Optional[str] = None,
+):
+    """按模型汇总LLM用量，可按日期和用户过滤"""
+    return _breakdown("model", day=day, user_id=user_id)
+
+@router.get("")
+def get_usage(
+    group_by: str = Query("model", description="逗号分隔的分组维度: day,model,task_id,user_id,agent,state"),
+    day: Optional[str] = None,
+    model: Optional[str] = None,
+    task_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    agent: Optional[str] = None,
+    state: Optional[str] = None,
+):
+    """按任意维度分组和过滤LLM用量"""
+    return _breakdown(group_by, day=day, model=model, task_id=task_id, user_id=user_id, agent=agent, state=state)
@@ -1,15 +1,22 @@
 # helios/routers/websocket.py
 
+import asyncio
 import json
+import time
 import uuid
-from typing import List, Dict, Any
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException
+from typing import List, Dict, Any, AsyncIterator, Optional
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException, Query
 from starlette.websockets import WebSocketState
 
+from helios.config import settings
 from helios.services import logger
-from helios.repositories.task_repository import TaskRepository
-from helios.repositories.conversation_repository import ConversationRepository
-from helios.database.dependencies import get_task_repository, get_conversation_repository
+from helios.services.pubsub import create_pubsub
+from helios.services.resilience import operations
+from helios.services.send_queue import ConnectionSender, FanoutMetrics
+from helios.repositories.task_repository import TaskRepository, AsyncTaskRepository
+from helios.repositories.conversation_repository import AsyncConversationRepository
+from helios.database.dependencies import get_task_repository
+from helios.database.session import AsyncSessionLocal
 
 router = APIRouter(tags=["websocket"])
 
@@ -17,6 +24,33 @@ router = APIRouter(tags=["websocket"])
 # 格式: {task_id: [websocket1, websocket2, ...]}
 active_connections: Dict[str, List[WebSocket]] = {}
 
+# 每个连接的发送队列，键为WebSocket对象
+senders: Dict[WebSocket, ConnectionSender] = {}
+fanout_metrics = FanoutMetrics()
+
+# 这些事件只携带最新状态，coalesce策略下同一事件只保留最新一条
+COALESCE_EVENTS = {"FEEDBACK_PROCESSED", "TASK_STATUS"}
+
+# 跨进程广播：消息先发布到共享后端，每个进程只订阅本地有连接的任务
+pubsub = create_pubsub(settings)
+
+# 控制频道：所有进程都订阅，用于把取消请求送到实际执行回复的进程
+CONTROL_CHANNEL = "helios:operations"
+PROCESS_ID = uuid.uuid4().hex
+
+# 最后一个本地连接断开后等待重连的定时器，键为任务ID
+abandon_timers: Dict[str, asyncio.TimerHandle] = {}
+
+def serialize_message(message) -> Dict[str, Any]:
+    """把ConversationMessage转换为推送给客户端的字典"""
+    return {
+        "id": message.id,
+        "sequence_order": message.sequence_order,
+        "speaker": message.speaker,
+        "message": message.message,
+        "created_at": message.created_at.isoformat(),
+    }
+
 async def get_task_or_404(
     task_id: uuid.UUID,
     task_repo: TaskRepository = Depends(get_task_repository)
@@ -31,12 +65,19 @@ async def get_task_or_404(
 async def websocket_task_messages(
     websocket: WebSocket,
     task_id: uuid.UUID,
-    task_repo: TaskRepository = Depends(get_task_repository),
-    conv_repo: ConversationRepository = Depends(get_conversation_repository)
+    last_seen_sequence: Optional[int] = Query(default=None, ge=-1)
 ):
-    """WebSocket端点，用于实时接收任务消息"""
+    """
+    WebSocket端点，用于实时接收任务消息
+
+    客户端重连时传入last_seen_sequence（已收到的最大sequence_order，从未收到过传-1），
+    服务端只补发更新的消息，并以HISTORY_BATCH批量帧发送；未传时逐条补发全部历史。
+    """
+    # 只在读取数据时使用数据库会话，避免整个连接期间占用连接池中的连接
+    async with AsyncSessionLocal() as db:
+        task = await AsyncTaskRepository(db).get(task_id)
+
     # 检查任务是否存在
-    task = task_repo.get(task_id)
     if not task:
         await websocket.close(code=1000)
         return
@@ -44,25 +85,16 @@ async def websocket_task_messages(
     # 接受WebSocket连接
     await websocket.accept()
     
-    # 将连接添加到活动连接列表
-    if str(task_id) not in active_connections:
-        active_connections[str(task_id)] = []
-    active_connections[str(task_id)].append(websocket)
-    
-    logger.info(f"WebSocket连接已建立: 任务ID={task_id}")
-    
     try:
-        # 发送现有消息历史
-        messages = conv_repo.find_by_task_id(task_id)
-        for message in messages:
-            await websocket.send_text(json.dumps({
-                "id": message.id,
-                "sequence_order": message.sequence_order,
-                "speaker": message.speaker,
-                "message": message.message,
-                "created_at": message.created_at.isoformat(),
-            }))
-        
+        # 先登记连接，补发历史期间广播的新消息暂存在发送队列中；
+        # 补发完成后丢弃其中已随历史发送的消息再开始发送，保证不重复、不遗漏
+        await register_connection(task_id, websocket, start=False)
+        last_sequence = await replay_history(websocket, task_id, last_seen_sequence, batched=last_seen_sequence is not None)
+        sender = senders.get(websocket)
+        if sender is not None:
+            sender.start(skip_through=last_sequence)
+        logger.info(f"WebSocket连接已建立: 任务ID={task_id}, 补发起点={last_seen_sequence}")
+
         # 持续监听消息
         while True:
             data = await websocket.receive_text()
@@ -70,140 +102,264 @@ async def websocket_task_messages(
             logger.info(f"收到WebSocket消息: {data}")
     except WebSocketDisconnect:
         # 连接断开时，从活动连接列表中移除
-        if str(task_id) in active_connections:
-            active_connections[str(task_id)].remove(websocket)
-            if not active_connections[str(task_id)]:
-                del active_connections[str(task_id)]
+        await unregister_connection(task_id, websocket)
         logger.info(f"WebSocket连接已断开: 任务ID={task_id}")
     except Exception as e:
         logger.error(f"WebSocket错误: {str(e)}")
+        await unregister_connection(task_id, websocket)
         # 如果连接仍然活跃，则关闭它
         if websocket.client_state != WebSocketState.DISCONNECTED:
             await websocket.close(code=1011)
 
-async def broadcast_message(task_id: uuid.UUID, message: Dict[str, Any]):
-    """向所有连接到特定任务的客户端广播消息"""
-    if str(task_id) not in active_connections:
+async def start_pubsub():
+    """启动广播后端并订阅控制频道（应用启动时调用，重复调用无副作用）"""
+    await pubsub.start(deliver_local)
+    await pubsub.subscribe(CONTROL_CHANNEL)
+
+async def register_connection(task_id: uuid.UUID, websocket: WebSocket, start: bool = True):
+    """
+    登记本地连接并创建它的发送队列，任务的第一个本地连接会让本进程订阅该任务的频道
+
+    参数:
+        task_id: 任务ID
+        websocket: WebSocket连接
+        start: 是否立即开始发送；为False时由调用方在补发历史后调用sender.start
+    """
+    channel = str(task_id)
+    sender = ConnectionSender(
+        websocket,
+        max_queue=settings.WS_SEND_QUEUE_SIZE,
+        policy=settings.WS_SLOW_CONSUMER_POLICY,
+        send_timeout=settings.WS_SEND_TIMEOUT,
+        metrics=fanout_metrics,
+        on_error=lambda _: asyncio.create_task(unregister_connection(channel, websocket)),
+    )
+    if start:
+        sender.start()
+    senders[websocket] = sender
+    timer = abandon_timers.pop(channel, None)
+    if timer is not None:
+        timer.cancel()
+    if channel not in active_connections:
+        active_connections[channel] = []
+        await pubsub.subscribe(channel)
+    active_connections[channel].append(websocket)
+
+async def unregister_connection(task_id: uuid.UUID, websocket: WebSocket):
+    """
+    移除本地连接，任务的最后一个本地连接断开后取消订阅
+
+    断开连接不会立即中止进行中的智能体回复：客户端可能马上重连（例如移动网络切换），
+    回复完成后会持久化，重连的客户端可以补齐。最后一个本地连接断开后等待
+    WS_ABANDON_GRACE_SECONDS秒，期间没有连接重新登记时视为客户端已离开，
+    中止本进程中该任务进行中的回复，不再消耗提供商的配额。
+    """
+    channel = str(task_id)
+    sender = senders.pop(websocket, None)
+    if sender is not None:
+        await sender.close()
+    connections = active_connections.get(channel)
+    if connections is None:
         return
-    
-    disconnected = []
-    for websocket in active_connections[str(task_id)]:
-        try:
-            await websocket.send_text(json.dumps(message))
-        except Exception:
-            disconnected.append(websocket)
-    
-    # 清理断开的连接
-    for ws in disconnected:
-        active_connections[str(task_id)].remove(ws)
-    
-    if not active_connections[str(task_id)]:
-        del active_connections[str(task_id)] 
- 
- 
- 
- 
+    if websocket in connections:
+        connections.remove(websocket)
+    if not connections:
+        del active_connections[channel]
+        await pubsub.unsubscribe(channel)
+        timer = abandon_timers.pop(channel, None)
+        if timer is not None:
+            timer.cancel()
+        if settings.WS_ABANDON_GRACE_SECONDS > 0:
+            abandon_timers[channel] = asyncio.get_running_loop().call_later(
+                settings.WS_ABANDON_GRACE_SECONDS, cancel_abandoned, channel
+            )
 
-import json
-import uuid
-from typing import List, Dict, Any
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException
-from starlette.websockets import WebSocketState
+def cancel_abandoned(channel: str):
+    """等待重连超时后仍没有本地连接时，中止该任务进行中的回复"""
+    abandon_timers.pop(channel, None)
+    if channel in active_connections:
+        return
+    cancelled = operations.cancel(channel, "客户端断开")
+    if cancelled:
+        logger.info(f"任务 {channel} 的客户端已离开，中止 {cancelled} 个进行中的操作")
 
-from helios.services import logger
-from helios.repositories.task_repository import TaskRepository
-from helios.repositories.conversation_repository import ConversationRepository
-from helios.database.dependencies import get_task_repository, get_conversation_repository
+async def cancel_operations(task_id: uuid.UUID, reason: str) -> int:
+    """
+    中止所有进程中该任务进行中的操作
 
-router = APIRouter(tags=["websocket"])
+    本进程直接取消，同时在控制频道上广播，其他进程收到后取消各自的操作。
 
-# 存储活动连接的字典
-# 格式: {task_id: [websocket1, websocket2, ...]}
-active_connections: Dict[str, List[WebSocket]] = {}
+    参数:
+        task_id: 任务ID
+        reason: 取消原因
 
-async def get_task_or_404(
-    task_id: uuid.UUID,
-    task_repo: TaskRepository = Depends(get_task_repository)
-):
-    """获取任务或返回404错误"""
-    task = task_repo.get(task_id)
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
-    return task
+    返回:
+        本进程中被取消的操作数
+    """
+    cancelled = operations.cancel(task_id, reason)
+    await start_pubsub()
+    await pubsub.publish(CONTROL_CHANNEL, {
+        "event": "CANCEL_OPERATIONS", "task_id": str(task_id), "reason": reason, "origin": PROCESS_ID,
+    })
+    return cancelled
 
-@router.websocket("/ws/tasks/{task_id}/messages")
-async def websocket_task_messages(
+async def deliver_local(channel: str, message: Dict[str, Any]):
+    """
+    把消息放入本进程中连接到该任务的各客户端的发送队列
+
+    消息只序列化一次，入队不等待发送，慢客户端不影响其他订阅者。
+    控制频道的消息不推送给客户端，由本进程处理。
+    """
+    if channel == CONTROL_CHANNEL:
+        if message.get("event") == "CANCEL_OPERATIONS" and message.get("origin") != PROCESS_ID:
+            operations.cancel(message["task_id"], message.get("reason") or "已取消")
+        return
+    connections = active_connections.get(channel)
+    if not connections:
+        return
+
+    start = time.perf_counter()
+    payload = json.dumps(message)
+    key = message.get("event") if message.get("event") in COALESCE_EVENTS else None
+    sequence = message.get("sequence_order")
+    rejected = [ws for ws in list(connections) if ws in senders and not senders[ws].enqueue(payload, key, sequence)]
+    fanout_metrics.record_fanout(len(connections), time.perf_counter() - start)
+
+    # 清理已关闭的连接
+    for ws in rejected:
+        await unregister_connection(channel, ws)
+
+async def replay_history(
     websocket: WebSocket,
     task_id: uuid.UUID,
-    task_repo: TaskRepository = Depends(get_task_repository),
-    conv_repo: ConversationRepository = Depends(get_conversation_repository)
-):
-    """WebSocket端点，用于实时接收任务消息"""
-    # 检查任务是否存在
-    task = task_repo.get(task_id)
-    if not task:
-        await websocket.close(code=1000)
-        return
-    
-    # 接受WebSocket连接
-    await websocket.accept()
-    
-    # 将连接添加到活动连接列表
-    if str(task_id) not in active_connections:
-        active_connections[str(task_id)] = []
-    active_connections[str(task_id)].append(websocket)
-    
-    logger.info(f"WebSocket连接已建立: 任务ID={task_id}")
-    
-    try:
-        # 发送现有消息历史
-        messages = conv_repo.find_by_task_id(task_id)
-        for message in messages:
+    after: Optional[int],
+    batched: bool
+) -> Optional[int]:
+    """
+    按sequence_order分页补发历史消息
+
+    每页使用一个短会话读取。batched为True时每页合并为一个HISTORY_BATCH帧:
+    {"event": "HISTORY_BATCH", "messages": [...], "last_sequence": n, "has_more": bool}，
+    即使没有新消息也会发送一帧，表示补发结束。
+
+    参数:
+        websocket: WebSocket连接
+        task_id: 任务ID
+        after: 只补发sequence_order大于该值的消息，None表示全部
+        batched: 是否以批量帧发送
+
+    返回:
+        已补发的最大sequence_order，没有补发任何消息时返回after
+    """
+    last_sequence = after
+    while True:
+        async with AsyncSessionLocal() as db:
+            rows, cursor = await AsyncConversationRepository(db).find_page(
+                task_id, after=last_sequence, limit=settings.WS_REPLAY_BATCH_SIZE
+            )
+        if rows:
+            last_sequence = rows[-1].sequence_order
+        if batched:
             await websocket.send_text(json.dumps({
-                "id": message.id,
-                "sequence_order": message.sequence_order,
-                "speaker": message.speaker,
-                "message": message.message,
-                "created_at": message.created_at.isoformat(),
+                "event": "HISTORY_BATCH",
+                "messages": [serialize_message(row) for row in rows],
+                "last_sequence": last_sequence,
+                "has_more": cursor is not None,
             }))
-        
-        # 持续监听消息
-        while True:
-            data = await websocket.receive_text()
-            # 处理接收到的消息（如果需要）
-            logger.info(f"收到WebSocket消息: {data}")
-    except WebSocketDisconnect:
-        # 连接断开时，从活动连接列表中移除
-        if str(task_id) in active_connections:
-            active_connections[str(task_id)].remove(websocket)
-            if not active_connections[str(task_id)]:
-                del active_connections[str(task_id)]
-        logger.info(f"WebSocket连接已断开: 任务ID={task_id}")
-    except Exception as e:
-        logger.error(f"WebSocket错误: {str(e)}")
-        # 如果连接仍然活跃，则关闭它
-        if websocket.client_state != WebSocketState.DISCONNECTED:
-            await websocket.close(code=1011)
+        else:
+            for row in rows:
+                await websocket.send_text(json.dumps(serialize_message(row)))
+        if cursor is None:
+            return last_sequence
+
+async def flush_connections(task_id: Optional[uuid.UUID] = None, timeout: float = 5.0):
+    """
+    等待本地连接的发送队列清空
+
+    参数:
+        task_id: 只等待该任务的连接，为None时等待所有连接
+        timeout: 每个连接的最长等待时间（秒）
+    """
+    if task_id is None:
+        websockets = list(senders)
+    else:
+        websockets = list(active_connections.get(str(task_id), []))
+    for ws in websockets:
+        sender = senders.get(ws)
+        if sender is not None:
+            try:
+                await sender.drain(timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"WebSocket发送队列在 {timeout} 秒内未清空")
 
 async def broadcast_message(task_id: uuid.UUID, message: Dict[str, Any]):
-    """向所有连接到特定任务的客户端广播消息"""
-    if str(task_id) not in active_connections:
-        return
-    
-    disconnected = []
-    for websocket in active_connections[str(task_id)]:
-        try:
-            await websocket.send_text(json.dumps(message))
-        except Exception:
-            disconnected.append(websocket)
-    
-    # 清理断开的连接
-    for ws in disconnected:
-        active_connections[str(task_id)].remove(ws)
-    
-    if not active_connections[str(task_id)]:
-        del active_connections[str(task_id)] 
- 
- 
- 
- 
\ No newline at end of file
+    """向所有连接到特定任务的客户端广播消息（包括其他工作进程中的连接）"""
+    await start_pubsub()
+    await pubsub.publish(str(task_id), message)
+
+@router.get("/ws/stats")
+async def get_websocket_stats():
+    """获取WebSocket广播统计：接收者数量、入队耗时、发送延迟、丢弃/合并的消息数和断开的慢客户端数"""
+    return {
+        "connections": len(senders),
+        "tasks": len(active_connections),
+        "queued": sum(sender.pending for sender in senders.values()),
+        **fanout_metrics.snapshot(),
+    }
+
+async def stream_agent_reply(
+    task_id: uuid.UUID,
+    speaker: str,
+    chunks: AsyncIterator[str],
+    conv_repo: AsyncConversationRepository,
+):
+    """
+    把智能体的流式回复实时推送给订阅者，结束后持久化为一条完整消息
+
+    每个增量片段以MESSAGE_DELTA帧广播，帧内带有本次流的stream_id和从0开始的seq，
+    客户端按seq拼接即可还原内容。流结束后写入一条ConversationMessage，
+    并广播该消息行（附带相同的stream_id），客户端可用它替换拼接出的临时内容。
+    流被取消、超过截止时间或失败时不持久化，改为广播MESSAGE_ABORTED帧:
+    {"event": "MESSAGE_ABORTED", "task_id": ..., "stream_id": ..., "speaker": ..., "seq": 已发送的增量数, "reason": ...}
+
+    参数:
+        task_id: 任务ID
+        speaker: 发言者
+        chunks: 增量文本的异步迭代器，如model_client.stream_chat(...)
+        conv_repo: 异步对话消息仓储
+
+    返回:
+        持久化后的ConversationMessage
+
+    异常:
+        OperationCancelled、DeadlineExceeded或流式调用的其他异常，在广播MESSAGE_ABORTED后重新抛出
+    """
+    stream_id = uuid.uuid4().hex
+    parts = []
+    seq = 0
+    try:
+        async for delta in chunks:
+            parts.append(delta)
+            await broadcast_message(task_id, {
+                "event": "MESSAGE_DELTA",
+                "stream_id": stream_id,
+                "seq": seq,
+                "speaker": speaker,
+                "delta": delta,
+            })
+            seq += 1
+    except Exception as e:
+        await broadcast_message(task_id, {
+            "event": "MESSAGE_ABORTED",
+            "task_id": str(task_id),
+            "stream_id": stream_id,
+            "speaker": speaker,
+            "seq": seq,
+            "reason": str(e),
+        })
+        raise
+
+    message = await conv_repo.add_message(task_id=task_id, speaker=speaker, message="".join(parts))
+    await broadcast_message(task_id, {**serialize_message(message), "stream_id": stream_id})
+    logger.info(f"流式回复完成: 任务ID={task_id}, 发言者={speaker}, 数据块={seq}")
+    return message
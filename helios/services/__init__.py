@@ -6,9 +6,12 @@
 它只依赖config层，不依赖应用层。
 """
 
+import asyncio
 import logging
 import sys
-from typing import Dict, List
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
 
 # 从config层导入配置
 from helios.config import settings
@@ -40,18 +43,77 @@ if not logger.handlers:
 
 logger.info("Logger initialized")
 
+from helios.services.llm_transport import LLMTransport, LLMTransportError
+from helios.services.routing import ModelRouter
+from helios.services.response_cache import ResponseCache
+from helios.services.metering import UsageMeter, estimate_message_tokens, get_meter, usage_context
+from helios.services.rate_limit import AdmissionController, RateLimited, get_admission_controller
+from helios.services.resilience import (
+    CLOSED, OPEN, CircuitBreaker, CircuitOpenError, DeadlineExceeded, OperationCancelled, RetryBudget,
+    RetryPolicy, cancel_scope, check_cancelled, deadline_scope, guard, remaining_time,
+)
+
 # 创建模型客户端服务
 class MultiModelClient:
     """
     管理多个LLM客户端的类。
     配置通过依赖注入在初始化时传入，而不是从全局模块导入。
     """
-    def __init__(self, settings):
+    def __init__(
+        self,
+        settings,
+        transports: Optional[Dict] = None,
+        cache: Optional[ResponseCache] = None,
+        meter: Optional[UsageMeter] = None,
+        limiter: Optional[AdmissionController] = None,
+    ):
         """
         使用传入的settings对象初始化客户端。
+
+        参数:
+            settings: 配置对象
+            transports: 可选的 {模型名称: httpx传输层} 映射，用于测试
+            cache: 可选的响应缓存，默认根据配置创建
+            meter: 可选的用量计量器，默认使用进程共享的计量器
+            limiter: 可选的准入控制器，按提供商限制请求数和tokens数，默认使用进程共享的控制器
         """
         self.settings = settings
         self.clients = self._initialize_clients()
+        if cache is None and settings.LLM_CACHE_ENABLED:
+            cache = ResponseCache(
+                settings.LLM_CACHE_URL,
+                ttl=settings.LLM_CACHE_TTL,
+                max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+                near_duplicate=settings.LLM_CACHE_NEAR_DUPLICATE,
+                max_distance=settings.LLM_CACHE_MAX_DISTANCE,
+                sweep_every=settings.LLM_CACHE_SWEEP_EVERY,
+            )
+        self.cache = cache
+        self.meter = meter or get_meter()
+        self.limiter = limiter or get_admission_controller()
+        self.transport = LLMTransport(self.clients, settings, transports=transports)
+        self.router = ModelRouter(
+            self.clients.keys(),
+            window_size=settings.LLM_ROUTER_WINDOW,
+            max_error_rate=settings.LLM_ROUTER_MAX_ERROR_RATE,
+        )
+        self.breakers: Dict[str, CircuitBreaker] = {
+            name: CircuitBreaker(
+                failure_threshold=settings.LLM_BREAKER_FAILURE_THRESHOLD,
+                recovery_timeout=settings.LLM_BREAKER_RECOVERY_TIMEOUT,
+                probe_timeout=settings.LLM_BREAKER_PROBE_TIMEOUT,
+            )
+            for name in self.clients
+        }
+        self.retry_policy = RetryPolicy(
+            max_attempts=settings.LLM_RETRY_MAX_ATTEMPTS,
+            base_delay=settings.LLM_RETRY_BASE_DELAY,
+            max_delay=settings.LLM_RETRY_MAX_DELAY,
+            budget=RetryBudget(ratio=settings.LLM_RETRY_BUDGET_RATIO),
+        )
+        # 同步调用方（autogen智能体）共用的后台事件循环，首次调用run_sync时创建
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
         logger.info("MultiModelClient initialized with available models.")
 
     def _initialize_clients(self) -> Dict:
@@ -93,29 +155,436 @@ class MultiModelClient:
     def get_config_list(self) -> List[Dict]:
         """
         生成autogen兼容的config_list。
+
+        autogen按列表顺序依次尝试，因此这里按路由器的排序
+        （熔断器未打开优先，其次是健康状态和p50延迟）返回配置。
         """
         config_list = []
-        for model_name, config in self.clients.items():
-            config_list.append(config)
+        for model_name in self.rank(self.clients.keys()):
+            config_list.append(self.clients[model_name])
         return config_list
 
+    def rank(self, candidates: Optional[List[str]] = None) -> List[str]:
+        """按路由器排序，熔断器打开的提供商排在最后"""
+        ranked = self.router.rank(candidates if candidates is not None else self.clients.keys())
+        return sorted(ranked, key=lambda model: model in self.breakers and self.breakers[model].state == OPEN)
+
+    def _cacheable(self, params: Dict[str, Any]) -> bool:
+        """只缓存低temperature的请求，高temperature的输出不可互换"""
+        temperature = params.get("temperature", 0.0)
+        return self.cache is not None and temperature <= self.settings.LLM_CACHE_MAX_TEMPERATURE
+
+    async def _acquire_quota(self, model: str, messages: List[Dict[str, Any]], params: Dict[str, Any]) -> int:
+        """
+        申请提供商的请求数和tokens配额，配额不足时等待或快速失败。
+
+        返回:
+            预留的tokens数（输入估算值加最大输出）
+
+        异常:
+            LLMTransportError: 如果配额在允许的等待时间内无法满足（status_code为429），
+                               route_chat会据此切换到下一个提供商
+        """
+        reserved = estimate_message_tokens(messages) + (
+            params.get("max_tokens") or self.settings.RATE_LIMIT_COMPLETION_ESTIMATE
+        )
+        try:
+            await self.limiter.acquire_provider(model, reserved)
+        except RateLimited as e:
+            raise LLMTransportError(model, str(e), status_code=429, retry_after=e.retry_after) from e
+        return reserved
+
+    def _settle_quota(self, model: str, reserved: int, usage: Dict[str, Any], error: Optional[Exception] = None):
+        """按实际用量修正预留的配额；提供商返回429时暂停向其发送请求，避免重试风暴"""
+        self.limiter.settle_provider(model, reserved, usage["prompt_tokens"] + usage["completion_tokens"])
+        if isinstance(error, LLMTransportError) and error.status_code == 429:
+            cooldown = error.retry_after or self.settings.RATE_LIMIT_PROVIDER_COOLDOWN
+            self.limiter.pause_provider(model, cooldown)
+            logger.warning(f"提供商 {model} 返回429，暂停 {cooldown:.1f} 秒")
+
+    def _admit_call(self, model: str):
+        """调用前检查取消信号、截止时间和熔断器"""
+        check_cancelled(f"{model} 调用")
+        breaker = self.breakers[model]
+        if not breaker.allow():
+            raise CircuitOpenError(model, breaker.retry_after)
+
+    def _record_outcome(self, model: str, error: Optional[Exception] = None) -> bool:
+        """
+        按调用结果更新熔断器：网络错误、429和5xx计为失败，
+        其他4xx说明提供商可以正常应答，计为成功；截止时间到期和取消不计入
+
+        返回:
+            是否记录了结果；未记录时调用方需要归还探测名额
+        """
+        if isinstance(error, (DeadlineExceeded, OperationCancelled)):
+            return False
+        status = getattr(error, "status_code", 0) if error is not None else 0
+        if error is not None and (status is None or status == 429 or status >= 500):
+            self.breakers[model].record_failure()
+        else:
+            self.breakers[model].record_success()
+        return True
+
+    async def _chat_once(self, pool, model: str, messages: List[Dict[str, Any]], params: Dict[str, Any]) -> Dict[str, Any]:
+        """向指定提供商发送一次请求，截止时间到期或操作取消时中止请求"""
+        self._admit_call(model)
+        recorded = False
+        try:
+            reserved = await self._acquire_quota(model, messages, params)
+            started = time.monotonic()
+            try:
+                response = await guard(pool.chat(self.clients[model]["model"], messages, **params), f"{model} 调用")
+            except asyncio.CancelledError:
+                # 被对冲请求取消不计入错误率
+                raise
+            except Exception as e:
+                self.router.record(model, None, ok=False)
+                recorded = self._record_outcome(model, e)
+                usage = self.meter.record(
+                    model, estimate_message_tokens(messages), latency=time.monotonic() - started,
+                    error=True, estimated=True,
+                )
+                self._settle_quota(model, reserved, usage, e)
+                raise
+            latency = time.monotonic() - started
+            self.router.record(model, latency, ok=True)
+            recorded = self._record_outcome(model)
+            usage = self.meter.record_response(model, messages, response, latency=latency)
+            self._settle_quota(model, reserved, usage)
+            return response
+        finally:
+            if not recorded:
+                self.breakers[model].release()
+
+    def _retry_delay(self, model: str, error: Exception, attempt: int) -> Optional[float]:
+        """
+        判断失败后是否在同一提供商上重试
+
+        返回:
+            重试前的等待秒数，不重试时返回None
+        """
+        policy = self.retry_policy
+        if attempt >= policy.max_attempts or not policy.is_retryable(error):
+            return None
+        if self.breakers[model].state != CLOSED:
+            return None
+        delay = policy.delay(attempt, getattr(error, "retry_after", None))
+        remaining = remaining_time()
+        if remaining is not None and delay >= remaining:
+            return None
+        if policy.budget is not None and not policy.budget.try_retry():
+            logger.warning(f"重试预算已用尽，不再重试 {model}")
+            return None
+        return delay
+
+    async def chat(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        use_cache: bool = True,
+        **params,
+    ) -> Dict[str, Any]:
+        """
+        通过共享连接池向指定模型发送聊天请求。
+
+        网络错误和5xx按指数退避加抖动重试，受重试预算、熔断器和
+        当前截止时间（deadline_scope）的限制。
+
+        参数:
+            model: 模型名称，如 "qwen-max"
+            messages: OpenAI格式的消息列表
+            use_cache: 是否读写响应缓存
+            **params: 其他请求参数，如temperature
+
+        返回:
+            OpenAI兼容格式的响应字典
+
+        异常:
+            CircuitOpenError: 如果该提供商的熔断器已打开
+            DeadlineExceeded: 如果截止时间已过
+            OperationCancelled: 如果当前操作被取消
+            LLMTransportError: 重试后仍然失败
+        """
+        pool = self.transport.get_pool(model)
+        cacheable = use_cache and self._cacheable(params)
+        if cacheable:
+            cached = await asyncio.to_thread(
+                self.cache.get, model, messages, **params
+            )
+            if cached is not None:
+                self.meter.record_response(model, messages, cached, cached=True)
+                return cached
+        if self.retry_policy.budget is not None:
+            self.retry_policy.budget.record_request()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                response = await self._chat_once(pool, model, messages, params)
+                break
+            except Exception as e:
+                delay = self._retry_delay(model, e, attempt)
+                if delay is None:
+                    raise
+                logger.warning(f"提供商 {model} 第{attempt}次请求失败，{delay:.2f} 秒后重试: {e}")
+                await guard(asyncio.sleep(delay), f"{model} 重试等待")
+        if cacheable:
+            await asyncio.to_thread(
+                self.cache.set, model, messages, response, **params
+            )
+        return response
+
+    async def stream_chat(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        use_cache: bool = True,
+        **params,
+    ) -> AsyncIterator[str]:
+        """
+        以流式方式向指定模型发送聊天请求，逐块产出增量文本。
+
+        命中缓存时整段内容作为一个数据块产出；流结束后，
+        完整回复会以普通响应的格式写入缓存。已产出的内容无法撤回，
+        因此流式请求不做重试，只检查熔断器，并在截止时间到期或操作取消时中止。
+
+        参数:
+            model: 模型名称
+            messages: OpenAI格式的消息列表
+            use_cache: 是否读写响应缓存
+            **params: 其他请求参数
+
+        产出:
+            增量文本片段
+        """
+        pool = self.transport.get_pool(model)
+        cacheable = use_cache and self._cacheable(params)
+        if cacheable:
+            cached = await asyncio.to_thread(
+                self.cache.get, model, messages, **params
+            )
+            if cached is not None:
+                self.meter.record_response(model, messages, cached, cached=True)
+                yield cached["choices"][0]["message"]["content"]
+                return
+        self._admit_call(model)
+        recorded = False
+        try:
+            reserved = await self._acquire_quota(model, messages, params)
+            started = time.monotonic()
+            parts = []
+            stream = pool.stream_chat(self.clients[model]["model"], messages, **params)
+            try:
+                while True:
+                    try:
+                        delta = await guard(stream.__anext__(), f"{model} 流式调用")
+                    except StopAsyncIteration:
+                        break
+                    parts.append(delta)
+                    yield delta
+            except (asyncio.CancelledError, GeneratorExit):
+                # 客户端中途断开时已生成的部分同样计费
+                usage = self.meter.record_response(
+                    model, messages, latency=time.monotonic() - started, completion_text="".join(parts)
+                )
+                self._settle_quota(model, reserved, usage)
+                raise
+            except Exception as e:
+                self.router.record(model, None, ok=False)
+                recorded = self._record_outcome(model, e)
+                usage = self.meter.record_response(
+                    model, messages, latency=time.monotonic() - started, error=True, completion_text="".join(parts)
+                )
+                self._settle_quota(model, reserved, usage, e)
+                raise
+            finally:
+                await stream.aclose()
+            latency = time.monotonic() - started
+            self.router.record(model, latency, ok=True)
+            recorded = self._record_outcome(model)
+        finally:
+            # 断开、取消、截止时间和本地限流都不产生结果，归还半开状态的探测名额
+            if not recorded:
+                self.breakers[model].release()
+        # 流式响应不带usage字段，用本地分词器估算
+        usage = self.meter.record_response(model, messages, latency=latency, completion_text="".join(parts))
+        self._settle_quota(model, reserved, usage)
+        if cacheable:
+            response = {
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(parts)}}],
+            }
+            await asyncio.to_thread(
+                self.cache.set, model, messages, response, **params
+            )
+
+    async def route_chat(
+        self,
+        messages: List[Dict[str, Any]],
+        candidates: Optional[List[str]] = None,
+        hedge: bool = False,
+        hedge_delay: Optional[float] = None,
+        **params,
+    ) -> Dict[str, Any]:
+        """
+        把请求发送给当前最快的健康提供商。
+
+        失败时按路由排序依次切换到下一个提供商。启用hedge时，
+        如果首选提供商在hedge_delay秒内没有返回，会向排名第二的提供商
+        发送一个重复请求，先返回的结果胜出，较慢的请求被取消。
+
+        参数:
+            messages: OpenAI格式的消息列表
+            candidates: 候选模型，默认为全部已配置模型
+            hedge: 是否启用对冲请求
+            hedge_delay: 发送对冲请求前的等待时间（秒），默认取配置值
+            **params: 其他请求参数
+
+        返回:
+            OpenAI兼容格式的响应字典，"model"字段为实际应答的模型
+        """
+        ranked = iter(self.rank(candidates or list(self.clients.keys())))
+        if hedge_delay is None:
+            hedge_delay = self.settings.LLM_HEDGE_DELAY
+        pending: Dict[asyncio.Task, str] = {}
+        last_error: Optional[Exception] = None
+
+        def launch() -> bool:
+            model = next(ranked, None)
+            if model is None:
+                return False
+            pending[asyncio.ensure_future(self.chat(model, messages, **params))] = model
+            return True
+
+        if not launch():
+            raise LLMTransportError("router", "没有可用的候选模型")
+        hedged = not hedge
+        try:
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=None if hedged else hedge_delay,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    hedged = True
+                    if launch():
+                        logger.info(f"首选提供商 {list(pending.values())[0]} 响应较慢，已发送对冲请求")
+                    continue
+                for task in done:
+                    model = pending.pop(task)
+                    if task.exception() is None:
+                        response = task.result()
+                        response.setdefault("model", model)
+                        return response
+                    last_error = task.exception()
+                    logger.warning(f"提供商 {model} 请求失败: {last_error}")
+                    if isinstance(last_error, (DeadlineExceeded, OperationCancelled)):
+                        # 截止时间已过或操作已取消，不再切换提供商
+                        raise last_error
+                if not pending:
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        raise last_error
+
+    @staticmethod
+    def _run_loop(loop: asyncio.AbstractEventLoop):
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    def _background_loop(self) -> asyncio.AbstractEventLoop:
+        """返回运行在守护线程中的后台事件循环，不存在时创建"""
+        with self._loop_lock:
+            if self._loop is None or self._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=self._run_loop, args=(loop,), name="helios-llm-loop", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def run_sync(self, coro):
+        """
+        在同步代码中执行协程，供autogen智能体等运行在普通线程中的调用方使用。
+
+        协程在客户端的后台事件循环中执行，连接池在多次调用之间保持复用；
+        run_coroutine_threadsafe在提交时复制调用线程的contextvars，
+        用量归属、截止时间和取消令牌随之传递。
+
+        参数:
+            coro: 要执行的协程
+
+        返回:
+            协程的返回值
+
+        异常:
+            RuntimeError: 如果在后台事件循环的线程中调用（会造成死锁）
+        """
+        loop = self._background_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            coro.close()
+            raise RuntimeError("不能在后台事件循环中同步等待协程")
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    async def aclose(self):
+        """关闭所有提供商的连接池（包括后台事件循环上的），应在应用关闭时调用。"""
+        await self.transport.aclose()
+        with self._loop_lock:
+            loop, self._loop = self._loop, None
+        if loop is not None and not loop.is_closed():
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self.transport.aclose(), loop))
+            loop.call_soon_threadsafe(loop.stop)
+
 # 创建LLM配置
-def create_llm_config(model_client):
-    """创建LLM配置"""
+def create_llm_config(model_client, routed: bool = True):
+    """
+    创建autogen的llm_config
+
+    提供商的排序随延迟、错误率和熔断器状态变化，不要在模块级别缓存结果，
+    应在创建智能体或团队时调用。
+
+    参数:
+        model_client: MultiModelClient实例
+        routed: 为True时config_list只包含HeliosModelClient条目，由路由器在每次调用时选择提供商，
+                智能体需要注册HeliosModelClient；为False时按调用时的路由排序返回各提供商的配置
+
+    返回:
+        llm_config字典
+    """
+    if routed:
+        from helios.services.autogen_client import HeliosModelClient
+        return {"config_list": [HeliosModelClient.config_entry()], "temperature": 0.2}
     return {
         "config_list": model_client.get_config_list(),
         "temperature": 0.2,
-        "request_timeout": 120,
-        "retry_wait_time": 5,
-        "max_retries": 3,
+        # 单次请求的超时；autogen 0.2的OpenAI客户端不识别旧的request_timeout/retry_wait_time
+        "timeout": model_client.settings.LLM_REQUEST_TIMEOUT,
+        # 提供商限流时多次重试只会加剧过载，由准入控制和路由切换代替
+        "max_retries": model_client.settings.LLM_CLIENT_MAX_RETRIES,
         "seed": 42,
     }
 
+def get_llm_config(routed: bool = True):
+    """按共享客户端的当前状态创建llm_config，参数同create_llm_config"""
+    return create_llm_config(model_client, routed)
+
 # 实例化服务
 model_client = MultiModelClient(settings)
-llm_config = create_llm_config(model_client)
 
 logger.info("All services initialized")
 
 # 导出服务实例，使其可以通过 from helios.services import ... 访问
-__all__ = ["logger", "model_client", "llm_config"] 
\ No newline at end of file
+__all__ = [
+    "logger", "model_client", "create_llm_config", "get_llm_config", "LLMTransportError", "usage_context",
+    "deadline_scope", "cancel_scope",
+] 
\ No newline at end of file
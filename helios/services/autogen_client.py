@@ -0,0 +1,142 @@
+# helios/services/autogen_client.py
+"""
+autogen自定义模型客户端
+
+让autogen智能体的补全请求经过MultiModelClient，从而共享连接池、
+延迟感知路由、响应缓存、用量计量、准入控制和熔断器。
+
+使用方式:
+    llm_config = {"config_list": [HeliosModelClient.config_entry()]}
+    agent = ConversableAgent("Analyst", llm_config=llm_config)
+    agent.register_model_client(HeliosModelClient, client=model_client)
+
+本模块不导入autogen，只实现autogen 0.2的ModelClient协议
+（create、message_retrieval、cost、get_usage）。
+"""
+
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Union
+
+from helios.services.metering import usage_context
+
+
+class HeliosResponse:
+    """
+    autogen要求的响应对象
+
+    choices[i].message的字段与OpenAI响应中的message相同；
+    model为实际应答的模型，usage为提供商返回的用量。
+    autogen会在响应上附加cost、config_id等属性。
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        """
+        参数:
+            data: OpenAI兼容格式的响应字典
+        """
+        self.id = data.get("id")
+        self.model = data.get("model")
+        self.usage = dict(data.get("usage") or {})
+        self.choices = [
+            SimpleNamespace(
+                index=choice.get("index", i),
+                finish_reason=choice.get("finish_reason"),
+                message=SimpleNamespace(**(choice.get("message") or {"role": "assistant", "content": None})),
+            )
+            for i, choice in enumerate(data.get("choices") or [])
+        ]
+
+
+class HeliosModelClient:
+    """
+    通过MultiModelClient.route_chat发送请求的autogen模型客户端
+
+    config_list中只需要一个条目，由路由器在每次调用时按延迟、错误率和
+    熔断器状态选择提供商，失败时切换到下一个提供商。
+    autogen在普通线程中同步调用create，请求在MultiModelClient的后台事件循环中执行，
+    调用线程的用量归属、截止时间和取消令牌随之传递。用量按提供商返回的usage和
+    实际应答的模型计量；注册时传入agent_name可把调用归属到该智能体（GroupChat中也适用）。
+    """
+
+    # 转发给提供商的请求参数；autogen合并到params中的其他配置项（如timeout）不转发
+    REQUEST_PARAMS = (
+        "temperature", "max_tokens", "top_p", "stop", "n", "presence_penalty", "frequency_penalty",
+        "seed", "response_format", "tools", "tool_choice", "functions", "function_call", "user",
+    )
+
+    RESPONSE_USAGE_KEYS = ["prompt_tokens", "completion_tokens", "total_tokens", "cost", "model"]
+
+    def __init__(self, config: Dict[str, Any], client=None, agent_name: Optional[str] = None, **kwargs):
+        """
+        参数:
+            config: config_list中对应的条目，可包含candidates（候选模型列表）和hedge（是否对冲）
+            client: MultiModelClient实例，默认使用helios.services.model_client
+            agent_name: 用量归属的智能体名称，默认沿用调用方的usage_context
+        """
+        if client is None:
+            from helios.services import model_client as client
+        self.client = client
+        self.agent_name = agent_name
+        self.candidates: Optional[List[str]] = config.get("candidates")
+        self.hedge = bool(config.get("hedge", False))
+
+    @classmethod
+    def config_entry(cls, candidates: Optional[List[str]] = None, hedge: bool = False) -> Dict[str, Any]:
+        """
+        生成使用本客户端的config_list条目
+
+        参数:
+            candidates: 候选模型，默认为全部已配置模型
+            hedge: 是否启用对冲请求
+
+        返回:
+            config_list条目；关闭autogen自带的磁盘缓存，缓存由MultiModelClient负责
+        """
+        entry = {"model": "helios-router", "model_client_cls": cls.__name__, "cache_seed": None, "hedge": hedge}
+        if candidates:
+            entry["candidates"] = list(candidates)
+        return entry
+
+    def create(self, params: Dict[str, Any]) -> HeliosResponse:
+        """
+        发送一次补全请求
+
+        参数:
+            params: autogen合并后的请求参数，包含messages
+
+        返回:
+            HeliosResponse
+        """
+        request = {key: params[key] for key in self.REQUEST_PARAMS if params.get(key) is not None}
+        with usage_context(agent=self.agent_name):
+            response = self.client.run_sync(
+                self.client.route_chat(params["messages"], candidates=self.candidates, hedge=self.hedge, **request)
+            )
+        return HeliosResponse(response)
+
+    def message_retrieval(self, response: HeliosResponse) -> List[Union[str, Dict[str, Any]]]:
+        """返回每个choice的回复：普通回复为文本，包含工具调用时为完整的消息字典"""
+        messages = []
+        for choice in response.choices:
+            message = vars(choice.message)
+            if message.get("tool_calls") or message.get("function_call"):
+                messages.append(dict(message))
+            else:
+                messages.append(message.get("content"))
+        return messages
+
+    def cost(self, response: HeliosResponse) -> float:
+        """费用由helios的用量计量器按提供商统计，这里不重复计算"""
+        return 0.0
+
+    @staticmethod
+    def get_usage(response: HeliosResponse) -> Dict[str, Any]:
+        """返回autogen汇总用量所需的字段"""
+        usage = response.usage
+        return {
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "total_tokens": usage.get("total_tokens", 0),
+            "cost": getattr(response, "cost", 0.0),
+            "model": response.model,
+        }
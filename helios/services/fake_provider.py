@@ -0,0 +1,105 @@
+# helios/services/fake_provider.py
+"""
+本地模拟提供商
+
+提供可配置延迟和故障率的OpenAI兼容假接口，
+通过httpx.MockTransport注入MultiModelClient，
+无需网络即可测试路由、对冲请求等行为。
+
+示例:
+    providers = {"qwen-max": FakeProvider(latency=0.05), "glm-4": FakeProvider(latency=0.5)}
+    client = MultiModelClient(settings, transports=fake_transports(providers))
+"""
+
+import asyncio
+import json
+import random
+from typing import Dict, Optional
+
+import httpx
+
+
+class FakeProvider:
+    """
+    一个模拟的聊天补全提供商
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        status_code: int = 500,
+        content: str = "这是一个来自模拟提供商的回复。",
+        seed: Optional[int] = None,
+    ):
+        """
+        参数:
+            latency: 每次请求的基础延迟（秒）
+            jitter: 在基础延迟上附加的随机抖动上限（秒）
+            error_rate: 返回错误响应的概率
+            status_code: 出错时返回的HTTP状态码
+            content: 成功时返回的回复内容
+            seed: 随机数种子，便于复现
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.status_code = status_code
+        self.content = content
+        self._random = random.Random(seed)
+        self.calls = 0
+        self.completed = 0
+        self.cancelled = 0
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        """处理一次请求"""
+        self.calls += 1
+        payload = json.loads(request.content or b"{}")
+        delay = self.latency + self._random.uniform(0, self.jitter)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self._random.random() < self.error_rate:
+            return httpx.Response(self.status_code, json={"error": {"message": "模拟的提供商故障"}})
+        self.completed += 1
+        if payload.get("stream"):
+            return httpx.Response(
+                200,
+                headers={"Content-Type": "text/event-stream"},
+                content=self._sse_body(payload.get("model")),
+            )
+        return httpx.Response(200, json={
+            "model": payload.get("model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": self.content},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+    def _sse_body(self, model: Optional[str], chunk_size: int = 4) -> bytes:
+        """把回复内容切分为SSE数据块"""
+        lines = []
+        for start in range(0, len(self.content), chunk_size):
+            chunk = {
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": self.content[start:start + chunk_size]}}],
+            }
+            lines.append(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+        lines.append("data: [DONE]\n\n")
+        return "".join(lines).encode("utf-8")
+
+    def transport(self) -> httpx.MockTransport:
+        """生成可注入httpx客户端的传输层"""
+        return httpx.MockTransport(self.handle)
+
+
+def fake_transports(providers: Dict[str, FakeProvider]) -> Dict[str, httpx.MockTransport]:
+    """
+    把 {模型名称: FakeProvider} 转换为MultiModelClient可用的transports参数
+    """
+    return {name: provider.transport() for name, provider in providers.items()}
@@ -0,0 +1,277 @@
+# helios/services/llm_transport.py
+"""
+LLM异步传输层
+
+为每个模型提供商维护一个持久的HTTP连接池（启用keep-alive），
+并限制每个提供商的并发请求数。所有智能体和路由共享同一组连接池，
+避免每一轮对话都重新建立TCP/TLS连接。
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import weakref
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+
+# 与helios.services中的日志服务共用同一个logger
+logger = logging.getLogger("HeliosApp")
+
+
+class LLMTransportError(Exception):
+    """提供商请求失败时抛出的异常"""
+
+    def __init__(
+        self,
+        provider: str,
+        message: str,
+        status_code: Optional[int] = None,
+        retry_after: Optional[float] = None,
+    ):
+        super().__init__(f"[{provider}] {message}")
+        self.provider = provider
+        self.status_code = status_code
+        # 提供商在429/503响应中通过Retry-After头建议的等待秒数
+        self.retry_after = retry_after
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """解析Retry-After头（秒数格式），缺失或无法解析时返回None"""
+    try:
+        return float(response.headers["retry-after"])
+    except (KeyError, ValueError):
+        return None
+
+
+class ProviderPool:
+    """
+    单个提供商的连接池
+
+    底层的httpx.AsyncClient在首次使用时按事件循环惰性创建，
+    因此可以在模块导入阶段安全地实例化。每个事件循环（例如API的事件循环和
+    同步调用方使用的后台事件循环）各自持有一个客户端和并发信号量，互不干扰。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        api_key: str,
+        base_url: str,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 60.0,
+        max_concurrent_streams: int = 8,
+        timeout: float = 120.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        """
+        参数:
+            name: 提供商名称（即模型名称）
+            api_key: API密钥
+            base_url: OpenAI兼容接口的基础URL
+            max_connections: 连接池最大连接数
+            max_keepalive_connections: 保持空闲的最大连接数
+            keepalive_expiry: 空闲连接的保活时间（秒）
+            max_concurrent_streams: 该提供商允许的最大并发请求数
+            timeout: 单次请求超时时间（秒）
+            transport: 可选的自定义传输层，主要用于测试
+        """
+        self.name = name
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_concurrent_streams = max_concurrent_streams
+        self.timeout = timeout
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._transport = transport
+        # 事件循环 -> (客户端, 并发信号量)；事件循环被回收后对应条目自动删除
+        self._clients = weakref.WeakKeyDictionary()
+        self._clients_lock = threading.Lock()
+        self.in_flight = 0
+        self.total_requests = 0
+
+    @property
+    def endpoint(self) -> str:
+        """聊天补全接口的完整URL"""
+        url = self.base_url.rstrip("/")
+        if url.endswith("/chat/completions"):
+            return url
+        return f"{url}/chat/completions"
+
+    @property
+    def _client(self) -> Optional[httpx.AsyncClient]:
+        """绑定到当前事件循环的客户端，尚未创建时为None"""
+        entry = self._clients.get(asyncio.get_running_loop())
+        return entry[0] if entry is not None else None
+
+    def _ensure_client(self) -> Tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        """获取绑定到当前事件循环的客户端和信号量"""
+        loop = asyncio.get_running_loop()
+        with self._clients_lock:
+            entry = self._clients.get(loop)
+            if entry is None:
+                # 已关闭的事件循环上的客户端无法再使用，直接丢弃
+                for stale in [other for other in self._clients if other.is_closed()]:
+                    del self._clients[stale]
+                entry = (
+                    httpx.AsyncClient(
+                        limits=self._limits,
+                        timeout=self.timeout,
+                        transport=self._transport,
+                        headers={"Authorization": f"Bearer {self.api_key}"},
+                    ),
+                    asyncio.Semaphore(self.max_concurrent_streams),
+                )
+                self._clients[loop] = entry
+        return entry
+
+    async def chat(self, model: str, messages: List[Dict[str, Any]], **params) -> Dict[str, Any]:
+        """
+        发送一次聊天补全请求
+
+        参数:
+            model: 模型名称
+            messages: OpenAI格式的消息列表
+            **params: 其他请求参数，如temperature、max_tokens
+
+        返回:
+            提供商返回的JSON响应
+
+        异常:
+            LLMTransportError: 网络错误或非2xx响应
+        """
+        client, semaphore = self._ensure_client()
+        payload = {"model": model, "messages": messages, **params}
+        async with semaphore:
+            self.in_flight += 1
+            self.total_requests += 1
+            try:
+                response = await client.post(self.endpoint, json=payload)
+            except httpx.HTTPError as e:
+                raise LLMTransportError(self.name, f"请求失败: {e}") from e
+            finally:
+                self.in_flight -= 1
+        if response.status_code >= 400:
+            raise LLMTransportError(
+                self.name,
+                f"HTTP {response.status_code}: {response.text[:200]}",
+                status_code=response.status_code,
+                retry_after=_retry_after(response),
+            )
+        return response.json()
+
+    async def stream_chat(self, model: str, messages: List[Dict[str, Any]], **params) -> AsyncIterator[str]:
+        """
+        以流式（SSE）方式发送聊天补全请求，逐块产出增量文本
+
+        参数:
+            model: 模型名称
+            messages: OpenAI格式的消息列表
+            **params: 其他请求参数
+
+        产出:
+            每个SSE数据块中的增量内容（choices[0].delta.content）
+
+        异常:
+            LLMTransportError: 网络错误或非2xx响应
+        """
+        client, semaphore = self._ensure_client()
+        payload = {"model": model, "messages": messages, **params, "stream": True}
+        async with semaphore:
+            self.in_flight += 1
+            self.total_requests += 1
+            try:
+                async with client.stream("POST", self.endpoint, json=payload) as response:
+                    if response.status_code >= 400:
+                        body = (await response.aread()).decode("utf-8", errors="replace")
+                        raise LLMTransportError(
+                            self.name,
+                            f"HTTP {response.status_code}: {body[:200]}",
+                            status_code=response.status_code,
+                            retry_after=_retry_after(response),
+                        )
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        chunk = json.loads(data)
+                        for choice in chunk.get("choices", []):
+                            delta = (choice.get("delta") or {}).get("content")
+                            if delta:
+                                yield delta
+            except httpx.HTTPError as e:
+                raise LLMTransportError(self.name, f"流式请求失败: {e}") from e
+            finally:
+                self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """返回连接池的运行统计"""
+        return {
+            "in_flight": self.in_flight,
+            "total_requests": self.total_requests,
+            "max_concurrent_streams": self.max_concurrent_streams,
+        }
+
+    async def aclose(self):
+        """关闭绑定到当前事件循环的底层连接池"""
+        with self._clients_lock:
+            entry = self._clients.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await entry[0].aclose()
+
+
+class LLMTransport:
+    """
+    按提供商管理连接池的传输层
+    """
+
+    def __init__(
+        self,
+        provider_configs: Dict[str, Dict[str, Any]],
+        settings,
+        transports: Optional[Dict[str, httpx.AsyncBaseTransport]] = None,
+    ):
+        """
+        参数:
+            provider_configs: {模型名称: {"model", "api_key", "base_url"}}
+            settings: 配置对象，提供连接池参数
+            transports: 可选的 {模型名称: 传输层} 映射，用于测试
+        """
+        transports = transports or {}
+        self.pools: Dict[str, ProviderPool] = {
+            name: ProviderPool(
+                name=name,
+                api_key=config["api_key"],
+                base_url=config["base_url"],
+                max_connections=settings.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+                max_concurrent_streams=settings.LLM_MAX_CONCURRENT_STREAMS,
+                timeout=settings.LLM_REQUEST_TIMEOUT,
+                transport=transports.get(name),
+            )
+            for name, config in provider_configs.items()
+        }
+
+    def get_pool(self, model_name: str) -> ProviderPool:
+        """获取模型对应的连接池"""
+        pool = self.pools.get(model_name)
+        if pool is None:
+            raise LLMTransportError(model_name, "未配置该模型")
+        return pool
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """返回所有连接池的运行统计"""
+        return {name: pool.stats() for name, pool in self.pools.items()}
+
+    async def aclose(self):
+        """关闭所有连接池在当前事件循环上的客户端"""
+        for pool in self.pools.values():
+            await pool.aclose()
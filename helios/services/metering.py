@@ -0,0 +1,438 @@
+# helios/services/metering.py
+"""
+LLM用量计量
+
+记录每次LLM调用的输入/输出token数、延迟和费用，并归属到
+任务ID、用户ID、智能体名称和状态机状态。归属信息通过usage_context
+在调用链上传递（基于contextvars，可跨越await和asyncio.to_thread）。
+
+调用明细先在内存中按维度聚合，定期合并写入数据库的llm_usage表，
+每行对应 (日期, 模型, 任务, 用户, 智能体, 状态) 的累计值。
+在事件循环中触发的写入放到线程池中执行，不阻塞事件循环。
+"""
+
+import asyncio
+import contextvars
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import (
+    Column, Float, Integer, MetaData, String, Table, UniqueConstraint,
+    create_engine, func, select, update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.pool import StaticPool
+
+# 与helios.services中的日志服务共用同一个logger
+logger = logging.getLogger("HeliosApp")
+
+metadata = MetaData()
+
+# 支持 INSERT ... ON CONFLICT DO UPDATE 的方言，其他数据库退回到先更新再插入
+UPSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+usage_table = Table(
+    "llm_usage",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("day", String(10), nullable=False),
+    Column("model", String(100), nullable=False),
+    Column("task_id", String(64), nullable=False, index=True),
+    Column("user_id", String(64), nullable=False),
+    Column("agent", String(50), nullable=False),
+    Column("state", String(50), nullable=False),
+    Column("calls", Integer, nullable=False, default=0),
+    Column("cached_calls", Integer, nullable=False, default=0),
+    Column("errors", Integer, nullable=False, default=0),
+    Column("prompt_tokens", Integer, nullable=False, default=0),
+    Column("completion_tokens", Integer, nullable=False, default=0),
+    Column("estimated_calls", Integer, nullable=False, default=0),
+    Column("latency_total", Float, nullable=False, default=0.0),
+    Column("cost", Float, nullable=False, default=0.0),
+    UniqueConstraint("day", "model", "task_id", "user_id", "agent", "state", name="uq_llm_usage_dimensions"),
+)
+
+DIMENSIONS = ("day", "model", "task_id", "user_id", "agent", "state")
+COUNTERS = (
+    "calls", "cached_calls", "errors", "prompt_tokens", "completion_tokens",
+    "estimated_calls", "latency_total", "cost",
+)
+
+# 各模型每千tokens的价格（元），(输入, 输出)；以提供商的实际账单为准，可通过LLM_PRICING覆盖
+DEFAULT_PRICES: Dict[str, Tuple[float, float]] = {
+    "qwen-max": (0.02, 0.06),
+    "glm-4": (0.1, 0.1),
+    "deepseek-chat": (0.001, 0.002),
+    "moonshot-v1-8k": (0.012, 0.012),
+}
+
+# 未提供归属信息时使用的占位值
+UNATTRIBUTED = "-"
+
+_usage_context: contextvars.ContextVar = contextvars.ContextVar("helios_usage_context", default={})
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    """惰性加载tiktoken编码；未安装或无法加载编码文件（如离线环境）时返回None"""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = None
+    return _encoding
+
+
+def estimate_tokens(text: Any) -> int:
+    """
+    估算文本的token数
+
+    优先使用本地tiktoken分词器（cl100k_base）；不可用时
+    中日韩字符按每字1个token，其余字符按每4个字符1个token估算。
+
+    参数:
+        text: 文本，非字符串会先转换为字符串
+
+    返回:
+        token数
+    """
+    if not text:
+        return 0
+    if not isinstance(text, str):
+        text = str(text)
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    cjk = sum(1 for ch in text if "　" <= ch <= "鿿" or "가" <= ch <= "힯" or "＀" <= ch <= "￯")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def estimate_message_tokens(messages: List[Dict[str, Any]]) -> int:
+    """
+    估算OpenAI格式消息列表的输入token数，每条消息另计4个格式token
+
+    参数:
+        messages: 消息列表
+
+    返回:
+        token数
+    """
+    return sum(4 + estimate_tokens(m.get("content")) + estimate_tokens(m.get("name")) for m in messages) + 2
+
+
+@contextmanager
+def usage_context(**attributes) -> Iterator[Dict[str, Any]]:
+    """
+    为上下文中的LLM调用设置归属信息，嵌套时内层的值覆盖外层
+
+    参数:
+        **attributes: task_id、user_id、agent、state，值为None的项被忽略
+
+    用法:
+        with usage_context(task_id=str(task.id), user_id=user_id):
+            with usage_context(agent="Researcher", state="RESEARCHING"):
+                await model_client.chat(...)
+    """
+    merged = {**_usage_context.get(), **{k: v for k, v in attributes.items() if v is not None}}
+    token = _usage_context.set(merged)
+    try:
+        yield merged
+    finally:
+        _usage_context.reset(token)
+
+
+def current_usage_context() -> Dict[str, Any]:
+    """返回当前的归属信息"""
+    return dict(_usage_context.get())
+
+
+class UsageMeter:
+    """
+    LLM用量计量器
+
+    record在内存中累加，达到flush_every条记录后合并写入数据库
+    （在事件循环中调用时由线程池写入）；查询接口会先写入未落盘的数据。
+    """
+
+    def __init__(
+        self,
+        url: str,
+        prices: Optional[Dict[str, Any]] = None,
+        flush_every: int = 20,
+        enabled: bool = True,
+    ):
+        """
+        参数:
+            url: 数据库连接URL
+            prices: 模型价格表 {模型: [输入价格, 输出价格]}（元/千tokens），覆盖DEFAULT_PRICES
+            flush_every: 累计多少次调用后写入数据库
+            enabled: 是否启用计量
+        """
+        self.url = url
+        self.prices = {**DEFAULT_PRICES, **{k: tuple(v) for k, v in (prices or {}).items()}}
+        self.flush_every = flush_every
+        self.enabled = enabled
+        self._engine = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[Tuple[str, ...], Dict[str, float]] = {}
+        self._pending_calls = 0
+        self._flush_scheduled = False
+
+    @property
+    def engine(self):
+        """惰性创建数据库引擎并建表"""
+        if self._engine is None:
+            kwargs = {}
+            if self.url.startswith("sqlite"):
+                kwargs["connect_args"] = {"check_same_thread": False}
+                if self.url in ("sqlite://", "sqlite:///:memory:"):
+                    kwargs["poolclass"] = StaticPool
+            self._engine = create_engine(self.url, **kwargs)
+            metadata.create_all(self._engine)
+        return self._engine
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        """
+        按价格表计算一次调用的费用
+
+        返回:
+            费用（元），未配置价格的模型为0
+        """
+        prompt_price, completion_price = self.prices.get(model, (0.0, 0.0))
+        return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+    def record(
+        self,
+        model: str,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        latency: float = 0.0,
+        cached: bool = False,
+        error: bool = False,
+        estimated: bool = False,
+        **attributes,
+    ) -> Dict[str, Any]:
+        """
+        记录一次LLM调用
+
+        参数:
+            model: 模型名称
+            prompt_tokens: 输入token数
+            completion_tokens: 输出token数
+            latency: 耗时（秒）
+            cached: 是否命中响应缓存（不计费）
+            error: 调用是否失败
+            estimated: token数是否为本地估算值（提供商未返回usage）
+            **attributes: 归属信息，覆盖usage_context中的值
+
+        返回:
+            本次调用的记录
+        """
+        attribution = {**_usage_context.get(), **{k: v for k, v in attributes.items() if v is not None}}
+        entry = {
+            "day": datetime.utcnow().strftime("%Y-%m-%d"),
+            "model": model,
+            **{name: str(attribution.get(name) or UNATTRIBUTED) for name in ("task_id", "user_id", "agent", "state")},
+            "calls": 1,
+            "cached_calls": int(cached),
+            "errors": int(error),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "estimated_calls": int(estimated),
+            "latency_total": latency,
+            "cost": 0.0 if cached else self.cost(model, prompt_tokens, completion_tokens),
+        }
+        if not self.enabled:
+            return entry
+        key = tuple(entry[name] for name in DIMENSIONS)
+        with self._lock:
+            totals = self._pending.setdefault(key, {name: 0 for name in COUNTERS})
+            for name in COUNTERS:
+                totals[name] += entry[name]
+            self._pending_calls += 1
+            should_flush = self._pending_calls >= self.flush_every and not self._flush_scheduled
+            if should_flush:
+                self._flush_scheduled = True
+        if should_flush:
+            self._flush_soon()
+        return entry
+
+    def _flush_soon(self):
+        """写入累计的用量；在事件循环中调用时放到线程池中执行，不阻塞事件循环"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is None:
+            self._flush_logged()
+        else:
+            loop.run_in_executor(None, self._flush_logged)
+
+    def _flush_logged(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"写入LLM用量失败: {e}")
+
+    def record_response(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        response: Optional[Dict[str, Any]] = None,
+        latency: float = 0.0,
+        cached: bool = False,
+        error: bool = False,
+        completion_text: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        根据OpenAI兼容响应记录一次调用；响应没有usage字段时用本地分词器估算
+
+        参数:
+            model: 模型名称
+            messages: 请求的消息列表
+            response: 响应字典，失败时为None
+            latency: 耗时（秒）
+            cached: 是否命中响应缓存
+            error: 调用是否失败
+            completion_text: 流式调用拼接后的回复文本
+
+        返回:
+            本次调用的记录
+        """
+        usage = (response or {}).get("usage") or {}
+        if "prompt_tokens" in usage:
+            return self.record(
+                model, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0),
+                latency=latency, cached=cached, error=error,
+            )
+        if completion_text is None and response:
+            choices = response.get("choices") or [{}]
+            completion_text = (choices[0].get("message") or {}).get("content")
+        return self.record(
+            model,
+            estimate_message_tokens(messages),
+            estimate_tokens(completion_text),
+            latency=latency,
+            cached=cached,
+            error=error,
+            estimated=True,
+        )
+
+    def flush(self):
+        """
+        把内存中的聚合值合并写入数据库
+
+        SQLite和PostgreSQL使用INSERT ... ON CONFLICT DO UPDATE，多个进程同时写入同一维度时不会冲突。
+        写入失败时，这批聚合值被合并回内存，下次写入时重试。
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending, self._pending_calls = self._pending, {}, 0
+                self._flush_scheduled = False
+            if not pending:
+                return
+            rows = [{**dict(zip(DIMENSIONS, key)), **totals} for key, totals in pending.items()]
+            try:
+                with self.engine.begin() as conn:
+                    self._merge_rows(conn, rows)
+            except Exception:
+                self._restore(pending)
+                raise
+
+    def _merge_rows(self, conn, rows: List[Dict[str, Any]]):
+        upsert = UPSERTS.get(conn.dialect.name)
+        if upsert is not None:
+            statement = upsert(usage_table)
+            conn.execute(
+                statement.on_conflict_do_update(
+                    index_elements=list(DIMENSIONS),
+                    set_={name: usage_table.c[name] + statement.excluded[name] for name in COUNTERS},
+                ),
+                rows,
+            )
+            return
+        for row in rows:
+            condition = [usage_table.c[name] == row[name] for name in DIMENSIONS]
+            updated = conn.execute(
+                update(usage_table).where(*condition).values(
+                    **{name: usage_table.c[name] + row[name] for name in COUNTERS}
+                )
+            ).rowcount
+            if not updated:
+                conn.execute(usage_table.insert().values(**row))
+
+    def _restore(self, pending: Dict[Tuple[str, ...], Dict[str, float]]):
+        """把未写入的聚合值合并回内存"""
+        with self._lock:
+            for key, totals in pending.items():
+                merged = self._pending.setdefault(key, {name: 0 for name in COUNTERS})
+                for name in COUNTERS:
+                    merged[name] += totals[name]
+                self._pending_calls += int(totals["calls"])
+
+    def breakdown(self, group_by: List[str], **filters) -> List[Dict[str, Any]]:
+        """
+        按指定维度汇总用量
+
+        参数:
+            group_by: 分组维度，取值为day、model、task_id、user_id、agent、state
+            **filters: 维度过滤条件，例如 task_id="..."；值为None的项被忽略
+
+        返回:
+            每组一条记录，包含分组维度、累计计数和平均延迟，按费用降序排列
+
+        异常:
+            ValueError: 如果分组或过滤维度未知
+        """
+        unknown = [name for name in list(group_by) + list(filters) if name not in DIMENSIONS]
+        if unknown:
+            raise ValueError(f"未知的用量维度: {unknown}")
+        self.flush()
+        columns = [usage_table.c[name] for name in group_by]
+        sums = [func.sum(usage_table.c[name]).label(name) for name in COUNTERS]
+        query = select(*columns, *sums)
+        for name, value in filters.items():
+            if value is not None:
+                query = query.where(usage_table.c[name] == str(value))
+        if columns:
+            query = query.group_by(*columns)
+        query = query.order_by(func.sum(usage_table.c.cost).desc())
+        with self.engine.connect() as conn:
+            rows = [dict(row._mapping) for row in conn.execute(query)]
+        result = []
+        for row in rows:
+            if not row["calls"]:
+                continue
+            row["cost"] = round(row["cost"], 6)
+            row["avg_latency"] = row["latency_total"] / row["calls"]
+            result.append(row)
+        return result
+
+
+_meter: Optional[UsageMeter] = None
+_meter_lock = threading.Lock()
+
+
+def get_meter() -> UsageMeter:
+    """获取进程共享的用量计量器，按配置惰性创建"""
+    global _meter
+    if _meter is None:
+        with _meter_lock:
+            if _meter is None:
+                from helios.config import settings
+                _meter = UsageMeter(
+                    settings.METERING_URL,
+                    prices=settings.LLM_PRICING,
+                    flush_every=settings.METERING_FLUSH_EVERY,
+                    enabled=settings.METERING_ENABLED,
+                )
+    return _meter
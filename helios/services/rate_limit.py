@@ -0,0 +1,381 @@
+# helios/services/rate_limit.py
+"""
+准入控制（令牌桶限流）
+
+为以下对象各维护一个令牌桶：
+1. 每个用户的请求数/分钟；
+2. 每个路由的请求数/分钟（所有用户共享）；
+3. 每个LLM提供商的请求数/分钟和tokens/分钟。
+
+请求在桶中令牌不足时，如果预计等待时间不超过允许的排队时间，
+就预留令牌并等待；否则立即拒绝并给出Retry-After。提供商返回429时
+暂停该提供商的桶，后续调用排队或快速失败（交给路由切换到其他提供商），
+而不是在配额耗尽时继续重试。
+
+桶的状态默认保存在进程内存中；多个API/工作进程需要共享限额时
+可以使用数据库存储（rate_limit_buckets表，乐观并发更新）。
+"""
+
+import asyncio
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import Column, Float, MetaData, String, Table, create_engine, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.pool import StaticPool
+
+# (令牌数, 上次更新时间, 暂停截止时间)
+BucketState = Tuple[float, float, float]
+
+# 未配置请求数限额的提供商使用的桶容量，只用于在提供商返回429后暂停调用
+UNLIMITED = 1e9
+
+metadata = MetaData()
+
+bucket_table = Table(
+    "rate_limit_buckets",
+    metadata,
+    Column("key", String(200), primary_key=True),
+    Column("tokens", Float, nullable=False),
+    Column("updated_at", Float, nullable=False),
+    Column("blocked_until", Float, nullable=False, default=0.0),
+)
+
+
+class RateLimited(Exception):
+    """请求超出限额时抛出的异常"""
+
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"超出限额: {scope}，请在 {retry_after:.1f} 秒后重试")
+        self.scope = scope
+        self.retry_after = retry_after
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        """429响应的Retry-After头（整数秒，至少1秒）"""
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+
+def _refill(state: Optional[BucketState], per_minute: float, now: float) -> BucketState:
+    """按经过的时间补充令牌，新建的桶是满的"""
+    if state is None:
+        return per_minute, now, 0.0
+    tokens, updated_at, blocked_until = state
+    tokens = min(per_minute, tokens + max(0.0, now - updated_at) * per_minute / 60.0)
+    return tokens, now, blocked_until
+
+
+def take(
+    state: Optional[BucketState], per_minute: float, amount: float, now: float, max_wait: float
+) -> Tuple[Optional[BucketState], float]:
+    """
+    尝试从桶中取出令牌
+
+    令牌不足但等待时间不超过max_wait时，令牌数允许变为负数，
+    即为调用方预留令牌，后来的请求需要等待更久，从而保持先来先服务。
+
+    参数:
+        state: 桶的当前状态，None表示新桶
+        per_minute: 每分钟补充的令牌数，同时也是桶的容量
+        amount: 需要的令牌数，超过容量时按容量计算
+        now: 当前时间（秒）
+        max_wait: 允许的最长等待时间（秒）
+
+    返回:
+        (新状态, 等待秒数)；被拒绝时新状态为None，等待秒数即建议的重试间隔
+    """
+    tokens, _, blocked_until = _refill(state, per_minute, now)
+    amount = min(amount, per_minute)
+    wait = max(0.0, blocked_until - now, (amount - tokens) * 60.0 / per_minute)
+    if wait > max_wait:
+        return None, wait
+    return (tokens - amount, now, blocked_until), wait
+
+
+class BucketStore:
+    """
+    令牌桶存储的基类
+
+    子类实现_update：在并发安全的前提下读取桶状态，调用fn(状态, 当前时间)
+    得到 (新状态, 返回值)，新状态不为None时写回。
+    """
+
+    # 调用是否会阻塞事件循环（需要放到线程中执行）
+    blocking = False
+
+    def _update(self, key: str, fn: Callable[[Optional[BucketState], float], Tuple[Optional[BucketState], Any]]):
+        raise NotImplementedError
+
+    def acquire(self, key: str, per_minute: float, amount: float = 1.0, max_wait: float = 0.0) -> Tuple[bool, float]:
+        """
+        从桶中取出令牌
+
+        返回:
+            (是否准入, 等待秒数)；未准入时等待秒数为建议的重试间隔
+        """
+        def fn(state, now):
+            new_state, wait = take(state, per_minute, amount, now, max_wait)
+            return new_state, (new_state is not None, wait)
+        return self._update(key, fn)
+
+    def adjust(self, key: str, per_minute: float, delta: float):
+        """额外扣除（delta>0）或退还（delta<0）令牌，用于按实际用量修正预留值"""
+        def fn(state, now):
+            tokens, updated_at, blocked_until = _refill(state, per_minute, now)
+            return (min(per_minute, tokens - delta), updated_at, blocked_until), None
+        self._update(key, fn)
+
+    def pause(self, key: str, per_minute: float, seconds: float):
+        """在接下来的seconds秒内不再放行该桶的请求"""
+        def fn(state, now):
+            tokens, updated_at, blocked_until = _refill(state, per_minute, now)
+            return (tokens, updated_at, max(blocked_until, now + seconds)), None
+        self._update(key, fn)
+
+
+class MemoryBucketStore(BucketStore):
+    """进程内的令牌桶存储"""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        """
+        参数:
+            clock: 返回当前时间（秒）的函数，测试时可替换
+        """
+        self.clock = clock
+        self._states: Dict[str, BucketState] = {}
+        self._lock = threading.Lock()
+
+    def _update(self, key, fn):
+        with self._lock:
+            new_state, result = fn(self._states.get(key), self.clock())
+            if new_state is not None:
+                self._states[key] = new_state
+            return result
+
+
+class DatabaseBucketStore(BucketStore):
+    """
+    保存在数据库中的令牌桶，供多个进程共享限额
+
+    使用乐观并发控制：按读取到的旧值条件更新，冲突时重新读取并计算。
+    各进程的时钟需要同步（使用time.time）。
+    """
+
+    blocking = True
+
+    def __init__(self, url: str, clock: Callable[[], float] = time.time, max_attempts: int = 20):
+        """
+        参数:
+            url: 数据库连接URL
+            clock: 返回当前时间（秒）的函数
+            max_attempts: 并发冲突时的最大重试次数，用尽后直接覆盖写入
+        """
+        kwargs = {}
+        if url.startswith("sqlite"):
+            kwargs["connect_args"] = {"check_same_thread": False}
+            if url in ("sqlite://", "sqlite:///:memory:"):
+                kwargs["poolclass"] = StaticPool
+        self.engine = create_engine(url, **kwargs)
+        metadata.create_all(self.engine)
+        self.clock = clock
+        self.max_attempts = max_attempts
+
+    def _update(self, key, fn):
+        result = None
+        for attempt in range(self.max_attempts):
+            try:
+                with self.engine.begin() as conn:
+                    row = conn.execute(select(bucket_table).where(bucket_table.c.key == key)).first()
+                    state = (row.tokens, row.updated_at, row.blocked_until) if row else None
+                    new_state, result = fn(state, self.clock())
+                    if new_state is None:
+                        return result
+                    values = dict(zip(("tokens", "updated_at", "blocked_until"), new_state))
+                    if row is None:
+                        conn.execute(bucket_table.insert().values(key=key, **values))
+                        return result
+                    query = update(bucket_table).where(bucket_table.c.key == key)
+                    if attempt < self.max_attempts - 1:
+                        query = query.where(
+                            bucket_table.c.tokens == row.tokens, bucket_table.c.updated_at == row.updated_at
+                        )
+                    if conn.execute(query.values(**values)).rowcount:
+                        return result
+            except IntegrityError:
+                # 其他进程同时创建了这个桶，重新读取
+                continue
+        return result
+
+
+class AdmissionController:
+    """
+    按用户、路由和提供商进行准入控制
+
+    限额以“每分钟”为单位，未配置或为0的限额表示不限制。
+    """
+
+    def __init__(
+        self,
+        store: Optional[BucketStore] = None,
+        user_rpm: float = 0,
+        route_rpm: Optional[Dict[str, float]] = None,
+        provider_rpm: Optional[Dict[str, float]] = None,
+        provider_tpm: Optional[Dict[str, float]] = None,
+        max_queue_seconds: float = 0.0,
+        provider_max_wait: float = 0.0,
+        enabled: bool = True,
+    ):
+        """
+        参数:
+            store: 令牌桶存储，默认为进程内存储
+            user_rpm: 每个用户每分钟的请求数
+            route_rpm: 每个路由每分钟的请求数 {路由名称: 限额}
+            provider_rpm: 每个提供商每分钟的请求数 {模型名称: 限额}
+            provider_tpm: 每个提供商每分钟的tokens数 {模型名称: 限额}
+            max_queue_seconds: API请求超出限额时允许排队等待的最长时间（秒），超过则返回429
+            provider_max_wait: LLM调用等待提供商配额的最长时间（秒），超过则快速失败
+            enabled: 是否启用准入控制
+        """
+        self.store = store or MemoryBucketStore()
+        self.user_rpm = user_rpm
+        self.route_rpm = route_rpm or {}
+        self.provider_rpm = provider_rpm or {}
+        self.provider_tpm = provider_tpm or {}
+        self.max_queue_seconds = max_queue_seconds
+        self.provider_max_wait = provider_max_wait
+        self.enabled = enabled
+        self.stats = {"admitted": 0, "queued": 0, "rejected": 0, "provider_pauses": 0}
+
+    def check(self, buckets: List[Tuple[str, float, float]], max_wait: float) -> float:
+        """
+        一次性从多个桶中取出令牌，任一桶拒绝时退还已取出的令牌
+
+        参数:
+            buckets: [(桶键, 每分钟限额, 令牌数)]，限额为0的桶被忽略
+            max_wait: 允许的最长等待时间（秒）
+
+        返回:
+            需要等待的秒数（所有桶中的最大值）
+
+        异常:
+            RateLimited: 如果某个桶的等待时间超过max_wait
+        """
+        taken, wait = [], 0.0
+        for key, per_minute, amount in buckets:
+            if not self.enabled or not per_minute:
+                continue
+            admitted, bucket_wait = self.store.acquire(key, per_minute, amount, max_wait)
+            if not admitted:
+                for taken_key, taken_rate, taken_amount in taken:
+                    self.store.adjust(taken_key, taken_rate, -taken_amount)
+                self.stats["rejected"] += 1
+                raise RateLimited(key, bucket_wait)
+            taken.append((key, per_minute, min(amount, per_minute)))
+            wait = max(wait, bucket_wait)
+        self.stats["admitted"] += 1
+        if wait > 0:
+            self.stats["queued"] += 1
+        return wait
+
+    async def _check_and_wait(self, buckets: List[Tuple[str, float, float]], max_wait: float):
+        if self.store.blocking:
+            wait = await asyncio.to_thread(self.check, buckets, max_wait)
+        else:
+            wait = self.check(buckets, max_wait)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def admit_request(self, route: str, user_id: Optional[str]):
+        """
+        API请求的准入检查，令牌不足时最多排队max_queue_seconds秒
+
+        参数:
+            route: 路由名称，如 "plan_generate"
+            user_id: 用户标识
+
+        异常:
+            RateLimited: 如果超出用户或路由的限额
+        """
+        await self._check_and_wait(self._request_buckets(route, user_id), self.max_queue_seconds)
+
+    def admit_request_sync(self, route: str, user_id: Optional[str]):
+        """
+        admit_request的同步版本，供在线程池中执行的同步路由使用，排队时阻塞当前线程
+
+        参数:
+            route: 路由名称，如 "plan_generate"
+            user_id: 用户标识
+
+        异常:
+            RateLimited: 如果超出用户或路由的限额
+        """
+        wait = self.check(self._request_buckets(route, user_id), self.max_queue_seconds)
+        if wait > 0:
+            time.sleep(wait)
+
+    def _request_buckets(self, route: str, user_id: Optional[str]) -> List[Tuple[str, float, float]]:
+        return [
+            (f"user:{user_id or 'anonymous'}", self.user_rpm, 1),
+            (f"route:{route}", self.route_rpm.get(route, 0), 1),
+        ]
+
+    async def acquire_provider(self, model: str, tokens: int):
+        """
+        LLM调用前按请求数和预计tokens数申请提供商配额
+
+        参数:
+            model: 模型名称
+            tokens: 预计消耗的tokens数（输入加最大输出）
+
+        异常:
+            RateLimited: 如果提供商的配额在provider_max_wait秒内无法满足
+        """
+        await self._check_and_wait(
+            [
+                (f"provider:{model}:requests", self.provider_rpm.get(model) or UNLIMITED, 1),
+                (f"provider:{model}:tokens", self.provider_tpm.get(model, 0), tokens),
+            ],
+            self.provider_max_wait,
+        )
+
+    def settle_provider(self, model: str, reserved: int, used: int):
+        """按实际消耗的tokens数修正调用前预留的提供商配额"""
+        per_minute = self.provider_tpm.get(model, 0)
+        if self.enabled and per_minute and used != reserved:
+            self.store.adjust(f"provider:{model}:tokens", per_minute, used - min(reserved, per_minute))
+
+    def pause_provider(self, model: str, seconds: float):
+        """提供商返回429后，在seconds秒内暂停向其发送请求"""
+        if not self.enabled:
+            return
+        self.stats["provider_pauses"] += 1
+        self.store.pause(f"provider:{model}:requests", self.provider_rpm.get(model) or UNLIMITED, seconds)
+
+
+_controller: Optional[AdmissionController] = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """获取进程共享的准入控制器，按配置惰性创建"""
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                from helios.config import settings
+                store = None
+                if settings.RATE_LIMIT_BACKEND == "database":
+                    store = DatabaseBucketStore(settings.RATE_LIMIT_URL or settings.DATABASE_URL)
+                _controller = AdmissionController(
+                    store,
+                    user_rpm=settings.RATE_LIMIT_USER_RPM,
+                    route_rpm=settings.RATE_LIMIT_ROUTE_RPM,
+                    provider_rpm=settings.RATE_LIMIT_PROVIDER_RPM,
+                    provider_tpm=settings.RATE_LIMIT_PROVIDER_TPM,
+                    max_queue_seconds=settings.RATE_LIMIT_MAX_QUEUE_SECONDS,
+                    provider_max_wait=settings.RATE_LIMIT_PROVIDER_MAX_WAIT,
+                    enabled=settings.RATE_LIMIT_ENABLED,
+                )
+    return _controller
@@ -0,0 +1,498 @@
+# helios/services/resilience.py
+"""
+提供商调用的容错层
+
+1. 熔断器：每个提供商一个（关闭/打开/半开），连续失败达到阈值后打开，
+   在恢复时间内直接拒绝调用，之后放行少量探测请求，成功则关闭。
+2. 重试策略：只重试网络错误和5xx，指数退避加随机抖动（full jitter），
+   并遵守提供商给出的Retry-After。
+3. 重试预算：重试次数不超过请求数的一定比例，避免故障时放大流量。
+4. 截止时间：基于contextvars从HTTP请求或任务一路传递到LLM调用，
+   每次调用和重试等待都不会超过剩余时间。
+5. 协作式取消：取消令牌同样经contextvars传递，FSM状态切换和工具调用前检查，
+   进行中的提供商请求在令牌触发时立即中止。
+"""
+
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Set
+
+from helios.services.llm_transport import LLMTransportError
+
+CLOSED = "CLOSED"
+OPEN = "OPEN"
+HALF_OPEN = "HALF_OPEN"
+
+
+class CircuitOpenError(LLMTransportError):
+    """熔断器打开时拒绝调用抛出的异常，route_chat会据此切换到下一个提供商"""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(provider, f"熔断器已打开，{retry_after:.1f} 秒后重试", status_code=503, retry_after=retry_after)
+
+
+class DeadlineExceeded(TimeoutError):
+    """请求的截止时间已过时抛出的异常"""
+
+
+class OperationCancelled(Exception):
+    """操作被取消（用户调用取消接口或客户端断开）时抛出的异常"""
+
+
+class CircuitBreaker:
+    """
+    单个提供商的熔断器
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+        probe_timeout: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        参数:
+            failure_threshold: 连续失败多少次后打开
+            recovery_timeout: 打开后经过多少秒进入半开状态
+            half_open_max_calls: 半开状态下同时放行的探测请求数
+            probe_timeout: 半开状态下探测请求的名额用尽后，超过多少秒仍没有结果
+                           就视为探测丢失并重新打开，默认等于recovery_timeout
+            clock: 返回当前时间（秒）的函数，测试时可替换
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.probe_timeout = recovery_timeout if probe_timeout is None else probe_timeout
+        self.clock = clock
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_at = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"opened": 0, "rejected": 0}
+
+    def _refresh(self):
+        now = self.clock()
+        if (self._state == HALF_OPEN and self._probes >= self.half_open_max_calls
+                and now - self._probe_at >= self.probe_timeout):
+            # 探测请求既没有记录结果也没有归还名额（例如调用方崩溃），重新打开以便稍后再探测
+            self._state = OPEN
+            self._opened_at = now
+        if self._state == OPEN and now - self._opened_at >= self.recovery_timeout:
+            self._state = HALF_OPEN
+            self._probes = 0
+
+    @property
+    def state(self) -> str:
+        """当前状态，打开超过恢复时间后变为半开"""
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    @property
+    def retry_after(self) -> float:
+        """距离进入半开状态的秒数，未打开时为0"""
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self.recovery_timeout - (self.clock() - self._opened_at))
+
+    def allow(self) -> bool:
+        """
+        判断是否放行一次调用，半开状态下会占用一个探测名额
+
+        返回:
+            是否放行
+        """
+        with self._lock:
+            self._refresh()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes < self.half_open_max_calls:
+                self._probes += 1
+                self._probe_at = self.clock()
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    def release(self):
+        """
+        归还allow占用的探测名额而不记录结果
+
+        调用在得到提供商的结果之前结束（截止时间、取消、被对冲请求取消、本地限流）时调用，
+        否则半开状态的探测名额会一直被占用。关闭或打开状态下没有影响。
+        """
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def record_success(self):
+        """记录一次成功，半开状态下关闭熔断器"""
+        with self._lock:
+            self._failures = 0
+            self._state = CLOSED
+
+    def record_failure(self):
+        """记录一次失败，达到阈值或探测失败时打开熔断器"""
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.stats["opened"] += 1
+                self._state = OPEN
+                self._opened_at = self.clock()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回熔断器的状态快照"""
+        state = self.state
+        return {"state": state, "consecutive_failures": self._failures, "retry_after": self.retry_after, **self.stats}
+
+
+class RetryBudget:
+    """
+    重试预算
+
+    每个请求存入ratio个重试令牌，每次重试取出1个，余额上限为reserve。
+    提供商大面积故障时，重试次数被限制在请求数的ratio倍左右。
+    """
+
+    def __init__(self, ratio: float = 0.2, reserve: float = 10.0):
+        """
+        参数:
+            ratio: 每个请求允许的重试次数比例
+            reserve: 余额上限，也是初始余额，允许低流量时正常重试
+        """
+        self.ratio = ratio
+        self.reserve = reserve
+        self._balance = reserve
+        self._lock = threading.Lock()
+        self.exhausted = 0
+
+    def record_request(self):
+        """记录一个新请求"""
+        with self._lock:
+            self._balance = min(self.reserve, self._balance + self.ratio)
+
+    def try_retry(self) -> bool:
+        """尝试取出一次重试的额度"""
+        with self._lock:
+            if self._balance >= 1:
+                self._balance -= 1
+                return True
+            self.exhausted += 1
+            return False
+
+    @property
+    def balance(self) -> float:
+        return self._balance
+
+
+class RetryPolicy:
+    """
+    指数退避重试策略
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        budget: Optional[RetryBudget] = None,
+        rng: Callable[[float, float], float] = random.uniform,
+    ):
+        """
+        参数:
+            max_attempts: 每个提供商的最大尝试次数（含首次）
+            base_delay: 第一次重试的退避上限（秒），之后每次翻倍
+            max_delay: 退避上限（秒）
+            budget: 重试预算，默认不限制
+            rng: 生成抖动的函数，测试时可替换
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.rng = rng
+
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        """
+        网络错误和5xx可以重试；4xx是请求本身的问题，429交给准入控制和路由切换
+        """
+        if isinstance(error, CircuitOpenError) or not isinstance(error, LLMTransportError):
+            return False
+        return error.status_code is None or error.status_code >= 500
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        第attempt次失败后的等待时间（full jitter），不少于提供商要求的Retry-After
+
+        参数:
+            attempt: 已失败的次数，从1开始
+            retry_after: 提供商给出的Retry-After秒数
+        """
+        backoff = self.rng(0.0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+        return max(backoff, retry_after or 0.0)
+
+
+_deadline: contextvars.ContextVar = contextvars.ContextVar("helios_deadline", default=None)
+
+
+@contextmanager
+def deadline_scope(timeout: Optional[float]) -> Iterator[Optional[float]]:
+    """
+    在上下文中设置截止时间，嵌套时取更早的一个
+
+    基于contextvars，可跨越await和asyncio.to_thread传递。
+
+    参数:
+        timeout: 从现在起的秒数，None表示不设置新的截止时间
+
+    用法:
+        with deadline_scope(30):
+            await model_client.route_chat(messages)
+    """
+    current = _deadline.get()
+    if timeout is not None:
+        candidate = time.monotonic() + timeout
+        current = candidate if current is None else min(current, candidate)
+    token = _deadline.set(current)
+    try:
+        yield current
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """距离截止时间的秒数，没有截止时间时返回None，已过期时为负数"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check_deadline(what: str = "请求"):
+    """
+    截止时间已过时抛出DeadlineExceeded
+
+    参数:
+        what: 写入错误信息的操作描述
+    """
+    remaining = remaining_time()
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceeded(f"{what}已超过截止时间")
+
+
+class CancellationToken:
+    """
+    协作式取消令牌
+
+    可以从任意线程取消；取消后check_cancelled抛出OperationCancelled，
+    通过guard等待的请求会被立即中止。
+    """
+
+    def __init__(self):
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._callbacks: list = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "已取消") -> bool:
+        """
+        取消令牌并执行已登记的回调
+
+        参数:
+            reason: 取消原因，写入OperationCancelled的错误信息
+
+        返回:
+            是否是第一次取消
+        """
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+        return True
+
+    def add_callback(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        登记取消时执行的回调，令牌已取消时立即执行
+
+        返回:
+            移除该回调的函数
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """阻塞等待取消，返回是否已取消"""
+        return self._event.wait(timeout)
+
+
+_cancellation: contextvars.ContextVar = contextvars.ContextVar("helios_cancellation", default=None)
+
+
+@contextmanager
+def cancel_scope(token: CancellationToken) -> Iterator[CancellationToken]:
+    """
+    在上下文中设置取消令牌，嵌套时外层令牌取消会连带取消内层令牌
+
+    参数:
+        token: 取消令牌
+
+    用法:
+        token = CancellationToken()
+        with cancel_scope(token):
+            await model_client.route_chat(messages)
+    """
+    outer = _cancellation.get()
+    unlink = None
+    if outer is not None and outer is not token:
+        unlink = outer.add_callback(lambda: token.cancel(outer.reason))
+    reset = _cancellation.set(token)
+    try:
+        yield token
+    finally:
+        _cancellation.reset(reset)
+        if unlink is not None:
+            unlink()
+
+
+def current_token() -> Optional[CancellationToken]:
+    """当前上下文的取消令牌，没有时返回None"""
+    return _cancellation.get()
+
+
+def check_cancelled(what: str = "请求"):
+    """
+    当前操作已取消时抛出OperationCancelled，截止时间已过时抛出DeadlineExceeded
+
+    参数:
+        what: 写入错误信息的操作描述
+    """
+    token = _cancellation.get()
+    if token is not None and token.cancelled:
+        raise OperationCancelled(f"{what}已取消: {token.reason}")
+    check_deadline(what)
+
+
+async def guard(awaitable: Awaitable, what: str = "请求") -> Any:
+    """
+    等待awaitable，截止时间到期或取消令牌触发时中止它
+
+    参数:
+        awaitable: 要等待的协程或awaitable，如提供商请求
+        what: 写入错误信息的操作描述
+
+    返回:
+        awaitable的结果
+
+    异常:
+        OperationCancelled: 如果当前操作被取消
+        DeadlineExceeded: 如果截止时间已过
+    """
+    token = _cancellation.get()
+    timeout = remaining_time()
+    if token is None and timeout is None:
+        return await awaitable
+    task = asyncio.ensure_future(awaitable)
+    try:
+        check_cancelled(what)
+    except Exception:
+        task.cancel()
+        raise
+    remove = None
+    if token is not None:
+        loop = asyncio.get_running_loop()
+        remove = token.add_callback(lambda: loop.call_soon_threadsafe(task.cancel))
+    try:
+        if timeout is None:
+            return await task
+        return await asyncio.wait_for(task, max(timeout, 0))
+    except asyncio.CancelledError:
+        if token is not None and token.cancelled:
+            raise OperationCancelled(f"{what}已取消: {token.reason}") from None
+        raise
+    except asyncio.TimeoutError:
+        if task.cancelled():
+            raise DeadlineExceeded(f"{what}在截止时间前未完成") from None
+        raise
+    finally:
+        if remove is not None:
+            remove()
+
+
+class CancellationRegistry:
+    """
+    进程内按键（如任务ID）登记进行中的操作，供取消接口和断开检测使用
+    """
+
+    def __init__(self):
+        self._tokens: Dict[str, Set[CancellationToken]] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def track(self, key: Any) -> Iterator[CancellationToken]:
+        """
+        为一次操作创建取消令牌并设置为当前令牌，结束后注销
+
+        参数:
+            key: 操作所属的键，如任务ID
+        """
+        key = str(key)
+        token = CancellationToken()
+        with self._lock:
+            self._tokens.setdefault(key, set()).add(token)
+        try:
+            with cancel_scope(token):
+                yield token
+        finally:
+            with self._lock:
+                tokens = self._tokens.get(key)
+                if tokens is not None:
+                    tokens.discard(token)
+                    if not tokens:
+                        del self._tokens[key]
+
+    def cancel(self, key: Any, reason: str = "已取消") -> int:
+        """
+        取消该键下所有进行中的操作
+
+        返回:
+            被取消的操作数
+        """
+        with self._lock:
+            tokens = list(self._tokens.get(str(key), ()))
+        return sum(token.cancel(reason) for token in tokens)
+
+    def active(self, key: Any) -> int:
+        """该键下进行中的操作数"""
+        with self._lock:
+            return len(self._tokens.get(str(key), ()))
+
+
+operations = CancellationRegistry()
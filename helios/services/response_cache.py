@@ -0,0 +1,291 @@
+# helios/services/response_cache.py
+"""
+LLM响应缓存
+
+以 (模型, 系统消息, 规范化后的消息, 全部请求参数) 为键持久化缓存模型响应，
+支持TTL过期和按最近访问时间的LRU淘汰。清理不在每次写入时进行：
+进程内维护一个近似条目数，每写入sweep_every次或近似条目数超过上限时
+才统计条目数并清理，超出上限时一次淘汰到上限的90%，留出写入余量。
+
+可选的近似重复模式：对对话文本做字符级shingle后计算64位SimHash，
+同一上下文（模型、系统消息和请求参数相同）下汉明距离不超过阈值的
+请求视为同一请求，无需向量模型。
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import (
+    Column, Float, Integer, MetaData, String, Table, Text,
+    create_engine, delete, func, or_, select, update,
+)
+from sqlalchemy.pool import StaticPool
+
+metadata = MetaData()
+
+cache_table = Table(
+    "llm_response_cache",
+    metadata,
+    Column("key", String(64), primary_key=True),
+    Column("context_key", String(64), index=True),
+    Column("simhash", String(16)),
+    *[Column(f"band{i}", Integer, index=True) for i in range(8)],
+    Column("response", Text),
+    Column("created_at", Float),
+    Column("expires_at", Float, index=True),
+    Column("last_accessed", Float, index=True),
+)
+
+_WHITESPACE = re.compile(r"\s+")
+
+# SimHash按8位分成8段；汉明距离小于8时至少有一段完全相同（鸽巢原理）
+_BANDS = 8
+_BAND_BITS = 8
+
+
+def normalize_text(text: Any) -> str:
+    """去除首尾空白并合并连续空白"""
+    if text is None:
+        return ""
+    if not isinstance(text, str):
+        text = json.dumps(text, ensure_ascii=False, sort_keys=True)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def shingles(text: str, size: int = 3) -> List[str]:
+    """生成字符级shingle，对中文和英文都适用"""
+    text = normalize_text(text).lower()
+    if len(text) <= size:
+        return [text] if text else []
+    return [text[i:i + size] for i in range(len(text) - size + 1)]
+
+
+def simhash(text: str) -> int:
+    """计算文本的64位SimHash"""
+    weights = [0] * 64
+    for shingle in shingles(text):
+        value = int.from_bytes(hashlib.md5(shingle.encode("utf-8")).digest()[:8], "big")
+        for bit in range(64):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    result = 0
+    for bit in range(64):
+        if weights[bit] > 0:
+            result |= 1 << bit
+    return result
+
+
+def _bands(fingerprint: int) -> List[int]:
+    mask = (1 << _BAND_BITS) - 1
+    return [(fingerprint >> (_BAND_BITS * i)) & mask for i in range(_BANDS)]
+
+
+def _hash(payload: Any) -> str:
+    data = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    基于SQLAlchemy的持久化响应缓存
+
+    默认使用独立的SQLite文件，也可以指向现有的DATABASE_URL。
+    """
+
+    def __init__(
+        self,
+        url: str,
+        ttl: float = 86400.0,
+        max_entries: int = 10000,
+        near_duplicate: bool = False,
+        max_distance: int = 6,
+        sweep_every: int = 100,
+    ):
+        """
+        参数:
+            url: 数据库连接URL
+            ttl: 缓存条目的存活时间（秒）
+            max_entries: 最大条目数，超出后淘汰最久未访问的条目
+            near_duplicate: 是否启用基于SimHash的近似重复匹配
+            max_distance: 近似匹配允许的最大汉明距离，需小于8
+            sweep_every: 每写入多少次清理一次过期条目并校准条目数
+        """
+        self.url = url
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.near_duplicate = near_duplicate
+        self.max_distance = min(max_distance, _BANDS - 1)
+        self.sweep_every = max(1, sweep_every)
+        self._engine = None
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "near_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        # 近似条目数（只统计本进程的写入），None表示尚未统计过
+        self._entries: Optional[int] = None
+        self._sets_since_sweep = 0
+
+    @property
+    def engine(self):
+        """惰性创建数据库引擎并建表"""
+        if self._engine is None:
+            kwargs = {}
+            if self.url.startswith("sqlite"):
+                kwargs["connect_args"] = {"check_same_thread": False}
+                if self.url in ("sqlite://", "sqlite:///:memory:"):
+                    kwargs["poolclass"] = StaticPool
+            self._engine = create_engine(self.url, **kwargs)
+            metadata.create_all(self._engine)
+        return self._engine
+
+    @staticmethod
+    def _split(messages: List[Dict[str, Any]]):
+        system = [normalize_text(m.get("content")) for m in messages if m.get("role") == "system"]
+        conversation = [
+            {"role": m.get("role"), "name": m.get("name"), "content": normalize_text(m.get("content"))}
+            for m in messages if m.get("role") != "system"
+        ]
+        return "\n".join(system), conversation
+
+    @staticmethod
+    def _params(tools, temperature, params) -> Dict[str, Any]:
+        # 除消息外的所有请求参数（max_tokens、top_p、stop、response_format等）都会改变输出，全部参与键计算；
+        # 值为None的参数与未传入等价
+        params = {"tools": tools, "temperature": temperature, **params}
+        return {name: value for name, value in params.items() if value is not None}
+
+    def _keys(self, model, messages, tools, temperature, params):
+        system, conversation = self._split(messages)
+        context_key = _hash({"model": model, "system": system, "params": self._params(tools, temperature, params)})
+        key = _hash({"context": context_key, "messages": conversation})
+        text = "\n".join(m["content"] for m in conversation)
+        return key, context_key, simhash(text)
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def get(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        tools: Optional[List[Dict[str, Any]]] = None,
+        temperature: Optional[float] = None,
+        **params,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        查找缓存的响应
+
+        参数:
+            model: 模型名称
+            messages: OpenAI格式的消息列表
+            tools: 工具定义
+            temperature: 采样温度
+            **params: 其他请求参数，如max_tokens、top_p、stop、response_format
+
+        返回:
+            缓存的响应字典，未命中时返回None
+        """
+        key, context_key, fingerprint = self._keys(model, messages, tools, temperature, params)
+        now = time.time()
+        with self.engine.begin() as conn:
+            row = conn.execute(
+                select(cache_table.c.key, cache_table.c.response).where(
+                    cache_table.c.key == key, cache_table.c.expires_at > now
+                )
+            ).first()
+            near = False
+            if row is None and self.near_duplicate:
+                row = self._find_near(conn, context_key, fingerprint, now)
+                near = row is not None
+            if row is None:
+                self._count("misses")
+                return None
+            conn.execute(
+                update(cache_table).where(cache_table.c.key == row.key).values(last_accessed=now)
+            )
+        self._count("near_hits" if near else "hits")
+        return json.loads(row.response)
+
+    def _find_near(self, conn, context_key: str, fingerprint: int, now: float):
+        bands = _bands(fingerprint)
+        candidates = conn.execute(
+            select(cache_table.c.key, cache_table.c.response, cache_table.c.simhash).where(
+                cache_table.c.context_key == context_key,
+                cache_table.c.expires_at > now,
+                or_(*[getattr(cache_table.c, f"band{i}") == band for i, band in enumerate(bands)]),
+            )
+        ).all()
+        best, best_distance = None, self.max_distance + 1
+        for candidate in candidates:
+            distance = bin(int(candidate.simhash, 16) ^ fingerprint).count("1")
+            if distance < best_distance:
+                best, best_distance = candidate, distance
+        return best
+
+    def set(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        response: Dict[str, Any],
+        tools: Optional[List[Dict[str, Any]]] = None,
+        temperature: Optional[float] = None,
+        **params,
+    ):
+        """写入缓存，按需清理过期条目并执行LRU淘汰；请求参数与get相同"""
+        key, context_key, fingerprint = self._keys(model, messages, tools, temperature, params)
+        now = time.time()
+        values = {
+            "context_key": context_key,
+            "simhash": f"{fingerprint:016x}",
+            **{f"band{i}": band for i, band in enumerate(_bands(fingerprint))},
+            "response": json.dumps(response, ensure_ascii=False),
+            "created_at": now,
+            "expires_at": now + self.ttl,
+            "last_accessed": now,
+        }
+        with self.engine.begin() as conn:
+            replaced = conn.execute(delete(cache_table).where(cache_table.c.key == key)).rowcount
+            conn.execute(cache_table.insert().values(key=key, **values))
+            with self._lock:
+                self._sets_since_sweep += 1
+                if self._entries is not None and not replaced:
+                    self._entries += 1
+                sweep = (
+                    self._entries is None
+                    or self._entries > self.max_entries
+                    or self._sets_since_sweep >= self.sweep_every
+                )
+            if sweep:
+                self._sweep(conn, now)
+        self._count("stores")
+
+    def _sweep(self, conn, now: float):
+        """删除过期条目，统计条目数，超出上限时淘汰最久未访问的条目到上限的90%"""
+        conn.execute(delete(cache_table).where(cache_table.c.expires_at <= now))
+        entries = conn.execute(select(func.count()).select_from(cache_table)).scalar()
+        if entries > self.max_entries:
+            overflow = entries - (self.max_entries - self.max_entries // 10)
+            oldest = select(cache_table.c.key).order_by(
+                cache_table.c.last_accessed.asc()
+            ).limit(overflow)
+            conn.execute(delete(cache_table).where(cache_table.c.key.in_(oldest)))
+            entries -= overflow
+            self._count("evictions", overflow)
+        with self._lock:
+            self._entries = entries
+            self._sets_since_sweep = 0
+
+    def clear(self):
+        """清空缓存"""
+        with self.engine.begin() as conn:
+            conn.execute(delete(cache_table))
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中/未命中计数"""
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["near_hits"] + counters["misses"]
+        counters["hit_rate"] = (counters["hits"] + counters["near_hits"]) / lookups if lookups else 0.0
+        return counters
@@ -0,0 +1,151 @@
+# helios/services/routing.py
+"""
+延迟感知的多提供商路由
+
+为每个模型维护一个滑动窗口，记录最近请求的延迟和成败，
+据此计算p50/p99延迟与错误率，并把请求优先分配给最快的健康提供商。
+"""
+
+import threading
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional
+
+
+class LatencyTracker:
+    """
+    单个模型的滑动窗口统计
+    """
+
+    def __init__(self, window_size: int = 100):
+        """
+        参数:
+            window_size: 保留的最近样本数量
+        """
+        self._latencies: deque = deque(maxlen=window_size)
+        self._outcomes: deque = deque(maxlen=window_size)
+
+    def record(self, latency: Optional[float], ok: bool):
+        """
+        记录一次请求结果
+
+        参数:
+            latency: 请求耗时（秒），失败请求可为None
+            ok: 请求是否成功
+        """
+        self._outcomes.append(ok)
+        if ok and latency is not None:
+            self._latencies.append(latency)
+
+    @property
+    def samples(self) -> int:
+        """窗口内的请求数量"""
+        return len(self._outcomes)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        计算成功请求延迟的分位数
+
+        参数:
+            q: 分位数，取值0到1之间
+
+        返回:
+            延迟（秒），没有样本时返回None
+        """
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+        return ordered[index]
+
+    @property
+    def error_rate(self) -> float:
+        """窗口内的错误率"""
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回当前统计快照"""
+        return {
+            "samples": self.samples,
+            "p50": self.percentile(0.5),
+            "p99": self.percentile(0.99),
+            "error_rate": self.error_rate,
+        }
+
+
+class ModelRouter:
+    """
+    根据滚动延迟和错误率对模型排序
+
+    没有样本的模型被视为最快，以便新加入的提供商能够获得流量并积累统计。
+    错误率超过阈值（且样本数足够）的模型被视为不健康，排在所有健康模型之后。
+    """
+
+    def __init__(
+        self,
+        models: Iterable[str],
+        window_size: int = 100,
+        max_error_rate: float = 0.5,
+        min_samples: int = 5,
+    ):
+        """
+        参数:
+            models: 按配置优先级排列的模型名称
+            window_size: 每个模型的滑动窗口大小
+            max_error_rate: 判定为健康的最大错误率
+            min_samples: 判定健康状态所需的最少样本数
+        """
+        self.models = list(models)
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self._window_size = window_size
+        self._trackers: Dict[str, LatencyTracker] = {
+            model: LatencyTracker(window_size) for model in self.models
+        }
+        self._lock = threading.Lock()
+
+    def _tracker(self, model: str) -> LatencyTracker:
+        if model not in self._trackers:
+            self._trackers[model] = LatencyTracker(self._window_size)
+            self.models.append(model)
+        return self._trackers[model]
+
+    def record(self, model: str, latency: Optional[float], ok: bool):
+        """记录一次请求的延迟和结果"""
+        with self._lock:
+            self._tracker(model).record(latency, ok)
+
+    def is_healthy(self, model: str) -> bool:
+        """判断模型当前是否健康"""
+        tracker = self._trackers.get(model)
+        if tracker is None or tracker.samples < self.min_samples:
+            return True
+        return tracker.error_rate <= self.max_error_rate
+
+    def rank(self, candidates: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        按健康状态和p50延迟对候选模型排序
+
+        参数:
+            candidates: 候选模型，默认为全部已配置模型
+
+        返回:
+            排序后的模型名称列表，延迟相同时保持配置顺序
+        """
+        candidates = list(candidates) if candidates is not None else list(self.models)
+        with self._lock:
+            def score(model: str):
+                tracker = self._trackers.get(model)
+                p50 = tracker.percentile(0.5) if tracker else None
+                return (not self.is_healthy(model), p50 if p50 is not None else 0.0)
+
+            return sorted(candidates, key=score)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """返回每个模型的统计信息"""
+        with self._lock:
+            return {
+                model: {**tracker.snapshot(), "healthy": self.is_healthy(model)}
+                for model, tracker in self._trackers.items()
+            }
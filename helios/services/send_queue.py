@@ -0,0 +1,237 @@
+# helios/services/send_queue.py
+
+"""
+WebSocket连接的有界发送队列
+
+每个连接有自己的发送队列和写协程，广播只把序列化好的消息放入各连接的队列，
+不等待任何一个客户端，慢客户端不会拖慢其他订阅者。
+
+队列满时的处理策略:
+    drop_oldest  丢弃队列中最早的消息
+    coalesce     相同合并键的消息只保留最新一条；队列满时再丢弃最早的消息
+    disconnect   断开跟不上的客户端
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger("HeliosApp")
+
+SLOW_CONSUMER_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+
+class FanoutMetrics:
+    """
+    广播的运行统计（线程安全）
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.broadcasts = 0
+        self.recipients = 0
+        self.total_fanout = 0.0
+        self.max_fanout = 0.0
+        self.sent = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.dropped = 0
+        self.coalesced = 0
+        self.disconnected = 0
+
+    def record_fanout(self, recipients: int, elapsed: float):
+        """记录一次广播的接收者数量和入队耗时（秒）"""
+        with self._lock:
+            self.broadcasts += 1
+            self.recipients += recipients
+            self.total_fanout += elapsed
+            self.max_fanout = max(self.max_fanout, elapsed)
+
+    def record_sent(self, latency: float):
+        """记录一条消息从入队到发送完成的耗时（秒）"""
+        with self._lock:
+            self.sent += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def record_dropped(self, coalesced: bool = False):
+        """记录一条因队列满被丢弃或被合并的消息"""
+        with self._lock:
+            if coalesced:
+                self.coalesced += 1
+            else:
+                self.dropped += 1
+
+    def record_disconnect(self):
+        """记录一次因跟不上或发送失败而断开的连接"""
+        with self._lock:
+            self.disconnected += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回统计快照，耗时单位为毫秒"""
+        with self._lock:
+            return {
+                "broadcasts": self.broadcasts,
+                "recipients": self.recipients,
+                "fanout_avg_ms": round(self.total_fanout / self.broadcasts * 1000, 3) if self.broadcasts else 0.0,
+                "fanout_max_ms": round(self.max_fanout * 1000, 3),
+                "sent": self.sent,
+                "send_latency_avg_ms": round(self.total_latency / self.sent * 1000, 3) if self.sent else 0.0,
+                "send_latency_max_ms": round(self.max_latency * 1000, 3),
+                "dropped": self.dropped,
+                "coalesced": self.coalesced,
+                "disconnected": self.disconnected,
+            }
+
+
+class ConnectionSender:
+    """
+    单个WebSocket连接的发送队列和写协程
+
+    enqueue不阻塞；写协程按顺序把队列中的消息发送给客户端。
+    发送失败、单次发送超时或按disconnect策略被断开时，调用on_error回调。
+    """
+
+    def __init__(
+        self,
+        websocket,
+        max_queue: int = 100,
+        policy: str = "drop_oldest",
+        send_timeout: float = 10.0,
+        metrics: Optional[FanoutMetrics] = None,
+        on_error: Optional[Callable[["ConnectionSender"], Any]] = None,
+    ):
+        """
+        参数:
+            websocket: 提供send_text的WebSocket对象
+            max_queue: 队列中最多积压的消息数
+            policy: 队列满时的处理策略，见SLOW_CONSUMER_POLICIES
+            send_timeout: 单条消息发送的超时时间（秒）
+            metrics: 广播统计对象
+            on_error: 连接被判定为失效时的回调
+        """
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"不支持的慢客户端策略: {policy}")
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.metrics = metrics or FanoutMetrics()
+        self.on_error = on_error
+        self.closed = False
+        # 队列元素: (合并键, 消息文本, 入队时间, 消息序号)
+        self._queue: deque = deque()
+        self._ready = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, skip_through: Optional[int] = None):
+        """
+        启动写协程（需在事件循环中调用）
+
+        启动前入队的消息会保留，可用于在补发历史期间缓存新消息。
+
+        参数:
+            skip_through: 丢弃队列中序号不大于该值的消息（这些消息已随历史补发）
+        """
+        if skip_through is not None:
+            self._queue = deque(item for item in self._queue if item[3] is None or item[3] > skip_through)
+            if not self._queue:
+                self._idle.set()
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    @property
+    def pending(self) -> int:
+        """队列中尚未发送的消息数"""
+        return len(self._queue)
+
+    def enqueue(self, payload: str, key: Optional[str] = None, sequence: Optional[int] = None) -> bool:
+        """
+        把消息放入发送队列，不等待发送完成
+
+        参数:
+            payload: 已序列化的消息文本
+            key: 合并键，coalesce策略下相同键的待发送消息只保留最新一条
+            sequence: 消息的sequence_order，用于start时去除已补发的消息
+
+        返回:
+            消息是否已入队；连接已关闭或因跟不上被断开时返回False
+        """
+        if self.closed:
+            return False
+        now = time.perf_counter()
+        if self.policy == "coalesce" and key is not None:
+            for index, (queued_key, _, queued_at, _) in enumerate(self._queue):
+                if queued_key == key:
+                    # 保留原来的排队位置和入队时间，只替换内容
+                    self._queue[index] = (key, payload, queued_at, sequence)
+                    self.metrics.record_dropped(coalesced=True)
+                    return True
+        if len(self._queue) >= self.max_queue:
+            if self.policy == "disconnect":
+                logger.warning(f"WebSocket客户端积压 {len(self._queue)} 条消息，断开连接")
+                self._fail()
+                return False
+            self._queue.popleft()
+            self.metrics.record_dropped()
+        self._queue.append((key, payload, now, sequence))
+        self._idle.clear()
+        self._ready.set()
+        return True
+
+    async def _run(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            while self._queue:
+                _, payload, queued_at, _ = self._queue.popleft()
+                try:
+                    await asyncio.wait_for(self.websocket.send_text(payload), self.send_timeout)
+                except Exception as e:
+                    logger.warning(f"WebSocket发送失败，断开连接: {str(e) or type(e).__name__}")
+                    self._fail()
+                    return
+                self.metrics.record_sent(time.perf_counter() - queued_at)
+            self._idle.set()
+
+    def _fail(self):
+        if self.closed:
+            return
+        self.metrics.record_disconnect()
+        self.cancel()
+        if self.on_error is not None:
+            self.on_error(self)
+
+    def cancel(self):
+        """立即停止写协程，丢弃未发送的消息"""
+        self.closed = True
+        self._queue.clear()
+        self._idle.set()
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+
+    async def drain(self, timeout: Optional[float] = None):
+        """等待队列中的消息全部发送完毕"""
+        await asyncio.wait_for(self._idle.wait(), timeout)
+
+    async def close(self, flush: bool = False, timeout: float = 5.0):
+        """
+        停止写协程
+
+        参数:
+            flush: 是否先把队列中的消息发送完
+            timeout: 等待发送完毕的最长时间（秒）
+        """
+        if self.closed:
+            return
+        if flush:
+            try:
+                await self.drain(timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"关闭WebSocket时仍有 {self.pending} 条消息未发送")
+        self.cancel()
@@ -0,0 +1,72 @@
+"""initial schema: users, tasks, conversation_messages
+
+已有数据库（由 helios.database.migrations.create_tables 建表）执行升级时，
+已存在的表会被跳过，因此无需先执行 alembic stamp。
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17 09:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_table(name: str) -> bool:
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade() -> None:
+    if not _has_table("users"):
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("username", sa.String(50)),
+            sa.Column("email", sa.String(100)),
+            sa.Column("hashed_password", sa.String(100)),
+            sa.Column("created_at", sa.DateTime()),
+            sa.Column("updated_at", sa.DateTime()),
+        )
+        op.create_index("ix_users_id", "users", ["id"])
+        op.create_index("ix_users_username", "users", ["username"], unique=True)
+        op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    if not _has_table("tasks"):
+        op.create_table(
+            "tasks",
+            sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+            sa.Column("description", sa.String(500), nullable=False),
+            sa.Column("status", sa.String(20)),
+            sa.Column("priority", sa.Integer()),
+            sa.Column("result", sa.JSON(), nullable=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id")),
+            sa.Column("created_at", sa.DateTime()),
+            sa.Column("updated_at", sa.DateTime()),
+        )
+
+    if not _has_table("conversation_messages"):
+        op.create_table(
+            "conversation_messages",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("task_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("tasks.id")),
+            sa.Column("sequence_order", sa.Integer()),
+            sa.Column("speaker", sa.String(50)),
+            sa.Column("message", sa.Text()),
+            sa.Column("created_at", sa.DateTime()),
+        )
+        op.create_index("ix_conversation_messages_id", "conversation_messages", ["id"])
+
+
+def downgrade() -> None:
+    op.drop_table("conversation_messages")
+    op.drop_table("tasks")
+    op.drop_table("users")
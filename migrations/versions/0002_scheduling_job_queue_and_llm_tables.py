@@ -0,0 +1,188 @@
+"""task scheduling columns, message sequence index, plan job queue and LLM service tables
+
+- tasks: provider / worker_id / started_at（调度器按提供商限制并发）及列表和分页索引
+- conversation_messages: (task_id, sequence_order) 唯一索引；升级前把重复的序号按原顺序重新编号
+- plan_jobs: 持久化的规划任务队列，包含检查点和取消请求
+- llm_usage / llm_response_cache / rate_limit_buckets: 用量计量、响应缓存和限流桶。
+  这些服务默认使用各自的数据库（METERING_URL、LLM_CACHE_URL、RATE_LIMIT_URL），
+  并在首次使用时自行建表；指向主数据库时由本迁移创建
+
+已由 create_all 建好的表、列和索引会被跳过。
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 09:10:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TASK_INDEXES = {
+    "ix_tasks_status_priority_created_at": ["status", "priority", "created_at"],
+    "ix_tasks_created_at_id": ["created_at", "id"],
+    "ix_tasks_user_id_created_at_id": ["user_id", "created_at", "id"],
+    "ix_tasks_status_created_at_id": ["status", "created_at", "id"],
+}
+
+
+def _has_table(name: str) -> bool:
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def _columns(table: str) -> set:
+    return {column["name"] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def _indexes(table: str) -> set:
+    return {index["name"] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def _renumber_duplicate_sequences():
+    """同一任务内序号重复的消息按 (sequence_order, id) 的顺序重新从0编号"""
+    bind = op.get_bind()
+    messages = sa.table(
+        "conversation_messages",
+        sa.column("id", sa.Integer),
+        sa.column("task_id"),
+        sa.column("sequence_order", sa.Integer),
+    )
+    duplicated = (
+        sa.select(messages.c.task_id)
+        .where(messages.c.sequence_order.is_not(None))
+        .group_by(messages.c.task_id, messages.c.sequence_order)
+        .having(sa.func.count() > 1)
+    )
+    rows = bind.execute(
+        sa.select(messages.c.id, messages.c.task_id)
+        .where(messages.c.task_id.in_(duplicated), messages.c.sequence_order.is_not(None))
+        .order_by(messages.c.task_id, messages.c.sequence_order, messages.c.id)
+    ).fetchall()
+    positions = {}
+    for message_id, task_id in rows:
+        position = positions.get(task_id, 0)
+        positions[task_id] = position + 1
+        bind.execute(messages.update().where(messages.c.id == message_id).values(sequence_order=position))
+
+
+def upgrade() -> None:
+    existing = _columns("tasks")
+    with op.batch_alter_table("tasks") as batch:
+        if "provider" not in existing:
+            batch.add_column(sa.Column("provider", sa.String(50), nullable=True))
+        if "worker_id" not in existing:
+            batch.add_column(sa.Column("worker_id", sa.String(100), nullable=True))
+        if "started_at" not in existing:
+            batch.add_column(sa.Column("started_at", sa.DateTime(), nullable=True))
+    existing = _indexes("tasks")
+    for name, columns in TASK_INDEXES.items():
+        if name not in existing:
+            op.create_index(name, "tasks", columns)
+
+    if "uq_conversation_messages_task_id_sequence_order" not in _indexes("conversation_messages"):
+        _renumber_duplicate_sequences()
+        op.create_index(
+            "uq_conversation_messages_task_id_sequence_order",
+            "conversation_messages",
+            ["task_id", "sequence_order"],
+            unique=True,
+        )
+
+    if not _has_table("plan_jobs"):
+        op.create_table(
+            "plan_jobs",
+            sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+            sa.Column("job_type", sa.String(50), nullable=False),
+            sa.Column("session_id", sa.String(100)),
+            sa.Column("payload", sa.JSON(), nullable=True),
+            sa.Column("status", sa.String(20)),
+            sa.Column("attempts", sa.Integer()),
+            sa.Column("max_attempts", sa.Integer()),
+            sa.Column("result", sa.JSON(), nullable=True),
+            sa.Column("error", sa.Text(), nullable=True),
+            sa.Column("checkpoint", sa.JSON(), nullable=True),
+            sa.Column("cancel_requested", sa.Boolean()),
+            sa.Column("worker_id", sa.String(100), nullable=True),
+            sa.Column("visible_at", sa.DateTime()),
+            sa.Column("created_at", sa.DateTime()),
+            sa.Column("updated_at", sa.DateTime()),
+        )
+        op.create_index("ix_plan_jobs_session_id", "plan_jobs", ["session_id"])
+        op.create_index("ix_plan_jobs_status_visible_at", "plan_jobs", ["status", "visible_at"])
+    else:
+        existing = _columns("plan_jobs")
+        with op.batch_alter_table("plan_jobs") as batch:
+            if "checkpoint" not in existing:
+                batch.add_column(sa.Column("checkpoint", sa.JSON(), nullable=True))
+            if "cancel_requested" not in existing:
+                batch.add_column(sa.Column("cancel_requested", sa.Boolean()))
+
+    if not _has_table("llm_usage"):
+        op.create_table(
+            "llm_usage",
+            sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column("day", sa.String(10), nullable=False),
+            sa.Column("model", sa.String(100), nullable=False),
+            sa.Column("task_id", sa.String(64), nullable=False),
+            sa.Column("user_id", sa.String(64), nullable=False),
+            sa.Column("agent", sa.String(50), nullable=False),
+            sa.Column("state", sa.String(50), nullable=False),
+            sa.Column("calls", sa.Integer(), nullable=False),
+            sa.Column("cached_calls", sa.Integer(), nullable=False),
+            sa.Column("errors", sa.Integer(), nullable=False),
+            sa.Column("prompt_tokens", sa.Integer(), nullable=False),
+            sa.Column("completion_tokens", sa.Integer(), nullable=False),
+            sa.Column("estimated_calls", sa.Integer(), nullable=False),
+            sa.Column("latency_total", sa.Float(), nullable=False),
+            sa.Column("cost", sa.Float(), nullable=False),
+            sa.UniqueConstraint(
+                "day", "model", "task_id", "user_id", "agent", "state", name="uq_llm_usage_dimensions"
+            ),
+        )
+        op.create_index("ix_llm_usage_task_id", "llm_usage", ["task_id"])
+
+    if not _has_table("llm_response_cache"):
+        op.create_table(
+            "llm_response_cache",
+            sa.Column("key", sa.String(64), primary_key=True),
+            sa.Column("context_key", sa.String(64)),
+            sa.Column("simhash", sa.String(16)),
+            *[sa.Column(f"band{i}", sa.Integer()) for i in range(8)],
+            sa.Column("response", sa.Text()),
+            sa.Column("created_at", sa.Float()),
+            sa.Column("expires_at", sa.Float()),
+            sa.Column("last_accessed", sa.Float()),
+        )
+        for column in ["context_key", *[f"band{i}" for i in range(8)], "expires_at", "last_accessed"]:
+            op.create_index(f"ix_llm_response_cache_{column}", "llm_response_cache", [column])
+
+    if not _has_table("rate_limit_buckets"):
+        op.create_table(
+            "rate_limit_buckets",
+            sa.Column("key", sa.String(200), primary_key=True),
+            sa.Column("tokens", sa.Float(), nullable=False),
+            sa.Column("updated_at", sa.Float(), nullable=False),
+            sa.Column("blocked_until", sa.Float(), nullable=False),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("rate_limit_buckets")
+    op.drop_table("llm_response_cache")
+    op.drop_table("llm_usage")
+    op.drop_table("plan_jobs")
+    op.drop_index("uq_conversation_messages_task_id_sequence_order", table_name="conversation_messages")
+    for name in TASK_INDEXES:
+        op.drop_index(name, table_name="tasks")
+    with op.batch_alter_table("tasks") as batch:
+        batch.drop_column("started_at")
+        batch.drop_column("worker_id")
+        batch.drop_column("provider")
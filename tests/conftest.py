@@ -7,6 +7,12 @@ from unittest.mock import MagicMock, patch
 import os
 from dotenv import load_dotenv
 
+# 测试中默认关闭持久化的LLM响应缓存，避免跨测试命中缓存
+# 必须在导入helios.config之前设置，因此放在模块级别
+os.environ.setdefault("LLM_CACHE_ENABLED", "false")
+# 用量计量写入内存数据库，不在工作目录生成文件
+os.environ.setdefault("METERING_URL", "sqlite://")
+
 @pytest.fixture(scope="session", autouse=True)
 def setup_test_environment():
     """
@@ -66,4 +72,58 @@ def mock_autogen_completion(mock_llm_response):
     # 模拟completion函数
     with patch('autogen.agentchat.conversable_agent.ConversableAgent._generate_oai_reply', 
                return_value=("", mock_llm_response.choices[0].message.content)) as mock_completion:
-        yield mock_completion 
\ No newline at end of file
+        yield mock_completion 
+@pytest.fixture
+def db_session(tmp_path):
+    """
+    提供一个基于临时SQLite文件的数据库会话，测试结束后自动销毁
+
+    使用文件而不是内存数据库，使同步会话、多线程和异步会话（async_session_factory）
+    可以访问同一份数据。
+    """
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from helios.database.models import Base
+
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'helios_test.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+@pytest.fixture
+def async_session_factory(db_session):
+    """
+    提供与db_session访问同一个数据库文件的异步会话工厂
+    """
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import NullPool
+    from helios.database.pool import to_async_url
+
+    # 每个测试可能在不同的事件循环中运行，不复用连接
+    engine = create_async_engine(to_async_url(str(db_session.get_bind().url)), poolclass=NullPool)
+    yield async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+@pytest.fixture
+def override_db(db_session, async_session_factory):
+    """
+    返回一个函数，把FastAPI应用的同步和异步数据库依赖指向测试数据库
+    """
+    from helios.database.session import get_async_db, get_db
+
+    async def _get_async_db():
+        async with async_session_factory() as db:
+            yield db
+
+    def apply(app):
+        app.dependency_overrides[get_db] = lambda: db_session
+        app.dependency_overrides[get_async_db] = _get_async_db
+        return app
+
+    return apply
@@ -0,0 +1,97 @@
+"""
+Tests for routing autogen agents through MultiModelClient (helios/services/autogen_client.py).
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+from autogen import ConversableAgent
+
+from helios.config import settings
+from helios.services import MultiModelClient, usage_context
+from helios.services.autogen_client import HeliosModelClient
+from helios.services.metering import UsageMeter
+from helios.services.rate_limit import AdmissionController
+from helios.services.resilience import DeadlineExceeded, deadline_scope
+
+
+def _handler(seen, content="分析完成", delay=0.0):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        seen.append(payload)
+        if delay:
+            await asyncio.sleep(delay)
+        return httpx.Response(200, json={
+            "id": "cmpl-1",
+            "model": payload["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": 30, "completion_tokens": 7, "total_tokens": 37},
+        })
+    return handler
+
+
+def _client(transports):
+    return MultiModelClient(
+        settings, transports=transports, meter=UsageMeter("sqlite://"), limiter=AdmissionController(),
+    )
+
+
+def _agent(client, candidates):
+    agent = ConversableAgent(
+        "Analyst",
+        llm_config={"config_list": [HeliosModelClient.config_entry(candidates)], "temperature": 0.1, "timeout": 30},
+        human_input_mode="NEVER",
+    )
+    agent.register_model_client(HeliosModelClient, client=client)
+    return agent
+
+
+def test_agent_reply_goes_through_multi_model_client():
+    """智能体的补全请求经过MultiModelClient，按提供商返回的用量和实际模型计量"""
+    seen = []
+    client = _client({"deepseek-chat": httpx.MockTransport(_handler(seen))})
+    agent = _agent(client, ["deepseek-chat"])
+
+    with usage_context(task_id="t-1", agent="Analyst"):
+        reply = agent.generate_reply(messages=[{"role": "user", "content": "学习Python"}])
+
+    assert reply == "分析完成"
+    assert len(seen) == 1
+    assert seen[0]["temperature"] == 0.1
+    assert "timeout" not in seen[0] and "model_client_cls" not in seen[0]
+    rows = client.meter.breakdown(["model", "agent"], task_id="t-1")
+    assert [(r["model"], r["agent"]) for r in rows] == [("deepseek-chat", "Analyst")]
+    assert rows[0]["prompt_tokens"] == 30 and rows[0]["completion_tokens"] == 7
+    assert client.router.stats()["deepseek-chat"]["samples"] == 1
+    asyncio.run(client.aclose())
+
+
+def test_sync_calls_keep_pools_separate_from_caller_loop():
+    """后台事件循环与调用方的事件循环各自持有连接池，交替调用互不影响"""
+    seen = []
+    client = _client({"qwen-max": httpx.MockTransport(_handler(seen))})
+    messages = [{"role": "user", "content": "hi"}]
+
+    client.run_sync(client.chat("qwen-max", messages, use_cache=False))
+
+    async def run():
+        await client.chat("qwen-max", messages, use_cache=False)
+        # 在事件循环中同步调用会阻塞该循环，这里放到线程中执行
+        await asyncio.to_thread(client.run_sync, client.chat("qwen-max", messages, use_cache=False))
+        await client.chat("qwen-max", messages, use_cache=False)
+        await client.aclose()
+
+    asyncio.run(run())
+    assert len(seen) == 4
+
+
+def test_deadline_propagates_to_background_loop():
+    """调用线程的截止时间随请求传递到后台事件循环"""
+    client = _client({"qwen-max": httpx.MockTransport(_handler([], delay=5))})
+    agent = _agent(client, ["qwen-max"])
+
+    with deadline_scope(0.1), pytest.raises(DeadlineExceeded):
+        agent.generate_reply(messages=[{"role": "user", "content": "hi"}])
+    asyncio.run(client.aclose())
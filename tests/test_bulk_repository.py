@@ -0,0 +1,149 @@
+"""
+Tests for bulk writes and unit_of_work in helios/repositories/base.py.
+"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from helios.database.models import ConversationMessage, Task, User
+from helios.repositories.base import unit_of_work
+from helios.repositories.conversation_repository import ConversationRepository
+from helios.repositories.task_repository import TaskRepository
+from helios.routers import tasks
+
+
+@pytest.fixture
+def user_id(db_session):
+    user = User(username="bulk", email="bulk@helios.dev")
+    db_session.add(user)
+    db_session.commit()
+    return user.id
+
+
+class StatementCounter:
+    """统计会话上执行的SQL语句和提交次数"""
+
+    def __init__(self, db):
+        self.engine = db.get_bind()
+        self.statements = []
+        self.commits = 0
+
+    def _on_execute(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def _on_commit(self, conn):
+        self.commits += 1
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        event.listen(self.engine, "commit", self._on_commit)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+        event.remove(self.engine, "commit", self._on_commit)
+
+
+def test_bulk_create_update_delete(db_session, user_id):
+    """批量创建、按主键批量更新、按条件更新和删除"""
+    repo = TaskRepository(db_session)
+    with StatementCounter(db_session) as counter:
+        created = repo.bulk_create([
+            {"description": f"step-{index}", "priority": index, "user_id": user_id} for index in range(5)
+        ])
+    assert [task.description for task in created] == [f"step-{index}" for index in range(5)]
+    assert all(task.id is not None for task in created)
+    assert len(counter.statements) == 1
+    assert counter.commits == 1
+
+    assert repo.bulk_update([{"id": created[0].id, "status": "COMPLETED"}, {"id": created[1].id, "priority": 99}]) == 2
+    db_session.expire_all()
+    assert repo.get(created[0].id).status == "COMPLETED"
+    assert repo.get(created[1].id).priority == 99
+
+    assert repo.update_where({"status": "FAILED"}, status="PENDING") == 4
+    assert repo.count(status="FAILED") == 4
+    assert repo.delete_where(status="FAILED") == 4
+    assert repo.count() == 1
+    with pytest.raises(ValueError):
+        repo.delete_where()
+    assert repo.bulk_create([]) == []
+
+
+def test_unit_of_work_commits_once(db_session, user_id):
+    """工作单元内的多次仓储调用只提交一次"""
+    task_repo = TaskRepository(db_session)
+    conv_repo = ConversationRepository(db_session)
+    task = task_repo.create(description="run", user_id=user_id)
+
+    with StatementCounter(db_session) as counter:
+        with unit_of_work(db_session):
+            conv_repo.add_message(task.id, "user", "开始")
+            conv_repo.add_messages(task.id, [("planner", "计划"), ("critic", "评审")])
+            task_repo.update_status(task.id, "IN_PROGRESS")
+            with unit_of_work(db_session):
+                task_repo.update_result(task.id, {"plan": "done"})
+            task_repo.update_status(task.id, "COMPLETED")
+    assert counter.commits == 1
+
+    db_session.expire_all()
+    assert task_repo.get(task.id).status == "COMPLETED"
+    assert [m.sequence_order for m in conv_repo.find_by_task_id(task.id)] == [0, 1, 2]
+
+
+def test_unit_of_work_rolls_back_on_error(db_session, user_id):
+    """工作单元中发生异常时所有写入都被回滚"""
+    task_repo = TaskRepository(db_session)
+    conv_repo = ConversationRepository(db_session)
+    task = task_repo.create(description="run", user_id=user_id)
+    task_id = task.id
+
+    with pytest.raises(RuntimeError):
+        with unit_of_work(db_session):
+            conv_repo.add_messages(task_id, [("planner", "计划")])
+            task_repo.update_status(task_id, "COMPLETED")
+            raise RuntimeError("智能体崩溃")
+
+    assert task_repo.get(task_id).status == "PENDING"
+    assert db_session.query(ConversationMessage).count() == 0
+
+
+def test_batch_messages_endpoint(db_session, user_id, override_db):
+    """批量消息接口在一个事务中写入消息并更新状态"""
+    task = TaskRepository(db_session).create(description="run", user_id=user_id)
+    app = FastAPI()
+    app.include_router(tasks.router, prefix="/api")
+    override_db(app)
+    client = TestClient(app)
+
+    response = client.post(f"/api/tasks/{task.id}/messages/batch", json={
+        "messages": [{"speaker": "planner", "message": "a"}, {"speaker": "critic", "message": "b"}],
+        "status": "COMPLETED",
+    })
+    assert response.status_code == 201
+    assert [m["sequence_order"] for m in response.json()] == [0, 1]
+    db_session.expire_all()
+    assert db_session.get(Task, task.id).status == "COMPLETED"
+
+
+def test_created_objects_stay_attached(db_session, user_id):
+    """批量创建和追加消息返回的对象留在会话中，提交后仍可访问属性和延迟加载关系"""
+    task_repo = TaskRepository(db_session)
+    conv_repo = ConversationRepository(db_session)
+    created = task_repo.bulk_create([{"description": "step", "user_id": user_id}])
+    with StatementCounter(db_session) as counter:
+        assert created[0].description == "step"
+    message = conv_repo.add_message(created[0].id, "planner", "计划")
+    with counter:
+        assert message.sequence_order == 0
+    assert counter.statements == []
+    batch = conv_repo.add_messages(created[0].id, [("critic", "评审")])
+
+    # 之后的提交让对象过期，访问时从数据库重新加载而不是抛出DetachedInstanceError
+    task_repo.update_where({"status": "COMPLETED"}, id=created[0].id)
+    assert created[0].status == "COMPLETED"
+    assert created[0].user.username == "bulk"
+    assert message.task.description == "step"
+    assert batch[0].task is message.task
@@ -0,0 +1,208 @@
+"""
+Tests for cooperative cancellation of plan jobs, agent replies and provider calls.
+"""
+
+import asyncio
+import threading
+import time
+import uuid
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+from helios.config import settings
+from helios.database.dependencies import get_job_repository
+from helios.jobs import JobWorker
+from helios.repositories.job_repository import JobRepository
+from helios.routers import adaptive_plan, websocket
+from helios.services import MultiModelClient
+from helios.services.metering import UsageMeter
+from helios.services.rate_limit import AdmissionController
+from helios.services.resilience import (
+    CLOSED, CancellationRegistry, CancellationToken, OperationCancelled, cancel_scope, check_cancelled, operations,
+)
+
+
+def test_cancel_aborts_in_flight_provider_request():
+    """取消令牌触发时立即中止进行中的提供商请求，不重试也不计入熔断器"""
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        await asyncio.sleep(5)
+        return httpx.Response(200, json={"choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}}]})
+
+    client = MultiModelClient(
+        settings,
+        transports={"qwen-max": httpx.MockTransport(handler)},
+        meter=UsageMeter("sqlite://"),
+        limiter=AdmissionController(),
+    )
+    token = CancellationToken()
+
+    async def run():
+        # 从其他线程取消，模拟工作进程的心跳线程
+        threading.Timer(0.1, token.cancel, args=("用户取消",)).start()
+        started = time.monotonic()
+        with cancel_scope(token), pytest.raises(OperationCancelled) as info:
+            await client.chat("qwen-max", [{"role": "user", "content": "hi"}], use_cache=False)
+        elapsed = time.monotonic() - started
+        await client.aclose()
+        return info.value, elapsed
+
+    error, elapsed = asyncio.run(run())
+    assert "用户取消" in str(error)
+    assert elapsed < 2
+    assert len(calls) == 1
+    assert client.breakers["qwen-max"].state == CLOSED
+
+
+def test_registry_cancels_tracked_operations_and_nested_scopes():
+    """按键取消登记的操作，外层令牌取消会连带取消内层令牌"""
+    registry = CancellationRegistry()
+
+    with registry.track("task-1") as token:
+        inner = CancellationToken()
+        with cancel_scope(inner):
+            assert registry.active("task-1") == 1
+            assert registry.cancel("task-2") == 0
+            assert registry.cancel("task-1", "客户端已断开") == 1
+            assert inner.cancelled and inner.reason == "客户端已断开"
+            with pytest.raises(OperationCancelled):
+                check_cancelled("测试")
+        assert token.cancelled
+
+    assert registry.active("task-1") == 0
+    check_cancelled("令牌作用域之外")
+
+
+class FakeWebSocket:
+    async def send_text(self, text):
+        pass
+
+
+def test_reconnect_within_grace_period_keeps_reply(monkeypatch):
+    """最后一个本地连接断开后在等待期内重连，进行中的回复不会被中止"""
+    monkeypatch.setattr(settings, "WS_ABANDON_GRACE_SECONDS", 0.05)
+
+    async def run():
+        with operations.track("task-reconnect") as token:
+            await websocket.register_connection("task-reconnect", FakeWebSocket())
+            socket = websocket.active_connections["task-reconnect"][0]
+            await websocket.unregister_connection("task-reconnect", socket)
+            assert not token.cancelled
+            await websocket.register_connection("task-reconnect", socket)
+            await asyncio.sleep(0.15)
+            await websocket.unregister_connection("task-reconnect", socket)
+            return token.cancelled
+
+    assert asyncio.run(run()) is False
+    assert "task-reconnect" not in websocket.active_connections
+
+
+def test_abandoned_reply_is_cancelled_after_grace_period(monkeypatch):
+    """最后一个本地连接断开后超过等待期仍无连接，进行中的回复被中止"""
+    monkeypatch.setattr(settings, "WS_ABANDON_GRACE_SECONDS", 0.05)
+
+    async def run():
+        with operations.track("task-abandoned") as token:
+            socket = FakeWebSocket()
+            await websocket.register_connection("task-abandoned", socket)
+            await websocket.unregister_connection("task-abandoned", socket)
+            await asyncio.sleep(0.15)
+            return token
+
+    token = asyncio.run(run())
+    assert token.cancelled and token.reason == "客户端断开"
+    assert "task-abandoned" not in websocket.abandon_timers
+
+
+def test_cancel_request_reaches_other_processes():
+    """取消请求通过控制频道广播，其他进程收到后中止各自的操作，本进程发出的广播不重复处理"""
+    async def run():
+        with operations.track("task-remote") as token:
+            await websocket.deliver_local(websocket.CONTROL_CHANNEL, {
+                "event": "CANCEL_OPERATIONS", "task_id": "task-remote", "reason": "用户取消",
+                "origin": websocket.PROCESS_ID,
+            })
+            assert not token.cancelled
+            await websocket.deliver_local(websocket.CONTROL_CHANNEL, {
+                "event": "CANCEL_OPERATIONS", "task_id": "task-remote", "reason": "用户取消", "origin": "other",
+            })
+            return token
+
+    token = asyncio.run(run())
+    assert token.cancelled and token.reason == "用户取消"
+
+
+def test_job_repository_cancel(db_session):
+    """排队中的任务直接取消；运行中的任务记录取消请求，由工作进程确认；取消的任务可以恢复"""
+    repo = JobRepository(db_session)
+    running = repo.enqueue("plan_generation", {"goal": "学习Python"}, session_id="s1")
+    queued = repo.enqueue("plan_generation", {"goal": "学习Go"}, session_id="s2")
+    repo.claim("worker-a")
+
+    assert repo.cancel(queued.id).status == "CANCELLED"
+    job = repo.cancel(running.id)
+    assert job.status == "RUNNING" and job.cancel_requested
+    assert repo.is_cancel_requested(running.id)
+    assert repo.cancel(uuid.uuid4()) is None
+
+    assert repo.mark_cancelled(running.id, "worker-b") is None
+    assert repo.mark_cancelled(running.id, "worker-a").status == "CANCELLED"
+    resumed = repo.resume(running.id)
+    assert resumed.status == "QUEUED" and not resumed.cancel_requested
+    assert repo.claim("worker-c") is not None
+
+
+def test_worker_aborts_running_job_on_cancel(db_session):
+    """运行中的任务被请求取消后，工作进程在心跳时触发令牌，处理函数中止并标记为CANCELLED"""
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=db_session.get_bind())
+    repo = JobRepository(db_session)
+    job = repo.enqueue("slow", {"goal": "学习Rust"}, session_id="s1")
+    started = threading.Event()
+    checks = []
+
+    def slow(payload):
+        started.set()
+        for _ in range(500):
+            checks.append(1)
+            check_cancelled("RESEARCHING阶段")
+            time.sleep(0.01)
+        return {"plan": "不应完成"}
+
+    worker = JobWorker(
+        session_factory=session_factory, handlers={"slow": slow}, concurrency=1, cancel_poll_interval=0.02,
+    )
+    thread = threading.Thread(target=worker.run_once)
+    thread.start()
+    assert started.wait(5)
+    JobRepository(session_factory()).cancel(job.id)
+    thread.join(5)
+
+    db_session.expire_all()
+    cancelled = repo.get(job.id)
+    assert not thread.is_alive()
+    assert cancelled.status == "CANCELLED"
+    assert cancelled.result is None
+    assert len(checks) < 500
+
+
+def test_cancel_route(db_session):
+    """取消接口对不存在的任务返回404，对已结束的任务返回409"""
+    repo = JobRepository(db_session)
+    queued = repo.enqueue("plan_generation", {"goal": "学习Python"})
+    app = FastAPI()
+    app.include_router(adaptive_plan.router)
+    app.dependency_overrides[get_job_repository] = lambda: repo
+    client = TestClient(app)
+
+    response = client.post(f"/api/plan/jobs/{queued.id}/cancel")
+    assert response.status_code == 200
+    assert response.json()["status"] == "CANCELLED"
+    assert client.post(f"/api/plan/jobs/{queued.id}/cancel").status_code == 409
+    assert client.post(f"/api/plan/jobs/{uuid.uuid4()}/cancel").status_code == 404
+    assert client.get(f"/api/plan/jobs/{queued.id}").json()["status"] == "CANCELLED"
@@ -0,0 +1,104 @@
+"""
+Tests for connection pool tuning/metrics (helios/database/pool.py) and the async repositories.
+"""
+
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from helios.database.models import Task, User
+from helios.database.pool import (
+    InstrumentedAsyncQueuePool,
+    InstrumentedQueuePool,
+    engine_options,
+    pool_stats,
+    to_async_url,
+)
+from helios.repositories.conversation_repository import AsyncConversationRepository, ConversationRepository
+from helios.repositories.task_repository import AsyncTaskRepository
+
+POOL_SETTINGS = SimpleNamespace(
+    DB_POOL_SIZE=1,
+    DB_MAX_OVERFLOW=0,
+    DB_POOL_TIMEOUT=0.2,
+    DB_POOL_RECYCLE=1800,
+    DB_POOL_PRE_PING=True,
+)
+
+
+def test_async_url_and_engine_options():
+    """异步URL推导，以及内存SQLite不使用连接池参数"""
+    assert to_async_url("postgresql://u:p@db:5432/helios") == "postgresql+asyncpg://u:p@db:5432/helios"
+    assert to_async_url("postgresql+psycopg2://u:p@db/helios") == "postgresql+asyncpg://u:p@db/helios"
+    assert to_async_url("sqlite:///./helios.db") == "sqlite+aiosqlite:///./helios.db"
+
+    assert engine_options("sqlite://", POOL_SETTINGS) == {"pool_pre_ping": True}
+    options = engine_options("postgresql://db/helios", POOL_SETTINGS, asynchronous=True)
+    assert options["poolclass"] is InstrumentedAsyncQueuePool
+    assert options["pool_size"] == 1
+    assert options["pool_timeout"] == 0.2
+
+
+def test_pool_metrics_track_checkouts_waits_and_timeouts(tmp_path):
+    """统计借出的连接数、等待时间和超时次数"""
+    url = f"sqlite:///{tmp_path / 'pool.db'}"
+    engine = create_engine(url, connect_args={"check_same_thread": False}, **engine_options(url, POOL_SETTINGS))
+    assert isinstance(engine.pool, InstrumentedQueuePool)
+
+    held = engine.connect()
+    assert pool_stats(engine.pool)["checked_out"] == 1
+
+    with pytest.raises(PoolTimeoutError):
+        engine.connect()
+
+    def release_later():
+        time.sleep(0.05)
+        held.close()
+
+    threading.Thread(target=release_later).start()
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+    stats = pool_stats(engine.pool)
+    assert stats["checked_out"] == 0
+    assert stats["checkouts"] == 2
+    assert stats["timeouts"] == 1
+    assert stats["wait_max_ms"] >= 30
+
+    engine.dispose()
+    assert pool_stats(engine.pool)["checkouts"] == 2
+
+
+def test_async_repositories(db_session, async_session_factory):
+    """异步仓储与同步仓储读写同一份数据"""
+    user = User(username="async", email="async@helios.dev")
+    db_session.add(user)
+    db_session.commit()
+    task = Task(description="异步", user_id=user.id, priority=5)
+    db_session.add(task)
+    db_session.commit()
+    ConversationRepository(db_session).add_messages(task.id, [("user", "你好"), ("planner", "计划")])
+
+    async def run():
+        async with async_session_factory() as db:
+            task_repo = AsyncTaskRepository(db)
+            conv_repo = AsyncConversationRepository(db)
+            fetched = await task_repo.get(task.id)
+            pending = await task_repo.find_pending_tasks()
+            rows, cursor = await task_repo.list_page(limit=10)
+            appended = await conv_repo.add_message(task.id, "critic", "评审")
+            page, next_cursor = await conv_repo.find_page(task.id, limit=2)
+            return fetched, pending, rows, cursor, appended, page, next_cursor, await task_repo.count(status="PENDING")
+
+    fetched, pending, rows, cursor, appended, page, next_cursor, pending_count = asyncio.run(run())
+    assert fetched.description == "异步"
+    assert [t.id for t in pending] == [task.id]
+    assert [row.id for row in rows] == [task.id] and cursor is None
+    assert appended.sequence_order == 2
+    assert [row.message for row in page] == ["你好", "计划"] and next_cursor == 1
+    assert pending_count == 1
@@ -0,0 +1,242 @@
+"""
+Tests for the persistent plan job queue (helios/repositories/job_repository.py, helios/jobs).
+"""
+
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from helios.database.models import Base, PlanJob
+from helios.jobs import JobWorker
+from helios.repositories.job_repository import JobRepository
+
+
+@pytest.fixture
+def session_factory(db_session):
+    """与db_session共享同一个内存数据库的会话工厂"""
+    return sessionmaker(autocommit=False, autoflush=False, bind=db_session.get_bind())
+
+
+def test_claim_is_exclusive(db_session, session_factory):
+    """同一个任务只能被一个工作进程领取"""
+    JobRepository(db_session).enqueue("plan_generation", {"goal": "学习Python"}, session_id="s1")
+
+    first = JobRepository(session_factory()).claim("worker-a")
+    second = JobRepository(session_factory()).claim("worker-b")
+
+    assert first is not None
+    assert first.status == "RUNNING"
+    assert first.attempts == 1
+    assert second is None
+
+
+def test_expired_visibility_timeout_is_reclaimed(db_session):
+    """工作进程崩溃后，任务在可见性超时后可被重新领取"""
+    repo = JobRepository(db_session)
+    job = repo.enqueue("plan_generation", {"goal": "学习Python"})
+    repo.claim("crashed-worker", visibility_timeout=0.01)
+    time.sleep(0.02)
+
+    reclaimed = repo.claim("worker-b")
+    assert reclaimed.id == job.id
+    assert reclaimed.worker_id == "worker-b"
+    assert reclaimed.attempts == 2
+    # 原工作进程已失去任务所有权
+    assert repo.complete(job.id, "crashed-worker", {"plan": "stale"}) is None
+
+
+def test_failures_retry_then_fail(db_session):
+    """失败任务在用尽尝试次数前重新排队，之后标记为FAILED"""
+    repo = JobRepository(db_session)
+    job = repo.enqueue("plan_generation", {"goal": "x"}, max_attempts=2)
+
+    repo.claim("w")
+    retried = repo.fail(job.id, "w", "provider error", retry_delay=0)
+    assert retried.status == "QUEUED"
+
+    repo.claim("w")
+    failed = repo.fail(job.id, "w", "provider error again", retry_delay=0)
+    assert failed.status == "FAILED"
+    assert failed.error == "provider error again"
+    assert repo.claim("w") is None
+
+
+def test_jobs_in_same_session_run_in_order(db_session):
+    """同一会话已有任务运行时，不领取该会话的后续任务"""
+    repo = JobRepository(db_session)
+    generation = repo.enqueue("plan_generation", {"goal": "x"}, session_id="user-1")
+    repo.enqueue("feedback_submission", {"text": "太难了"}, session_id="user-1")
+    other = repo.enqueue("plan_generation", {"goal": "y"}, session_id="user-2")
+
+    assert repo.claim("w1").id == generation.id
+    assert repo.claim("w2").id == other.id
+    assert repo.claim("w3") is None
+
+
+def test_worker_runs_handlers_and_records_results(db_session, session_factory):
+    """工作进程执行已注册的处理函数，并持久化结果或错误"""
+    repo = JobRepository(db_session)
+    ok = repo.enqueue("echo", {"goal": "学习Python"}, session_id="s1")
+    broken = repo.enqueue("boom", {}, session_id="s2", max_attempts=1)
+
+    def boom(payload):
+        raise RuntimeError("智能体崩溃")
+
+    worker = JobWorker(
+        session_factory=session_factory,
+        handlers={"echo": lambda payload: {"plan": payload["goal"], "session": payload["session_id"]}, "boom": boom},
+        concurrency=1,
+        retry_delay=0,
+    )
+    assert worker.run_once()
+    assert worker.run_once()
+    assert not worker.run_once()
+
+    db_session.expire_all()
+    assert repo.get(ok.id).status == "SUCCEEDED"
+    assert repo.get(ok.id).result == {"plan": "学习Python", "session": "s1"}
+    assert repo.get(broken.id).status == "FAILED"
+    assert "智能体崩溃" in repo.get(broken.id).error
+
+
+def test_worker_threads_drain_queue(tmp_path):
+    """多个工作线程并发处理时每个任务只执行一次"""
+    # 并发事务需要真实的连接池，这里使用临时的SQLite文件而不是共享连接的内存库
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db_session = session_factory()
+    repo = JobRepository(db_session)
+    for index in range(6):
+        repo.enqueue("count", {"n": index}, session_id=f"s{index}")
+    seen = []
+
+    worker = JobWorker(
+        session_factory=session_factory,
+        handlers={"count": lambda payload: seen.append(payload["n"]) or {}},
+        concurrency=3,
+        poll_interval=0.01,
+    )
+    worker.start()
+    deadline = datetime.utcnow() + timedelta(seconds=5)
+    while len(seen) < 6 and datetime.utcnow() < deadline:
+        time.sleep(0.01)
+    worker.stop()
+
+    assert sorted(seen) == list(range(6))
+    assert db_session.query(PlanJob).filter(PlanJob.status == "SUCCEEDED").count() == 6
+    db_session.close()
+    engine.dispose()
+
+
+def test_retry_resumes_from_checkpoint(db_session, session_factory):
+    """失败重试时处理函数收到上一次保存的检查点，旧工作进程无法覆盖检查点"""
+    repo = JobRepository(db_session)
+    job = repo.enqueue("plan", {"goal": "学习Python"}, session_id="s1", max_attempts=2)
+    seen = []
+
+    def plan(payload):
+        seen.append(payload["checkpoint"])
+        if payload["checkpoint"] is None:
+            payload["save_checkpoint"]({"state": "RESEARCHING", "shared_data": {"structured_goal": {"goal": "x"}}})
+            raise RuntimeError("研究阶段崩溃")
+        return {"plan": "ok"}
+
+    worker = JobWorker(session_factory=session_factory, handlers={"plan": plan}, concurrency=1, retry_delay=0)
+    assert worker.run_once()
+    assert worker.run_once()
+
+    db_session.expire_all()
+    assert seen == [None, {"state": "RESEARCHING", "shared_data": {"structured_goal": {"goal": "x"}}}]
+    assert repo.get(job.id).status == "SUCCEEDED"
+    assert not repo.save_checkpoint(job.id, "stale-worker", {"state": "INIT"})
+
+
+def test_resume_requeues_failed_job_with_checkpoint(db_session):
+    """只有最终失败的任务可以恢复，恢复后保留检查点并重置尝试次数"""
+    repo = JobRepository(db_session)
+    job = repo.enqueue("plan_generation", {"goal": "x"}, max_attempts=1)
+    assert repo.resume(job.id) is None
+
+    repo.claim("w")
+    assert repo.save_checkpoint(job.id, "w", {"state": "PLANNING"})
+    repo.fail(job.id, "w", "超时", retry_delay=0)
+
+    resumed = repo.resume(job.id)
+    assert resumed.status == "QUEUED"
+    assert resumed.attempts == 0
+    assert resumed.checkpoint == {"state": "PLANNING"}
+    assert repo.claim("w2").id == job.id
+
+
+def test_plan_handler_restores_checkpoint(monkeypatch):
+    """规划处理函数把检查点恢复到会话中，并把状态转换的检查点交给工作进程保存"""
+    from helios.jobs import handlers
+    from helios.jobs.team_pool import TeamPool
+
+    saved = []
+
+    class Session(dict):
+        on_checkpoint = None
+        state = "初始化状态"
+
+    class FakeTeam:
+        STATES = {"INIT": "初始化状态", "COMPLETE": "完成状态", "ERROR": "错误状态"}
+
+        def create_session(self, session_id):
+            return Session(id=session_id)
+
+        def restore_session(self, session, checkpoint):
+            session["restored"] = checkpoint["state"]
+
+        def run(self, goal, session=None, resume=False):
+            session.on_checkpoint({"state": "COMPLETE"})
+            session.state = self.STATES["COMPLETE"]
+            return {
+                "structured_goal": None, "research_report": None, "timings": {}, "speculation": {},
+                "plan": f"{goal}:{session.get('restored')}:{resume}",
+            }
+
+    monkeypatch.setattr(handlers, "_team_pool", TeamPool(FakeTeam, max_sessions=1, admission_timeout=1, idle_ttl=60))
+    result = handlers.handle_plan_generation({
+        "goal": "学习Python",
+        "session_id": "s1",
+        "job_id": "j1",
+        "checkpoint": {"state": "PLANNING"},
+        "save_checkpoint": saved.append,
+    })
+
+    assert result["plan"] == "学习Python:PLANNING:True"
+    assert saved == [{"state": "COMPLETE"}]
+
+
+def test_worker_enforces_job_deadline(db_session, session_factory):
+    """超过截止时间的任务不再执行也不重试，未过期的任务在截止时间范围内运行"""
+    from helios.services.resilience import DeadlineExceeded, remaining_time
+
+    repo = JobRepository(db_session)
+    expired = repo.enqueue("echo", {"deadline_at": time.time() - 1}, session_id="s1", max_attempts=3)
+    late = repo.enqueue("slow", {"deadline_at": time.time() + 60}, session_id="s2", max_attempts=3)
+    seen = []
+
+    def slow(payload):
+        seen.append(remaining_time())
+        raise DeadlineExceeded("研究阶段超时")
+
+    worker = JobWorker(
+        session_factory=session_factory,
+        handlers={"echo": lambda payload: seen.append("ran") or {}, "slow": slow},
+        concurrency=1,
+        retry_delay=0,
+    )
+    assert worker.run_once()
+    assert worker.run_once()
+
+    db_session.expire_all()
+    assert repo.get(expired.id).status == "FAILED"
+    assert repo.get(late.id).status == "FAILED"
+    assert repo.get(late.id).attempts == 1
+    assert len(seen) == 1 and 0 < seen[0] <= 60
@@ -0,0 +1,102 @@
+"""
+Tests for the helios/services/llm_transport.py module.
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from helios.config import settings
+from helios.services import MultiModelClient, LLMTransportError
+from helios.services.llm_transport import ProviderPool
+
+
+def _completion(content: str) -> dict:
+    return {
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5},
+    }
+
+
+def test_endpoint_normalization():
+    """base_url 是否已包含 /chat/completions 都应得到正确的接口地址"""
+    plain = ProviderPool("deepseek-chat", "k", "https://api.deepseek.com/v1/")
+    full = ProviderPool("glm-4", "k", "https://open.bigmodel.cn/api/paas/v4/chat/completions")
+    assert plain.endpoint == "https://api.deepseek.com/v1/chat/completions"
+    assert full.endpoint == "https://open.bigmodel.cn/api/paas/v4/chat/completions"
+
+
+def test_chat_reuses_client_and_sends_payload():
+    """多次调用应复用同一个连接池，并携带鉴权头和模型名称"""
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append((request.headers["Authorization"], json.loads(request.content)))
+        return httpx.Response(200, json=_completion("ok"))
+
+    client = MultiModelClient(settings, transports={"qwen-max": httpx.MockTransport(handler)})
+
+    async def run():
+        first = await client.chat("qwen-max", [{"role": "user", "content": "hi"}], temperature=0.2)
+        http_client = client.transport.get_pool("qwen-max")._client
+        await client.chat("qwen-max", [{"role": "user", "content": "again"}])
+        assert client.transport.get_pool("qwen-max")._client is http_client
+        await client.aclose()
+        return first
+
+    result = asyncio.run(run())
+    assert result["choices"][0]["message"]["content"] == "ok"
+    assert len(seen) == 2
+    assert seen[0][0] == f"Bearer {settings.DASHSCOPE_API_KEY}"
+    assert seen[0][1]["model"] == "qwen-max"
+    assert seen[0][1]["temperature"] == 0.2
+
+
+def test_concurrent_streams_are_limited():
+    """同一提供商的并发请求数不应超过配置的上限"""
+    active = 0
+    peak = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return httpx.Response(200, json=_completion("ok"))
+
+    pool = ProviderPool(
+        "deepseek-chat", "k", "https://api.deepseek.com/v1",
+        max_concurrent_streams=2, transport=httpx.MockTransport(handler),
+    )
+
+    async def run():
+        await asyncio.gather(*[pool.chat("deepseek-chat", []) for _ in range(6)])
+        await pool.aclose()
+
+    asyncio.run(run())
+    assert peak == 2
+    assert pool.stats()["total_requests"] == 6
+    assert pool.stats()["in_flight"] == 0
+
+
+def test_error_status_raises_transport_error():
+    """非2xx响应应转换为LLMTransportError并保留状态码"""
+    pool = ProviderPool(
+        "moonshot-v1-8k", "k", "https://api.moonshot.cn/v1",
+        transport=httpx.MockTransport(lambda request: httpx.Response(429, text="rate limited")),
+    )
+
+    with pytest.raises(LLMTransportError) as excinfo:
+        asyncio.run(pool.chat("moonshot-v1-8k", []))
+    assert excinfo.value.status_code == 429
+    assert excinfo.value.provider == "moonshot-v1-8k"
+
+
+def test_unknown_model_raises():
+    """未配置的模型应直接报错"""
+    client = MultiModelClient(settings)
+    with pytest.raises(LLMTransportError):
+        asyncio.run(client.chat("gpt-unknown", []))
@@ -0,0 +1,141 @@
+"""
+Tests for atomic message append in helios/repositories/conversation_repository.py.
+"""
+
+import threading
+
+import pytest
+from sqlalchemy import create_engine, event, literal, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+from helios.database.models import Base, ConversationMessage, Task, User
+from helios.repositories.conversation_repository import ConversationRepository
+
+
+def _task(db):
+    user = User(username="chat", email="chat@helios.dev")
+    db.add(user)
+    db.commit()
+    task = Task(description="群聊", user_id=user.id)
+    db.add(task)
+    db.commit()
+    return task.id
+
+
+def test_append_is_a_single_statement(db_session):
+    """追加一条消息只执行一条SQL，返回的对象无需再次查询"""
+    task_id = _task(db_session)
+    conv_repo = ConversationRepository(db_session)
+    conv_repo.add_message(task_id, "user", "你好")
+
+    statements = []
+    engine = db_session.get_bind()
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        message = conv_repo.add_message(task_id, "planner", "先制定学习计划")
+        assert (message.sequence_order, message.speaker, message.message) == (1, "planner", "先制定学习计划")
+        assert message.id is not None and message.created_at is not None
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert len(statements) == 1
+    assert statements[0].startswith("INSERT")
+
+
+def test_batch_append_is_contiguous(db_session):
+    """批量追加在一个事务中分配连续序号"""
+    task_id = _task(db_session)
+    conv_repo = ConversationRepository(db_session)
+    conv_repo.add_message(task_id, "user", "开始")
+
+    created = conv_repo.add_messages(task_id, [("planner", "a"), ("critic", "b"), ("planner", "c")])
+    assert [(m.sequence_order, m.speaker) for m in created] == [(1, "planner"), (2, "critic"), (3, "planner")]
+    assert conv_repo.add_messages(task_id, []) == []
+    assert [m.message for m in conv_repo.find_by_task_id(task_id)] == ["开始", "a", "b", "c"]
+
+
+def test_conflicting_sequence_is_retried(db_session, monkeypatch):
+    """分配到已被占用的序号时回滚并重试；超过重试次数后抛出异常"""
+    task_id = _task(db_session)
+    conv_repo = ConversationRepository(db_session)
+    conv_repo.add_message(task_id, "user", "第一条")
+
+    original = ConversationRepository._next_sequence
+    calls = []
+
+    def stale_then_fresh(self, tid):
+        calls.append(tid)
+        if len(calls) == 1:
+            # 模拟并发写入者读到了过期的最大序号
+            return select(literal(0)).scalar_subquery()
+        return original(self, tid)
+
+    monkeypatch.setattr(ConversationRepository, "_next_sequence", stale_then_fresh)
+    assert conv_repo.add_message(task_id, "assistant", "第二条").sequence_order == 1
+    assert len(calls) == 2
+
+    monkeypatch.setattr(ConversationRepository, "_next_sequence", lambda self, tid: select(literal(0)).scalar_subquery())
+    with pytest.raises(IntegrityError):
+        ConversationRepository(db_session, max_retries=2).add_message(task_id, "assistant", "冲突")
+
+
+def test_batch_append_is_a_single_statement(db_session):
+    """批量追加只执行一条SQL，序号分配和插入之间不会被其他写入者插入"""
+    task_id = _task(db_session)
+    conv_repo = ConversationRepository(db_session)
+    conv_repo.add_message(task_id, "user", "开始")
+
+    statements = []
+    engine = db_session.get_bind()
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        created = conv_repo.add_messages(task_id, [("planner", "a"), ("critic", "b")])
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert [m.sequence_order for m in created] == [1, 2]
+    assert len(statements) == 1
+    assert statements[0].startswith("INSERT")
+
+
+def test_concurrent_writers_keep_ordering(tmp_path):
+    """多个线程同时追加时序号不重复、不缺失"""
+    # 并发事务需要真实的连接池，这里使用临时的SQLite文件而不是共享连接的内存库
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'chat.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = session_factory()
+    task_id = _task(db)
+
+    errors = []
+
+    def writer(name):
+        session = session_factory()
+        try:
+            conv_repo = ConversationRepository(session)
+            for index in range(10):
+                if index % 3 == 0:
+                    conv_repo.add_messages(task_id, [(name, f"{name}-{index}a"), (name, f"{name}-{index}b")])
+                else:
+                    conv_repo.add_message(task_id, name, f"{name}-{index}")
+        except Exception as e:
+            errors.append(e)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=writer, args=(f"agent{n}",)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+    orders = [row.sequence_order for row in db.query(ConversationMessage).filter_by(task_id=task_id)]
+    assert sorted(orders) == list(range(4 * 14))
+    db.close()
+    engine.dispose()
@@ -0,0 +1,154 @@
+"""
+Tests for LLM usage metering (helios/services/metering.py).
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from helios.config import settings
+from helios.services import MultiModelClient, usage_context
+from helios.services.metering import UsageMeter
+
+
+def test_usage_is_attributed_and_priced():
+    """调用按usage_context归属到任务和智能体，并按价格表计算费用"""
+    meter = UsageMeter("sqlite://", prices={"qwen-max": [0.02, 0.06]})
+
+    with usage_context(task_id="42", user_id="7"):
+        with usage_context(agent="Analyst", state="ANALYZING"):
+            meter.record("qwen-max", 1000, 500, latency=1.0)
+        meter.record("qwen-max", 2000, 0, latency=3.0, agent="Researcher", state="RESEARCHING")
+    meter.record("deepseek-chat", 100, 100)
+
+    rows = meter.breakdown(["agent", "state"], task_id="42")
+    assert [(r["agent"], r["state"]) for r in rows] == [("Analyst", "ANALYZING"), ("Researcher", "RESEARCHING")]
+    assert rows[0]["cost"] == pytest.approx(0.05)
+    assert rows[1]["cost"] == pytest.approx(0.04)
+    assert rows[1]["avg_latency"] == pytest.approx(3.0)
+
+    by_model = {r["model"]: r for r in meter.breakdown(["model"])}
+    assert by_model["qwen-max"]["calls"] == 2
+    assert by_model["deepseek-chat"]["prompt_tokens"] == 100
+
+
+def test_flush_merges_into_existing_rows():
+    """多次落盘的同一维度组合累加到同一行"""
+    meter = UsageMeter("sqlite://", flush_every=2)
+
+    for _ in range(5):
+        meter.record("glm-4", 10, 5, task_id="t")
+    meter.flush()
+
+    rows = meter.breakdown(["task_id", "model"])
+    assert len(rows) == 1
+    assert rows[0]["calls"] == 5
+    assert rows[0]["prompt_tokens"] == 50
+    assert rows[0]["completion_tokens"] == 25
+
+
+def test_meters_sharing_a_database_upsert_the_same_row(tmp_path):
+    """两个计量器（模拟两个进程）写入同一维度时合并到同一行"""
+    url = f"sqlite:///{tmp_path / 'usage.db'}"
+    first, second = UsageMeter(url), UsageMeter(url)
+
+    first.record("glm-4", 10, 5, task_id="t")
+    second.record("glm-4", 20, 5, task_id="t")
+    second.flush()
+    first.flush()
+
+    rows = first.breakdown(["task_id", "model"])
+    assert [(r["calls"], r["prompt_tokens"]) for r in rows] == [(2, 30)]
+
+
+def test_failed_flush_keeps_pending_usage(monkeypatch):
+    """写入失败时聚合值留在内存中，下次写入时一并合并"""
+    meter = UsageMeter("sqlite://")
+    meter.record("glm-4", 10, 5, task_id="t")
+    original = meter._merge_rows
+
+    def broken(conn, rows):
+        raise RuntimeError("数据库不可用")
+
+    monkeypatch.setattr(meter, "_merge_rows", broken)
+    with pytest.raises(RuntimeError):
+        meter.flush()
+    meter.record("glm-4", 10, 5, task_id="t")
+
+    monkeypatch.setattr(meter, "_merge_rows", original)
+    rows = meter.breakdown(["task_id"])
+    assert [(r["calls"], r["prompt_tokens"]) for r in rows] == [(2, 20)]
+
+
+def test_unknown_dimension_is_rejected():
+    """未知的分组或过滤维度抛出ValueError"""
+    meter = UsageMeter("sqlite://")
+    with pytest.raises(ValueError):
+        meter.breakdown(["agent", "tenant"])
+    with pytest.raises(ValueError):
+        meter.breakdown(["agent"], tenant="x")
+
+
+def test_client_records_provider_usage_and_errors():
+    """MultiModelClient按提供商返回的usage计量，失败的调用记为错误"""
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) > 1:
+            return httpx.Response(400, json={"error": "bad request"})
+        return httpx.Response(200, json={
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}}],
+            "usage": {"prompt_tokens": 12, "completion_tokens": 3, "total_tokens": 15},
+        })
+
+    meter = UsageMeter("sqlite://")
+    client = MultiModelClient(settings, transports={"qwen-max": httpx.MockTransport(handler)}, meter=meter)
+
+    async def run():
+        with usage_context(task_id="99", agent="Strategist"):
+            await client.chat("qwen-max", [{"role": "user", "content": "hi"}])
+            with pytest.raises(Exception):
+                await client.chat("qwen-max", [{"role": "user", "content": "again"}])
+        await client.aclose()
+
+    asyncio.run(run())
+    row = meter.breakdown(["agent"], task_id="99")[0]
+    assert row["agent"] == "Strategist"
+    assert row["calls"] == 2
+    assert row["errors"] == 1
+    assert row["prompt_tokens"] >= 12
+    assert row["completion_tokens"] == 3
+    assert row["estimated_calls"] == 1
+
+
+def test_flush_from_event_loop_runs_off_loop():
+    """在事件循环中触发的落盘由线程池执行，不阻塞事件循环"""
+    import threading
+
+    meter = UsageMeter("sqlite://", flush_every=2)
+    flushed_on = []
+    original_flush = meter.flush
+
+    def flush():
+        flushed_on.append(threading.get_ident())
+        original_flush()
+
+    meter.flush = flush
+
+    async def run():
+        loop_thread = threading.get_ident()
+        meter.record("qwen-max", 10, 5)
+        meter.record("qwen-max", 10, 5)
+        meter.record("qwen-max", 10, 5)
+        # 等待线程池中的落盘完成
+        await asyncio.get_running_loop().run_in_executor(None, lambda: None)
+        return loop_thread
+
+    loop_thread = asyncio.run(run())
+    assert len(flushed_on) == 1 and flushed_on[0] != loop_thread
+
+    meter.record("qwen-max", 10, 5)
+    assert flushed_on[-1] == threading.get_ident()
+    assert meter.breakdown(["model"])[0]["calls"] == 4
@@ -0,0 +1,82 @@
+"""
+Tests for the Alembic revisions in migrations/versions.
+
+alembic runs in a subprocess: env.py calls logging.config.fileConfig, which would
+disable the loggers of the test process.
+"""
+
+import os
+import subprocess
+import sys
+import uuid
+
+import sqlalchemy as sa
+
+from helios.database.models import Base
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _alembic(url, *args):
+    result = subprocess.run(
+        [sys.executable, "-m", "alembic", *args],
+        cwd=ROOT, env={**os.environ, "DATABASE_URL": url}, capture_output=True, text=True, timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+    return result
+
+
+def _assert_head_schema(engine):
+    inspector = sa.inspect(engine)
+    assert {"provider", "worker_id", "started_at"} <= {c["name"] for c in inspector.get_columns("tasks")}
+    assert {
+        "ix_tasks_status_priority_created_at", "ix_tasks_created_at_id",
+        "ix_tasks_user_id_created_at_id", "ix_tasks_status_created_at_id",
+    } <= {i["name"] for i in inspector.get_indexes("tasks")}
+    unique = {i["name"]: i["unique"] for i in inspector.get_indexes("conversation_messages")}
+    assert unique["uq_conversation_messages_task_id_sequence_order"]
+    assert {"checkpoint", "cancel_requested"} <= {c["name"] for c in inspector.get_columns("plan_jobs")}
+    for table in ("llm_usage", "llm_response_cache", "rate_limit_buckets"):
+        assert inspector.has_table(table)
+
+
+def test_upgrade_fresh_database(tmp_path):
+    """空数据库升级到head后包含全部表、列和索引，并且可以降级回空库"""
+    url = f"sqlite:///{tmp_path / 'fresh.db'}"
+    _alembic(url, "upgrade", "head")
+    engine = sa.create_engine(url)
+    _assert_head_schema(engine)
+
+    _alembic(url, "downgrade", "base")
+    assert set(sa.inspect(engine).get_table_names()) == {"alembic_version"}
+
+
+def test_upgrade_existing_baseline_database(tmp_path):
+    """升级只有初始表结构的已有数据库：补充新列和索引，重复的消息序号按原顺序重新编号"""
+    url = f"sqlite:///{tmp_path / 'baseline.db'}"
+    _alembic(url, "upgrade", "0001")
+    engine = sa.create_engine(url)
+    task_id = uuid.uuid4().hex
+    with engine.begin() as conn:
+        conn.execute(sa.text("INSERT INTO tasks (id, description) VALUES (:id, '学习Python')"), {"id": task_id})
+        for message_id, order in [(1, 0), (2, 1), (3, 1), (4, 2)]:
+            conn.execute(
+                sa.text("INSERT INTO conversation_messages (id, task_id, sequence_order) VALUES (:id, :task, :order)"),
+                {"id": message_id, "task": task_id, "order": order},
+            )
+
+    _alembic(url, "upgrade", "head")
+    _assert_head_schema(engine)
+    with engine.connect() as conn:
+        rows = conn.execute(sa.text("SELECT id, sequence_order FROM conversation_messages ORDER BY id")).fetchall()
+    assert [tuple(row) for row in rows] == [(1, 0), (2, 1), (3, 2), (4, 3)]
+
+
+def test_upgrade_database_created_by_create_all(tmp_path):
+    """由create_tables()建好的数据库直接升级，已存在的表和索引被跳过"""
+    url = f"sqlite:///{tmp_path / 'create_all.db'}"
+    engine = sa.create_engine(url)
+    Base.metadata.create_all(bind=engine)
+
+    _alembic(url, "upgrade", "head")
+    _assert_head_schema(engine)
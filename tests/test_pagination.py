@@ -0,0 +1,109 @@
+"""
+Tests for keyset pagination of task and message listings.
+"""
+
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from helios.database.models import Task, User
+from helios.repositories.conversation_repository import ConversationRepository
+from helios.repositories.pagination import decode_cursor, encode_cursor
+from helios.repositories.task_repository import TaskRepository
+from helios.routers import tasks
+
+
+@pytest.fixture
+def seeded(db_session):
+    """两个用户，共25个任务；其中一个任务带有30条消息"""
+    db_session.add_all([
+        User(id=1, username="a", email="a@helios.dev"),
+        User(id=2, username="b", email="b@helios.dev"),
+    ])
+    db_session.commit()
+    base = datetime(2026, 1, 1)
+    for index in range(25):
+        # 每3个任务共用同一个创建时间，检验 (created_at, id) 的并列处理
+        db_session.add(Task(
+            description=f"task-{index}",
+            user_id=index % 2 + 1,
+            created_at=base + timedelta(minutes=index // 3),
+            result={"plan": "x" * 100},
+        ))
+    db_session.commit()
+    task = db_session.query(Task).first()
+    conv_repo = ConversationRepository(db_session)
+    for index in range(30):
+        conv_repo.add_message(task.id, "user" if index % 2 == 0 else "assistant", f"第{index}条消息" + "内容" * 50)
+    return task
+
+
+def _walk(fetch):
+    items, cursor = [], None
+    while True:
+        page, cursor = fetch(cursor)
+        items.extend(page)
+        if cursor is None:
+            return items
+
+
+def test_cursor_roundtrip():
+    """游标可以还原排序键，非法游标抛出ValueError"""
+    created_at = datetime(2026, 5, 1, 12, 30, 15, 123456)
+    task_id = uuid.uuid4()
+    assert decode_cursor(encode_cursor(created_at, task_id)) == (created_at, task_id)
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def test_task_pages_cover_every_task_once(db_session, seeded):
+    """逐页遍历能不重不漏地返回所有任务，且按创建时间倒序"""
+    repo = TaskRepository(db_session)
+    rows = _walk(lambda cursor: repo.list_page(limit=4, after=cursor))
+
+    assert len(rows) == 25
+    assert len({row.id for row in rows}) == 25
+    keys = [(row.created_at, row.id) for row in rows]
+    assert keys == sorted(keys, reverse=True)
+    assert "result" not in rows[0]._fields
+
+    user_rows = _walk(lambda cursor: repo.list_page(user_id=2, limit=5, after=cursor))
+    assert len(user_rows) == 12
+    assert {row.user_id for row in user_rows} == {2}
+
+
+def test_message_pages_and_preview(db_session, seeded):
+    """消息按sequence_order分页，preview只返回内容前缀"""
+    conv_repo = ConversationRepository(db_session)
+    rows = _walk(lambda cursor: conv_repo.find_page(seeded.id, after=cursor, limit=7))
+    assert [row.sequence_order for row in rows] == list(range(30))
+
+    page, cursor = conv_repo.find_page(seeded.id, limit=5, preview=4)
+    assert cursor == 4
+    assert page[0].message == "第0条消"
+
+
+def test_list_endpoints_return_next_cursor_header(db_session, seeded, override_db):
+    """列表接口响应体保持为数组，下一页游标放在X-Next-Cursor响应头中"""
+    app = FastAPI()
+    app.include_router(tasks.router, prefix="/api")
+    override_db(app)
+    client = TestClient(app)
+
+    first = client.get("/api/tasks/", params={"limit": 10})
+    assert first.status_code == 200
+    assert len(first.json()) == 10
+    assert "result" not in first.json()[0]
+    second = client.get("/api/tasks/", params={"limit": 20, "after": first.headers["X-Next-Cursor"]})
+    assert len(second.json()) == 15
+    assert "X-Next-Cursor" not in second.headers
+    assert client.get("/api/tasks/", params={"after": "bogus"}).status_code == 400
+
+    messages = client.get(f"/api/tasks/{seeded.id}/messages", params={"limit": 25})
+    assert len(messages.json()) == 25
+    assert messages.headers["X-Next-Cursor"] == "24"
+    rest = client.get(f"/api/tasks/{seeded.id}/messages", params={"after": 24})
+    assert [m["sequence_order"] for m in rest.json()] == list(range(25, 30))
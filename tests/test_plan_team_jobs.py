@@ -0,0 +1,214 @@
+"""
+End-to-end tests for plan jobs running the real AdaptivePlanTeam (backend/agent_team.py)
+through JobWorker, with the LLM providers stubbed at the HTTP layer.
+"""
+
+import asyncio
+import json
+import threading
+import time
+
+import httpx
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+import helios.services
+from helios.config import settings
+from helios.jobs import JobWorker, handlers
+from helios.repositories.job_repository import JobRepository
+from helios.services import MultiModelClient
+from helios.services.metering import UsageMeter
+from helios.services.rate_limit import AdmissionController
+
+# 按系统提示词识别发言的智能体，返回能推进状态机的回复
+REPLIES = {
+    "目标解构专家": ("Analyst", json.dumps({"structured_goal": True, "goal": "学习Python"}, ensure_ascii=False)),
+    "学习方法研究专家": ("Researcher", "research_report: 先学语法，再做项目"),
+    "总体规划师": ("Strategist", "plan: 第1周语法，第2周项目"),
+    "反馈分析与适应专家": ("Adaptor", "调整节奏，重新规划"),
+}
+
+
+class StubLLM:
+    """按智能体返回固定回复的假提供商，可以让某个智能体的请求失败或变慢"""
+
+    def __init__(self):
+        self.calls = []
+        self.failing = set()
+        self.delays = {}
+        self.slow_started = threading.Event()
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        system = payload["messages"][0]["content"]
+        agent, content = next(reply for key, reply in REPLIES.items() if key in system)
+        self.calls.append(agent)
+        if agent in self.delays:
+            self.slow_started.set()
+            await asyncio.sleep(self.delays[agent])
+        if agent in self.failing:
+            return httpx.Response(400, json={"error": {"message": "bad request"}})
+        return httpx.Response(200, json={
+            "model": payload["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": 20, "completion_tokens": 10, "total_tokens": 30},
+        })
+
+
+@pytest.fixture
+def stub_llm(monkeypatch):
+    """把共享的MultiModelClient替换为连接假提供商的客户端，并使用新的团队会话池"""
+    stub = StubLLM()
+    transport = httpx.MockTransport(stub.handle)
+    client = MultiModelClient(
+        settings,
+        transports={name: transport for name in ("qwen-max", "glm-4", "deepseek-chat", "moonshot-v1-8k")},
+        meter=UsageMeter("sqlite://"),
+        limiter=AdmissionController(),
+    )
+    monkeypatch.setattr(helios.services, "model_client", client)
+    monkeypatch.setattr(handlers, "_team_pool", None)
+    return stub
+
+
+@pytest.fixture
+def session_factory(db_session):
+    """与db_session共享同一个数据库的会话工厂"""
+    return sessionmaker(autocommit=False, autoflush=False, bind=db_session.get_bind())
+
+
+def test_worker_runs_real_team(db_session, session_factory, stub_llm):
+    """工作进程用真实的智能体团队生成计划，随后在同一会话中处理反馈"""
+    repo = JobRepository(db_session)
+    plan_job = repo.enqueue("plan_generation", {"goal": "学习Python"}, session_id="s1")
+    feedback_job = repo.enqueue("feedback_submission", {"text": "太快了", "ratings": {"pace": 2}}, session_id="s1")
+    worker = JobWorker(session_factory=session_factory, concurrency=1, retry_delay=0)
+
+    assert worker.run_once()
+    db_session.expire_all()
+    job = repo.get(plan_job.id)
+    assert job.status == "SUCCEEDED", job.error
+    assert job.result["plan"] == "plan: 第1周语法，第2周项目"
+    assert job.result["structured_goal"]["goal"] == "学习Python"
+    assert set(job.result["timings"]) == {"ANALYZING", "RESEARCHING", "PLANNING"}
+    assert stub_llm.calls == ["Analyst", "Researcher", "Strategist"]
+
+    assert worker.run_once()
+    db_session.expire_all()
+    job = repo.get(feedback_job.id)
+    assert job.status == "SUCCEEDED", job.error
+    assert job.result["original_plan"] == "plan: 第1周语法，第2周项目"
+    assert stub_llm.calls[3:] == ["Adaptor", "Strategist"]
+
+    # 用量按提供商返回的usage和实际应答的模型计量，并归属到任务、智能体和状态
+    rows = helios.services.model_client.meter.breakdown(["model", "agent", "state"], task_id=str(plan_job.id))
+    assert sorted((r["agent"], r["state"]) for r in rows) == [
+        ("Analyst", "ANALYZING"), ("Researcher", "RESEARCHING"), ("Strategist", "PLANNING"),
+    ]
+    assert {r["model"] for r in rows} <= set(helios.services.model_client.clients)
+    assert all(r["prompt_tokens"] == 20 and r["estimated_calls"] == 0 for r in rows)
+    feedback_rows = helios.services.model_client.meter.breakdown(["agent"], task_id=str(feedback_job.id))
+    assert {r["agent"] for r in feedback_rows} == {"Adaptor", "Strategist"}
+
+
+def test_feedback_on_another_worker_restores_plan(db_session, session_factory, stub_llm):
+    """反馈任务由没有该会话的工作进程处理时，从数据库中最近的结果恢复计划"""
+    repo = JobRepository(db_session)
+    plan_job = repo.enqueue("plan_generation", {"goal": "学习Python"}, session_id="s1")
+    first = repo.enqueue("feedback_submission", {"text": "太快了"}, session_id="s1")
+    second = repo.enqueue("feedback_submission", {"text": "还是太快"}, session_id="s1")
+    worker = JobWorker(session_factory=session_factory, concurrency=1, retry_delay=0)
+
+    for job in (plan_job, first, second):
+        # 每个任务都由一个全新的团队会话池处理，模拟另一个工作进程或重启后的进程
+        handlers._team_pool = None
+        assert worker.run_once()
+        db_session.expire_all()
+        assert repo.get(job.id).status == "SUCCEEDED", repo.get(job.id).error
+
+    for job in (first, second):
+        result = repo.get(job.id).result
+        assert result["original_plan"] == "plan: 第1周语法，第2周项目"
+        assert result["research_report"] == "research_report: 先学语法，再做项目"
+        assert result["structured_goal"]["goal"] == "学习Python"
+    assert stub_llm.calls[3:] == ["Adaptor", "Strategist", "Adaptor", "Strategist"]
+
+
+def test_feedback_without_plan_fails(db_session, session_factory, stub_llm):
+    """会话还没有成功生成过计划时，反馈任务失败而不是在没有计划的情况下重新规划"""
+    repo = JobRepository(db_session)
+    job = repo.enqueue("feedback_submission", {"text": "太快了"}, session_id="s1", max_attempts=1)
+    worker = JobWorker(session_factory=session_factory, concurrency=1, retry_delay=0)
+
+    assert worker.run_once()
+    db_session.expire_all()
+    failed = repo.get(job.id)
+    assert failed.status == "FAILED"
+    assert "还没有可调整的计划" in failed.error
+    assert stub_llm.calls == []
+
+
+def test_speculative_calls_are_metered(stub_llm):
+    """推测执行的调用同样计量，归属到发起推测时的状态"""
+    from helios.services.metering import usage_context
+
+    team = handlers._create_agent_team()
+    team.speculative = True
+    with usage_context(task_id="spec-1"):
+        result = team.run("学习Python")
+
+    assert result["plan"] == "plan: 第1周语法，第2周项目"
+    assert result["speculation"]["started"] == 1
+    rows = helios.services.model_client.meter.breakdown(["agent", "state"], task_id="spec-1")
+    calls = {(r["agent"], r["state"]): r["calls"] for r in rows}
+    assert calls[("Researcher", "ANALYZING")] == 1
+    assert sum(calls.values()) == len(stub_llm.calls)
+
+
+def test_retry_resumes_real_team_from_checkpoint(db_session, session_factory, stub_llm):
+    """规划阶段失败后重试的任务从检查点继续，不重新调用已完成阶段的智能体"""
+    repo = JobRepository(db_session)
+    job = repo.enqueue("plan_generation", {"goal": "学习Python"}, session_id="s1", max_attempts=2)
+    worker = JobWorker(session_factory=session_factory, concurrency=1, retry_delay=0)
+
+    stub_llm.failing.add("Strategist")
+    assert worker.run_once()
+    db_session.expire_all()
+    failed = repo.get(job.id)
+    assert failed.status == "QUEUED"
+    assert failed.checkpoint["state"] == "PLANNING"
+    assert failed.checkpoint["shared_data"]["research_report"] == "research_report: 先学语法，再做项目"
+
+    # 模拟另一个工作进程接手：会话状态只能来自检查点
+    handlers._team_pool = None
+    stub_llm.failing.clear()
+    stub_llm.calls.clear()
+    assert worker.run_once()
+    db_session.expire_all()
+    resumed = repo.get(job.id)
+    assert resumed.status == "SUCCEEDED", resumed.error
+    assert resumed.result["plan"] == "plan: 第1周语法，第2周项目"
+    assert resumed.result["research_report"] == "research_report: 先学语法，再做项目"
+    assert stub_llm.calls == ["Strategist"]
+
+
+def test_cancel_aborts_real_team_run(db_session, session_factory, stub_llm):
+    """运行中的规划任务被取消后，进行中的研究员调用被中止，任务停在已保存的检查点"""
+    repo = JobRepository(db_session)
+    job = repo.enqueue("plan_generation", {"goal": "学习Python"}, session_id="s1")
+    stub_llm.delays["Researcher"] = 10
+    worker = JobWorker(session_factory=session_factory, concurrency=1, cancel_poll_interval=0.02)
+    thread = threading.Thread(target=worker.run_once)
+    thread.start()
+    assert stub_llm.slow_started.wait(5)
+    started = time.monotonic()
+    JobRepository(session_factory()).cancel(job.id)
+    thread.join(5)
+
+    db_session.expire_all()
+    cancelled = repo.get(job.id)
+    assert not thread.is_alive()
+    assert time.monotonic() - started < 5
+    assert cancelled.status == "CANCELLED"
+    assert cancelled.checkpoint["state"] == "RESEARCHING"
+    assert stub_llm.calls == ["Analyst", "Researcher"]
@@ -0,0 +1,125 @@
+"""
+Tests for cross-process WebSocket fan-out (helios/services/pubsub.py).
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from helios.routers import websocket
+from helios.services.pubsub import (
+    InMemoryPubSub,
+    PostgresPubSub,
+    UnixSocketBroker,
+    UnixSocketPubSub,
+    create_pubsub,
+)
+
+
+class FakeWebSocket:
+    def __init__(self, fail=False):
+        self.sent = []
+        self.fail = fail
+
+    async def send_text(self, text):
+        if self.fail:
+            raise RuntimeError("连接已断开")
+        self.sent.append(json.loads(text))
+
+
+def test_in_memory_delivers_only_subscribed_channels():
+    """进程内后端只把消息交给已订阅的频道"""
+    received = []
+
+    async def handler(channel, message):
+        received.append((channel, message))
+
+    async def run():
+        pubsub = InMemoryPubSub()
+        with pytest.raises(RuntimeError):
+            await pubsub.publish("a", {"n": 0})
+        await pubsub.start(handler)
+        await pubsub.subscribe("a")
+        await pubsub.publish("a", {"n": 1})
+        await pubsub.publish("b", {"n": 2})
+        await pubsub.unsubscribe("a")
+        await pubsub.publish("a", {"n": 3})
+
+    asyncio.run(run())
+    assert received == [("a", {"n": 1})]
+
+
+def test_broadcast_subscribes_per_task_and_drops_dead_sockets():
+    """第一个本地连接订阅任务频道，断开的连接被清理，最后一个连接离开后取消订阅"""
+    alive, dead = FakeWebSocket(), FakeWebSocket(fail=True)
+
+    async def run():
+        await websocket.register_connection("task-1", alive)
+        await websocket.register_connection("task-1", dead)
+        assert "task-1" in websocket.pubsub.channels
+        await websocket.broadcast_message("task-1", {"speaker": "planner"})
+        await websocket.broadcast_message("task-2", {"speaker": "critic"})
+        await websocket.flush_connections("task-1")
+        await asyncio.sleep(0.01)
+        assert websocket.active_connections["task-1"] == [alive]
+        await websocket.unregister_connection("task-1", alive)
+
+    asyncio.run(run())
+    assert alive.sent == [{"speaker": "planner"}]
+    assert "task-1" not in websocket.active_connections
+    assert "task-1" not in websocket.pubsub.channels
+
+
+def test_unix_socket_broker_fans_out_across_workers(tmp_path):
+    """通过Unix套接字代理，一个工作进程发布的消息送达所有订阅该任务的工作进程"""
+    path = str(tmp_path / "pubsub.sock")
+    inboxes = {"w1": [], "w2": [], "w3": []}
+
+    def collect(name):
+        async def handler(channel, message):
+            inboxes[name].append((channel, message))
+        return handler
+
+    async def run():
+        broker = UnixSocketBroker(path)
+        await broker.start()
+        workers = {name: UnixSocketPubSub(path, reconnect_delay=0.01) for name in inboxes}
+        for name, worker in workers.items():
+            await worker.start(collect(name))
+        await workers["w1"].subscribe("task-1")
+        await workers["w2"].subscribe("task-1")
+        await workers["w3"].subscribe("task-2")
+        await asyncio.sleep(0.05)
+
+        await workers["w3"].publish("task-1", {"text": "你好"})
+        await workers["w1"].publish("task-2", {"text": "计划"})
+        await asyncio.sleep(0.05)
+
+        for worker in workers.values():
+            await worker.close()
+        await broker.close()
+
+    asyncio.run(run())
+    assert inboxes["w1"] == [("task-1", {"text": "你好"})]
+    assert inboxes["w2"] == [("task-1", {"text": "你好"})]
+    assert inboxes["w3"] == [("task-2", {"text": "计划"})]
+
+
+def test_factory_and_postgres_channel_names():
+    """按配置创建后端，PostgreSQL通道名合法且稳定"""
+    config = SimpleNamespace(PUBSUB_BACKEND="postgres", PUBSUB_URL="", DATABASE_URL="postgresql+psycopg2://u:p@db/helios",
+                             PUBSUB_SOCKET_PATH="/tmp/x.sock")
+    pubsub = create_pubsub(config)
+    assert isinstance(pubsub, PostgresPubSub)
+    assert pubsub.dsn == "postgresql://u:p@db/helios"
+    channel = PostgresPubSub.pg_channel("4f1c3c9e-0000-4000-8000-000000000000")
+    assert channel.startswith("helios_") and len(channel) < 63
+    assert channel == PostgresPubSub.pg_channel("4f1c3c9e-0000-4000-8000-000000000000")
+
+    config.PUBSUB_BACKEND = "unix"
+    assert isinstance(create_pubsub(config), UnixSocketPubSub)
+    config.PUBSUB_BACKEND = "redis"
+    with pytest.raises(ValueError):
+        create_pubsub(config)
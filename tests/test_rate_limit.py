@@ -0,0 +1,172 @@
+"""
+Tests for token-bucket admission control (helios/services/rate_limit.py).
+"""
+
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from helios.config import settings
+from helios.database.dependencies import get_job_repository
+from helios.routers import adaptive_plan
+from helios.services import LLMTransportError, MultiModelClient
+from helios.services.metering import UsageMeter
+from helios.services.rate_limit import (
+    AdmissionController, DatabaseBucketStore, MemoryBucketStore, RateLimited,
+)
+
+
+def _clock():
+    now = [0.0]
+    return now, lambda: now[0]
+
+
+def test_bucket_allows_burst_then_rejects_with_retry_after():
+    """桶满时允许突发，令牌耗尽后拒绝并给出补充一个令牌所需的时间"""
+    now, clock = _clock()
+    store = MemoryBucketStore(clock)
+
+    assert [store.acquire("user:1", 60)[0] for _ in range(60)] == [True] * 60
+    admitted, retry_after = store.acquire("user:1", 60)
+    assert not admitted
+    assert retry_after == pytest.approx(1.0)
+
+    now[0] = 1.0
+    assert store.acquire("user:1", 60) == (True, 0.0)
+
+
+def test_short_waits_are_queued_in_order():
+    """等待时间在允许范围内时预留令牌，后到的请求需要等待更久"""
+    _, clock = _clock()
+    store = MemoryBucketStore(clock)
+    store.acquire("route:plan", 6, amount=6)
+
+    first = store.acquire("route:plan", 6, max_wait=30)
+    second = store.acquire("route:plan", 6, max_wait=30)
+    third = store.acquire("route:plan", 6, max_wait=15)
+
+    assert first == (True, pytest.approx(10.0))
+    assert second == (True, pytest.approx(20.0))
+    assert third[0] is False and third[1] == pytest.approx(30.0)
+
+
+def test_rejection_refunds_other_buckets():
+    """路由桶拒绝时退还已从用户桶取出的令牌"""
+    _, clock = _clock()
+    controller = AdmissionController(MemoryBucketStore(clock), user_rpm=5, route_rpm={"plan_generate": 1})
+
+    asyncio.run(controller.admit_request("plan_generate", "alice"))
+    with pytest.raises(RateLimited) as info:
+        asyncio.run(controller.admit_request("plan_generate", "alice"))
+
+    assert info.value.scope == "route:plan_generate"
+    assert info.value.headers == {"Retry-After": "60"}
+    assert controller.store.acquire("user:alice", 5, amount=4) == (True, 0.0)
+
+
+def test_database_store_shares_buckets_between_processes(tmp_path):
+    """两个数据库存储实例（模拟两个进程）共享同一个桶"""
+    url = f"sqlite:///{tmp_path / 'buckets.db'}"
+    now, clock = _clock()
+    first = DatabaseBucketStore(url, clock=clock)
+    second = DatabaseBucketStore(url, clock=clock)
+
+    assert first.acquire("provider:glm-4:requests", 2)[0]
+    assert second.acquire("provider:glm-4:requests", 2)[0]
+    assert not first.acquire("provider:glm-4:requests", 2)[0]
+
+    second.pause("provider:glm-4:requests", 2, 100)
+    now[0] = 90.0
+    admitted, retry_after = first.acquire("provider:glm-4:requests", 2)
+    assert not admitted and retry_after == pytest.approx(10.0)
+
+
+def test_plan_route_returns_429(monkeypatch):
+    """超出用户限额的规划请求返回429和Retry-After，不会入队"""
+    enqueued = []
+
+    class FakeJobRepository:
+        def enqueue(self, job_type, payload, session_id=None, max_attempts=None):
+            enqueued.append(payload)
+            return type("Job", (), {"id": len(enqueued)})()
+
+    controller = AdmissionController(user_rpm=1)
+    monkeypatch.setattr(adaptive_plan, "get_admission_controller", lambda: controller)
+    app = FastAPI()
+    app.include_router(adaptive_plan.router)
+    app.dependency_overrides[get_job_repository] = FakeJobRepository
+    client = TestClient(app)
+
+    assert client.post("/api/plan/generate", json={"goal": "学Python", "user_id": "u1"}).status_code == 200
+    response = client.post("/api/plan/generate", json={"goal": "学Go", "user_id": "u1"})
+    other = client.post("/api/plan/generate", json={"goal": "学Rust", "user_id": "u2"})
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert other.status_code == 200
+    assert len(enqueued) == 2
+
+
+def test_provider_429_pauses_provider_and_routes_elsewhere():
+    """提供商返回429后暂停向其发送请求，路由直接切换到其他提供商"""
+    calls = {"qwen-max": 0, "glm-4": 0}
+
+    def handler_for(model):
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls[model] += 1
+            if model == "qwen-max":
+                return httpx.Response(429, headers={"Retry-After": "30"}, json={"error": "rate limited"})
+            return httpx.Response(200, json={
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}}],
+                "usage": {"prompt_tokens": 5, "completion_tokens": 1, "total_tokens": 6},
+            })
+        return handler
+
+    controller = AdmissionController(MemoryBucketStore(lambda: 0.0), provider_tpm={"glm-4": 100000})
+    client = MultiModelClient(
+        settings,
+        transports={name: httpx.MockTransport(handler_for(name)) for name in calls},
+        meter=UsageMeter("sqlite://"),
+        limiter=controller,
+    )
+    messages = [{"role": "user", "content": "hi"}]
+
+    async def run():
+        with pytest.raises(LLMTransportError) as first:
+            await client.chat("qwen-max", messages)
+        with pytest.raises(LLMTransportError) as second:
+            await client.chat("qwen-max", messages)
+        routed = await client.route_chat(messages, candidates=["qwen-max", "glm-4"])
+        await client.aclose()
+        return first.value, second.value, routed
+
+    first, second, routed = asyncio.run(run())
+    assert first.retry_after == 30.0
+    assert second.status_code == 429
+    assert calls["qwen-max"] == 1
+    assert routed["model"] == "glm-4"
+    assert controller.stats["provider_pauses"] == 1
+    # 预留的tokens按实际用量退还，只扣除实际消耗的6个
+    assert not controller.store.acquire("provider:glm-4:tokens", 100000, amount=99995)[0]
+    assert controller.store.acquire("provider:glm-4:tokens", 100000, amount=99994)[0]
+
+
+def test_sync_admission_queues_in_calling_thread(monkeypatch):
+    """同步准入检查在调用线程中排队等待，规划路由都是在线程池中执行的同步函数"""
+    from helios.services import rate_limit
+
+    _, clock = _clock()
+    sleeps = []
+    monkeypatch.setattr(rate_limit.time, "sleep", sleeps.append)
+    controller = AdmissionController(MemoryBucketStore(clock), user_rpm=6, max_queue_seconds=15)
+
+    for _ in range(7):
+        controller.admit_request_sync("plan_generate", "alice")
+    with pytest.raises(RateLimited):
+        controller.admit_request_sync("plan_generate", "alice")
+
+    assert sleeps == [pytest.approx(10.0)]
+    assert not any(asyncio.iscoroutinefunction(route.endpoint) for route in adaptive_plan.router.routes)
@@ -0,0 +1,280 @@
+"""
+Tests for provider circuit breakers, retries and deadlines (helios/services/resilience.py).
+"""
+
+import asyncio
+import threading
+
+import httpx
+import pytest
+
+from helios.config import settings
+from helios.services import LLMTransportError, MultiModelClient, deadline_scope
+from helios.services.metering import UsageMeter
+from helios.services.fake_provider import FakeProvider, fake_transports
+from helios.services.rate_limit import AdmissionController, MemoryBucketStore
+from helios.services.resilience import (
+    CLOSED, HALF_OPEN, OPEN, CancellationToken, CircuitBreaker, CircuitOpenError, DeadlineExceeded,
+    OperationCancelled, RetryBudget, RetryPolicy, cancel_scope,
+)
+
+
+def _completion(content: str = "ok") -> dict:
+    return {
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 3, "completion_tokens": 1, "total_tokens": 4},
+    }
+
+
+def _client(handlers, **retry):
+    client = MultiModelClient(
+        settings,
+        transports={name: httpx.MockTransport(handler) for name, handler in handlers.items()},
+        meter=UsageMeter("sqlite://"),
+        limiter=AdmissionController(),
+    )
+    client.retry_policy = RetryPolicy(rng=lambda low, high: 0.0, **retry)
+    return client
+
+
+def test_breaker_opens_half_opens_and_closes():
+    """连续失败达到阈值后打开，恢复时间后放行一个探测请求，探测结果决定关闭或重新打开"""
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=10, clock=lambda: now[0])
+
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
+    assert breaker.retry_after == pytest.approx(10)
+
+    now[0] = 10.0
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    now[0] = 20.0
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.allow()
+
+
+def test_retry_policy_backoff_and_budget():
+    """退避时间按指数增长且不少于Retry-After，重试预算按请求数比例补充"""
+    policy = RetryPolicy(base_delay=1, max_delay=4, rng=lambda low, high: high)
+    assert [policy.delay(n) for n in (1, 2, 3, 4)] == [1, 2, 4, 4]
+    assert policy.delay(1, retry_after=7) == 7
+    assert RetryPolicy.is_retryable(LLMTransportError("m", "x", status_code=503))
+    assert RetryPolicy.is_retryable(LLMTransportError("m", "x"))
+    assert not RetryPolicy.is_retryable(LLMTransportError("m", "x", status_code=400))
+    assert not RetryPolicy.is_retryable(LLMTransportError("m", "x", status_code=429))
+
+    budget = RetryBudget(ratio=0.5, reserve=1)
+    assert budget.try_retry() and not budget.try_retry()
+    budget.record_request()
+    budget.record_request()
+    assert budget.try_retry()
+
+
+def test_chat_retries_server_errors_but_not_client_errors():
+    """5xx按策略重试直到成功，4xx直接返回错误"""
+    statuses = {"qwen-max": [502, 503, 200], "glm-4": [400, 200]}
+    calls = {"qwen-max": 0, "glm-4": 0}
+
+    def handler_for(model):
+        def handler(request):
+            status = statuses[model][calls[model]]
+            calls[model] += 1
+            return httpx.Response(status, json=_completion() if status == 200 else {"error": "x"})
+        return handler
+
+    client = _client({name: handler_for(name) for name in calls}, max_attempts=3)
+
+    async def run():
+        response = await client.chat("qwen-max", [{"role": "user", "content": "hi"}], use_cache=False)
+        with pytest.raises(LLMTransportError) as info:
+            await client.chat("glm-4", [{"role": "user", "content": "hi"}], use_cache=False)
+        await client.aclose()
+        return response, info.value
+
+    response, error = asyncio.run(run())
+    assert response["choices"][0]["message"]["content"] == "ok"
+    assert calls == {"qwen-max": 3, "glm-4": 1}
+    assert error.status_code == 400
+    assert client.breakers["glm-4"].state == CLOSED
+
+
+def test_open_breaker_fails_fast_and_failover_follows_it():
+    """熔断器打开后不再请求该提供商，路由直接切换到下一个模型"""
+    calls = {"qwen-max": 0, "glm-4": 0}
+
+    def handler_for(model):
+        def handler(request):
+            calls[model] += 1
+            if model == "qwen-max":
+                return httpx.Response(500, json={"error": "down"})
+            return httpx.Response(200, json=_completion())
+        return handler
+
+    client = _client({name: handler_for(name) for name in calls}, max_attempts=1)
+    client.breakers["qwen-max"] = CircuitBreaker(failure_threshold=2, recovery_timeout=60)
+    messages = [{"role": "user", "content": "hi"}]
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(LLMTransportError):
+                await client.chat("qwen-max", messages, use_cache=False)
+        with pytest.raises(CircuitOpenError):
+            await client.chat("qwen-max", messages, use_cache=False)
+        routed = await client.route_chat(messages, candidates=["qwen-max", "glm-4"], use_cache=False)
+        await client.aclose()
+        return routed
+
+    routed = asyncio.run(run())
+    assert calls["qwen-max"] == 2
+    assert routed["model"] == "glm-4"
+    assert client.rank(["qwen-max", "glm-4"])[-1] == "qwen-max"
+    assert client.get_config_list()[-1]["model"] == "qwen-max"
+
+
+def test_deadline_bounds_slow_provider_calls():
+    """截止时间到期时中止进行中的请求，不重试也不触发熔断"""
+    async def slow(request):
+        await asyncio.sleep(1)
+        return httpx.Response(200, json=_completion())
+
+    client = _client({"qwen-max": slow}, max_attempts=3)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        with deadline_scope(0.05):
+            with pytest.raises(DeadlineExceeded):
+                await client.chat("qwen-max", [{"role": "user", "content": "hi"}], use_cache=False)
+            with pytest.raises(DeadlineExceeded):
+                await client.chat("qwen-max", [{"role": "user", "content": "again"}], use_cache=False)
+        elapsed = loop.time() - started
+        await client.aclose()
+        return elapsed
+
+    assert asyncio.run(run()) < 0.5
+    assert client.breakers["qwen-max"].state == CLOSED
+    assert client.transport.get_pool("qwen-max").total_requests == 1
+
+
+def _half_open(client, model):
+    """把提供商的熔断器置为半开状态，只剩一个探测名额"""
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=10, clock=lambda: now[0])
+    breaker.record_failure()
+    now[0] = 10.0
+    client.breakers[model] = breaker
+    assert breaker.state == HALF_OPEN
+    return breaker
+
+
+def _assert_probe_released(breaker):
+    """探测没有得到结果时名额被归还，下一次调用仍可作为探测放行"""
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+async def _slow(request):
+    await asyncio.sleep(1)
+    return httpx.Response(200, json=_completion())
+
+
+def test_probe_lost_to_deadline_is_released():
+    """探测请求因截止时间中止时归还名额"""
+    client = _client({"qwen-max": _slow})
+    breaker = _half_open(client, "qwen-max")
+
+    async def run():
+        with deadline_scope(0.05), pytest.raises(DeadlineExceeded):
+            await client.chat("qwen-max", [{"role": "user", "content": "hi"}], use_cache=False)
+        await client.aclose()
+
+    asyncio.run(run())
+    _assert_probe_released(breaker)
+
+
+def test_probe_lost_to_cancellation_is_released():
+    """探测请求因取消中止时归还名额"""
+    client = _client({"qwen-max": _slow})
+    breaker = _half_open(client, "qwen-max")
+    token = CancellationToken()
+
+    async def run():
+        threading.Timer(0.05, token.cancel).start()
+        with cancel_scope(token), pytest.raises(OperationCancelled):
+            await client.chat("qwen-max", [{"role": "user", "content": "hi"}], use_cache=False)
+        await client.aclose()
+
+    asyncio.run(run())
+    _assert_probe_released(breaker)
+
+
+def test_probe_lost_to_hedge_is_released():
+    """探测请求被更快的对冲请求取消时归还名额"""
+    client = _client({"qwen-max": _slow, "glm-4": lambda request: httpx.Response(200, json=_completion())})
+    breaker = _half_open(client, "qwen-max")
+    client.rank = lambda candidates=None: ["qwen-max", "glm-4"]
+
+    async def run():
+        response = await client.route_chat(
+            [{"role": "user", "content": "hi"}], hedge=True, hedge_delay=0.01, use_cache=False
+        )
+        await client.aclose()
+        return response
+
+    assert asyncio.run(run())["model"] == "glm-4"
+    _assert_probe_released(breaker)
+
+
+def test_probe_lost_to_stream_disconnect_is_released():
+    """流式探测请求在客户端断开（GeneratorExit）时归还名额"""
+    provider = FakeProvider(content="先学基础语法，再做项目。")
+    client = MultiModelClient(settings, transports=fake_transports({"qwen-max": provider}),
+                              meter=UsageMeter("sqlite://"), limiter=AdmissionController())
+    breaker = _half_open(client, "qwen-max")
+
+    async def run():
+        stream = client.stream_chat("qwen-max", [{"role": "user", "content": "hi"}], use_cache=False)
+        await stream.__anext__()
+        await stream.aclose()
+        await client.aclose()
+
+    asyncio.run(run())
+    _assert_probe_released(breaker)
+
+
+def test_probe_lost_to_local_quota_is_released():
+    """本地配额不足（在发出请求之前失败）时归还名额，也不计为提供商失败"""
+    client = _client({"qwen-max": lambda request: httpx.Response(200, json=_completion())})
+    client.limiter = AdmissionController(MemoryBucketStore(lambda: 0.0), provider_rpm={"qwen-max": 1})
+    client.limiter.store.acquire("provider:qwen-max:requests", 1)
+    breaker = _half_open(client, "qwen-max")
+
+    async def run():
+        with pytest.raises(LLMTransportError) as info:
+            await client.chat("qwen-max", [{"role": "user", "content": "hi"}], use_cache=False)
+        await client.aclose()
+        return info.value
+
+    assert asyncio.run(run()).status_code == 429
+    _assert_probe_released(breaker)
+
+
+def test_unreported_probe_times_out_back_to_open():
+    """探测请求既没有结果也没有归还名额时，超过probe_timeout后重新打开，之后可以再次探测"""
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=10, probe_timeout=30, clock=lambda: now[0])
+    breaker.record_failure()
+    now[0] = 10.0
+    assert breaker.allow() and not breaker.allow()
+
+    now[0] = 40.0
+    assert breaker.state == OPEN
+    now[0] = 50.0
+    assert breaker.state == HALF_OPEN and breaker.allow()
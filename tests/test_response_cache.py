@@ -0,0 +1,152 @@
+"""
+Tests for the helios/services/response_cache.py module.
+"""
+
+import asyncio
+import time
+
+from sqlalchemy import event
+
+from helios.config import settings
+from helios.services import MultiModelClient
+from helios.services.fake_provider import FakeProvider, fake_transports
+from helios.services.response_cache import ResponseCache, simhash
+
+SYSTEM = {"role": "system", "content": "你是一名目标解构专家。"}
+RESPONSE = {"choices": [{"message": {"role": "assistant", "content": "{\"goal\": \"learn python\"}"}}]}
+
+
+def _messages(text):
+    return [SYSTEM, {"role": "user", "content": text}]
+
+
+def test_exact_hit_ignores_whitespace_differences():
+    """规范化后相同的消息应命中缓存"""
+    cache = ResponseCache("sqlite://")
+    cache.set("qwen-max", _messages("learn Python in 3 months"), RESPONSE, temperature=0.2)
+
+    assert cache.get("qwen-max", _messages("  learn   Python in 3 months\n"), temperature=0.2) == RESPONSE
+    assert cache.get("glm-4", _messages("learn Python in 3 months"), temperature=0.2) is None
+    assert cache.get("qwen-max", _messages("learn Python in 3 months"), temperature=0.7) is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+
+
+def test_key_includes_all_request_params():
+    """除消息外的请求参数（max_tokens、stop、response_format等）不同的请求互不命中"""
+    cache = ResponseCache("sqlite://")
+    cache.set("qwen-max", _messages("goal"), RESPONSE, temperature=0.2, max_tokens=100, stop=["\n"])
+
+    assert cache.get("qwen-max", _messages("goal"), temperature=0.2, stop=["\n"], max_tokens=100) == RESPONSE
+    assert cache.get("qwen-max", _messages("goal"), temperature=0.2, max_tokens=100) is None
+    assert cache.get("qwen-max", _messages("goal"), temperature=0.2, max_tokens=20, stop=["\n"]) is None
+    assert cache.get(
+        "qwen-max", _messages("goal"), temperature=0.2, max_tokens=100, stop=["\n"],
+        response_format={"type": "json_object"},
+    ) is None
+    assert cache.get("qwen-max", _messages("goal"), temperature=0.2, max_tokens=100, stop=["\n"], top_p=None) == RESPONSE
+
+
+def test_ttl_expiry():
+    """过期条目不应被返回"""
+    cache = ResponseCache("sqlite://", ttl=0.01)
+    cache.set("qwen-max", _messages("goal"), RESPONSE)
+    time.sleep(0.02)
+    assert cache.get("qwen-max", _messages("goal")) is None
+
+
+def test_lru_eviction_keeps_recently_used():
+    """超过容量时淘汰最久未访问的条目"""
+    cache = ResponseCache("sqlite://", max_entries=2)
+    cache.set("qwen-max", _messages("a"), RESPONSE)
+    time.sleep(0.01)
+    cache.set("qwen-max", _messages("b"), RESPONSE)
+    time.sleep(0.01)
+    cache.get("qwen-max", _messages("a"))
+    time.sleep(0.01)
+    cache.set("qwen-max", _messages("c"), RESPONSE)
+
+    assert cache.get("qwen-max", _messages("a")) is not None
+    assert cache.get("qwen-max", _messages("b")) is None
+    assert cache.stats()["evictions"] == 1
+
+
+def _count_queries(cache):
+    """记录缓存执行的count(*)统计语句"""
+    statements = []
+    event.listen(
+        cache.engine, "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement) if "count(" in statement else None,
+    )
+    return statements
+
+
+def test_sweep_runs_periodically_not_on_every_write():
+    """写入不再每次都统计条目数，只在每sweep_every次写入时清理过期条目"""
+    cache = ResponseCache("sqlite://", ttl=0.01, sweep_every=5)
+    counts = _count_queries(cache)
+    for i in range(12):
+        cache.set("qwen-max", _messages(f"goal {i}"), RESPONSE)
+
+    # 第一次写入时校准条目数，之后每5次写入清理一次
+    assert len(counts) == 3
+    assert cache.stats()["stores"] == 12
+
+
+def test_overflow_evicts_down_to_low_water_mark():
+    """近似条目数超过上限时立即淘汰，并一次淘汰到上限的90%，之后的写入不再触发统计"""
+    cache = ResponseCache("sqlite://", max_entries=20, sweep_every=1000)
+    counts = _count_queries(cache)
+    for i in range(21):
+        time.sleep(0.001)
+        cache.set("qwen-max", _messages(f"goal {i}"), RESPONSE)
+    assert len(counts) == 2
+    assert cache.stats()["evictions"] == 3
+    assert cache.get("qwen-max", _messages("goal 2")) is None
+    assert cache.get("qwen-max", _messages("goal 3")) is not None
+
+    # 覆盖已有的键不增加条目数
+    for i in range(3, 8):
+        cache.set("qwen-max", _messages(f"goal {i}"), RESPONSE)
+    cache.set("qwen-max", _messages("goal 21"), RESPONSE)
+    cache.set("qwen-max", _messages("goal 22"), RESPONSE)
+    assert len(counts) == 2
+    assert cache.stats()["evictions"] == 3
+
+
+def test_near_duplicate_mode():
+    """近似重复模式下，措辞略有差异的目标也能命中"""
+    base = "I want to learn Python in 3 months so that I can analyse data for my job every week"
+    variant = "I want to learn Python in 3 months so that I can analyze data for my job every week"
+    assert bin(simhash(base) ^ simhash(variant)).count("1") <= 6
+
+    exact_only = ResponseCache("sqlite://")
+    exact_only.set("qwen-max", _messages(base), RESPONSE)
+    assert exact_only.get("qwen-max", _messages(variant)) is None
+
+    near = ResponseCache("sqlite://", near_duplicate=True)
+    near.set("qwen-max", _messages(base), RESPONSE)
+    assert near.get("qwen-max", _messages(variant)) == RESPONSE
+    assert near.get("qwen-max", _messages("完全不同的目标：三周内学会弹吉他")) is None
+    assert near.stats()["near_hits"] == 1
+
+
+def test_client_serves_repeated_requests_from_cache():
+    """MultiModelClient对低temperature的重复请求只调用一次提供商"""
+    provider = FakeProvider()
+    client = MultiModelClient(
+        settings, transports=fake_transports({"qwen-max": provider}), cache=ResponseCache("sqlite://")
+    )
+
+    async def run():
+        for _ in range(3):
+            await client.chat("qwen-max", _messages("learn Python"), temperature=0.2)
+        await client.chat("qwen-max", _messages("learn Python"), temperature=0.9)
+        await client.chat("qwen-max", _messages("learn Python"), temperature=0.2, use_cache=False)
+        await client.chat("qwen-max", _messages("learn Python"), temperature=0.2, max_tokens=50)
+
+    asyncio.run(run())
+    assert provider.calls == 4
+    assert client.cache.stats()["hits"] == 2
@@ -0,0 +1,130 @@
+"""
+Tests for the helios/services/routing.py module and MultiModelClient.route_chat.
+"""
+
+import asyncio
+
+import pytest
+
+from helios.config import settings
+from helios.services import MultiModelClient, LLMTransportError
+from helios.services.fake_provider import FakeProvider, fake_transports
+from helios.services.routing import LatencyTracker, ModelRouter
+
+MESSAGES = [{"role": "user", "content": "帮我制定三个月学会Python的计划"}]
+
+
+def _client(providers):
+    return MultiModelClient(settings, transports=fake_transports(providers))
+
+
+def test_latency_tracker_percentiles_and_error_rate():
+    """滑动窗口应只保留最近的样本，并正确计算分位数和错误率"""
+    tracker = LatencyTracker(window_size=4)
+    for latency in [0.1, 0.2, 0.3, 0.4, 0.5]:
+        tracker.record(latency, ok=True)
+    tracker.record(None, ok=False)
+
+    assert tracker.samples == 4
+    assert tracker.percentile(0.5) in (0.3, 0.4)
+    assert tracker.percentile(0.99) == 0.5
+    assert tracker.error_rate == 0.25
+
+
+def test_router_prefers_fast_healthy_models():
+    """健康模型按p50排序，不健康模型排到最后"""
+    router = ModelRouter(["a", "b", "c"], min_samples=2)
+    for _ in range(3):
+        router.record("a", 0.9, ok=True)
+        router.record("b", 0.1, ok=True)
+        router.record("c", None, ok=False)
+
+    assert router.rank() == ["b", "a", "c"]
+    assert router.stats()["c"]["healthy"] is False
+
+
+def test_route_chat_picks_fastest_provider():
+    """积累统计后，请求应发送给最快的提供商"""
+    providers = {
+        "qwen-max": FakeProvider(latency=0.05),
+        "deepseek-chat": FakeProvider(latency=0.0),
+    }
+    client = _client(providers)
+
+    async def run():
+        # 预热：让两个提供商都有延迟样本
+        await client.chat("qwen-max", MESSAGES)
+        await client.chat("deepseek-chat", MESSAGES)
+        result = await client.route_chat(MESSAGES, candidates=["qwen-max", "deepseek-chat"])
+        await client.aclose()
+        return result
+
+    result = asyncio.run(run())
+    assert result["model"] == "deepseek-chat"
+    order = [config["model"] for config in client.get_config_list()]
+    assert order.index("deepseek-chat") < order.index("qwen-max")
+
+
+def test_route_chat_fails_over_on_error():
+    """首选提供商出错时应切换到下一个提供商"""
+    providers = {
+        "qwen-max": FakeProvider(error_rate=1.0),
+        "glm-4": FakeProvider(),
+    }
+    client = _client(providers)
+
+    result = asyncio.run(client.route_chat(MESSAGES, candidates=["qwen-max", "glm-4"]))
+    assert result["model"] == "glm-4"
+    assert client.router.stats()["qwen-max"]["error_rate"] == 1.0
+
+
+def test_hedged_request_cancels_slower_provider():
+    """对冲请求：慢提供商超过延迟阈值后发送副本，胜出后取消慢请求"""
+    providers = {
+        "qwen-max": FakeProvider(latency=1.0),
+        "moonshot-v1-8k": FakeProvider(latency=0.01),
+    }
+    client = _client(providers)
+
+    async def run():
+        return await client.route_chat(
+            MESSAGES, candidates=["qwen-max", "moonshot-v1-8k"], hedge=True, hedge_delay=0.02
+        )
+
+    result = asyncio.run(run())
+    assert result["model"] == "moonshot-v1-8k"
+    assert providers["qwen-max"].cancelled == 1
+    assert providers["qwen-max"].completed == 0
+    # 被取消的请求不计入错误率
+    assert client.router.stats()["qwen-max"]["samples"] == 0
+
+
+def test_route_chat_raises_when_all_fail():
+    """所有候选都失败时抛出最后一个错误"""
+    providers = {"glm-4": FakeProvider(error_rate=1.0, status_code=503)}
+    client = _client(providers)
+
+    with pytest.raises(LLMTransportError) as excinfo:
+        asyncio.run(client.route_chat(MESSAGES, candidates=["glm-4"]))
+    assert excinfo.value.status_code == 503
+
+
+def test_llm_config_follows_current_ranking():
+    """llm_config在调用时生成：路由模式交给路由器逐次选择，非路由模式反映调用时的排序"""
+    from helios.services import create_llm_config
+    from helios.services.autogen_client import HeliosModelClient
+
+    client = _client({"qwen-max": FakeProvider(), "deepseek-chat": FakeProvider()})
+    routed = create_llm_config(client)
+    assert [c["model_client_cls"] for c in routed["config_list"]] == [HeliosModelClient.__name__]
+
+    for _ in range(client.router.min_samples):
+        client.router.record("qwen-max", 0.9, ok=True)
+        client.router.record("deepseek-chat", 0.1, ok=True)
+    before = [c["model"] for c in create_llm_config(client, routed=False)["config_list"]]
+    for _ in range(client.router.min_samples * 3):
+        client.router.record("deepseek-chat", None, ok=False)
+    after = [c["model"] for c in create_llm_config(client, routed=False)["config_list"]]
+
+    assert before.index("deepseek-chat") < before.index("qwen-max")
+    assert after.index("qwen-max") < after.index("deepseek-chat")
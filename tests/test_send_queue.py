@@ -0,0 +1,105 @@
+"""
+Tests for per-connection bounded send queues (helios/services/send_queue.py).
+"""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+from helios.routers import websocket
+from helios.services.send_queue import ConnectionSender, FanoutMetrics
+
+
+class SlowWebSocket:
+    """每次发送前等待gate的假WebSocket"""
+
+    def __init__(self, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.sent = []
+
+    async def send_text(self, text):
+        if self.fail:
+            raise RuntimeError("连接已断开")
+        await asyncio.sleep(self.delay)
+        self.sent.append(json.loads(text))
+
+
+def _frames(n, event=None):
+    return [json.dumps({"n": i, **({"event": event} if event else {})}) for i in range(n)]
+
+
+def test_slow_client_does_not_delay_fast_clients():
+    """广播只入队不等待，慢客户端不影响快客户端"""
+    fast, slow = SlowWebSocket(), SlowWebSocket(delay=0.5)
+
+    async def run():
+        senders = [ConnectionSender(ws) for ws in (fast, slow)]
+        for sender in senders:
+            sender.start()
+        start = time.perf_counter()
+        for payload in _frames(3):
+            for sender in senders:
+                assert sender.enqueue(payload)
+        enqueue_time = time.perf_counter() - start
+        await senders[0].drain(1.0)
+        fast_done = time.perf_counter() - start
+        for sender in senders:
+            sender.cancel()
+        return enqueue_time, fast_done
+
+    enqueue_time, fast_done = asyncio.run(run())
+    assert enqueue_time < 0.05
+    assert fast_done < 0.2
+    assert [frame["n"] for frame in fast.sent] == [0, 1, 2]
+    assert len(slow.sent) < 3
+
+
+def test_overflow_policies():
+    """队列满时按策略丢弃最早的消息、合并同类消息或断开连接"""
+    async def fill(policy, payloads, keys=None):
+        metrics = FanoutMetrics()
+        errors = []
+        sender = ConnectionSender(SlowWebSocket(), max_queue=2, policy=policy, metrics=metrics, on_error=errors.append)
+        accepted = [sender.enqueue(p, k) for p, k in zip(payloads, keys or [None] * len(payloads))]
+        queued = [json.loads(item[1])["n"] for item in sender._queue]
+        return accepted, queued, metrics.snapshot(), errors
+
+    accepted, queued, stats, _ = asyncio.run(fill("drop_oldest", _frames(4)))
+    assert accepted == [True] * 4 and queued == [2, 3] and stats["dropped"] == 2
+
+    keys = ["STATUS", "STATUS", None, "STATUS"]
+    accepted, queued, stats, _ = asyncio.run(fill("coalesce", _frames(4), keys))
+    assert queued == [3, 2] and stats["coalesced"] == 2 and stats["dropped"] == 0
+
+    accepted, queued, stats, errors = asyncio.run(fill("disconnect", _frames(3)))
+    assert accepted == [True, True, False]
+    assert stats["disconnected"] == 1 and len(errors) == 1
+    assert errors[0].closed and not errors[0].enqueue("{}")
+
+    with pytest.raises(ValueError):
+        ConnectionSender(SlowWebSocket(), policy="block")
+
+
+def test_router_removes_failed_connections():
+    """发送失败的连接会被取消登记，统计中记录入队耗时"""
+    good, bad = SlowWebSocket(), SlowWebSocket(fail=True)
+
+    async def run():
+        await websocket.register_connection("task-q", good)
+        await websocket.register_connection("task-q", bad)
+        await websocket.broadcast_message("task-q", {"speaker": "planner"})
+        await websocket.flush_connections("task-q")
+        await asyncio.sleep(0.01)
+        connections = list(websocket.active_connections.get("task-q", []))
+        stats = await websocket.get_websocket_stats()
+        await websocket.unregister_connection("task-q", good)
+        return connections, stats
+
+    connections, stats = asyncio.run(run())
+    assert connections == [good]
+    assert good.sent == [{"speaker": "planner"}]
+    assert stats["broadcasts"] >= 1 and stats["disconnected"] >= 1
+    assert bad not in websocket.senders
@@ -0,0 +1,116 @@
+"""
+Tests for streaming agent replies through helios/routers/websocket.py.
+"""
+
+import asyncio
+import json
+
+from helios.config import settings
+from helios.database.models import Task, User
+from helios.routers import websocket
+from helios.repositories.conversation_repository import AsyncConversationRepository, ConversationRepository
+from helios.services import MultiModelClient
+from helios.services.fake_provider import FakeProvider, fake_transports
+
+
+class FakeWebSocket:
+    """记录发送帧的假WebSocket"""
+
+    def __init__(self):
+        self.frames = []
+
+    async def send_text(self, data):
+        self.frames.append(json.loads(data))
+
+
+def _task(db_session):
+    user = User(username="stream_user", email="stream@helios.dev", hashed_password="x")
+    db_session.add(user)
+    db_session.commit()
+    task = Task(description="学习Python", user_id=user.id)
+    db_session.add(task)
+    db_session.commit()
+    return task
+
+
+def test_stream_chat_yields_sse_deltas():
+    """stream_chat应逐块产出提供商SSE中的增量内容"""
+    provider = FakeProvider(content="先学基础语法，再做项目。")
+    client = MultiModelClient(settings, transports=fake_transports({"qwen-max": provider}))
+
+    async def run():
+        return [delta async for delta in client.stream_chat("qwen-max", [{"role": "user", "content": "hi"}])]
+
+    deltas = asyncio.run(run())
+    assert len(deltas) > 1
+    assert "".join(deltas) == provider.content
+
+
+def test_stream_agent_reply_broadcasts_deltas_and_persists_once(db_session, async_session_factory):
+    """增量帧带有递增的seq，结束后只持久化一条完整消息"""
+    task = _task(db_session)
+    conv_repo = ConversationRepository(db_session)
+    provider = FakeProvider(content="第一周：变量、控制流与函数。")
+    client = MultiModelClient(settings, transports=fake_transports({"glm-4": provider}))
+    subscriber = FakeWebSocket()
+
+    async def run():
+        await websocket.register_connection(task.id, subscriber)
+        chunks = client.stream_chat("glm-4", [{"role": "user", "content": "制定计划"}])
+        try:
+            async with async_session_factory() as db:
+                message = await websocket.stream_agent_reply(task.id, "Strategist", chunks, AsyncConversationRepository(db))
+            await websocket.flush_connections(task.id)
+            return message
+        finally:
+            await websocket.unregister_connection(task.id, subscriber)
+
+    message = asyncio.run(run())
+
+    deltas = [frame for frame in subscriber.frames if frame.get("event") == "MESSAGE_DELTA"]
+    final = subscriber.frames[-1]
+    assert [frame["seq"] for frame in deltas] == list(range(len(deltas)))
+    assert "".join(frame["delta"] for frame in deltas) == provider.content
+    assert {frame["stream_id"] for frame in deltas} == {final["stream_id"]}
+    assert final["message"] == provider.content
+    assert final["speaker"] == "Strategist"
+
+    stored = conv_repo.find_by_task_id(task.id)
+    assert len(stored) == 1
+    assert stored[0].id == message.id
+
+
+def test_cancelled_stream_sends_aborted_frame(db_session, async_session_factory):
+    """流被取消时订阅者收到带原因的MESSAGE_ABORTED帧，回复不持久化"""
+    from helios.services.resilience import OperationCancelled
+
+    task = _task(db_session)
+    subscriber = FakeWebSocket()
+
+    async def chunks():
+        yield "第一周："
+        raise OperationCancelled("用户取消")
+
+    async def run():
+        await websocket.register_connection(task.id, subscriber)
+        try:
+            async with async_session_factory() as db:
+                try:
+                    await websocket.stream_agent_reply(task.id, "Strategist", chunks(), AsyncConversationRepository(db))
+                except OperationCancelled:
+                    pass
+                else:
+                    raise AssertionError("取消异常应重新抛出")
+            await websocket.flush_connections(task.id)
+        finally:
+            await websocket.unregister_connection(task.id, subscriber)
+
+    asyncio.run(run())
+
+    delta, aborted = subscriber.frames
+    assert aborted["event"] == "MESSAGE_ABORTED"
+    assert aborted["task_id"] == str(task.id)
+    assert aborted["stream_id"] == delta["stream_id"]
+    assert aborted["seq"] == 1
+    assert "用户取消" in aborted["reason"]
+    assert ConversationRepository(db_session).find_by_task_id(task.id) == []
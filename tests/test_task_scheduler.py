@@ -0,0 +1,114 @@
+"""
+Tests for the priority-aware task scheduler (TaskRepository.claim_next, helios/jobs/scheduler.py).
+"""
+
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from helios.database.models import Base, Task, User
+from helios.jobs import TaskScheduler
+from helios.repositories.task_repository import TaskRepository
+
+
+def _users(db, count=3):
+    for index in range(1, count + 1):
+        db.add(User(id=index, username=f"u{index}", email=f"u{index}@example.com"))
+    db.commit()
+
+
+def test_claims_highest_priority_first(db_session):
+    """按优先级从高到低、同优先级按创建时间领取"""
+    _users(db_session)
+    repo = TaskRepository(db_session)
+    low = repo.create(description="low", priority=1, user_id=1)
+    high = repo.create(description="high", priority=20, user_id=1)
+    mid = repo.create(description="mid", priority=10, user_id=1)
+
+    order = [repo.claim_next("w", fairness_penalty=0).id for _ in range(3)]
+    assert order == [high.id, mid.id, low.id]
+    assert repo.claim_next("w") is None
+    assert repo.get(high.id).status == "IN_PROGRESS"
+    assert repo.get(high.id).worker_id == "w"
+
+
+def test_aging_prevents_starvation(db_session):
+    """等待足够久的低优先级任务会超过新到的高优先级任务"""
+    _users(db_session)
+    repo = TaskRepository(db_session)
+    old = repo.create(description="old", priority=1, user_id=1, created_at=datetime.utcnow() - timedelta(minutes=30))
+    fresh = repo.create(description="fresh", priority=10, user_id=1)
+
+    assert repo.claim_next("w", aging_interval=0).id == fresh.id
+    repo.release(fresh.id, "w")
+    assert repo.claim_next("w", aging_interval=60).id == old.id
+
+
+def test_per_user_fairness(db_session):
+    """已有运行中任务的用户让位给其他用户"""
+    _users(db_session)
+    repo = TaskRepository(db_session)
+    for index in range(3):
+        repo.create(description=f"heavy-{index}", priority=10, user_id=1)
+    light = repo.create(description="light", priority=10, user_id=2)
+
+    first = repo.claim_next("w")
+    assert first.user_id == 1
+    assert repo.claim_next("w").id == light.id
+
+
+def test_provider_concurrency_limit(db_session):
+    """达到提供商并发上限后跳过该提供商的任务"""
+    _users(db_session)
+    repo = TaskRepository(db_session)
+    for index in range(3):
+        repo.create(description=f"glm-{index}", priority=20, user_id=index + 1, provider="glm-4")
+    qwen = repo.create(description="qwen", priority=1, user_id=1, provider="qwen-max")
+    limits = {"glm-4": 2}
+
+    claimed = [repo.claim_next("w", provider_limits=limits, fairness_penalty=0) for _ in range(4)]
+    assert [task.provider for task in claimed[:3]] == ["glm-4", "glm-4", "qwen-max"]
+    assert claimed[2].id == qwen.id
+    assert claimed[3] is None
+
+    repo.finish(claimed[0].id, "w", "COMPLETED", {"ok": True})
+    assert repo.claim_next("w", provider_limits=limits).provider == "glm-4"
+
+
+def test_concurrent_schedulers_never_duplicate(tmp_path):
+    """多个调度器并发领取时每个任务只执行一次"""
+    # 并发事务需要真实的连接池，这里使用临时的SQLite文件而不是共享连接的内存库
+    engine = create_engine(f"sqlite:///{tmp_path / 'tasks.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = session_factory()
+    _users(db)
+    repo = TaskRepository(db)
+    for index in range(12):
+        repo.create(description=f"t{index}", priority=index % 3, user_id=index % 3 + 1)
+    seen = []
+
+    schedulers = [
+        TaskScheduler(
+            handler=lambda task: seen.append(task.description) or {"done": True},
+            session_factory=session_factory,
+            concurrency=2,
+            poll_interval=0.01,
+            provider_limits={},
+        )
+        for _ in range(2)
+    ]
+    for scheduler in schedulers:
+        scheduler.start()
+    deadline = time.time() + 5
+    while len(seen) < 12 and time.time() < deadline:
+        time.sleep(0.01)
+    for scheduler in schedulers:
+        scheduler.stop()
+
+    assert sorted(seen) == sorted(f"t{index}" for index in range(12))
+    assert db.query(Task).filter(Task.status == "COMPLETED").count() == 12
+    db.close()
+    engine.dispose()
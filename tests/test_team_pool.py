@@ -0,0 +1,119 @@
+"""
+Tests for the session-scoped agent team pool (helios/jobs/team_pool.py).
+"""
+
+import threading
+import time
+
+import pytest
+
+from helios.jobs import PoolExhausted, TeamPool
+
+
+class FakeTeam:
+    """记录创建次数的假团队"""
+
+    created = 0
+
+    def __init__(self):
+        FakeTeam.created += 1
+        self.sessions = []
+
+    def create_session(self, session_id):
+        session = {"id": session_id, "plan": None}
+        self.sessions.append(session)
+        return session
+
+
+def test_team_is_built_once_and_sessions_are_isolated():
+    """团队只创建一次，不同会话的状态互不影响，同一会话复用状态"""
+    FakeTeam.created = 0
+    pool = TeamPool(FakeTeam, max_sessions=2, admission_timeout=1, idle_ttl=60)
+
+    with pool.session("a") as (team_a, state_a):
+        state_a["plan"] = "计划A"
+    with pool.session("b") as (team_b, state_b):
+        state_b["plan"] = "计划B"
+    with pool.session("a") as (_, again):
+        assert again["plan"] == "计划A"
+
+    assert team_a is team_b
+    assert FakeTeam.created == 1
+    assert pool.snapshot()["sessions"] == 2
+
+
+def test_sessions_beyond_limit_queue_until_a_slot_frees():
+    """超出并发上限的会话排队，名额释放后按顺序放行，排队超时则失败"""
+    pool = TeamPool(FakeTeam, max_sessions=1, admission_timeout=2, idle_ttl=60)
+    order = []
+    release = threading.Event()
+
+    def hold():
+        with pool.session("first"):
+            order.append("first")
+            release.wait(2)
+
+    def wait_for_slot():
+        with pool.session("second"):
+            order.append("second")
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    while not order:
+        time.sleep(0.005)
+    waiter = threading.Thread(target=wait_for_slot)
+    waiter.start()
+    time.sleep(0.05)
+    assert order == ["first"]
+    assert pool.snapshot()["waiting"] == 1
+
+    with pytest.raises(PoolExhausted):
+        with pool.session("third", timeout=0.05):
+            pass
+
+    release.set()
+    holder.join()
+    waiter.join()
+    assert order == ["first", "second"]
+    assert pool.stats["rejected"] == 1
+
+
+def test_same_session_is_serialized():
+    """同一会话的任务即使有空闲名额也不会并发执行"""
+    pool = TeamPool(FakeTeam, max_sessions=4, admission_timeout=2, idle_ttl=60)
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def work():
+        with pool.session("same"):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+
+    threads = [threading.Thread(target=work) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 1
+
+
+def test_idle_sessions_are_evicted():
+    """空闲超过idle_ttl的会话被释放，再次使用时重新创建"""
+    now = [0.0]
+    pool = TeamPool(FakeTeam, max_sessions=2, admission_timeout=1, idle_ttl=10, clock=lambda: now[0])
+
+    with pool.session("old") as (_, state):
+        state["plan"] = "旧计划"
+    now[0] = 5.0
+    with pool.session("recent"):
+        pass
+    now[0] = 12.0
+
+    assert pool.evict_idle() == 1
+    with pool.session("old") as (_, state):
+        assert state["plan"] is None
+    assert pool.stats["evicted"] == 1
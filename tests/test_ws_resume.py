@@ -0,0 +1,86 @@
+"""
+Tests for resumable WebSocket subscriptions (last_seen_sequence replay in helios/routers/websocket.py).
+"""
+
+import asyncio
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from helios.config import settings
+from helios.database.models import Task, User
+from helios.repositories.conversation_repository import ConversationRepository
+from helios.routers import websocket
+from helios.services.send_queue import ConnectionSender
+
+
+@pytest.fixture
+def task_with_history(db_session):
+    user = User(username="resume", email="resume@helios.dev")
+    db_session.add(user)
+    db_session.commit()
+    task = Task(description="断线重连", user_id=user.id)
+    db_session.add(task)
+    db_session.commit()
+    ConversationRepository(db_session).add_messages(task.id, [("planner", f"消息{i}") for i in range(5)])
+    return task
+
+
+@pytest.fixture
+def client(async_session_factory, monkeypatch):
+    monkeypatch.setattr(websocket, "AsyncSessionLocal", async_session_factory)
+    monkeypatch.setattr(settings, "WS_REPLAY_BATCH_SIZE", 2)
+    app = FastAPI()
+    app.include_router(websocket.router)
+    return TestClient(app)
+
+
+def test_resume_replays_only_newer_messages_in_batches(client, task_with_history):
+    """传入last_seen_sequence时只补发更新的消息，并按批量帧发送"""
+    with client.websocket_connect(f"/ws/tasks/{task_with_history.id}/messages?last_seen_sequence=1") as ws:
+        first, second = ws.receive_json(), ws.receive_json()
+
+    assert first["event"] == second["event"] == "HISTORY_BATCH"
+    assert [m["sequence_order"] for m in first["messages"]] == [2, 3] and first["has_more"]
+    assert [m["sequence_order"] for m in second["messages"]] == [4] and not second["has_more"]
+    assert second["last_sequence"] == 4
+
+
+def test_resume_when_up_to_date_sends_empty_batch(client, task_with_history):
+    """客户端已是最新时只收到一个空批量帧"""
+    with client.websocket_connect(f"/ws/tasks/{task_with_history.id}/messages?last_seen_sequence=4") as ws:
+        frame = ws.receive_json()
+    assert frame == {"event": "HISTORY_BATCH", "messages": [], "last_sequence": 4, "has_more": False}
+
+
+def test_legacy_clients_get_full_history_per_message(client, task_with_history):
+    """未传last_seen_sequence的旧客户端仍逐条收到全部历史"""
+    with client.websocket_connect(f"/ws/tasks/{task_with_history.id}/messages") as ws:
+        frames = [ws.receive_json() for _ in range(5)]
+    assert [frame["sequence_order"] for frame in frames] == [0, 1, 2, 3, 4]
+
+
+def test_messages_broadcast_during_replay_are_not_duplicated():
+    """补发期间入队的消息中，已随历史发送的被丢弃，更新的按顺序发送"""
+    class Recorder:
+        def __init__(self):
+            self.sent = []
+
+        async def send_text(self, text):
+            self.sent.append(json.loads(text))
+
+    recorder = Recorder()
+
+    async def run():
+        sender = ConnectionSender(recorder)
+        for sequence in (3, 4, 5):
+            sender.enqueue(json.dumps({"sequence_order": sequence}), sequence=sequence)
+        sender.enqueue(json.dumps({"event": "MESSAGE_DELTA"}))
+        sender.start(skip_through=4)
+        await sender.drain(1.0)
+        sender.cancel()
+
+    asyncio.run(run())
+    assert recorder.sent == [{"sequence_order": 5}, {"event": "MESSAGE_DELTA"}]